@@ -6,9 +6,14 @@ to my GitHub site.
 https://907sjl.github.io/
 """
 
+import gc
+import importlib
 import os
+import sys
+import traceback
 
 from jinja2 import Environment, FileSystemLoader
+from tornado.ioloop import PeriodicCallback
 from tornado.web import RequestHandler, StaticFileHandler
 
 from bokeh.server.server import Server
@@ -16,20 +21,125 @@ from bokeh.server.views.static_handler import StaticHandler
 from bokeh.application import Application 
 from bokeh.application.handlers.function import FunctionHandler
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+from threading import Event
 
-import app.ClinicProcessApp as cpa
-import app.CRMUsageApp as cua
-import app.PendingReferralsApp as pra
-import app.RoutinePerformanceApp as rpa
-import app.UrgentPerformanceApp as upa
-import app.SeenTimesApp as sta
-import app.ScheduleTimesApp as scta
+import model.MonthCache as mc
+import model.Snapshot as sn
+import model.Timing as t
 
 
 # global tornado environment for this module
 env = Environment(loader=FileSystemLoader('templates'))
 
+# Number of server processes that are forked after the measure data is loaded, or 1 to serve from this process.
+# Forking is not supported on Windows, where the server always runs in one process.
+_SERVER_PROCESSES = 1 if sys.platform == 'win32' else max(int(os.environ.get('REFERRALS_SERVER_PROCESSES', '1')), 1)
+
+# The measure data is loaded before any thread starts when server processes or month worker processes are forked
+# from this process, since forking a process with other threads running can deadlock the forked processes
+_LOAD_BEFORE_LISTENING = _SERVER_PROCESSES > 1 or mc.PARALLEL_WORKERS > 1
+
+# Seconds that a browser waits to reload a page while the measure data is loading
+_LOADING_RETRY_SECONDS = 5
+
+# Seconds between checks for changed source data files, which are loaded into a new model snapshot, or 0 for none
+_RELOAD_CHECK_SECONDS = max(float(os.environ.get('REFERRALS_RELOAD_SECONDS', '60')), 0.0)
+
+# Apps by route with the module and handler function of each app.  The app modules load the source data and
+# calculate the measures when they are imported, so they are imported after the server starts listening.
+# Apps without Bokeh models are rendered once per data snapshot and served as static pages.
+_STATIC_APP_HANDLERS = {'/referrals/scheduled': ('app.ScheduleTimesApp', 'schedule_times_app_handler'),
+                        '/referrals/seen': ('app.SeenTimesApp', 'seen_times_app_handler'),
+                        '/referrals/routine': ('app.RoutinePerformanceApp', 'routine_performance_app_handler'),
+                        '/referrals/urgent': ('app.UrgentPerformanceApp', 'urgent_performance_app_handler')}
+_APP_HANDLERS = {'/referrals/referrals': ('app.ClinicProcessApp', 'clinic_process_app_handler'),
+                 '/referrals/crm': ('app.CRMUsageApp', 'crm_usage_app_handler'),
+                 '/referrals/pending': ('app.PendingReferralsApp', 'pending_referrals_app_handler')}
+
+# App handler functions and static pages by route, which are added when the measure data is loaded
+_app_handlers = {}
+_static_pages = {}
+
+# Set when the measure data is loaded, and the traceback of the exception if the load failed
+_data_ready = Event()
+_data_load_error = None
+
+# The thread that loads the measure data and later loads changed source data, one load at a time
+_data_loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='data-load')
+_data_reload = None
+
+
+def _load_data() -> None:
+    """
+    Imports the app modules, which load the source data and calculate the measures, and adds the app handler
+    functions and static pages of the apps.  The server answers with a loading page until this completes.
+    """
+    global _data_load_error
+    try:
+        with t.timed('startup/data-load'):
+            from app.StaticPage import StaticPage
+            for path, (module_name, handler_name) in _STATIC_APP_HANDLERS.items():
+                _static_pages[path] = StaticPage(path, getattr(importlib.import_module(module_name), handler_name))
+            for path, (module_name, handler_name) in _APP_HANDLERS.items():
+                # Each app handler is timed under the path of the app
+                _app_handlers[path] = t.timed_function('app' + path,
+                                                       getattr(importlib.import_module(module_name), handler_name))
+        _data_ready.set()
+        print('Report data loaded')
+    except Exception:
+        _data_load_error = traceback.format_exc()
+        print('Report data failed to load:\n' + _data_load_error)
+# END load_data
+
+
+def _reload_data() -> None:
+    """
+    Loads changed source data files into a new model snapshot.  The server keeps serving the current snapshot
+    while the new snapshot is built, and keeps it if the source data fails to load.
+    """
+    try:
+        sn.reload_if_changed()
+    except Exception:
+        print('Changed source data failed to load:\n' + traceback.format_exc())
+# END reload_data
+
+
+def _check_source_data() -> None:
+    """Starts a load of changed source data files unless the measure data is not loaded or is being reloaded."""
+    global _data_reload
+    if not _data_ready.is_set() or (_data_reload is not None and not _data_reload.done()):
+        return
+    _data_reload = _data_loader.submit(_reload_data)
+# END check_source_data
+
+
+def _get_loading_variables() -> dict:
+    """Returns the variables of the template of the page served in place of an app while the data is loading."""
+    return {'today_long': date.today().strftime("%A, %B %d, %Y"),
+            'retry_seconds': _LOADING_RETRY_SECONDS}
+# END get_loading_variables
+
+
+def _create_app_handler(path: str):
+    """
+    Returns a Bokeh application handler function for a route that fills the document of a new session with the
+    app when the measure data is loaded, or with the loading page while it is loading.
+    :param path: the route of the app
+    """
+
+    def app_handler(doc) -> None:
+        if _data_ready.is_set():
+            _app_handlers[path](doc)
+        else:
+            doc.title = 'Loading Report Data'
+            doc.template = env.get_template('loading.html')
+            doc.template_variables.update(_get_loading_variables())
+
+    return app_handler
+# END create_app_handler
+
 
 # Tornado request handlers for static-ish pages
 
@@ -61,31 +171,103 @@ class CoverHandler(RequestHandler):
 # END CLASS CoverHandler
 
 
+class StatsHandler(RequestHandler):
+    # Tornado event handler to process HTTP requests to a pre-configured path
+    # returns the timing histograms of data loads, measure calculations, and app handlers as JSON
+    def get(self):
+        self.set_header('Cache-Control', 'no-store')
+        # timings are kept per server process, so the process that answered is included
+        self.write({'pid': os.getpid(), 'timings': t.get_timing_stats()})
+# END CLASS StatsHandler
+
+
+class LiveHandler(RequestHandler):
+    # Tornado event handler to process HTTP requests to a pre-configured path
+    # answers while the server process is running, and fails after the measure data failed to load
+    def get(self):
+        self.set_header('Cache-Control', 'no-store')
+        if _data_load_error is not None:
+            self.set_status(500)
+        self.write({'live': _data_load_error is None, 'pid': os.getpid()})
+# END CLASS LiveHandler
+
+
+class ReadyHandler(RequestHandler):
+    # Tornado event handler to process HTTP requests to a pre-configured path
+    # answers that the server is unavailable until the measure data is loaded
+    def get(self):
+        self.set_header('Cache-Control', 'no-store')
+        if not _data_ready.is_set():
+            self.set_status(503)
+            self.set_header('Retry-After', str(_LOADING_RETRY_SECONDS))
+        self.write({'ready': _data_ready.is_set(),
+                    'error': _data_load_error,
+                    'snapshot': sn.get_snapshot().version if _data_ready.is_set() else None})
+# END CLASS ReadyHandler
+
+
+class StaticPageHandler(RequestHandler):
+    # Tornado event handler to process HTTP requests to a pre-configured path
+    # serves an app page that is rendered once per data snapshot instead of in a new Bokeh session
+    def initialize(self, path: str):
+        self.path = path
+
+    def get(self):
+        # answer with the loading page until the measure data is loaded
+        if not _data_ready.is_set():
+            self.set_status(503)
+            self.set_header('Retry-After', str(_LOADING_RETRY_SECONDS))
+            self.set_header('Cache-Control', 'no-store')
+            self.write(env.get_template('loading.html').render(_get_loading_variables()))
+            return
+        # answer a conditional request with no content when the client has the current page
+        from app.StaticPage import write_static_page
+        write_static_page(self, _static_pages[self.path])
+# END CLASS StaticPageHandler
+
+
 # MAIN script - run on execution
 
 # The `static/` end point is reserved for Bokeh resources, as specified in
 # bokeh.server.urls. In order to make your own end point for static resources,
 # add the following to the `extra_patterns` argument, replacing `DIR` with the desired directory.
 # (r'/DIR/(.*)', StaticFileHandler, {'path': os.path.normpath(os.path.dirname(__file__) + '/DIR')})
-apps = {'/referrals/scheduled': Application(FunctionHandler(scta.schedule_times_app_handler)),
-        '/referrals/seen': Application(FunctionHandler(sta.seen_times_app_handler)),
-        '/referrals/routine': Application(FunctionHandler(rpa.routine_performance_app_handler)),
-        '/referrals/urgent': Application(FunctionHandler(upa.urgent_performance_app_handler)),
-        '/referrals/referrals': Application(FunctionHandler(cpa.clinic_process_app_handler)),
-        '/referrals/crm': Application(FunctionHandler(cua.crm_usage_app_handler)),
-        '/referrals/pending': Application(FunctionHandler(pra.pending_referrals_app_handler))}
+# Apps are served with a loading page until the measure data is loaded
+static_routes = [(path, StaticPageHandler, {'path': path}) for path in _STATIC_APP_HANDLERS]
+apps = {path: Application(FunctionHandler(_create_app_handler(path))) for path in _APP_HANDLERS}
 routes = [('/referrals/cover', CoverHandler),
+          ('/referrals/_stats', StatsHandler),
+          ('/referrals/_live', LiveHandler),
+          ('/referrals/_ready', ReadyHandler),
           ('/', IndexHandler),
           ('/referrals', IndexHandler),
           (r'/referrals/css/(.*)', StaticFileHandler, {'path': os.path.normpath(os.path.dirname(__file__) + '/css')}),
           (r'/referrals/images/(.*)',
           StaticFileHandler,
           {'path': os.path.normpath(os.path.dirname(__file__) + '/images')}),
-          (r'/referrals/static/(.*)', StaticHandler, {})]
+          (r'/referrals/static/(.*)', StaticHandler, {})] + static_routes
+
+# Forked server processes must share measure data that is loaded before the fork, so the data is loaded before
+# the server starts listening.  The forked processes share it copy-on-write without loading the source data or
+# calculating measures again.  Objects that exist before the fork are moved out of garbage collection so that
+# collections in the server processes do not write to the shared memory pages.  Months are calculated by forked
+# worker processes only while this process has no other threads, so the data is also loaded first for them.
+# Snapshots loaded later for changed source files are loaded by a background thread and calculate their months in
+# this process as they are requested.
+if _LOAD_BEFORE_LISTENING:
+    _load_data()
+if _SERVER_PROCESSES > 1:
+    gc.collect()
+    gc.freeze()
+    print(f'Forking {_SERVER_PROCESSES} server processes...')
 
-server = Server(apps, port=5005, extra_patterns=routes)
+server = Server(apps, port=5005, num_procs=_SERVER_PROCESSES, extra_patterns=routes)
 server.start()
 
+# Source data files are checked for changes in every server process, and each process loads its own snapshot
+if _RELOAD_CHECK_SECONDS > 0:
+    PeriodicCallback(_check_source_data, _RELOAD_CHECK_SECONDS * 1000).start()
+
 if __name__ == '__main__':
     print('Open Tornado app with embedded Bokeh application on http://localhost:5005/')
     print('Current working directory is: ', os.getcwd())
@@ -93,6 +275,10 @@ if __name__ == '__main__':
         os.chdir(r'.\referrals-bokeh')
         print('...changing working directory to app folder: ', os.getcwd())
 
+    # A single server process listens while the measure data loads in the background
+    if not _LOAD_BEFORE_LISTENING:
+        _data_loader.submit(_load_data)
+
     # The following line will open a browser page on a client and load the app
 #    server.io_loop.add_callback(view, "http://localhost:5005/")
 
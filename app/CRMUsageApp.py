@@ -15,11 +15,15 @@ from jinja2 import Environment, FileSystemLoader
 
 from bokeh.document import Document
 
+from pandas import DataFrame
+
 from datetime import date, datetime
 
 import model.ProcessTime as wt
 import model.CRMUse as c
+import model.Snapshot as sn
 import app.common as v
+import app.RenderPayloads as rp
 import app.plot.CategoryBarsPlot as cbp
 import app.plot.HorizontalRatioPlot as hrp
 import app.plot.DataLabelPlot as dlp
@@ -34,7 +38,7 @@ class NotAcceptedStatusPlot(cbp.CategoryBarsPlot):
     Overrides plot.CategoryBarsPlot
 
     Public Methods:
-        load_clinic_data - Override - Loads the data used to render visualizations.
+        get_clinic_data - Override - Returns the data used to render visualizations.
     """
 
     def __init__(self,
@@ -51,16 +55,17 @@ class NotAcceptedStatusPlot(cbp.CategoryBarsPlot):
                          plot_width=300)
     # END __init__
 
-    def load_clinic_data(self, month: datetime, clinic: str) -> None:
+    def get_clinic_data(self, month: datetime, clinic: str) -> dict:
         """
-        Loads the data used to render visualizations.
+        Returns the data used to render visualizations.
         :param month: The month to query data from
         :param clinic: The name of the clinic to query data for
+        :return: The referral counts of the clinic by status for referrals not accepted
         """
         volume_values = c.get_counts_by_not_accepted_referral_status(month, clinic).copy()
-        self.ratio_data = {'measure': volume_values[self.category_column].tolist(),
-                           'value': volume_values[self.values_column].tolist()}
-    # END load_clinic_data
+        return {'measure': volume_values[self.category_column].tolist(),
+                'value': volume_values[self.values_column].tolist()}
+    # END get_clinic_data
 # END CLASS NotAcceptedStatusPlot
 
 
@@ -74,6 +79,7 @@ class CRMUsageApp:
         app_root - The route through the HTTP server that is the root of HTTP resource requests
         clinic - The currently selected clinic used to collect and render data
         document - The Bokeh document for an instance of this application
+        snapshot - The model snapshot that the session shows until the page is loaded again
         percentage_color_mapper - The gradient color mapper for process wait times
         age_category_color_mapper - The category color mapper for wait time bin backgrounds
         age_category_label_color_mapper - The category color mapper for wait time bin text
@@ -97,6 +103,7 @@ class CRMUsageApp:
         """
         self.clinic = 'Immunology'
         self.document = doc
+        self.snapshot = sn.get_snapshot()
         percentage_color_mapper, age_category_color_mapper, age_category_label_color_mapper = (
             v.create_color_mappers(v.HEAT_MAP_PALETTE, v.AGE_CATEGORY_COLOR_MAP, v.AGE_CATEGORY_LABEL_COLOR_MAP))
         self.percentage_color_mapper = percentage_color_mapper
@@ -204,116 +211,246 @@ class CRMUsageApp:
         self._linked_ratio_plot.update_plot()
     # END update_plots
 
-    def _collect_dsm_import_data(self, month: datetime) -> None:
+    def _collect_dsm_import_data(self,
+                                 month: datetime,
+                                 clinic: str,
+                                 test_results_df: DataFrame,
+                                 payload: dict,
+                                 label_data: dict) -> None:
         """
         Collects measure data showing the rate at which direct secure
         messages are converted to referrals.  This is called to update a
         previously rendered document.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param test_results_df: The CRM usage test results of the clinic that point scores are added to
+        :param payload: The render payload that plot payloads are added to
+        :param label_data: The label data that data driven labels are set in
         """
-        self._dsm_import_ratio_plot.load_clinic_data(month, self.clinic)
-        self._dsm_import_ratio_plot.create_plot_data()
+        payload['dsm_import_ratio_plot'] = self._dsm_import_ratio_plot.calculate_plot_payload(month, clinic)
+        ratio_data = payload['dsm_import_ratio_plot']['attributes']['ratio_data']
 
-        if self._dsm_import_ratio_plot.ratio_data['DSM Referrals'] == 0:
+        if ratio_data['DSM Referrals'] == 0:
             crm_referral_ratio = 1.0
         else:
-            crm_referral_ratio = (self._dsm_import_ratio_plot.ratio_data['Also in CRM'] /
-                                  self._dsm_import_ratio_plot.ratio_data['DSM Referrals'])
+            crm_referral_ratio = ratio_data['Also in CRM'] / ratio_data['DSM Referrals']
 
         # Add a point score to the import milestone test of CRM use
-        c.set_crm_usage_score_for_clinic(month, self.clinic, 'Import', crm_referral_ratio)
+        c.set_crm_usage_score(test_results_df, 'Import', crm_referral_ratio)
 
         # Data driven labels
-        self._dsm_to_crm_referral_ratio_plot.set_label_text(str(v.half_up_int(crm_referral_ratio * 100.0)) + '%')
-        self._dsm_referral_count_plot.set_label_text(str(self._dsm_import_ratio_plot.ratio_data['DSM Referrals']))
+        self._dsm_to_crm_referral_ratio_plot.set_label_text(str(v.half_up_int(crm_referral_ratio * 100.0)) + '%',
+                                                            label_data)
+        self._dsm_referral_count_plot.set_label_text(str(ratio_data['DSM Referrals']), label_data)
     # END update_measures_of_dsm_imports
 
-    def _collect_measures_of_referrals_tagged_as_seen(self, month: datetime) -> None:
+    def _collect_measures_of_referrals_tagged_as_seen(self,
+                                                      month: datetime,
+                                                      clinic: str,
+                                                      test_results_df: DataFrame,
+                                                      payload: dict,
+                                                      label_data: dict) -> None:
         """
         Collects measure data showing the rate at which referrals are tagged
         as seen when the patient is seen.  This is called to update a
         previously rendered document.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param test_results_df: The CRM usage test results of the clinic that point scores are added to
+        :param payload: The render payload that plot payloads are added to
+        :param label_data: The label data that data driven labels are set in
         """
-        self._tagged_ratio_plot.load_clinic_data(month, self.clinic)
-        self._tagged_ratio_plot.create_plot_data()
+        payload['tagged_ratio_plot'] = self._tagged_ratio_plot.calculate_plot_payload(month, clinic)
+        ratio_data = payload['tagged_ratio_plot']['attributes']['ratio_data']
 
-        if self._tagged_ratio_plot.ratio_data['All Seen'] > 0:
-            crm_seen_referral_ratio = (self._tagged_ratio_plot.ratio_data['Seen in CRM'] /
-                                       self._tagged_ratio_plot.ratio_data['All Seen'])
+        if ratio_data['All Seen'] > 0:
+            crm_seen_referral_ratio = ratio_data['Seen in CRM'] / ratio_data['All Seen']
         else:
             crm_seen_referral_ratio = 0.0
 
         # Seen referrals completed ratio
-        if self._tagged_ratio_plot.ratio_data['All Seen'] > 0:
-            seen_and_completed_ratio = (self._tagged_ratio_plot.ratio_data['Completed'] /
-                                        self._tagged_ratio_plot.ratio_data['All Seen'])
+        if ratio_data['All Seen'] > 0:
+            seen_and_completed_ratio = ratio_data['Completed'] / ratio_data['All Seen']
         else:
             seen_and_completed_ratio = 0.0
 
         # Add a point score to the seen milestone test of CRM use
-        c.set_crm_usage_score_for_clinic(month, self.clinic, 'Seen', crm_seen_referral_ratio)
+        c.set_crm_usage_score(test_results_df, 'Seen', crm_seen_referral_ratio)
 
         # Add a point score to the completed milestone test of CRM use
-        c.set_crm_usage_score_for_clinic(month, self.clinic, 'Completed', seen_and_completed_ratio)
+        c.set_crm_usage_score(test_results_df, 'Completed', seen_and_completed_ratio)
 
         # Data driven labels
-        self._crm_seen_referral_ratio_plot.set_label_text(str(v.half_up_int(crm_seen_referral_ratio * 100.0)) + '%')
-        self._seen_and_completed_ratio_plot.set_label_text(str(v.half_up_int(seen_and_completed_ratio * 100.0)) + '%')
-        self._seen_referral_count_plot.set_label_text(str(self._tagged_ratio_plot.ratio_data['All Seen']))
+        self._crm_seen_referral_ratio_plot.set_label_text(str(v.half_up_int(crm_seen_referral_ratio * 100.0)) + '%',
+                                                          label_data)
+        self._seen_and_completed_ratio_plot.set_label_text(str(v.half_up_int(seen_and_completed_ratio * 100.0)) + '%',
+                                                           label_data)
+        self._seen_referral_count_plot.set_label_text(str(ratio_data['All Seen']), label_data)
     # END update_measures_of_referrals_tagged_as_seen
 
-    def _collect_measures_of_linked_appointments(self, month: datetime) -> None:
+    def _collect_measures_of_linked_appointments(self,
+                                                 month: datetime,
+                                                 clinic: str,
+                                                 test_results_df: DataFrame,
+                                                 payload: dict,
+                                                 label_data: dict) -> None:
         """
         Collects measure data showing the rate at which appointments are linked
         to referrals when the patient is scheduled.  This is called to update a
         previously rendered document.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param test_results_df: The CRM usage test results of the clinic that point scores are added to
+        :param payload: The render payload that plot payloads are added to
+        :param label_data: The label data that data driven labels are set in
         """
-        self._linked_ratio_plot.load_clinic_data(month, self.clinic)
-        self._linked_ratio_plot.create_plot_data()
+        payload['linked_ratio_plot'] = self._linked_ratio_plot.calculate_plot_payload(month, clinic)
+        ratio_data = payload['linked_ratio_plot']['attributes']['ratio_data']
 
-        if self._linked_ratio_plot.ratio_data['Scheduled'] > 0:
-            linked_appointment_ratio = (self._linked_ratio_plot.ratio_data['Linked in CRM'] /
-                                        self._linked_ratio_plot.ratio_data['Scheduled'])
+        if ratio_data['Scheduled'] > 0:
+            linked_appointment_ratio = ratio_data['Linked in CRM'] / ratio_data['Scheduled']
         else:
             linked_appointment_ratio = 0.0
 
         # Add a point score to the linked milestone test of CRM use
-        c.set_crm_usage_score_for_clinic(month, self.clinic, 'Linked', linked_appointment_ratio)
+        c.set_crm_usage_score(test_results_df, 'Linked', linked_appointment_ratio)
 
         # Add data as Jinja2 variables to render via HTML
-        self._linked_appointment_ratio_plot.set_label_text(str(v.half_up_int(linked_appointment_ratio * 100.0)) + '%')
-        self._scheduled_referral_count_plot.set_label_text(str(self._linked_ratio_plot.ratio_data['Scheduled']))
+        self._linked_appointment_ratio_plot.set_label_text(str(v.half_up_int(linked_appointment_ratio * 100.0)) + '%',
+                                                           label_data)
+        self._scheduled_referral_count_plot.set_label_text(str(ratio_data['Scheduled']), label_data)
     # END update_measures_of_linked_appointments
 
-    def _collect_referrals_not_accepted_data(self, month: datetime) -> None:
+    def _collect_referrals_not_accepted_data(self,
+                                             month: datetime,
+                                             clinic: str,
+                                             test_results_df: DataFrame,
+                                             payload: dict,
+                                             label_data: dict) -> None:
         """
         Collects measure data showing the rate at which referrals are accepted
         by the clinic.  This is called to update a previously rendered document.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param test_results_df: The CRM usage test results of the clinic that point scores are added to
+        :param payload: The render payload that plot payloads are added to
+        :param label_data: The label data that data driven labels are set in
         """
-        self._not_accepted_status_plot.load_clinic_data(month, self.clinic)
-        self._not_accepted_status_plot.create_plot_data()
+        payload['not_accepted_status_plot'] = self._not_accepted_status_plot.calculate_plot_payload(month, clinic)
 
         # Accepted ratio
         accepted_count = v.half_up_int(
-            wt.get_clinic_count_measure(month, self.clinic, 'Referrals Accepted After 90d'))
+            wt.get_clinic_count_measure(month, clinic, 'Referrals Accepted After 90d'))
         kept_referral_count = v.half_up_int(
-            wt.get_clinic_count_measure(month, self.clinic, 'Referrals Aged'))
+            wt.get_clinic_count_measure(month, clinic, 'Referrals Aged'))
         if kept_referral_count > 0:
             accepted_ratio = accepted_count / kept_referral_count
         else:
             accepted_ratio = 0.0
 
         # Add a point score to the accept milestone test of CRM use
-        c.set_crm_usage_score_for_clinic(month, self.clinic, 'Accepted', accepted_ratio)
+        c.set_crm_usage_score(test_results_df, 'Accepted', accepted_ratio)
 
         # Data driven labels
-        self._accepted_ratio_plot.set_label_text(str(v.half_up_int(accepted_ratio * 100.0)) + '%')
-        self._kept_referral_count_plot.set_label_text(str(kept_referral_count))
+        self._accepted_ratio_plot.set_label_text(str(v.half_up_int(accepted_ratio * 100.0)) + '%', label_data)
+        self._kept_referral_count_plot.set_label_text(str(kept_referral_count), label_data)
     # END update_measures_referrals_not_accepted
 
+    def _collect_crm_usage_test_data(self,
+                                     month: datetime,
+                                     clinic: str,
+                                     test_results_df: DataFrame,
+                                     payload: dict,
+                                     label_data: dict) -> None:
+        """
+        Collects the CRM usage test results and total scores after the point scores of each test are added.
+        :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param test_results_df: The CRM usage test results of the clinic that point scores are added to
+        :param payload: The render payload that plot payloads are added to
+        :param label_data: The label data that data driven labels are set in
+        """
+        tests_vw = test_results_df
+        tests_vw['Result %'] = tests_vw['Result'].astype('string') + '%'
+        payload['crm_usage_score_table'] = self._crm_usage_score_table.calculate_plot_payload(tests_vw)
+
+        # Data driven labels
+        total_test_value = tests_vw['Point Value'].sum()
+        total_test_score = tests_vw['Score'].sum()
+        self._total_test_value_plot.set_label_text(str(round(total_test_value, 2)), label_data)
+        self._total_test_score_plot.set_label_text(str(round(total_test_score, 2)), label_data)
+        (self._total_test_percent_plot.
+         set_label_text(str(v.half_up_int((total_test_score / total_test_value) * 100.0)) + '%', label_data))
+    # END collect_crm_usage_test_data
+
+    def _calculate_clinic_payload(self, clinic: str, month: datetime) -> dict:
+        """
+        Calculates the plot data, test results, and data driven labels of every CRM usage visual for a clinic.
+        The model is read without changing the plots of this document, so this can run outside of the document lock.
+        :param clinic: the clinic to calculate the render payload of
+        :param month: The month to query data in
+        :return: the render payload of the clinic
+        """
+        payload = {}
+        label_data = self._label_data_source.create_label_data()
+
+        # Point scores are added to a copy of the test results of the clinic, since sessions share the model
+        test_results_df = c.get_crm_usage_test_results(month, clinic)
+        self._collect_referrals_not_accepted_data(month, clinic, test_results_df, payload, label_data)
+        self._collect_measures_of_linked_appointments(month, clinic, test_results_df, payload, label_data)
+        self._collect_measures_of_referrals_tagged_as_seen(month, clinic, test_results_df, payload, label_data)
+        self._collect_dsm_import_data(month, clinic, test_results_df, payload, label_data)
+        self._collect_crm_usage_test_data(month, clinic, test_results_df, payload, label_data)
+        payload['label_data_source'] = rp.create_plot_payload({'label_data': label_data}, {})
+        return payload
+    # END calculate_clinic_payload
+
+    def _get_payload_plots(self) -> dict:
+        """Returns the plots with clinic data in the render payloads of this application by payload name."""
+        return {'label_data_source': self._label_data_source,
+                'not_accepted_status_plot': self._not_accepted_status_plot,
+                'dsm_import_ratio_plot': self._dsm_import_ratio_plot,
+                'linked_ratio_plot': self._linked_ratio_plot,
+                'tagged_ratio_plot': self._tagged_ratio_plot,
+                'crm_usage_score_table': self._crm_usage_score_table}
+    # END get_payload_plots
+
+    def _load_clinic_data(self, month: datetime) -> None:
+        """
+        Loads plot data, test results, and data driven labels for the selected clinic from the render payloads
+        shared by every session, collecting the data only when no session has shown the clinic for the month.
+        :param month: The month to query data in
+        """
+        rp.render_payloads.load(type(self).__name__, month, self.clinic, self._get_payload_plots(),
+                                lambda: self._calculate_clinic_payload(self.clinic, month))
+    # END load_clinic_data
+
+    def _get_clinic_payload(self, clinic: str, month: datetime) -> dict:
+        """
+        Returns the render payload of a clinic without changing the plots of this document, calculating it from
+        the model when no session has shown the clinic for the month.
+        :param clinic: the clinic to return the render payload of
+        :param month: The month to query data in
+        :return: the render payload of the clinic
+        """
+        return rp.render_payloads.get_payload(type(self).__name__, month, clinic,
+                                              lambda: self._calculate_clinic_payload(clinic, month))
+    # END get_clinic_payload
+
+    def _apply_clinic_payload(self, clinic: str, payload: dict) -> None:
+        """
+        Updates the plots of this document with the render payload of a selected clinic, unless another clinic
+        was selected while the payload was calculated.
+        :param clinic: the clinic of the render payload
+        :param payload: the render payload of the clinic
+        """
+        if clinic != self.clinic:
+            return
+        rp.render_payloads.set_payload(type(self).__name__, self._get_payload_plots(), payload)
+        self._update_plots()
+        self._label_data_source.update_plot_data()
+    # END apply_clinic_payload
+
     def set_clinic(self, clinic: str) -> None:
         """Sets the currently selected clinic."""
         self.clinic = clinic
@@ -322,31 +459,17 @@ class CRMUsageApp:
     def _clinic_selection_handler(self, attr: str, old, new) -> None:
         """
         This function queries new data when the clinic selection changes. This function
-        signature matches the requirements for a Bokeh callback in Python.
+        signature matches the requirements for a Bokeh callback in Python.  The data is
+        collected in a worker thread and the plots are updated on a later tick.
         :param attr: Not used
         :param old: The previous clinic value before the selection changes
         :param new: The new clinic value after the selection changes
         """
         self.set_clinic(new)
-        self._collect_referrals_not_accepted_data(wt.last_month)
-        self._collect_measures_of_linked_appointments(wt.last_month)
-        self._collect_measures_of_referrals_tagged_as_seen(wt.last_month)
-        self._collect_dsm_import_data(wt.last_month)
-        self._update_plots()
-
-        # Data driven HTML table
-        tests_vw = c.get_crm_usage_test_results(c.last_month, self.clinic).copy()
-        tests_vw['Result %'] = tests_vw['Result'].astype('string') + '%'
-
-        # Data driven labels
-        total_test_value = tests_vw['Point Value'].sum()
-        total_test_score = tests_vw['Score'].sum()
-        self._total_test_value_plot.set_label_text(str(round(total_test_value, 2)))
-        self._total_test_score_plot.set_label_text(str(round(total_test_score, 2)))
-        (self._total_test_percent_plot.
-         set_label_text(str(v.half_up_int((total_test_score / total_test_value) * 100.0)) + '%'))
-        self._crm_usage_score_table.create_plot_data(tests_vw)
-        self._label_data_source.update_plot_data()
+        v.offload_clinic_selection(self.document,
+                                   self.snapshot,
+                                   lambda: self._get_clinic_payload(new, c.last_month),
+                                   lambda payload: self._apply_clinic_payload(new, payload))
     # END clinic_selection_handler
 
     def insert_crm_usage_visuals(self) -> None:
@@ -360,10 +483,7 @@ class CRMUsageApp:
         if len(clinic) > 0:
             self.clinic = clinic
 
-        self._collect_referrals_not_accepted_data(c.last_month)
-        self._collect_measures_of_linked_appointments(c.last_month)
-        self._collect_measures_of_referrals_tagged_as_seen(c.last_month)
-        self._collect_dsm_import_data(c.last_month)
+        self._load_clinic_data(c.last_month)
 
         # Add plots to the Bokeh document
         self._add_plots()
@@ -372,18 +492,9 @@ class CRMUsageApp:
         v.add_clinic_slicer(self.document, wt.last_month, self.clinic, self._clinic_selection_handler)
 
         # Data driven table of CRM test results
-        tests_vw = c.get_crm_usage_test_results(c.last_month, self.clinic).copy()
-        tests_vw['Result %'] = tests_vw['Result'].astype('string') + '%'
-        self._crm_usage_score_table.create_plot_data(tests_vw)
         self._crm_usage_score_table.add_plot()
 
         # Data driven labels
-        total_test_value = tests_vw['Point Value'].sum()
-        total_test_score = tests_vw['Score'].sum()
-        self._total_test_value_plot.set_label_text(str(round(total_test_value, 2)))
-        self._total_test_score_plot.set_label_text(str(round(total_test_score, 2)))
-        (self._total_test_percent_plot.
-         set_label_text(str(v.half_up_int((total_test_score / total_test_value) * 100.0)) + '%'))
         self._label_data_source.update_plot_data()
         self._label_data_source.add_plot()
 
@@ -418,5 +529,6 @@ def crm_usage_app_handler(doc: Document) -> None:
     """
 
     crm_use_app = CRMUsageApp(doc)
-    crm_use_app.insert_crm_usage_visuals()
+    with sn.pinned(crm_use_app.snapshot):
+        crm_use_app.insert_crm_usage_visuals()
 # END crm_usage_app_handler
@@ -18,7 +18,9 @@ from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 
 import model.ProcessTime as wt
+import model.Snapshot as sn
 import app.common as v
+import app.RenderPayloads as rp
 import app.plot.AgeDistributionPlot as adp
 import app.plot.ReferralVolumePlot as rvp
 import app.plot.ProcessGaugePlot as pgp
@@ -36,6 +38,7 @@ class ClinicProcessApp:
         app_root - The route through the HTTP server that is the root of HTTP resource requests
         clinic - The currently selected clinic used to collect and render data
         document - The Bokeh document for an instance of this application
+        snapshot - The model snapshot that the session shows until the page is loaded again
         percentage_color_mapper - The gradient color mapper for process wait times
         age_category_color_mapper - The category color mapper for wait time bin backgrounds
         age_category_label_color_mapper - The category color mapper for wait time bin text
@@ -59,6 +62,7 @@ class ClinicProcessApp:
         """
         self.clinic = 'Immunology'
         self.document = doc
+        self.snapshot = sn.get_snapshot()
         percentage_color_mapper, age_category_color_mapper, age_category_label_color_mapper = (
             v.create_color_mappers(v.HEAT_MAP_PALETTE, v.AGE_CATEGORY_COLOR_MAP, v.AGE_CATEGORY_LABEL_COLOR_MAP))
         self.percentage_color_mapper = percentage_color_mapper
@@ -320,27 +324,30 @@ class ClinicProcessApp:
         self._seen_histogram_plot.add_plot()
     # END add_plots
 
-    def _collect_referral_volume_plot_data(self, month: datetime) -> None:
+    def _collect_referral_volume_plot_data(self,
+                                           month: datetime,
+                                           clinic: str,
+                                           payload: dict,
+                                           label_data: dict) -> None:
         """
         Collects plot data for clinic referral volume measures in a Bokeh document.
         :param month: month of performance to visualize
+        :param clinic: the clinic to collect data for
+        :param payload: the render payload that plot payloads are added to
+        :param label_data: the label data that data driven labels are set in
         """
 
         # Data to calculate volume measures after 5 days
-        self._urgent_volume_plot.load_clinic_data(month, self.clinic)
-        self._urgent_volume_plot.create_plot_data()
+        payload['urgent_volume_plot'] = self._urgent_volume_plot.calculate_plot_payload(month, clinic)
 
         # Data to calculate volume measures after 30 days
-        self._routine_volume_plot.load_clinic_data(month, self.clinic)
-        self._routine_volume_plot.create_plot_data()
+        payload['routine_volume_plot'] = self._routine_volume_plot.calculate_plot_payload(month, clinic)
 
         # Data to calculate volume measures after 90 days
-        self._all_volume_plot.load_clinic_data(month, self.clinic)
-        self._all_volume_plot.create_plot_data()
+        payload['all_volume_plot'] = self._all_volume_plot.calculate_plot_payload(month, clinic)
 
         # Data to calculate volume of referrals by process milestone after 90 days
-        self._process_volume_plot.load_clinic_data(month, self.clinic)
-        self._process_volume_plot.create_plot_data()
+        payload['process_volume_plot'] = self._process_volume_plot.calculate_plot_payload(month, clinic)
 
         # Dates of urgent referrals counted
         urgent_first_date = month + relativedelta(days=-5)
@@ -352,295 +359,265 @@ class ClinicProcessApp:
 
         # Data driven labels
         self._urgent_min_date_plot.\
-            set_label_text(f'{urgent_first_date.month}/{urgent_first_date.day}/{urgent_first_date:%y}')
+            set_label_text(f'{urgent_first_date.month}/{urgent_first_date.day}/{urgent_first_date:%y}', label_data)
         self._urgent_max_date_plot.\
-            set_label_text(f'{urgent_last_date.month}/{urgent_last_date.day}/{urgent_last_date:%y}')
+            set_label_text(f'{urgent_last_date.month}/{urgent_last_date.day}/{urgent_last_date:%y}', label_data)
         self._routine_min_date_plot.\
-            set_label_text(f'{routine_first_date.month}/{routine_first_date.day}/{routine_first_date:%y}')
+            set_label_text(f'{routine_first_date.month}/{routine_first_date.day}/{routine_first_date:%y}', label_data)
         self._routine_max_date_plot.\
-            set_label_text(f'{routine_last_date.month}/{routine_last_date.day}/{routine_last_date:%y}')
+            set_label_text(f'{routine_last_date.month}/{routine_last_date.day}/{routine_last_date:%y}', label_data)
         self._all_min_date_plot.\
-            set_label_text(f'{first_date.month}/{first_date.day}/{first_date:%y}')
+            set_label_text(f'{first_date.month}/{first_date.day}/{first_date:%y}', label_data)
         self._all_max_date_plot.\
-            set_label_text(f'{last_date.month}/{last_date.day}/{last_date:%y}')
+            set_label_text(f'{last_date.month}/{last_date.day}/{last_date:%y}', label_data)
     # END update_referral_volume_plots
 
-    def _collect_seen_ratio_plot_data(self, month: datetime) -> None:
+    def _collect_seen_ratio_plot_data(self,
+                                      month: datetime,
+                                      clinic: str,
+                                      payload: dict,
+                                      label_data: dict) -> None:
         """
         Collects plot data for clinic referral seen ratios to a Bokeh document.
         :param month: month of data to visualize
+        :param clinic: the clinic to collect data for
+        :param payload: the render payload that plot payloads are added to
+        :param label_data: the label data that data driven labels are set in
         """
 
         # Data to calculate seen ratio measures after 5 days
-        self._urgent_seen_ratio_plot.load_clinic_data(month, self.clinic)
-        self._urgent_seen_ratio_plot.create_plot_data()
+        payload['urgent_seen_ratio_plot'] = self._urgent_seen_ratio_plot.calculate_plot_payload(month, clinic)
 
         # Data to calculate seen ratio measures after 30 days
-        self._routine_seen_ratio_plot.load_clinic_data(month, self.clinic)
-        self._routine_seen_ratio_plot.create_plot_data()
+        payload['routine_seen_ratio_plot'] = self._routine_seen_ratio_plot.calculate_plot_payload(month, clinic)
 
         # Data to calculate seen ratio measures after 90 days
-        self._all_seen_ratio_plot.load_clinic_data(month, self.clinic)
-        self._all_seen_ratio_plot.create_plot_data()
+        payload['all_seen_ratio_plot'] = self._all_seen_ratio_plot.calculate_plot_payload(month, clinic)
     # END update_seen_ratio_plots
 
-    def _collect_urgent_referral_process_aim_data(self, month: datetime) -> None:
+    def _collect_urgent_referral_process_aim_data(self,
+                                                  month: datetime,
+                                                  clinic: str,
+                                                  payload: dict,
+                                                  label_data: dict) -> None:
         """
         Collects plot data for the clinic referral process aim for urgent referrals.
         :param month: month of performance to visualize
+        :param clinic: the clinic to collect data for
+        :param payload: the render payload that plot payloads are added to
+        :param label_data: the label data that data driven labels are set in
         """
-        self._urgent_aim_plot.load_clinic_data(month, self.clinic)
-        self._urgent_aim_plot.create_plot_data()
-
-        urgent_ratio_3_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'MOV91 Pct Urgent Referrals Seen in 5d')))
-        urgent_variance_3_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var Target MOV91 Pct Urgent Referrals Seen in 5d')))
-        urgent_direction_3_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var Target MOV91 Pct Urgent Referrals Seen in 5d'))
-        urgent_improvement_3_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var MOV91 Pct Urgent Referrals Seen in 5d')))
-        urgent_improvement_dir_3_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var MOV91 Pct Urgent Referrals Seen in 5d'))
-
-        urgent_ratio_6_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'MOV182 Pct Urgent Referrals Seen in 5d')))
-        urgent_variance_6_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var Target MOV182 Pct Urgent Referrals Seen in 5d')))
-        urgent_direction_6_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var Target MOV182 Pct Urgent Referrals Seen in 5d'))
-        urgent_improvement_6_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var MOV182 Pct Urgent Referrals Seen in 5d')))
-        urgent_improvement_dir_6_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var MOV182 Pct Urgent Referrals Seen in 5d'))
-        urgent_ratio_12_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'MOV364 Pct Urgent Referrals Seen in 5d')))
-        urgent_variance_12_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var Target MOV364 Pct Urgent Referrals Seen in 5d')))
-        urgent_direction_12_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var Target MOV364 Pct Urgent Referrals Seen in 5d'))
-        urgent_improvement_12_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var MOV364 Pct Urgent Referrals Seen in 5d')))
-        urgent_improvement_dir_12_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var MOV364 Pct Urgent Referrals Seen in 5d'))
+        payload['urgent_aim_plot'] = self._urgent_aim_plot.calculate_plot_payload(month, clinic)
+        target_data = payload['urgent_aim_plot']['attributes']['target_data']
+
+        # Updated process aim values in one fetch
+        measures_df = wt.get_clinic_measures(month,
+                                             clinic,
+                                             ['MOV91 Pct Urgent Referrals Seen in 5d',
+                                              'Var Target MOV91 Pct Urgent Referrals Seen in 5d',
+                                              'Dir Var Target MOV91 Pct Urgent Referrals Seen in 5d',
+                                              'Var MOV91 Pct Urgent Referrals Seen in 5d',
+                                              'Dir Var MOV91 Pct Urgent Referrals Seen in 5d',
+                                              'MOV182 Pct Urgent Referrals Seen in 5d',
+                                              'Var Target MOV182 Pct Urgent Referrals Seen in 5d',
+                                              'Dir Var Target MOV182 Pct Urgent Referrals Seen in 5d',
+                                              'Var MOV182 Pct Urgent Referrals Seen in 5d',
+                                              'Dir Var MOV182 Pct Urgent Referrals Seen in 5d',
+                                              'MOV364 Pct Urgent Referrals Seen in 5d',
+                                              'Var Target MOV364 Pct Urgent Referrals Seen in 5d',
+                                              'Dir Var Target MOV364 Pct Urgent Referrals Seen in 5d',
+                                              'Var MOV364 Pct Urgent Referrals Seen in 5d',
+                                              'Dir Var MOV364 Pct Urgent Referrals Seen in 5d'])
+        values = measures_df.loc[0]
+
+        urgent_ratio_3_month = v.half_up_int(float(values['MOV91 Pct Urgent Referrals Seen in 5d']))
+        urgent_variance_3_month = v.half_up_int(float(values['Var Target MOV91 Pct Urgent Referrals Seen in 5d']))
+        urgent_direction_3_month = values['Dir Var Target MOV91 Pct Urgent Referrals Seen in 5d']
+        urgent_improvement_3_month = v.half_up_int(float(values['Var MOV91 Pct Urgent Referrals Seen in 5d']))
+        urgent_improvement_dir_3_month = values['Dir Var MOV91 Pct Urgent Referrals Seen in 5d']
+
+        urgent_ratio_6_month = v.half_up_int(float(values['MOV182 Pct Urgent Referrals Seen in 5d']))
+        urgent_variance_6_month = v.half_up_int(float(values['Var Target MOV182 Pct Urgent Referrals Seen in 5d']))
+        urgent_direction_6_month = values['Dir Var Target MOV182 Pct Urgent Referrals Seen in 5d']
+        urgent_improvement_6_month = v.half_up_int(float(values['Var MOV182 Pct Urgent Referrals Seen in 5d']))
+        urgent_improvement_dir_6_month = values['Dir Var MOV182 Pct Urgent Referrals Seen in 5d']
+
+        urgent_ratio_12_month = v.half_up_int(float(values['MOV364 Pct Urgent Referrals Seen in 5d']))
+        urgent_variance_12_month = v.half_up_int(float(values['Var Target MOV364 Pct Urgent Referrals Seen in 5d']))
+        urgent_direction_12_month = values['Dir Var Target MOV364 Pct Urgent Referrals Seen in 5d']
+        urgent_improvement_12_month = v.half_up_int(float(values['Var MOV364 Pct Urgent Referrals Seen in 5d']))
+        urgent_improvement_dir_12_month = values['Dir Var MOV364 Pct Urgent Referrals Seen in 5d']
 
         # Data driven labels
-        self._urgent_ratio_3_month_plot.set_label_text(str(urgent_ratio_3_month) + '%')
-        self._urgent_variance_3_month_plot.set_label_text(str(urgent_variance_3_month) + '%')
-        self._urgent_direction_3_month_plot.set_label_text(str(urgent_direction_3_month))
-        self._urgent_improvement_dir_3_month_plot.set_label_text(str(urgent_improvement_dir_3_month))
+        self._urgent_ratio_3_month_plot.set_label_text(str(urgent_ratio_3_month) + '%', label_data)
+        self._urgent_variance_3_month_plot.set_label_text(str(urgent_variance_3_month) + '%', label_data)
+        self._urgent_direction_3_month_plot.set_label_text(str(urgent_direction_3_month), label_data)
+        self._urgent_improvement_dir_3_month_plot.set_label_text(str(urgent_improvement_dir_3_month), label_data)
 
-        self._urgent_ratio_6_month_plot.set_label_text(str(urgent_ratio_6_month) + '%')
-        self._urgent_variance_6_month_plot.set_label_text(str(urgent_variance_6_month) + '%')
-        self._urgent_direction_6_month_plot.set_label_text(str(urgent_direction_6_month))
-        self._urgent_improvement_dir_6_month_plot.set_label_text(str(urgent_improvement_dir_6_month))
+        self._urgent_ratio_6_month_plot.set_label_text(str(urgent_ratio_6_month) + '%', label_data)
+        self._urgent_variance_6_month_plot.set_label_text(str(urgent_variance_6_month) + '%', label_data)
+        self._urgent_direction_6_month_plot.set_label_text(str(urgent_direction_6_month), label_data)
+        self._urgent_improvement_dir_6_month_plot.set_label_text(str(urgent_improvement_dir_6_month), label_data)
 
-        self._urgent_ratio_12_month_plot.set_label_text(str(urgent_ratio_12_month) + '%')
-        self._urgent_variance_12_month_plot.set_label_text(str(urgent_variance_12_month) + '%')
-        self._urgent_direction_12_month_plot.set_label_text(str(urgent_direction_12_month))
-        self._urgent_improvement_dir_12_month_plot.set_label_text(str(urgent_improvement_dir_12_month))
+        self._urgent_ratio_12_month_plot.set_label_text(str(urgent_ratio_12_month) + '%', label_data)
+        self._urgent_variance_12_month_plot.set_label_text(str(urgent_variance_12_month) + '%', label_data)
+        self._urgent_direction_12_month_plot.set_label_text(str(urgent_direction_12_month), label_data)
+        self._urgent_improvement_dir_12_month_plot.set_label_text(str(urgent_improvement_dir_12_month), label_data)
 
-        self._urgent_ratio_target_plot.set_label_text(
-            str(int(self._urgent_aim_plot.target_data['value'][0] * 100.0)) + '%')
+        self._urgent_ratio_target_plot.set_label_text(str(int(target_data['value'][0] * 100.0)) + '%', label_data)
 
         # Data driven label styles
         if urgent_variance_3_month < 0:
-            self._urgent_direction_3_month_plot.set_label_style("table-data-direction-down")
+            self._urgent_direction_3_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._urgent_direction_3_month_plot.set_label_style("table-data-direction-up")
+            self._urgent_direction_3_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if urgent_improvement_3_month < 0:
-            self._urgent_improvement_dir_3_month_plot.set_label_style("table-data-direction-down")
+            self._urgent_improvement_dir_3_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._urgent_improvement_dir_3_month_plot.set_label_style("table-data-direction-up")
+            self._urgent_improvement_dir_3_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if urgent_variance_6_month < 0:
-            self._urgent_direction_6_month_plot.set_label_style("table-data-direction-down")
+            self._urgent_direction_6_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._urgent_direction_6_month_plot.set_label_style("table-data-direction-up")
+            self._urgent_direction_6_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if urgent_improvement_6_month < 0:
-            self._urgent_improvement_dir_6_month_plot.set_label_style("table-data-direction-down")
+            self._urgent_improvement_dir_6_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._urgent_improvement_dir_6_month_plot.set_label_style("table-data-direction-up")
+            self._urgent_improvement_dir_6_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if urgent_variance_12_month < 0:
-            self._urgent_direction_12_month_plot.set_label_style("table-data-direction-down")
+            self._urgent_direction_12_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._urgent_direction_12_month_plot.set_label_style("table-data-direction-up")
+            self._urgent_direction_12_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if urgent_improvement_12_month < 0:
-            self._urgent_improvement_dir_12_month_plot.set_label_style("table-data-direction-down")
+            self._urgent_improvement_dir_12_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._urgent_improvement_dir_12_month_plot.set_label_style("table-data-direction-up")
+            self._urgent_improvement_dir_12_month_plot.set_label_style("table-data-direction-up", label_data)
     # END update_urgent_referral_process_aim
 
-    def _collect_routine_referral_process_aim_data(self, month: datetime) -> None:
+    def _collect_routine_referral_process_aim_data(self,
+                                                   month: datetime,
+                                                   clinic: str,
+                                                   payload: dict,
+                                                   label_data: dict) -> None:
         """
         Collects plot data for the clinic referral process aim for routine referrals.
         :param month: month of performance to visualize
+        :param clinic: the clinic to collect data for
+        :param payload: the render payload that plot payloads are added to
+        :param label_data: the label data that data driven labels are set in
         """
-        self._routine_aim_plot.load_clinic_data(month, self.clinic)
-        self._routine_aim_plot.create_plot_data()
-
-        # Updated process aim values
-        routine_ratio_3_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'MOV91 Pct Routine Referrals Seen in 30d')))
-        routine_variance_3_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var Target MOV91 Pct Routine Referrals Seen in 30d')))
-        routine_direction_3_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var Target MOV91 Pct Routine Referrals Seen in 30d'))
-
-        routine_improvement_3_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var MOV91 Pct Routine Referrals Seen in 30d')))
-
-        routine_improvement_dir_3_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var MOV91 Pct Routine Referrals Seen in 30d'))
-
-        routine_ratio_6_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'MOV182 Pct Routine Referrals Seen in 30d')))
-        routine_variance_6_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var Target MOV182 Pct Routine Referrals Seen in 30d')))
-        routine_direction_6_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var Target MOV182 Pct Routine Referrals Seen in 30d'))
-        routine_improvement_6_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var MOV182 Pct Routine Referrals Seen in 30d')))
-        routine_improvement_dir_6_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var MOV182 Pct Routine Referrals Seen in 30d'))
-
-        routine_ratio_12_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'MOV364 Pct Routine Referrals Seen in 30d')))
-        routine_variance_12_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var Target MOV364 Pct Routine Referrals Seen in 30d')))
-        routine_direction_12_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var Target MOV364 Pct Routine Referrals Seen in 30d'))
-        routine_improvement_12_month = (
-            v.half_up_int(wt.get_clinic_rate_measure(month,
-                                                     self.clinic,
-                                                     'Var MOV364 Pct Routine Referrals Seen in 30d')))
-        routine_improvement_dir_12_month = (
-            wt.get_clinic_measure(month,
-                                  self.clinic,
-                                  'Dir Var MOV364 Pct Routine Referrals Seen in 30d'))
+        payload['routine_aim_plot'] = self._routine_aim_plot.calculate_plot_payload(month, clinic)
+        target_data = payload['routine_aim_plot']['attributes']['target_data']
+
+        # Updated process aim values in one fetch
+        measures_df = wt.get_clinic_measures(month,
+                                             clinic,
+                                             ['MOV91 Pct Routine Referrals Seen in 30d',
+                                              'Var Target MOV91 Pct Routine Referrals Seen in 30d',
+                                              'Dir Var Target MOV91 Pct Routine Referrals Seen in 30d',
+                                              'Var MOV91 Pct Routine Referrals Seen in 30d',
+                                              'Dir Var MOV91 Pct Routine Referrals Seen in 30d',
+                                              'MOV182 Pct Routine Referrals Seen in 30d',
+                                              'Var Target MOV182 Pct Routine Referrals Seen in 30d',
+                                              'Dir Var Target MOV182 Pct Routine Referrals Seen in 30d',
+                                              'Var MOV182 Pct Routine Referrals Seen in 30d',
+                                              'Dir Var MOV182 Pct Routine Referrals Seen in 30d',
+                                              'MOV364 Pct Routine Referrals Seen in 30d',
+                                              'Var Target MOV364 Pct Routine Referrals Seen in 30d',
+                                              'Dir Var Target MOV364 Pct Routine Referrals Seen in 30d',
+                                              'Var MOV364 Pct Routine Referrals Seen in 30d',
+                                              'Dir Var MOV364 Pct Routine Referrals Seen in 30d'])
+        values = measures_df.loc[0]
+
+        routine_ratio_3_month = v.half_up_int(float(values['MOV91 Pct Routine Referrals Seen in 30d']))
+        routine_variance_3_month = v.half_up_int(float(values['Var Target MOV91 Pct Routine Referrals Seen in 30d']))
+        routine_direction_3_month = values['Dir Var Target MOV91 Pct Routine Referrals Seen in 30d']
+        routine_improvement_3_month = v.half_up_int(float(values['Var MOV91 Pct Routine Referrals Seen in 30d']))
+        routine_improvement_dir_3_month = values['Dir Var MOV91 Pct Routine Referrals Seen in 30d']
+
+        routine_ratio_6_month = v.half_up_int(float(values['MOV182 Pct Routine Referrals Seen in 30d']))
+        routine_variance_6_month = v.half_up_int(float(values['Var Target MOV182 Pct Routine Referrals Seen in 30d']))
+        routine_direction_6_month = values['Dir Var Target MOV182 Pct Routine Referrals Seen in 30d']
+        routine_improvement_6_month = v.half_up_int(float(values['Var MOV182 Pct Routine Referrals Seen in 30d']))
+        routine_improvement_dir_6_month = values['Dir Var MOV182 Pct Routine Referrals Seen in 30d']
+
+        routine_ratio_12_month = v.half_up_int(float(values['MOV364 Pct Routine Referrals Seen in 30d']))
+        routine_variance_12_month = v.half_up_int(float(values['Var Target MOV364 Pct Routine Referrals Seen in 30d']))
+        routine_direction_12_month = values['Dir Var Target MOV364 Pct Routine Referrals Seen in 30d']
+        routine_improvement_12_month = v.half_up_int(float(values['Var MOV364 Pct Routine Referrals Seen in 30d']))
+        routine_improvement_dir_12_month = values['Dir Var MOV364 Pct Routine Referrals Seen in 30d']
 
         # Data driven labels
-        self._routine_ratio_3_month_plot.set_label_text(str(routine_ratio_3_month) + '%')
-        self._routine_variance_3_month_plot.set_label_text(str(routine_variance_3_month) + '%')
-        self._routine_direction_3_month_plot.set_label_text(str(routine_direction_3_month))
-        self._routine_improvement_dir_3_month_plot.set_label_text(str(routine_improvement_dir_3_month))
+        self._routine_ratio_3_month_plot.set_label_text(str(routine_ratio_3_month) + '%', label_data)
+        self._routine_variance_3_month_plot.set_label_text(str(routine_variance_3_month) + '%', label_data)
+        self._routine_direction_3_month_plot.set_label_text(str(routine_direction_3_month), label_data)
+        self._routine_improvement_dir_3_month_plot.set_label_text(str(routine_improvement_dir_3_month), label_data)
 
-        self._routine_ratio_6_month_plot.set_label_text(str(routine_ratio_6_month) + '%')
-        self._routine_variance_6_month_plot.set_label_text(str(routine_variance_6_month) + '%')
-        self._routine_direction_6_month_plot.set_label_text(str(routine_direction_6_month))
-        self._routine_improvement_dir_6_month_plot.set_label_text(str(routine_improvement_dir_6_month))
+        self._routine_ratio_6_month_plot.set_label_text(str(routine_ratio_6_month) + '%', label_data)
+        self._routine_variance_6_month_plot.set_label_text(str(routine_variance_6_month) + '%', label_data)
+        self._routine_direction_6_month_plot.set_label_text(str(routine_direction_6_month), label_data)
+        self._routine_improvement_dir_6_month_plot.set_label_text(str(routine_improvement_dir_6_month), label_data)
 
-        self._routine_ratio_12_month_plot.set_label_text(str(routine_ratio_12_month) + '%')
-        self._routine_variance_12_month_plot.set_label_text(str(routine_variance_12_month) + '%')
-        self._routine_direction_12_month_plot.set_label_text(str(routine_direction_12_month))
-        self._routine_improvement_dir_12_month_plot.set_label_text(str(routine_improvement_dir_12_month))
+        self._routine_ratio_12_month_plot.set_label_text(str(routine_ratio_12_month) + '%', label_data)
+        self._routine_variance_12_month_plot.set_label_text(str(routine_variance_12_month) + '%', label_data)
+        self._routine_direction_12_month_plot.set_label_text(str(routine_direction_12_month), label_data)
+        self._routine_improvement_dir_12_month_plot.set_label_text(str(routine_improvement_dir_12_month), label_data)
 
-        self._routine_ratio_target_plot.set_label_text(
-            str(int(self._routine_aim_plot.target_data['value'][0] * 100.0)) + '%')
+        self._routine_ratio_target_plot.set_label_text(str(int(target_data['value'][0] * 100.0)) + '%', label_data)
 
         # Data driven label styles
         if routine_variance_3_month < 0:
-            self._routine_direction_3_month_plot.set_label_style("table-data-direction-down")
+            self._routine_direction_3_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._routine_direction_3_month_plot.set_label_style("table-data-direction-up")
+            self._routine_direction_3_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if routine_improvement_3_month < 0:
-            self._routine_improvement_dir_3_month_plot.set_label_style("table-data-direction-down")
+            self._routine_improvement_dir_3_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._routine_improvement_dir_3_month_plot.set_label_style("table-data-direction-up")
+            self._routine_improvement_dir_3_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if routine_variance_6_month < 0:
-            self._routine_direction_6_month_plot.set_label_style("table-data-direction-down")
+            self._routine_direction_6_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._routine_direction_6_month_plot.set_label_style("table-data-direction-up")
+            self._routine_direction_6_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if routine_improvement_6_month < 0:
-            self._routine_improvement_dir_6_month_plot.set_label_style("table-data-direction-down")
+            self._routine_improvement_dir_6_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._routine_improvement_dir_6_month_plot.set_label_style("table-data-direction-up")
+            self._routine_improvement_dir_6_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if routine_variance_12_month < 0:
-            self._routine_direction_12_month_plot.set_label_style("table-data-direction-down")
+            self._routine_direction_12_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._routine_direction_12_month_plot.set_label_style("table-data-direction-up")
+            self._routine_direction_12_month_plot.set_label_style("table-data-direction-up", label_data)
 
         if routine_improvement_12_month < 0:
-            self._routine_improvement_dir_12_month_plot.set_label_style("table-data-direction-down")
+            self._routine_improvement_dir_12_month_plot.set_label_style("table-data-direction-down", label_data)
         else:
-            self._routine_improvement_dir_12_month_plot.set_label_style("table-data-direction-up")
+            self._routine_improvement_dir_12_month_plot.set_label_style("table-data-direction-up", label_data)
     # END update_routine_referral_process_aim
 
-    def _collect_referral_process_data(self, month: datetime) -> None:
+    def _collect_referral_process_data(self,
+                                       month: datetime,
+                                       clinic: str,
+                                       payload: dict,
+                                       label_data: dict) -> None:
         """
         Collects plot data for the clinic referral process milestones for all referrals.
         :param month: month of performance to visualize
+        :param clinic: the clinic to collect data for
+        :param payload: the render payload that plot payloads are added to
+        :param label_data: the label data that data driven labels are set in
         """
         # Data to calculate volume measures after 5 days
-        self._seen_histogram_plot.load_clinic_data(month, self.clinic)
-        self._seen_histogram_plot.create_plot_data()
+        payload['seen_histogram_plot'] = self._seen_histogram_plot.calculate_plot_payload(month, clinic)
 
         # Data for processing volume measures after 90 days
-        volume_values = self._process_volume_plot.volume_data['value']
+        volume_values = payload['process_volume_plot']['attributes']['volume_data']['value']
 
         # Processing rates
         if volume_values[0] > 0:
@@ -653,25 +630,97 @@ class ClinicProcessApp:
             ratio_completed = 0.0
 
         # Processing Time
-        accepted_days = v.half_up_int(
-            wt.get_clinic_rate_measure(wt.last_month, self.clinic, 'MOV28 Median Days to Accept'))
-        scheduled_days = (
-            v.half_up_int(wt.get_clinic_rate_measure(wt.last_month, self.clinic, 'MOV28 Median Days until Scheduled')))
-        completed_days = (
-            v.half_up_int(wt.get_clinic_rate_measure(wt.last_month, self.clinic, 'MOV28 Median Days until Completed')))
-        seen_days = (
-            v.half_up_int(wt.get_clinic_rate_measure(wt.last_month, self.clinic, 'MOV28 Median Days until Seen')))
+        measures_df = wt.get_clinic_measures(wt.last_month,
+                                             clinic,
+                                             ['MOV28 Median Days to Accept',
+                                              'MOV28 Median Days until Scheduled',
+                                              'MOV28 Median Days until Completed',
+                                              'MOV28 Median Days until Seen'])
+        accepted_days = v.half_up_int(float(measures_df.at[0, 'MOV28 Median Days to Accept']))
+        scheduled_days = v.half_up_int(float(measures_df.at[0, 'MOV28 Median Days until Scheduled']))
+        completed_days = v.half_up_int(float(measures_df.at[0, 'MOV28 Median Days until Completed']))
+        seen_days = v.half_up_int(float(measures_df.at[0, 'MOV28 Median Days until Seen']))
 
         # Data driven labels
-        self._all_accepted_rate_plot.set_label_text(str(v.half_up_int(ratio_accepted * 100.0)) + '%')
-        self._all_scheduled_rate_plot.set_label_text(str(v.half_up_int(ratio_scheduled * 100.0)) + '%')
-        self._all_completed_rate_plot.set_label_text(str(v.half_up_int(ratio_completed * 100.0)) + '%')
-        self._median_days_to_accepted_plot.set_label_text(str(accepted_days))
-        self._median_days_to_scheduled_plot.set_label_text(str(scheduled_days))
-        self._median_days_to_completed_plot.set_label_text(str(completed_days))
-        self._median_days_to_seen_plot.set_label_text(str(seen_days))
+        self._all_accepted_rate_plot.set_label_text(str(v.half_up_int(ratio_accepted * 100.0)) + '%', label_data)
+        self._all_scheduled_rate_plot.set_label_text(str(v.half_up_int(ratio_scheduled * 100.0)) + '%', label_data)
+        self._all_completed_rate_plot.set_label_text(str(v.half_up_int(ratio_completed * 100.0)) + '%', label_data)
+        self._median_days_to_accepted_plot.set_label_text(str(accepted_days), label_data)
+        self._median_days_to_scheduled_plot.set_label_text(str(scheduled_days), label_data)
+        self._median_days_to_completed_plot.set_label_text(str(completed_days), label_data)
+        self._median_days_to_seen_plot.set_label_text(str(seen_days), label_data)
     # END update_referral_process_measures
 
+    def _calculate_clinic_payload(self, clinic: str, month: datetime) -> dict:
+        """
+        Calculates the plot data and data driven labels of every clinic referral process visual for a clinic.
+        The model is read without changing the plots of this document, so this can run outside of the document lock.
+        :param clinic: the clinic to calculate the render payload of
+        :param month: month of performance to visualize
+        :return: the render payload of the clinic
+        """
+        payload = {}
+        label_data = self._label_data_source.create_label_data()
+        self._collect_referral_volume_plot_data(month, clinic, payload, label_data)
+        self._collect_seen_ratio_plot_data(month, clinic, payload, label_data)
+        self._collect_urgent_referral_process_aim_data(month, clinic, payload, label_data)
+        self._collect_routine_referral_process_aim_data(month, clinic, payload, label_data)
+        self._collect_referral_process_data(month, clinic, payload, label_data)
+        payload['label_data_source'] = rp.create_plot_payload({'label_data': label_data}, {})
+        return payload
+    # END calculate_clinic_payload
+
+    def _get_payload_plots(self) -> dict:
+        """Returns the plots with clinic data in the render payloads of this application by payload name."""
+        return {'label_data_source': self._label_data_source,
+                'urgent_seen_ratio_plot': self._urgent_seen_ratio_plot,
+                'routine_seen_ratio_plot': self._routine_seen_ratio_plot,
+                'all_seen_ratio_plot': self._all_seen_ratio_plot,
+                'urgent_volume_plot': self._urgent_volume_plot,
+                'routine_volume_plot': self._routine_volume_plot,
+                'all_volume_plot': self._all_volume_plot,
+                'process_volume_plot': self._process_volume_plot,
+                'urgent_aim_plot': self._urgent_aim_plot,
+                'routine_aim_plot': self._routine_aim_plot,
+                'seen_histogram_plot': self._seen_histogram_plot}
+    # END get_payload_plots
+
+    def _load_clinic_data(self, month: datetime) -> None:
+        """
+        Loads plot data and data driven labels for the selected clinic from the render payloads shared by
+        every session, collecting the data only when no session has shown the clinic for the month.
+        :param month: month of performance to visualize
+        """
+        rp.render_payloads.load(type(self).__name__, month, self.clinic, self._get_payload_plots(),
+                                lambda: self._calculate_clinic_payload(self.clinic, month))
+    # END load_clinic_data
+
+    def _get_clinic_payload(self, clinic: str, month: datetime) -> dict:
+        """
+        Returns the render payload of a clinic without changing the plots of this document, calculating it from
+        the model when no session has shown the clinic for the month.
+        :param clinic: the clinic to return the render payload of
+        :param month: month of performance to visualize
+        :return: the render payload of the clinic
+        """
+        return rp.render_payloads.get_payload(type(self).__name__, month, clinic,
+                                              lambda: self._calculate_clinic_payload(clinic, month))
+    # END get_clinic_payload
+
+    def _apply_clinic_payload(self, clinic: str, payload: dict) -> None:
+        """
+        Updates the plots of this document with the render payload of a selected clinic, unless another clinic
+        was selected while the payload was calculated.
+        :param clinic: the clinic of the render payload
+        :param payload: the render payload of the clinic
+        """
+        if clinic != self.clinic:
+            return
+        rp.render_payloads.set_payload(type(self).__name__, self._get_payload_plots(), payload)
+        self._update_referral_process_plot()
+        self._label_data_source.update_plot_data()
+    # END apply_clinic_payload
+
     def _update_referral_process_plot(self) -> None:
         """Updates plots for the clinic referral process milestones for all referrals."""
         self._seen_histogram_plot.update_plot()
@@ -685,19 +734,17 @@ class ClinicProcessApp:
     def _clinic_selection_handler(self, attr: str, old, new) -> None:
         """
         This function queries new data when the clinic selection changes. This function
-        signature matches the requirements for a Bokeh callback in Python.
+        signature matches the requirements for a Bokeh callback in Python.  The data is
+        collected in a worker thread and the plots are updated on a later tick.
         :param attr: Not used
         :param old: The previous clinic value before the selection changes
         :param new: The new clinic value after the selection changes
         """
         self.set_clinic(new)
-        self._collect_seen_ratio_plot_data(wt.last_month)
-        self._collect_referral_volume_plot_data(wt.last_month)
-        self._update_referral_process_plot()
-        self._collect_urgent_referral_process_aim_data(wt.last_month)
-        self._collect_routine_referral_process_aim_data(wt.last_month)
-        self._collect_referral_process_data(wt.last_month)
-        self._label_data_source.update_plot_data()
+        v.offload_clinic_selection(self.document,
+                                   self.snapshot,
+                                   lambda: self._get_clinic_payload(new, wt.last_month),
+                                   lambda payload: self._apply_clinic_payload(new, payload))
     # END clinic_selection_handler
 
     def insert_clinic_process_visuals(self) -> None:
@@ -712,11 +759,7 @@ class ClinicProcessApp:
             self.clinic = clinic
 
         # Add clinic referral process measure visuals to document
-        self._collect_referral_volume_plot_data(wt.last_month)
-        self._collect_seen_ratio_plot_data(wt.last_month)
-        self._collect_urgent_referral_process_aim_data(wt.last_month)
-        self._collect_routine_referral_process_aim_data(wt.last_month)
-        self._collect_referral_process_data(wt.last_month)
+        self._load_clinic_data(wt.last_month)
         self._add_plots()
 
         # Add a slicer for clinic name to document
@@ -756,5 +799,6 @@ def clinic_process_app_handler(doc: Document) -> None:
     :param doc: The Bokeh document to add content to
     """
     process_app = ClinicProcessApp(doc)
-    process_app.insert_clinic_process_visuals()
+    with sn.pinned(process_app.snapshot):
+        process_app.insert_clinic_process_visuals()
 # END clinic_process_app_handler
@@ -20,7 +20,9 @@ from datetime import date, datetime
 
 import model.ProcessTime as wt
 import model.PendingTime as p
+import model.Snapshot as sn
 import app.common as v
+import app.RenderPayloads as rp
 import app.plot.AgeDistributionPlot as adp
 import app.plot.CategoryBarsPlot as cbp
 
@@ -33,7 +35,7 @@ class PendingAgeDistributionPlot(adp.AgeDistributionPlot):
     Overrides plot.AgeDistributionPlot
 
     Public Methods:
-        load_clinic_data - Override - Loads the data used to render visualizations.
+        get_clinic_data - Override - Returns the data used to render visualizations.
     """
 
     def __init__(self,
@@ -67,11 +69,12 @@ class PendingAgeDistributionPlot(adp.AgeDistributionPlot):
                          include_curve)
     # END __init__
 
-    def load_clinic_data(self, month: datetime, clinic: str) -> None:
+    def get_clinic_data(self, month: datetime, clinic: str) -> dict:
         """
-        Loads the data used to render visualizations.
+        Returns the data used to render visualizations.
         :param month: The month to query data from
         :param clinic: The name of the clinic to query data for
+        :return: The pending referral counts of the clinic by age category
         """
 
         # Build list of distribution counts in same order as categories
@@ -80,8 +83,8 @@ class PendingAgeDistributionPlot(adp.AgeDistributionPlot):
             all_counts.append(p.get_count_by_age_category(clinic, self.category_measure, category))
 
         # Create a dataframe with the referral distribution data
-        self.distribution_data = {'category': self.categories, 'referral_count': all_counts}
-    # END load_clinic_data
+        return {'category': self.categories, 'referral_count': all_counts}
+    # END get_clinic_data
 # END CLASS PendingAgeDistributionPlot
 
 
@@ -95,6 +98,7 @@ class PendingReferralsApp:
         app_root - The route through the HTTP server that is the root of HTTP resource requests
         clinic - The currently selected clinic used to collect and render data
         document - The Bokeh document for an instance of this application
+        snapshot - The model snapshot that the session shows until the page is loaded again
         percentage_color_mapper - The gradient color mapper for process wait times
         age_category_color_mapper - The category color mapper for wait time bin backgrounds
         age_category_label_color_mapper - The category color mapper for wait time bin text
@@ -119,6 +123,7 @@ class PendingReferralsApp:
 
         self.clinic = 'Immunology'
         self.document = doc
+        self.snapshot = sn.get_snapshot()
         percentage_color_mapper, age_category_color_mapper, age_category_label_color_mapper = (
             v.create_color_mappers(v.HEAT_MAP_PALETTE, v.AGE_CATEGORY_COLOR_MAP, v.AGE_CATEGORY_LABEL_COLOR_MAP))
         self.percentage_color_mapper = percentage_color_mapper
@@ -173,165 +178,201 @@ class PendingReferralsApp:
 
     # Methods
 
-    def _add_on_hold_referral_measures(self, month: datetime) -> None:
+    def _collect_on_hold_referral_measures(self,
+                                           month: datetime,
+                                           clinic: str,
+                                           payload: dict) -> None:
         """
-        Collects and renders data showing the number of on hold referrals by reason.
+        Collects data showing the number of on hold referrals by reason.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param payload: The render payload that plot payloads are added to
         """
-        self._on_hold_category_plot.load_clinic_data(month, self.clinic)
-        self._on_hold_category_plot.create_plot_data()
-        self._on_hold_category_plot.add_plot()
-    # END add_on_hold_referral_measures
+        payload['on_hold_category_plot'] = self._on_hold_category_plot.calculate_plot_payload(month, clinic)
+    # END collect_on_hold_referral_measures
 
-    def _update_on_hold_referral_measures(self, month: datetime) -> None:
+    def _collect_on_hold_age_distribution(self,
+                                          month: datetime,
+                                          clinic: str,
+                                          payload: dict) -> None:
         """
-        Collects and updates data showing the number of on hold referrals by reason.
+        Collects data showing the number of on hold referrals by age category.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param payload: The render payload that plot payloads are added to
         """
-        self._on_hold_category_plot.load_clinic_data(month, self.clinic)
-        self._on_hold_category_plot.create_plot_data()
-        self._on_hold_category_plot.update_plot()
-    # END update_on_hold_referral_measures
+        payload['on_hold_distribution_plot'] = self._on_hold_distribution_plot.calculate_plot_payload(month, clinic)
+    # END collect_on_hold_age_distribution
 
-    def _add_on_hold_age_distribution(self, month: datetime) -> None:
+    def _collect_pending_reschedule_referral_measures(self,
+                                                      month: datetime,
+                                                      clinic: str,
+                                                      payload: dict) -> None:
         """
-        Collects and renders data showing the number of on hold referrals by age category.
+        Collects data showing the number of referrals pending reschedule by queue sub-status.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param payload: The render payload that plot payloads are added to
         """
-        self._on_hold_distribution_plot.load_clinic_data(month, self.clinic)
-        self._on_hold_distribution_plot.create_plot_data()
-        self._on_hold_distribution_plot.add_plot()
-    # END add_on_hold_age_distribution
+        payload['reschedule_category_plot'] = self._reschedule_category_plot.calculate_plot_payload(month, clinic)
+    # END collect_pending_reschedule_referral_measures
 
-    def _update_on_hold_age_distribution(self, month: datetime) -> None:
+    def _collect_pending_reschedule_age_distribution(self,
+                                                     month: datetime,
+                                                     clinic: str,
+                                                     payload: dict) -> None:
         """
-        Collects and updates data showing the number of on hold referrals by age category.
+        Collects data showing the number of referrals pending reschedule by age category.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param payload: The render payload that plot payloads are added to
         """
-        self._on_hold_distribution_plot.load_clinic_data(month, self.clinic)
-        self._on_hold_distribution_plot.create_plot_data()
-        self._on_hold_distribution_plot.update_plot()
-    # END update_on_hold_age_distribution
+        payload['reschedule_distribution_plot'] = (
+            self._reschedule_distribution_plot.calculate_plot_payload(month, clinic))
+    # END collect_pending_reschedule_age_distribution
 
-    def _add_pending_reschedule_referral_measures(self, month: datetime) -> None:
+    def _collect_pending_acceptance_referral_measures(self,
+                                                      month: datetime,
+                                                      clinic: str,
+                                                      payload: dict) -> None:
         """
-        Collects and renders data showing the number of referrals pending reschedule by queue sub-status.
+        Collects data showing the number of referrals pending acceptance by queue sub-status.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param payload: The render payload that plot payloads are added to
         """
-        self._reschedule_category_plot.load_clinic_data(month, self.clinic)
-        self._reschedule_category_plot.create_plot_data()
-        self._reschedule_category_plot.add_plot()
-    # END add_pending_reschedule_referral_measures
+        payload['pending_category_plot'] = self._pending_category_plot.calculate_plot_payload(month, clinic)
+    # END collect_pending_acceptance_referral_measures
 
-    def _update_pending_reschedule_referral_measures(self, month: datetime) -> None:
+    def _collect_pending_acceptance_age_distribution(self,
+                                                     month: datetime,
+                                                     clinic: str,
+                                                     payload: dict) -> None:
         """
-        Collects and updates data showing the number of referrals pending reschedule by queue sub-status.
+        Collects data showing the number of referrals pending acceptance by age category.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param payload: The render payload that plot payloads are added to
         """
-        self._reschedule_category_plot.load_clinic_data(month, self.clinic)
-        self._reschedule_category_plot.create_plot_data()
-        self._reschedule_category_plot.update_plot()
-    # END add_pending_reschedule_referral_measures
+        payload['pending_distribution_plot'] = self._pending_distribution_plot.calculate_plot_payload(month, clinic)
+    # END collect_pending_acceptance_age_distribution
 
-    def _add_pending_reschedule_age_distribution(self, month: datetime) -> None:
+    def _collect_accepted_status_referral_measures(self,
+                                                   month: datetime,
+                                                   clinic: str,
+                                                   payload: dict) -> None:
         """
-        Collects and renders data showing the number of referrals pending reschedule by age category.
+        Collects data showing the number of referrals in accepted status by queue sub-status.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param payload: The render payload that plot payloads are added to
         """
-        self._reschedule_distribution_plot.load_clinic_data(month, self.clinic)
-        self._reschedule_distribution_plot.create_plot_data()
-        self._reschedule_distribution_plot.add_plot()
-    # END add_pending_reschedule_age_distribution
+        payload['accepted_category_plot'] = self._accepted_category_plot.calculate_plot_payload(month, clinic)
+    # END collect_accepted_status_referral_measures
 
-    def _update_pending_reschedule_age_distribution(self, month: datetime) -> None:
+    def _collect_accepted_status_age_distribution(self,
+                                                  month: datetime,
+                                                  clinic: str,
+                                                  payload: dict) -> None:
         """
-        Collects and updates data showing the number of referrals pending reschedule by age category.
+        Collects data showing the number of referrals in accepted status by age category.
         :param month: The month to query data in
+        :param clinic: The name of the clinic to query data for
+        :param payload: The render payload that plot payloads are added to
         """
-        self._reschedule_distribution_plot.load_clinic_data(month, self.clinic)
-        self._reschedule_distribution_plot.create_plot_data()
-        self._reschedule_distribution_plot.update_plot()
-    # END update_pending_reschedule_age_distribution
+        payload['accepted_distribution_plot'] = self._accepted_distribution_plot.calculate_plot_payload(month, clinic)
+    # END collect_accepted_status_age_distribution
 
-    def _add_pending_acceptance_referral_measures(self, month: datetime) -> None:
+    def _calculate_clinic_payload(self, clinic: str, month: datetime) -> dict:
         """
-        Collects and renders data showing the number of referrals pending acceptance by queue sub-status.
+        Calculates the data of every pending referral visual for a clinic.  The model is read without changing
+        the plots of this document, so this can run outside of the document lock.
+        :param clinic: the clinic to calculate the render payload of
         :param month: The month to query data in
-        """
-        self._pending_category_plot.load_clinic_data(month, self.clinic)
-        self._pending_category_plot.create_plot_data()
-        self._pending_category_plot.add_plot()
-    # END add_pending_acceptance_referral_measures
-
-    def _update_pending_acceptance_referral_measures(self, month: datetime) -> None:
-        """
-        Collects and updates data showing the number of referrals pending acceptance by queue sub-status.
+        :return: the render payload of the clinic
+        """
+        payload = {}
+        self._collect_on_hold_referral_measures(month, clinic, payload)
+        self._collect_on_hold_age_distribution(month, clinic, payload)
+        self._collect_pending_reschedule_referral_measures(month, clinic, payload)
+        self._collect_pending_reschedule_age_distribution(month, clinic, payload)
+        self._collect_pending_acceptance_referral_measures(month, clinic, payload)
+        self._collect_pending_acceptance_age_distribution(month, clinic, payload)
+        self._collect_accepted_status_referral_measures(month, clinic, payload)
+        self._collect_accepted_status_age_distribution(month, clinic, payload)
+        return payload
+    # END calculate_clinic_payload
+
+    def _get_payload_plots(self) -> dict:
+        """Returns the plots with clinic data in the render payloads of this application by payload name."""
+        return {'on_hold_category_plot': self._on_hold_category_plot,
+                'on_hold_distribution_plot': self._on_hold_distribution_plot,
+                'reschedule_category_plot': self._reschedule_category_plot,
+                'reschedule_distribution_plot': self._reschedule_distribution_plot,
+                'pending_category_plot': self._pending_category_plot,
+                'pending_distribution_plot': self._pending_distribution_plot,
+                'accepted_category_plot': self._accepted_category_plot,
+                'accepted_distribution_plot': self._accepted_distribution_plot}
+    # END get_payload_plots
+
+    def _load_clinic_data(self, month: datetime) -> None:
+        """
+        Loads data for the selected clinic from the render payloads shared by every session, collecting the
+        data only when no session has shown the clinic for the month.
         :param month: The month to query data in
         """
-        self._pending_category_plot.load_clinic_data(month, self.clinic)
-        self._pending_category_plot.create_plot_data()
-        self._pending_category_plot.update_plot()
-    # END update_pending_acceptance_referral_measures
+        rp.render_payloads.load(type(self).__name__, month, self.clinic, self._get_payload_plots(),
+                                lambda: self._calculate_clinic_payload(self.clinic, month))
+    # END load_clinic_data
 
-    def _add_pending_acceptance_age_distribution(self, month: datetime) -> None:
-        """
-        Collects and renders data showing the number of referrals pending acceptance by age category.
-        :param month: The month to query data in
-        """
-        self._pending_distribution_plot.load_clinic_data(month, self.clinic)
-        self._pending_distribution_plot.create_plot_data()
+    def _add_plots(self) -> None:
+        """Adds plots of pending referral counts and ages to the Bokeh document."""
+        self._on_hold_category_plot.add_plot()
+        self._on_hold_distribution_plot.add_plot()
+        self._reschedule_category_plot.add_plot()
+        self._reschedule_distribution_plot.add_plot()
+        self._pending_category_plot.add_plot()
         self._pending_distribution_plot.add_plot()
-    # END add_pending_acceptance_age_distribution
-
-    def _update_pending_acceptance_age_distribution(self, month: datetime) -> None:
-        """
-        Collects and updates data showing the number of referrals pending acceptance by age category.
-        :param month: The month to query data in
-        """
-        self._pending_distribution_plot.load_clinic_data(month, self.clinic)
-        self._pending_distribution_plot.create_plot_data()
-        self._pending_distribution_plot.update_plot()
-    # END update_pending_acceptance_age_distribution
-
-    def _add_accepted_status_referral_measures(self, month: datetime) -> None:
-        """
-        Collects and renders data showing the number of referrals in accepted status by queue sub-status.
-        :param month: The month to query data in
-        """
-        self._accepted_category_plot.load_clinic_data(month, self.clinic)
-        self._accepted_category_plot.create_plot_data()
         self._accepted_category_plot.add_plot()
-    # END add_accepted_status_referral_measures
+        self._accepted_distribution_plot.add_plot()
+    # END add_plots
 
-    def _update_accepted_status_referral_measures(self, month: datetime) -> None:
-        """
-        Collects and updates data showing the number of referrals in accepted status by queue sub-status.
-        :param month: The month to query data in
-        """
-        self._accepted_category_plot.load_clinic_data(month, self.clinic)
-        self._accepted_category_plot.create_plot_data()
+    def _update_plots(self) -> None:
+        """Updates plots of pending referral counts and ages in the Bokeh document."""
+        self._accepted_distribution_plot.update_plot()
         self._accepted_category_plot.update_plot()
-    # END update_accepted_status_referral_measures
+        self._pending_distribution_plot.update_plot()
+        self._pending_category_plot.update_plot()
+        self._reschedule_distribution_plot.update_plot()
+        self._reschedule_category_plot.update_plot()
+        self._on_hold_distribution_plot.update_plot()
+        self._on_hold_category_plot.update_plot()
+    # END update_plots
 
-    def _add_accepted_status_age_distribution(self, month: datetime) -> None:
+    def _get_clinic_payload(self, clinic: str, month: datetime) -> dict:
         """
-        Collects and renders data showing the number of referrals in accepted status by age category.
+        Returns the render payload of a clinic without changing the plots of this document, calculating it from
+        the model when no session has shown the clinic for the month.
+        :param clinic: the clinic to return the render payload of
         :param month: The month to query data in
+        :return: the render payload of the clinic
         """
-        self._accepted_distribution_plot.load_clinic_data(month, self.clinic)
-        self._accepted_distribution_plot.create_plot_data()
-        self._accepted_distribution_plot.add_plot()
-    # END add_accepted_status_age_distribution
+        return rp.render_payloads.get_payload(type(self).__name__, month, clinic,
+                                              lambda: self._calculate_clinic_payload(clinic, month))
+    # END get_clinic_payload
 
-    def _update_accepted_status_age_distribution(self, month: datetime) -> None:
+    def _apply_clinic_payload(self, clinic: str, payload: dict) -> None:
         """
-        Collects and updates data showing the number of referrals in accepted status by age category.
-        :param month: The month to query data in
+        Updates the plots of this document with the render payload of a selected clinic, unless another clinic
+        was selected while the payload was calculated.
+        :param clinic: the clinic of the render payload
+        :param payload: the render payload of the clinic
         """
-        self._accepted_distribution_plot.load_clinic_data(month, self.clinic)
-        self._accepted_distribution_plot.create_plot_data()
-        self._accepted_distribution_plot.update_plot()
-    # END update_accepted_status_age_distribution
+        if clinic != self.clinic:
+            return
+        rp.render_payloads.set_payload(type(self).__name__, self._get_payload_plots(), payload)
+        self._update_plots()
+    # END apply_clinic_payload
 
     def set_clinic(self, clinic: str) -> None:
         """Sets the currently selected clinic."""
@@ -341,20 +382,17 @@ class PendingReferralsApp:
     def _clinic_selection_handler(self, attr: str, old, new) -> None:
         """
         This function queries new data when the clinic selection changes. This function
-        signature matches the requirements for a Bokeh callback in Python.
+        signature matches the requirements for a Bokeh callback in Python.  The data is
+        collected in a worker thread and the plots are updated on a later tick.
         :param attr: Not used
         :param old: The previous clinic value before the selection changes
         :param new: The new clinic value after the selection changes
         """
         self.set_clinic(new)
-        self._update_accepted_status_age_distribution(wt.last_month)
-        self._update_accepted_status_referral_measures(wt.last_month)
-        self._update_pending_acceptance_age_distribution(wt.last_month)
-        self._update_pending_acceptance_referral_measures(wt.last_month)
-        self._update_pending_reschedule_age_distribution(wt.last_month)
-        self._update_pending_reschedule_referral_measures(wt.last_month)
-        self._update_on_hold_age_distribution(wt.last_month)
-        self._update_on_hold_referral_measures(wt.last_month)
+        v.offload_clinic_selection(self.document,
+                                   self.snapshot,
+                                   lambda: self._get_clinic_payload(new, p.last_month),
+                                   lambda payload: self._apply_clinic_payload(new, payload))
     # END clinic_selection_handler
 
     def insert_pending_referrals_visuals(self) -> None:
@@ -368,14 +406,8 @@ class PendingReferralsApp:
         if len(clinic) > 0:
             self.clinic = clinic
 
-        self._add_on_hold_referral_measures(p.last_month)
-        self._add_on_hold_age_distribution(p.last_month)
-        self._add_pending_reschedule_referral_measures(p.last_month)
-        self._add_pending_reschedule_age_distribution(p.last_month)
-        self._add_pending_acceptance_referral_measures(p.last_month)
-        self._add_pending_acceptance_age_distribution(p.last_month)
-        self._add_accepted_status_referral_measures(p.last_month)
-        self._add_accepted_status_age_distribution(p.last_month)
+        self._load_clinic_data(p.last_month)
+        self._add_plots()
         v.add_clinic_slicer(self.document, wt.last_month, self.clinic, self._clinic_selection_handler)
 
         # The Bokeh application handlers pass this text through to the HTML page title
@@ -408,5 +440,6 @@ def pending_referrals_app_handler(doc: Document) -> None:
     :param doc: The Bokeh document to add content to
     """
     pending_app = PendingReferralsApp(doc)
-    pending_app.insert_pending_referrals_visuals()
+    with sn.pinned(pending_app.snapshot):
+        pending_app.insert_pending_referrals_visuals()
 # END pending_referrals_app_handler
@@ -0,0 +1,210 @@
+"""
+RenderPayloads.py
+Provides a process-wide cache of the clinic data that the Bokeh applications render.  A render payload holds the
+clinic data attributes of every plot in an application and the columns of their Bokeh data sources.  The payload
+of an application, month, and clinic is calculated from the model by the first session that shows it, without
+creating Bokeh models, and later sessions and clinic selections copy the prepared data into their own documents.
+Code that runs on the Tornado IOLoop thread never waits for a payload that another thread is calculating, since
+every session of the process would stall.
+https://907sjl.github.io/
+
+Classes:
+    RenderPayloadCache - Least recently used cache of render payloads by app, month, clinic, and data snapshot
+
+Functions:
+    create_plot_payload - Returns the payload of a plot from its clinic data attributes and data source columns
+    set_plot_payload - Sets the clinic data attributes of a plot and creates or updates its data sources
+
+Top-Level Variables:
+    render_payloads - The cache of render payloads shared by every session in this process
+"""
+
+from bokeh.models import ColumnDataSource
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from threading import Lock
+from typing import Callable
+
+import pandas as pd
+
+import model.ProcessTime as wt
+from model.Timing import timed
+
+
+# Maximum number of render payloads kept in the cache
+_PAYLOAD_CAPACITY = 512
+
+
+def create_plot_payload(attributes: dict, sources: dict[str, str]) -> dict:
+    """
+    Returns the payload of a plot from the clinic data attributes that the plot calculated, with the columns of
+    each of its data sources taken from the attribute that the source is filled from.
+    :param attributes: the clinic data attribute values of the plot by attribute name
+    :param sources: names of the data source attributes with the name of the attribute each source is filled from
+    :return: a dictionary with the attribute values and the data source columns
+    """
+    columns = {}
+    for source, attribute in sources.items():
+        data = attributes[attribute]
+        columns[source] = ColumnDataSource.from_df(data) if isinstance(data, pd.DataFrame) else dict(data)
+    return {'attributes': attributes, 'columns': columns}
+# END create_plot_payload
+
+
+def set_plot_payload(plot: object, payload: dict) -> None:
+    """
+    Sets the clinic data attributes of a plot from a payload and creates or updates its data sources with
+    copies of the payload columns, so that no document shares a data source or a dictionary with another.
+    :param plot: the plot to set the clinic data of
+    :param payload: a payload calculated by a plot of the same configuration
+    """
+    for attribute, value in payload['attributes'].items():
+        setattr(plot, attribute, dict(value) if isinstance(value, dict) else value)
+
+    for source, columns in payload['columns'].items():
+        if getattr(plot, source) is None:
+            setattr(plot, source, ColumnDataSource(data=dict(columns)))
+        else:
+            getattr(plot, source).data = dict(columns)
+# END set_plot_payload
+
+
+class RenderPayloadCache:
+    """
+    Class that holds the render payloads of applications by application, month, clinic, and the key of the
+    measure data snapshot, so that payloads of earlier data are never served.  The least recently used payload
+    is evicted when more than the given number of payloads are cached.  A payload is calculated once even when
+    several clinic selections request it at the same time, since worker threads that request a payload that is
+    being calculated wait for the calculation and share its payload.  Sessions that load a payload on the IOLoop
+    thread calculate it themselves instead of waiting.
+
+    Public Attributes:
+        capacity - The maximum number of payloads kept in the cache
+
+    Public Methods:
+        get_payload - Returns the payload of an application, month, and clinic, calculating it on first request
+        set_payload - Copies a payload into the plots of an application
+        load - Copies the payload of an application, month, and clinic into its plots without waiting on threads
+        clear - Removes every payload
+    """
+
+    def __init__(self, capacity: int = _PAYLOAD_CAPACITY):
+        """
+        Initialize instances with no payloads.
+        :param capacity: the maximum number of payloads kept in the cache
+        """
+        self.capacity = max(capacity, 1)
+        self._payloads = OrderedDict()
+        self._calculations = {}
+        self._lock = Lock()
+    # END __init__
+
+    def get_payload(self,
+                    app_name: str,
+                    month: datetime,
+                    clinic: str,
+                    calculate_payload: Callable[[], dict],
+                    wait: bool = True) -> dict:
+        """
+        Returns the render payload of an application, month, and clinic, calculating it on first request.  The
+        payload is calculated without the lock of the cache, so this can run outside of the Bokeh document lock.
+        A request for a payload that another thread is calculating waits for the calculation, and a calculation
+        that fails raises its exception in every thread waiting for it.  When waiting is not allowed the payload
+        is calculated again by this request, and the payload of whichever calculation finishes first is cached.
+        :param app_name: the name of the application
+        :param month: the month of the clinic data
+        :param clinic: the name of the clinic
+        :param calculate_payload: function that calculates the payload from the model
+        :param wait: False to calculate a payload that another thread is calculating instead of waiting for it
+        :return: the render payload, which must not be changed
+        """
+        key = (app_name, month, clinic, wt.get_snapshot_key())
+        with self._lock:
+            payload = self._payloads.get(key)
+            if payload is not None:
+                self._payloads.move_to_end(key)
+                return payload
+            calculation = self._calculations.get(key)
+            waiting = calculation is not None
+            if not waiting:
+                calculation = self._calculations[key] = Future()
+
+        if waiting and wait:
+            with timed('render-payload/' + app_name + '/wait'):
+                return calculation.result()
+        if waiting:
+            with timed('render-payload/' + app_name + '/calculate'):
+                payload = calculate_payload()
+            with self._lock:
+                self._payloads.setdefault(key, payload)
+                self._payloads.move_to_end(key)
+                while len(self._payloads) > self.capacity:
+                    self._payloads.popitem(last=False)
+            return payload
+
+        try:
+            with timed('render-payload/' + app_name + '/calculate'):
+                payload = calculate_payload()
+        except BaseException as error:
+            with self._lock:
+                del self._calculations[key]
+            calculation.set_exception(error)
+            raise
+
+        # The payload is cached before the calculation is removed so that no request calculates it again
+        with self._lock:
+            self._payloads[key] = payload
+            self._payloads.move_to_end(key)
+            while len(self._payloads) > self.capacity:
+                self._payloads.popitem(last=False)
+            del self._calculations[key]
+        calculation.set_result(payload)
+        return payload
+    # END get_payload
+
+    @staticmethod
+    def set_payload(app_name: str, plots: dict[str, object], payload: dict) -> None:
+        """
+        Copies a render payload into the plots of an application.
+        :param app_name: the name of the application
+        :param plots: the plots of the application by a name that is unique within the application
+        :param payload: the render payload of the application
+        """
+        with timed('render-payload/' + app_name + '/copy'):
+            for name, plot in plots.items():
+                plot.set_plot_payload(payload[name])
+    # END set_payload
+
+    def load(self,
+             app_name: str,
+             month: datetime,
+             clinic: str,
+             plots: dict[str, object],
+             calculate_payload: Callable[[], dict]) -> None:
+        """
+        Copies the render payload of an application, month, and clinic into the plots of the application,
+        calculating the payload on first request.  A payload that another thread is calculating is calculated
+        again instead of waited for, because this runs on the IOLoop thread with the document lock held and must
+        not wait for other threads.
+        :param app_name: the name of the application
+        :param month: the month of the clinic data
+        :param clinic: the name of the clinic
+        :param plots: the plots of the application by a name that is unique within the application
+        :param calculate_payload: function that calculates the payload from the model
+        """
+        self.set_payload(app_name, plots, self.get_payload(app_name, month, clinic, calculate_payload, wait=False))
+    # END load
+
+    def clear(self) -> None:
+        """Removes every payload."""
+        with self._lock:
+            self._payloads.clear()
+    # END clear
+# END CLASS RenderPayloadCache
+
+
+# MAIN
+
+render_payloads = RenderPayloadCache()
@@ -37,12 +37,6 @@ class RoutinePerformanceApp:
 
     # Class level properties
 
-    # Routine referral performance data pre-sorted by clinic name
-    clinics = wt.clinic_measures[wt.last_month].copy()
-    clinics.sort_values(by='Clinic', ascending=True, inplace=True)
-    clinics.reset_index(drop=True, inplace=True)
-    clinics = clinics.loc[clinics['Clinic'] != '*ALL*']
-
     # App page configuration
     app_title = 'Routine Referral Performance'
     app_template = 'routine.html'
@@ -56,6 +50,9 @@ class RoutinePerformanceApp:
         """
         self.document = doc
 
+        # Performance data of the model snapshot that this document renders, pre-sorted by clinic name
+        self.clinics = v.get_clinic_performance_data(wt.last_month)
+
     # Methods
 
     def insert_routine_performance_data(self) -> None:
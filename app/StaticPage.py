@@ -0,0 +1,121 @@
+"""
+StaticPage.py
+Renders Bokeh application pages that have no Bokeh models into static HTML.  The all-clinic summary pages only
+fill Jinja2 template variables, so each page is rendered once per data snapshot and day and the HTML is served
+without a Bokeh session or websocket.
+https://907sjl.github.io/
+
+Classes:
+    StaticPage - A page rendered from a Bokeh application handler into cached HTML bytes
+
+Functions:
+    write_static_page - Answers an HTTP request with the HTML of a page, or with no content if the client has it
+"""
+
+from bokeh.core.templates import FILE, MACROS
+from bokeh.document import Document
+from tornado.web import RequestHandler
+
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Callable
+
+import hashlib
+
+import model.ProcessTime as wt
+import model.Snapshot as sn
+from model.Timing import timed
+
+
+class StaticPage:
+    """
+    Class that renders the document of a Bokeh application handler into HTML with the Jinja2 template and template
+    variables that the handler sets.  The rendered HTML is kept until the data snapshot or the day changes, since
+    the pages show the current date.
+
+    Public Attributes:
+        path - The route through the HTTP server that serves the page
+        app_handler - The Bokeh application handler function that fills a document for the page
+
+    Public Methods:
+        get_page - Returns the HTML of the page with its entity tag and time of last modification
+    """
+
+    def __init__(self, path: str, app_handler: Callable[[Document], None]):
+        """
+        Initialize instances with no rendered HTML.
+        :param path: the route through the HTTP server that serves the page
+        :param app_handler: the Bokeh application handler function that fills a document for the page
+        """
+        self.path = path
+        self.app_handler = app_handler
+        self._page_key = None
+        self._page = None
+        self._lock = Lock()
+    # END __init__
+
+    def _render(self) -> bytes:
+        """Returns the HTML of a new document filled by the application handler."""
+        doc = Document()
+        self.app_handler(doc)
+
+        # The pages have no Bokeh models, so the base Bokeh template is rendered without BokehJS or a plot script
+        context = dict(doc.template_variables)
+        context.update(title=doc.title,
+                       bokeh_js=None,
+                       bokeh_css=None,
+                       plot_script='',
+                       docs=[],
+                       base=FILE,
+                       macros=MACROS)
+        return doc.template.render(context).encode('utf-8')
+    # END render
+
+    def get_page(self) -> (bytes, str, datetime):
+        """
+        Returns the HTML of the page, rendering it first when the data snapshot or day changed since it was
+        last rendered.  The page is rendered from the model snapshot that its key was taken from.
+        :return: the HTML bytes, the entity tag of the HTML, and the time the HTML was rendered in UTC
+        """
+        snapshot = sn.get_snapshot()
+        with sn.pinned(snapshot):
+            page_key = (wt.get_snapshot_key(), date.today())
+        with self._lock:
+            if self._page_key != page_key:
+                with timed('static-render' + self.path), sn.pinned(snapshot):
+                    html = self._render()
+                self._page = (html,
+                              '"' + hashlib.sha1(html).hexdigest() + '"',
+                              datetime.now(timezone.utc).replace(microsecond=0))
+                self._page_key = page_key
+            return self._page
+    # END get_page
+# END CLASS StaticPage
+
+
+def write_static_page(handler: RequestHandler, page: StaticPage) -> None:
+    """
+    Answers an HTTP request with the HTML of a page, or with status 304 and no content when the entity tag or the
+    modification time in the conditional headers of the request shows that the client has the current page.  An
+    If-None-Match header is checked instead of an If-Modified-Since header when a request has both.
+    :param handler: the Tornado request handler of the request
+    :param page: the page to answer with
+    """
+    html, etag, last_modified = page.get_page()
+    handler.set_header('Etag', etag)
+    handler.set_header('Last-Modified', last_modified)
+    handler.set_header('Cache-Control', 'no-cache')
+    if handler.request.headers.get('If-None-Match') is not None:
+        not_modified = handler.check_etag_header()
+    else:
+        try:
+            not_modified = parsedate_to_datetime(handler.request.headers['If-Modified-Since']) >= last_modified
+        except (KeyError, TypeError, ValueError):
+            not_modified = False
+    if not_modified:
+        handler.set_status(304)
+        return
+    handler.set_header('Content-Type', 'text/html; charset=UTF-8')
+    handler.write(html)
+# END write_static_page
@@ -8,8 +8,10 @@ Modules:
     common.py - Utility functions used across multiple apps
     CRMUsageApp.py - Measures that show the relative use of the Clinic Referral Management system vs. the schedule book
     PendingReferralsApp.py - Measures the number of referrals pending an appointment with their ages in days pending
+    RenderPayloads.py - Process-wide cache of the clinic data that app plots render, shared across sessions
     RoutinePerformanceApp.py - Process aim performance for routine referrals measured across all clinics
     ScheduleTimesApp.py - Median time to schedule referrals for appointments measured across all clinics
     SeenTimesApp.py - Median time to see referred patients measured across all clinics
+    StaticPage.py - Renders app pages without Bokeh models into HTML that is cached per data snapshot
     UrgentPerformanceApp.py - Process aim performance for urgent referrals measured across all clinics
 """
\ No newline at end of file
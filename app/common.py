@@ -13,18 +13,27 @@ Public Functions:
     create_color_mappers - Creates unique color mapper Bokeh instances, Bokeh requires unique instances per document
     add_clinic_slicer - Creates a drop-down widget within a given document containing clinic names
     get_clinic_from_request - Parses the HTTP request and cookies to identify the last selected clinic
+    offload_clinic_selection - Calculates clinic data in a worker thread and applies it to a document on the next tick
+    get_clinic_performance_data - Returns the measures of every clinic for a month sorted by clinic name
 """
 
-from bokeh.document import Document
+from bokeh.document import Document, without_document_lock
 from bokeh.models import Select
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
+from tornado.ioloop import IOLoop
+from typing import Callable
+
+from pandas import DataFrame
 
 from bokeh.core.property.vectorization import Field
 from bokeh.models import LinearColorMapper, CustomJS
 from bokeh.transform import factor_cmap
 
 import model.ProcessTime as wt
+import model.Snapshot as sn
 
 
 # reverse heat map color palette
@@ -45,6 +54,10 @@ AGE_CATEGORY_LABEL_COLOR_MAP = {'7d': '#000000',
                                 '90d': '#000000',
                                 '>90d': '#FFFFFF'}
 
+# Threads that calculate clinic data for clinic selections without holding the lock of a Bokeh document
+_CLINIC_DATA_THREADS = 4
+_clinic_data_executor = ThreadPoolExecutor(max_workers=_CLINIC_DATA_THREADS, thread_name_prefix='clinic-data')
+
 
 def half_up_int(value: float) -> int:
     """
@@ -139,3 +152,58 @@ def get_clinic_from_request(doc: Document) -> str:
 
     return ''
 # END get_clinic_from_request
+
+
+def offload_clinic_selection(doc: Document,
+                             snapshot: sn.ModelSnapshot,
+                             calculate: Callable[[], object],
+                             apply: Callable[[object], None]) -> None:
+    """
+    Calculates clinic data for a clinic selection in a worker thread and applies it to a document on the next
+    tick.  The calculation runs without the document lock so that the Tornado IOLoop keeps serving every other
+    session, and only the short apply function changes Bokeh models while holding the document lock.  Both
+    functions read the model snapshot of the session, since worker threads do not inherit a pinned snapshot.
+    An exception raised by the calculation is raised again by a next tick callback of the document, so it is
+    reported for the session like an exception raised by a clinic selection handler that runs in the session.
+    :param doc: The document of the session that selected the clinic
+    :param snapshot: The model snapshot that the session shows
+    :param calculate: The function that returns the clinic data without changing any model in the document
+    :param apply: The function that changes the models in the document with the clinic data
+    """
+
+    def calculate_pinned() -> object:
+        with sn.pinned(snapshot):
+            return calculate()
+
+    def apply_pinned(result: object) -> None:
+        with sn.pinned(snapshot):
+            apply(result)
+
+    def raise_error(error: Exception) -> None:
+        raise error
+
+    @without_document_lock
+    async def calculate_unlocked():
+        try:
+            result = await IOLoop.current().run_in_executor(_clinic_data_executor, calculate_pinned)
+        except Exception as error:
+            doc.add_next_tick_callback(partial(raise_error, error))
+            return
+        doc.add_next_tick_callback(partial(apply_pinned, result))
+
+    doc.add_next_tick_callback(calculate_unlocked)
+# END offload_clinic_selection
+
+
+def get_clinic_performance_data(report_month: datetime) -> DataFrame:
+    """
+    Returns the measures of every clinic for a month sorted by clinic name and without the row of all clinics.
+    The measures are read from the model snapshot of the caller, so a static page rendered for a new snapshot
+    lists the clinics of that snapshot.
+    :param report_month: The month of the measures
+    :return: A data frame with one row of measures per clinic
+    """
+    clinics = wt.clinic_measures[report_month].sort_values(by='Clinic', ascending=True)
+    clinics.reset_index(drop=True, inplace=True)
+    return clinics.loc[clinics['Clinic'] != '*ALL*']
+# END get_clinic_performance_data
@@ -9,7 +9,6 @@ Classes:
 
 from bokeh.document import Document
 from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource
 from bokeh.models.ranges import FactorRange, Range1d
 from bokeh.models.annotations import HTMLLabelSet
 from bokeh.core.property.vectorization import Field
@@ -19,7 +18,9 @@ import pandas as pd
 from datetime import datetime
 
 import model.ProcessTime as wt
+import model.source.Referrals as r
 import app.common as v
+import app.RenderPayloads as rp
 
 
 class AgeDistributionPlot:
@@ -27,8 +28,9 @@ class AgeDistributionPlot:
     Class that adds a histogram of referrals by age category bins to a Bokeh document
 
     Public Methods:
-        load_clinic_data - Loads the data used to render visualizations.
-        create_plot_data - Creates or updates the Bokeh ColumnDataSource using the clinic data collected.
+        get_clinic_data - Returns the data used to render visualizations.
+        calculate_plot_payload - Calculates the clinic data and data source columns without changing the plot.
+        set_plot_payload - Sets the clinic data and data sources from a shared payload.
         add_plot - Creates the figure and models that render the visual.
         update_plot - Updates the y-axis range using the most recently updated data.
     """
@@ -42,7 +44,8 @@ class AgeDistributionPlot:
                  data_point_color_map: Field,
                  plot_width: int = 500,
                  plot_height: int = 180,
-                 include_curve: bool = False):
+                 include_curve: bool = False,
+                 age_category_bins: dict = r.AGE_CATEGORY_BINS):
         """
         Initialize instances.
         :param doc: The Bokeh document for an instance of this application
@@ -53,13 +56,14 @@ class AgeDistributionPlot:
         :param plot_width: The width of the resulting plot in pixels
         :param plot_height: The height of the resulting plot in pixels
         :param include_curve: True to include a line with the cumulative percentage by category
+        :param age_category_bins: The age category bins that the referral counts are distributed by
         """
 
         self.document = doc
         self.figure = None
         self.distribution_y_range = None
         self.plot_name = plot_name
-        self.categories = ['7d', '14d', '30d', '60d', '90d', '>90d']
+        self.categories = list(age_category_bins['labels'])
         self.bar_color_map = bar_color_map
         self.data_point_color_map = data_point_color_map
         self.plot_width = plot_width
@@ -82,11 +86,12 @@ class AgeDistributionPlot:
         self.over_labels_plot_data_source = None
     # END __init__
 
-    def load_clinic_data(self, month: datetime, clinic: str) -> None:
+    def get_clinic_data(self, month: datetime, clinic: str) -> dict:
         """
-        Loads the data used to render visualizations.
+        Returns the data used to render visualizations.
         :param month: The month to query data from
         :param clinic: The name of the clinic to query data for
+        :return: The referral counts of the clinic by age category
         """
 
         # Build list of distribution counts in same order as categories
@@ -102,15 +107,24 @@ class AgeDistributionPlot:
             all_counts.append(category_count)
 
         # Create a dataframe with the referral distribution data
-        self.distribution_data = {'category': self.categories, 'referral_count': all_counts}
-    # END load_clinic_data
+        return {'category': self.categories, 'referral_count': all_counts}
+    # END get_clinic_data
 
-    def create_plot_data(self) -> None:
-        """Creates or updates the Bokeh ColumnDataSource using the clinic data collected."""
-        max_data_value = max(self.distribution_data['referral_count'])
-        self.distribution_y_range = Range1d(0, ((24.0 / self.plot_height) + 1.0) * max_data_value)
+    def calculate_plot_payload(self, month: datetime, clinic: str) -> dict:
+        """
+        Returns the clinic data of the plot and the columns of its data sources, calculated from the model
+        without changing this plot or creating Bokeh models.  The y-axis range is a Bokeh model of one
+        document, so only its bounds are in the payload.
+        :param month: The month to query data from
+        :param clinic: The name of the clinic to query data for
+        :return: A dictionary with the clinic data attributes and the data source columns of the plot
+        """
+
+        distribution_data = self.get_clinic_data(month, clinic)
+        max_data_value = max(distribution_data['referral_count'])
+        y_range = (0, ((24.0 / self.plot_height) + 1.0) * max_data_value)
 
-        distribution_dataframe = pd.DataFrame(self.distribution_data, index=list(range(0, len(self.categories))))
+        distribution_dataframe = pd.DataFrame(distribution_data, index=list(range(0, len(self.categories))))
 
         # If a data point is more than 84% of the range the label will be inside the bar
         distribution_dataframe['range_ratio'] = distribution_dataframe.referral_count / max_data_value
@@ -123,24 +137,21 @@ class AgeDistributionPlot:
             distribution_dataframe['referral_count'].apply(lambda x: str(x)))
 
         # The inside and outside aligned labels must be in separate label sets
-        self.inside_labels_plot_data = (
-            distribution_dataframe.loc[(distribution_dataframe['bar_data_label_placement'] == 'inside')])
-        if self.inside_labels_plot_data_source is None:
-            self.inside_labels_plot_data_source = ColumnDataSource(self.inside_labels_plot_data)
-        else:
-            self.inside_labels_plot_data_source.data = self.inside_labels_plot_data.to_dict(orient="list")
-
-        self.outside_labels_plot_data = (
-            distribution_dataframe.loc[(distribution_dataframe['bar_data_label_placement'] == 'outside')])
-        if self.outside_labels_plot_data_source is None:
-            self.outside_labels_plot_data_source = ColumnDataSource(self.outside_labels_plot_data)
-        else:
-            self.outside_labels_plot_data_source.data = self.outside_labels_plot_data.to_dict(orient="list")
+        attributes = {'distribution_data': distribution_data,
+                      'inside_labels_plot_data': distribution_dataframe.loc[
+                          (distribution_dataframe['bar_data_label_placement'] == 'inside')],
+                      'outside_labels_plot_data': distribution_dataframe.loc[
+                          (distribution_dataframe['bar_data_label_placement'] == 'outside')],
+                      'under_labels_plot_data': pd.DataFrame(),
+                      'over_labels_plot_data': pd.DataFrame()}
+        sources = {'distribution_plot_data_source': 'distribution_plot_data',
+                   'inside_labels_plot_data_source': 'inside_labels_plot_data',
+                   'outside_labels_plot_data_source': 'outside_labels_plot_data'}
 
         # Draw the curve if included
         if self.include_curve:
             # Curve ratios
-            total_counts = sum(self.distribution_data['referral_count'])
+            total_counts = sum(distribution_data['referral_count'])
             distribution_dataframe['cumulative_count'] = distribution_dataframe['referral_count'].cumsum()
             if total_counts > 0:
                 distribution_dataframe['throughput_ratio'] = distribution_dataframe.cumulative_count / total_counts
@@ -165,30 +176,25 @@ class AgeDistributionPlot:
                 distribution_dataframe['throughput_ratio'].apply(lambda x: str(v.half_up_int(x * 100.0)) + '%'))
 
             # The over and under aligned labels must be in separate label sets
-            self.under_labels_plot_data = (
+            attributes['under_labels_plot_data'] = (
                 distribution_dataframe.loc[(distribution_dataframe['curve_data_label_placement'] == 'under')])
-            if self.under_labels_plot_data_source is None:
-                self.under_labels_plot_data_source = ColumnDataSource(self.under_labels_plot_data)
-            else:
-                self.under_labels_plot_data_source.data = self.under_labels_plot_data.to_dict(orient="list")
-
-            self.over_labels_plot_data = (
+            attributes['over_labels_plot_data'] = (
                 distribution_dataframe.loc[(distribution_dataframe['curve_data_label_placement'] == 'over')])
-            if self.over_labels_plot_data_source is None:
-                self.over_labels_plot_data_source = ColumnDataSource(self.over_labels_plot_data)
-            else:
-                self.over_labels_plot_data_source.data = self.over_labels_plot_data.to_dict(orient="list")
+            sources['under_labels_plot_data_source'] = 'under_labels_plot_data'
+            sources['over_labels_plot_data_source'] = 'over_labels_plot_data'
         # END if include_curve
 
-        # Store the distribution data for rendering later
-        self.distribution_plot_data = distribution_dataframe
-
-        # Either add or update a Bokeh connected data source
-        if self.distribution_plot_data_source is None:
-            self.distribution_plot_data_source = ColumnDataSource(distribution_dataframe)
-        else:
-            self.distribution_plot_data_source.data = distribution_dataframe.to_dict(orient="list")
-    # END create_plot_data
+        attributes['distribution_plot_data'] = distribution_dataframe
+        payload = rp.create_plot_payload(attributes, sources)
+        payload['y_range'] = y_range
+        return payload
+    # END calculate_plot_payload
+
+    def set_plot_payload(self, payload: dict) -> None:
+        """Sets the clinic data of the plot and creates or updates its data sources from a shared payload."""
+        rp.set_plot_payload(self, payload)
+        self.distribution_y_range = Range1d(*payload['y_range'])
+    # END set_plot_payload
 
     def add_plot(self) -> None:
         """Creates the figure and models that render the visual."""
@@ -13,9 +13,10 @@ from datetime import datetime
 
 from bokeh.document import Document
 from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource, FactorRange
+from bokeh.models import FactorRange
 from bokeh.models.annotations import HTMLLabelSet
 import model.PendingTime as p
+import app.RenderPayloads as rp
 
 
 class CategoryBarsPlot:
@@ -23,8 +24,9 @@ class CategoryBarsPlot:
     Class that represents a horizontal bar chart of referral counts by category in a Bokeh document
 
     Public Methods:
-        load_clinic_data - Loads the data used to render visualizations.
-        create_plot_data - Creates or updates the Bokeh ColumnDataSource using the clinic data collected.
+        get_clinic_data - Returns the data used to render visualizations.
+        calculate_plot_payload - Calculates the clinic data and data source columns without changing the plot.
+        set_plot_payload - Sets the clinic data and data sources from a shared payload.
         add_plot - Creates the figure and models that render the visual.
         update_plot - Updates the y-axis range using the most recently updated data.
     """
@@ -63,30 +65,38 @@ class CategoryBarsPlot:
         self.plot_height = 0
     # END __init__
 
-    def load_clinic_data(self, month: datetime, clinic: str) -> None:
+    def get_clinic_data(self, month: datetime, clinic: str) -> dict:
         """
-        Loads the data used to render visualizations.
+        Returns the data used to render visualizations.
         :param month: The month to query data from
         :param clinic: The name of the clinic to query data for
+        :return: The referral counts of the clinic by category
         """
 
         volume_values = (
             p.get_counts_by_category(clinic, self.values_measure, self.category_column, self.values_column))
-        self.ratio_data = {'measure': volume_values[self.category_column].tolist(),
-                           'value': volume_values[self.values_column].tolist()}
-    # END load_clinic_data
+        return {'measure': volume_values[self.category_column].tolist(),
+                'value': volume_values[self.values_column].tolist()}
+    # END get_clinic_data
 
-    def create_plot_data(self) -> None:
-        """Creates or updates the Bokeh ColumnDataSource using the clinic data collected."""
+    def calculate_plot_payload(self, month: datetime, clinic: str) -> dict:
+        """
+        Returns the clinic data of the plot and the columns of its data sources, calculated from the model
+        without changing this plot or creating Bokeh models.
+        :param month: The month to query data from
+        :param clinic: The name of the clinic to query data for
+        :return: A dictionary with the clinic data attributes and the data source columns of the plot
+        """
 
-        max_data_value = max(self.ratio_data['value'])
-        if len(self.ratio_data['measure']) > 11:
-            self.plot_height = 34 + (22 * 10)
+        ratio_data = self.get_clinic_data(month, clinic)
+        max_data_value = max(ratio_data['value'])
+        if len(ratio_data['measure']) > 11:
+            plot_height = 34 + (22 * 10)
         else:
-            self.plot_height = 34 + (22 * (len(self.ratio_data['measure']) - 1))
+            plot_height = 34 + (22 * (len(ratio_data['measure']) - 1))
 
         # Create a dataframe to hold potting data for each slice of the pie chart
-        df = pd.DataFrame.from_dict(self.ratio_data).sort_values(by=['value'], ascending=False).reindex()
+        df = pd.DataFrame.from_dict(ratio_data).sort_values(by=['value'], ascending=False).reindex()
 
         # If a data point is more than 75% of the range the label will be right-aligned inside the bar
         df['range_ratio'] = df['value'] / max_data_value
@@ -102,27 +112,22 @@ class CategoryBarsPlot:
         df.loc[(df['measure'] == '(none)'), ['bar_color']] = '#808080'
         df.loc[(df['measure'] == 'No Status'), ['bar_color']] = '#808080'
 
-        # Store plot data for rendering later
-        self.plot_data = df
-
-        if self.plot_data_source is None:
-            self.plot_data_source = ColumnDataSource(self.plot_data)
-        else:
-            self.plot_data_source.data = self.plot_data.to_dict(orient="list")
-
         # The left and right aligned labels must be in separate label sets
-        self.left_align_labels_df = df.loc[(df.data_label_align == 'left')]
-        if self.left_align_labels_source is None:
-            self.left_align_labels_source = ColumnDataSource(self.left_align_labels_df)
-        else:
-            self.left_align_labels_source.data = self.left_align_labels_df.to_dict(orient="list")
-
-        self.right_align_labels_df = df.loc[(df.data_label_align == 'right')]
-        if self.right_align_labels_source is None:
-            self.right_align_labels_source = ColumnDataSource(self.right_align_labels_df)
-        else:
-            self.right_align_labels_source.data = self.right_align_labels_df.to_dict(orient="list")
-    # END create_plot_data
+        return rp.create_plot_payload(
+            {'ratio_data': ratio_data,
+             'plot_height': plot_height,
+             'plot_data': df,
+             'left_align_labels_df': df.loc[(df.data_label_align == 'left')],
+             'right_align_labels_df': df.loc[(df.data_label_align == 'right')]},
+            {'plot_data_source': 'plot_data',
+             'left_align_labels_source': 'left_align_labels_df',
+             'right_align_labels_source': 'right_align_labels_df'})
+    # END calculate_plot_payload
+
+    def set_plot_payload(self, payload: dict) -> None:
+        """Sets the clinic data of the plot and creates or updates its data sources from a shared payload."""
+        rp.set_plot_payload(self, payload)
+    # END set_plot_payload
 
     def add_plot(self) -> None:
         """Creates the figure and models that render the visual."""
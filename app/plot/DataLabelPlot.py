@@ -15,6 +15,8 @@ from bokeh.models import ColumnDataSource, CustomJS
 from bokeh.models.ranges import Range1d
 from bokeh.models.annotations import LabelSet
 
+import app.RenderPayloads as rp
+
 
 class LabelDataSource:
     """
@@ -24,10 +26,13 @@ class LabelDataSource:
     hidden and floating.
 
     Public Methods:
-        load_clinic_data - Loads the data used to render visualizations.
-        create_plot_data - Creates or updates the Bokeh ColumnDataSource using the clinic data collected.
+        update_plot_data - Creates or updates the Bokeh ColumnDataSource using the clinic data collected.
         add_plot - Creates the figure and models that render the visual.
+        add_label - Adds a label with its default content and css class.
         update_label - Adds or updates the content for a label.
+        update_label_style - Adds or updates the css class for a label.
+        create_label_data - Returns a copy of the default label content to collect clinic label data into.
+        set_plot_payload - Sets the clinic data and data sources from a shared payload.
     """
 
     def __init__(self,
@@ -41,30 +46,63 @@ class LabelDataSource:
         self.document = doc
         self.plot_name = plot_name
         self.label_data = {'empty': ['']}
+        self.default_label_data = {'empty': ['']}
         self.plot_data_source = None
     # END __init__
 
+    def add_label(self,
+                  name: str,
+                  value: str,
+                  class_name: str = '') -> None:
+        """
+        Adds a label with its default content and css class.
+        :param name: The name of the label to add
+        :param value: The default content for the label
+        :param class_name: The default css class name for the label, if any
+        """
+        for label_data in [self.label_data, self.default_label_data]:
+            self.update_label(name, value, label_data)
+            if class_name > '':
+                self.update_label_style(name, class_name, label_data)
+    # END add_label
+
     def update_label(self,
                      name: str,
-                     value: str) -> None:
+                     value: str,
+                     label_data: dict = None) -> None:
         """
         Adds or updates the content for a label.
         :param name: The name of the label to update
         :param value: The content for the label
+        :param label_data: The label data to update instead of the label data of this plot
         """
-        self.label_data[name] = [value]
+        if label_data is None:
+            label_data = self.label_data
+        label_data[name] = [value]
     # END update_label
 
     def update_label_style(self,
                            name: str,
-                           class_name: str) -> None:
+                           class_name: str,
+                           label_data: dict = None) -> None:
         """
         Adds or updates the name of the css class to apply to this label.
         :param name: The name of the label to set the class for.
         :param class_name: The name of the css class in the template document.
+        :param label_data: The label data to update instead of the label data of this plot
         """
-        self.label_data['CLASS:' + name] = [class_name]
-    # END update_label
+        if label_data is None:
+            label_data = self.label_data
+        label_data['CLASS:' + name] = [class_name]
+    # END update_label_style
+
+    def create_label_data(self) -> dict:
+        """
+        Returns a copy of the default label content, which clinic label data is collected into without changing
+        this plot so that it can be calculated outside of the document lock.
+        """
+        return {name: list(value) for name, value in self.default_label_data.items()}
+    # END create_label_data
 
     def update_plot_data(self):
         """Creates or updates the Bokeh ColumnDataSource using the clinic data collected."""
@@ -74,6 +112,11 @@ class LabelDataSource:
             self.plot_data_source.data = self.label_data
     # END update_plot_data
 
+    def set_plot_payload(self, payload: dict) -> None:
+        """Sets the clinic data of the plot and creates or updates its data sources from a shared payload."""
+        rp.set_plot_payload(self, payload)
+    # END set_plot_payload
+
     def add_plot(self):
         """Creates the figure and models that render the visual."""
         label_plot = figure(title=None,
@@ -177,26 +220,28 @@ class CallbackLabelPlot:
         self.label_text = label_text
         self.class_name = class_name
 
-        label_data_source.update_label(plot_name, label_text)
-        if class_name > '':
-            label_data_source.update_label_style(plot_name, class_name)
+        label_data_source.add_label(plot_name, label_text, class_name)
     # END __init__
 
     def set_label_text(self,
-                       value: str) -> None:
+                       value: str,
+                       label_data: dict = None) -> None:
         """
         Sets or changes the content for a label.
         :param value: The new content for the label.
+        :param label_data: The label data to set the content in instead of the label data source
         """
-        self.label_data_source.update_label(self.plot_name, value)
+        self.label_data_source.update_label(self.plot_name, value, label_data)
     # END set_label_text
 
     def set_label_style(self,
-                        class_name: str) -> None:
+                        class_name: str,
+                        label_data: dict = None) -> None:
         """
         Sets or changes the css class for a label.
         :param class_name: The new class name for the label.
+        :param label_data: The label data to set the class in instead of the label data source
         """
-        self.label_data_source.update_label_style(self.plot_name, class_name)
-    # END set_label_text
+        self.label_data_source.update_label_style(self.plot_name, class_name, label_data)
+    # END set_label_style
 # END CLASS CallbackLabelPlot
@@ -13,10 +13,12 @@ from pandas import DataFrame
 
 from bokeh.document import Document
 from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource, CustomJS
+from bokeh.models import CustomJS
 from bokeh.models.ranges import Range1d
 from bokeh.models.annotations import LabelSet
 
+import app.RenderPayloads as rp
+
 
 class DataTablePlot:
     """
@@ -25,7 +27,8 @@ class DataTablePlot:
     hidden and floating.
 
     Public Methods:
-        create_plot_data - Creates or updates the Bokeh ColumnDataSource using the clinic data collected.
+        calculate_plot_payload - Calculates the clinic data and data source columns without changing the plot.
+        set_plot_payload - Sets the clinic data and data sources from a shared payload.
         add_plot - Creates the figure and models that render the visual.
     """
 
@@ -47,16 +50,21 @@ class DataTablePlot:
         self.plot_data_source = None
     # END __init__
 
-    def create_plot_data(self, df: DataFrame) -> None:
-        """Creates or updates the Bokeh ColumnDataSource using the given DataFrame with clinic data."""
-
+    def calculate_plot_payload(self, df: DataFrame) -> dict:
+        """
+        Returns the clinic data of the plot and the columns of its data source for a DataFrame of clinic data,
+        without changing this plot or creating Bokeh models.
+        :param df: The rows of the table, which the column for the empty label text is added to
+        :return: A dictionary with the clinic data attributes and the data source columns of the plot
+        """
         df['empty'] = ''
-        self.plot_data = df
-        if self.plot_data_source is None:
-            self.plot_data_source = ColumnDataSource(self.plot_data)
-        else:
-            self.plot_data_source.data = self.plot_data
-    # END update_plot_data
+        return rp.create_plot_payload({'plot_data': df}, {'plot_data_source': 'plot_data'})
+    # END calculate_plot_payload
+
+    def set_plot_payload(self, payload: dict) -> None:
+        """Sets the clinic data of the plot and creates or updates its data sources from a shared payload."""
+        rp.set_plot_payload(self, payload)
+    # END set_plot_payload
 
     def add_plot(self) -> None:
         """Creates the figure and models that render the visual."""
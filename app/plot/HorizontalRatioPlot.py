@@ -11,7 +11,6 @@ import pandas as pd
 
 from bokeh.document import Document
 from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource
 from bokeh.models.ranges import FactorRange
 from bokeh.models.annotations import HTMLLabelSet
 
@@ -21,6 +20,7 @@ import model.ProcessTime as wt
 import model.CRMUse as c
 import model.DSMUse as d
 import app.common as v
+import app.RenderPayloads as rp
 
 
 class HorizontalRatioPlot:
@@ -28,8 +28,9 @@ class HorizontalRatioPlot:
     Class that represents a bar chart plot in a Bokeh document of referral counts that represent a process ratio.
 
     Public Methods:
-        load_clinic_data - Loads the data used to render visualizations.
-        create_plot_data - Creates or updates the Bokeh ColumnDataSource using the clinic data collected.
+        get_clinic_data - Returns the data used to render visualizations.
+        calculate_plot_payload - Calculates the clinic data and data source columns without changing the plot.
+        set_plot_payload - Sets the clinic data and data sources from a shared payload.
         add_plot - Creates the figure and models that render the visual.
         update_plot - Updates the y-axis range using the most recently updated data.
     """
@@ -80,11 +81,12 @@ class HorizontalRatioPlot:
         self.plot_height = plot_height
     # END __init__
 
-    def load_clinic_data(self, month: datetime, clinic: str) -> None:
+    def get_clinic_data(self, month: datetime, clinic: str) -> dict:
         """
-        Loads the data used to render visualizations.
+        Returns the data used to render visualizations.
         :param month: The month to query data from
         :param clinic: The name of the clinic to query data for
+        :return: The numerator and denominator counts of the clinic by display name
         """
 
         if self.numerator_measure == 'Patients with DSM and CRM Referrals After 90d':
@@ -107,22 +109,30 @@ class HorizontalRatioPlot:
         else:
             numerator2_count = 0
 
-        self.ratio_data = {self.numerator_name: numerator_count,
-                           self.denominator_name: denominator_count,
-                           self.numerator2_name: numerator2_count}
-    # END load_clinic_data
+        return {self.numerator_name: numerator_count,
+                self.denominator_name: denominator_count,
+                self.numerator2_name: numerator2_count}
+    # END get_clinic_data
 
-    def create_plot_data(self) -> None:
-        """Creates or updates the Bokeh ColumnDataSource using the clinic data collected."""
+    def calculate_plot_payload(self, month: datetime, clinic: str) -> dict:
+        """
+        Returns the clinic data of the plot and the columns of its data sources, calculated from the model
+        without changing this plot or creating Bokeh models.
+        :param month: The month to query data from
+        :param clinic: The name of the clinic to query data for
+        :return: A dictionary with the clinic data attributes and the data source columns of the plot
+        """
+
+        ratio_data = self.get_clinic_data(month, clinic)
 
         # Data for volume measures
         volume_measures = [self.denominator_name, self.numerator_name]
         if self.numerator2_name != '':
             volume_measures.append(self.numerator2_name)
 
-        volume_values = [self.ratio_data[self.denominator_name], self.ratio_data[self.numerator_name]]
+        volume_values = [ratio_data[self.denominator_name], ratio_data[self.numerator_name]]
         if self.numerator2_name != '':
-            volume_values.append(self.ratio_data[self.numerator2_name])
+            volume_values.append(ratio_data[self.numerator2_name])
 
         bar_colors = ['#808080', '#EB895F']
         if self.numerator2_name != '':
@@ -131,35 +141,32 @@ class HorizontalRatioPlot:
         plot_dict = {'measure': volume_measures,
                      'value': volume_values,
                      'bar_color': bar_colors}
-        self.plot_data = pd.DataFrame.from_dict(plot_dict, orient='columns')
+        plot_data = pd.DataFrame.from_dict(plot_dict, orient='columns')
 
         # If a data point is more than 75% of the range the label will be right-aligned inside the bar
         max_data_value = max(volume_values)
-        self.plot_data['range_ratio'] = self.plot_data['value'] / max_data_value
-        self.plot_data.loc[(self.plot_data['range_ratio'] > 0.75), ['data_label_align']] = 'right'
-        self.plot_data.loc[(self.plot_data['range_ratio'] <= 0.75), ['data_label_align']] = 'left'
+        plot_data['range_ratio'] = plot_data['value'] / max_data_value
+        plot_data.loc[(plot_data['range_ratio'] > 0.75), ['data_label_align']] = 'right'
+        plot_data.loc[(plot_data['range_ratio'] <= 0.75), ['data_label_align']] = 'left'
 
         # Create the data label text
-        self.plot_data['data_point_label'] = self.plot_data['value'].apply(lambda x: str(x))
-
-        if self.plot_data_source is None:
-            self.plot_data_source = ColumnDataSource(self.plot_data)
-        else:
-            self.plot_data_source.data = self.plot_data.to_dict(orient="list")
+        plot_data['data_point_label'] = plot_data['value'].apply(lambda x: str(x))
 
         # The left and right aligned labels must be in separate label sets
-        self.left_label_data = self.plot_data.loc[(self.plot_data['data_label_align'] == 'left')]
-        if self.left_label_data_source is None:
-            self.left_label_data_source = ColumnDataSource(self.left_label_data)
-        else:
-            self.left_label_data_source.data = self.left_label_data.to_dict(orient="list")
-
-        self.right_label_data = self.plot_data.loc[(self.plot_data['data_label_align'] == 'right')]
-        if self.right_label_data_source is None:
-            self.right_label_data_source = ColumnDataSource(self.right_label_data)
-        else:
-            self.right_label_data_source.data = self.right_label_data.to_dict(orient="list")
-    # END create_plot_data
+        return rp.create_plot_payload(
+            {'ratio_data': ratio_data,
+             'plot_data': plot_data,
+             'left_label_data': plot_data.loc[(plot_data['data_label_align'] == 'left')],
+             'right_label_data': plot_data.loc[(plot_data['data_label_align'] == 'right')]},
+            {'plot_data_source': 'plot_data',
+             'left_label_data_source': 'left_label_data',
+             'right_label_data_source': 'right_label_data'})
+    # END calculate_plot_payload
+
+    def set_plot_payload(self, payload: dict) -> None:
+        """Sets the clinic data of the plot and creates or updates its data sources from a shared payload."""
+        rp.set_plot_payload(self, payload)
+    # END set_plot_payload
 
     def add_plot(self) -> None:
         """Creates the figure and models that render the visual."""
@@ -9,7 +9,7 @@ Classes:
 
 from bokeh.document import Document
 from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource, LinearColorMapper
+from bokeh.models import LinearColorMapper
 from bokeh.models.ranges import Range1d
 from bokeh.models.annotations import HTMLLabelSet
 
@@ -23,6 +23,7 @@ from numpy import cos, sin
 
 import model.ProcessTime as wt
 import app.common as v
+import app.RenderPayloads as rp
 
 
 class ProcessGaugePlot:
@@ -30,8 +31,9 @@ class ProcessGaugePlot:
     Class that represents a speedometer gauge plot of referral process aim performance in a Bokeh document.
 
     Public Methods:
-        load_clinic_data - Loads the data used to render visualizations.
-        create_plot_data - Creates or updates the Bokeh ColumnDataSource using the clinic data collected.
+        get_clinic_data - Returns the data used to render visualizations.
+        calculate_plot_payload - Calculates the clinic data and data source columns without changing the plot.
+        set_plot_payload - Sets the clinic data and data sources from a shared payload.
         add_plot - Creates the figure and models that render the visual.
     """
 
@@ -73,28 +75,33 @@ class ProcessGaugePlot:
         self.inner_radius = 0.0
     # END __init__
 
-    def load_clinic_data(self, month: datetime, clinic: str) -> None:
+    def get_clinic_data(self, month: datetime, clinic: str) -> dict:
         """
-        Loads the data used to render visualizations.
+        Returns the data used to render visualizations.
         :param month: The month to query data from
         :param clinic: The name of the clinic to query data for
+        :return: The process rate, target rate, and rate label value of the clinic
         """
 
-        urgent_pct = wt.get_clinic_rate_measure(month,
-                                                clinic,
-                                                self.rate_measure)
-        urgent_target_pct = wt.get_clinic_rate_measure(month,
-                                                       clinic,
-                                                       self.target_measure)
-        self.ratio_data = {'value': [urgent_pct / 100.0, 1.0]}
-        self.target_data = {'value': [urgent_target_pct / 100.0]}
-        self.ratio_label_data = {'value': v.half_up_int(urgent_pct)}
-    # END load_clinic_data
+        measures_df = wt.get_clinic_measures(month, clinic, [self.rate_measure, self.target_measure])
+        urgent_pct = float(measures_df.at[0, self.rate_measure])
+        urgent_target_pct = float(measures_df.at[0, self.target_measure])
+        return {'ratio_data': {'value': [urgent_pct / 100.0, 1.0]},
+                'target_data': {'value': [urgent_target_pct / 100.0]},
+                'ratio_label_data': {'value': v.half_up_int(urgent_pct)}}
+    # END get_clinic_data
 
-    def create_plot_data(self) -> None:
-        """Creates or updates the Bokeh ColumnDataSource using the clinic data collected."""
+    def calculate_plot_payload(self, month: datetime, clinic: str) -> dict:
+        """
+        Returns the clinic data of the plot and the columns of its data sources, calculated from the model
+        without changing this plot or creating Bokeh models.
+        :param month: The month to query data from
+        :param clinic: The name of the clinic to query data for
+        :return: A dictionary with the clinic data attributes and the data source columns of the plot
+        """
 
-        ratio_dataframe = pd.DataFrame(self.ratio_data, index=[0, 1])
+        clinic_data = self.get_clinic_data(month, clinic)
+        ratio_dataframe = pd.DataFrame(clinic_data['ratio_data'], index=[0, 1])
 
         # The half-pie chart will render left-to-right, or backwards from normal angles
         ratio_dataframe['starting_plot_angle'] = pi - (ratio_dataframe.value * pi)
@@ -106,60 +113,50 @@ class ProcessGaugePlot:
         # Give the remainder of the half-pie a value below the percentage range to trigger the low color
         ratio_dataframe.loc[1:1, ['value']] = -1
 
-        # Store plot data for later rendering
-        self.plot_data = ratio_dataframe
-
-        # Either add or modify the plot data source for the gauge
-        if self.plot_data_source is None:
-            self.plot_data_source = ColumnDataSource(ratio_dataframe)
-        else:
-            self.plot_data_source.data = ratio_dataframe.to_dict(orient="list")
-
         # Calculate the size of the half-donut
         if self.plot_height < self.plot_width:
-            self.outer_radius = self.plot_height - (0.15 * self.plot_height)
+            outer_radius = self.plot_height - (0.15 * self.plot_height)
         else:
-            self.outer_radius = self.plot_width / 2.0
-        self.inner_radius = self.outer_radius - 20.0
+            outer_radius = self.plot_width / 2.0
+        inner_radius = outer_radius - 20.0
 
         # Create plotting data for the target marker
-        target_dataframe = pd.DataFrame(self.target_data, index=[0])
+        target_dataframe = pd.DataFrame(clinic_data['target_data'], index=[0])
 
         # Calculate the location, vector, and length of the target line
         target_dataframe['starting_plot_angle'] = pi - (target_dataframe['value'] * pi)
         target_dataframe['target_y_pos'] = (
-            round(sin(target_dataframe['starting_plot_angle']) * (self.inner_radius + (0.06 * self.plot_height)), 2))
+            round(sin(target_dataframe['starting_plot_angle']) * (inner_radius + (0.06 * self.plot_height)), 2))
         target_dataframe['target_x_pos'] = (
-            round(cos(target_dataframe['starting_plot_angle']) * (self.inner_radius + (0.06 * self.plot_height)), 2))
+            round(cos(target_dataframe['starting_plot_angle']) * (inner_radius + (0.06 * self.plot_height)), 2))
         target_dataframe['target_ball_y_pos'] = (
-            round(sin(target_dataframe['starting_plot_angle']) * (self.outer_radius + (0.06 * self.plot_height)), 2))
+            round(sin(target_dataframe['starting_plot_angle']) * (outer_radius + (0.06 * self.plot_height)), 2))
         target_dataframe['target_ball_x_pos'] = (
-            round(cos(target_dataframe['starting_plot_angle']) * (self.outer_radius + (0.06 * self.plot_height)), 2))
-
-        # Store plot data for later rendering
-        self.target_plot_data = target_dataframe
-
-        # Either add or modify the plot data source for the gauge
-        if self.target_plot_data_source is None:
-            self.target_plot_data_source = ColumnDataSource(target_dataframe)
-        else:
-            self.target_plot_data_source.data = target_dataframe.to_dict(orient="list")
+            round(cos(target_dataframe['starting_plot_angle']) * (outer_radius + (0.06 * self.plot_height)), 2))
 
-        # Create a data source for the center, ratio label
-        label_dataframe = pd.DataFrame(self.ratio_label_data, index=[0])
+        # Create plotting data for the center, ratio label
+        label_dataframe = pd.DataFrame(clinic_data['ratio_label_data'], index=[0])
         label_dataframe['data_point_label'] = label_dataframe['value'].astype('str') + '%'
         label_dataframe['label_x_pos'] = 0
         label_dataframe['label_y_pos'] = -6.0
 
-        # Store plot data for later rendering
-        self.ratio_label_data = label_dataframe
-
-        # Either add or modify the plot data source for the gauge
-        if self.ratio_label_data_source is None:
-            self.ratio_label_data_source = ColumnDataSource(label_dataframe)
-        else:
-            self.ratio_label_data_source.data = label_dataframe.to_dict(orient="list")
-    # END create_plot_data
+        return rp.create_plot_payload(
+            {'ratio_data': clinic_data['ratio_data'],
+             'target_data': clinic_data['target_data'],
+             'plot_data': ratio_dataframe,
+             'target_plot_data': target_dataframe,
+             'ratio_label_data': label_dataframe,
+             'outer_radius': outer_radius,
+             'inner_radius': inner_radius},
+            {'plot_data_source': 'plot_data',
+             'target_plot_data_source': 'target_plot_data',
+             'ratio_label_data_source': 'ratio_label_data'})
+    # END calculate_plot_payload
+
+    def set_plot_payload(self, payload: dict) -> None:
+        """Sets the clinic data of the plot and creates or updates its data sources from a shared payload."""
+        rp.set_plot_payload(self, payload)
+    # END set_plot_payload
 
     def add_plot(self) -> None:
         """Creates the figure and models that render the visual."""
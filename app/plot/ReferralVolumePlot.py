@@ -9,7 +9,6 @@ Classes:
 
 from bokeh.document import Document
 from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource
 from bokeh.models.ranges import FactorRange
 from bokeh.models.annotations import HTMLLabelSet
 
@@ -18,6 +17,7 @@ import pandas as pd
 from datetime import datetime
 
 import model.ProcessTime as wt
+import app.RenderPayloads as rp
 
 
 class ReferralVolumePlot:
@@ -25,8 +25,9 @@ class ReferralVolumePlot:
     Class that represents a horizontal bar chart of referral counts that represent volume measures in a Bokeh document
 
     Public Methods:
-        load_clinic_data - Loads the data used to render visualizations.
-        create_plot_data - Creates or updates the Bokeh ColumnDataSource using the clinic data collected.
+        get_clinic_data - Returns the data used to render visualizations.
+        calculate_plot_payload - Calculates the clinic data and data source columns without changing the plot.
+        set_plot_payload - Sets the clinic data and data sources from a shared payload.
         add_plot - Creates the figure and models that render the visual.
     """
 
@@ -69,29 +70,35 @@ class ReferralVolumePlot:
         self.plot_right_align_label_data = pd.DataFrame()
         self.plot_right_align_label_source = None
 
-    def load_clinic_data(self, month: datetime, clinic: str) -> None:
+    def get_clinic_data(self, month: datetime, clinic: str) -> dict:
         """
-        Loads the data used to render visualizations.
+        Returns the data used to render visualizations.
         :param month: The month to query data from
         :param clinic: The name of the clinic to query data for
+        :return: The referral counts of the clinic by volume measure
         """
 
-        volume_values = [wt.get_clinic_count_measure(month, clinic, self.sent_measure),
-                         wt.get_clinic_count_measure(month, clinic, self.canceled_measure),
-                         wt.get_clinic_count_measure(month, clinic, self.rejected_measure),
-                         wt.get_clinic_count_measure(month, clinic, self.closed_wbs_measure)]
-        self.volume_data = {'measure': self.volume_measures,
-                            'value': volume_values,
-                            'bar_color': self.bar_colors}
-    # END load_clinic_data
+        measure_names = [self.sent_measure, self.canceled_measure, self.rejected_measure, self.closed_wbs_measure]
+        volume_values = [int(value) for value in wt.get_clinic_measures(month, clinic, measure_names).loc[0]]
+        return {'measure': self.volume_measures,
+                'value': volume_values,
+                'bar_color': self.bar_colors}
+    # END get_clinic_data
 
-    def create_plot_data(self) -> None:
-        """Creates or updates the Bokeh ColumnDataSource using the clinic data collected."""
+    def calculate_plot_payload(self, month: datetime, clinic: str) -> dict:
+        """
+        Returns the clinic data of the plot and the columns of its data sources, calculated from the model
+        without changing this plot or creating Bokeh models.
+        :param month: The month to query data from
+        :param clinic: The name of the clinic to query data for
+        :return: A dictionary with the clinic data attributes and the data source columns of the plot
+        """
 
-        max_data_value = max(self.volume_data['value'])
+        volume_data = self.get_clinic_data(month, clinic)
+        max_data_value = max(volume_data['value'])
 
         # Create a dataframe with the plot data
-        volume_dataframe = pd.DataFrame.from_dict(self.volume_data, orient='columns')
+        volume_dataframe = pd.DataFrame.from_dict(volume_data, orient='columns')
 
         # If a data point is more than 75% of the range the label will be right-aligned inside the bar
         volume_dataframe['range_ratio'] = volume_dataframe.value / max_data_value
@@ -101,28 +108,21 @@ class ReferralVolumePlot:
         # Create the data label text
         volume_dataframe['data_point_label'] = volume_dataframe['value'].apply(lambda x: str(x))
 
-        # Store the plot data to be used for rendering
-        self.plot_data = volume_dataframe
-
-        # Either create or update a column data source for the bar chart
-        if self.plot_data_source is None:
-            self.plot_data_source = ColumnDataSource(volume_dataframe)
-        else:
-            self.plot_data_source.data = volume_dataframe.to_dict(orient="list")
-
         # The left and right aligned labels must be in separate label sets
-        self.plot_left_align_label_data = volume_dataframe.loc[(volume_dataframe.data_label_align == 'left')]
-        if self.plot_left_align_label_source is None:
-            self.plot_left_align_label_source = ColumnDataSource(self.plot_left_align_label_data)
-        else:
-            self.plot_left_align_label_source.data = self.plot_left_align_label_data.to_dict(orient="list")
-
-        self.plot_right_align_label_data = volume_dataframe.loc[(volume_dataframe.data_label_align == 'right')]
-        if self.plot_right_align_label_source is None:
-            self.plot_right_align_label_source = ColumnDataSource(self.plot_right_align_label_data)
-        else:
-            self.plot_right_align_label_source.data = self.plot_right_align_label_data.to_dict(orient="list")
-    # END create_plot_data
+        return rp.create_plot_payload(
+            {'volume_data': volume_data,
+             'plot_data': volume_dataframe,
+             'plot_left_align_label_data': volume_dataframe.loc[(volume_dataframe.data_label_align == 'left')],
+             'plot_right_align_label_data': volume_dataframe.loc[(volume_dataframe.data_label_align == 'right')]},
+            {'plot_data_source': 'plot_data',
+             'plot_left_align_label_source': 'plot_left_align_label_data',
+             'plot_right_align_label_source': 'plot_right_align_label_data'})
+    # END calculate_plot_payload
+
+    def set_plot_payload(self, payload: dict) -> None:
+        """Sets the clinic data of the plot and creates or updates its data sources from a shared payload."""
+        rp.set_plot_payload(self, payload)
+    # END set_plot_payload
 
     def add_plot(self) -> None:
         """Creates the figure and models that render the visual."""
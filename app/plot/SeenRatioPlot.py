@@ -9,7 +9,6 @@ Classes:
 
 from bokeh.document import Document
 from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource
 from bokeh.models.ranges import Range1d
 from bokeh.models.annotations import HTMLLabelSet
 
@@ -23,6 +22,7 @@ from numpy import cumsum, cos, sin
 
 import model.ProcessTime as wt
 import app.common as v
+import app.RenderPayloads as rp
 
 
 class SeenRatioPlot:
@@ -30,8 +30,9 @@ class SeenRatioPlot:
     Class that represents a donut chart in a Bokeh document representing the percentage of referrals seen and scheduled
 
     Public Methods:
-        load_clinic_data - Loads the data used to render visualizations.
-        create_plot_data - Creates or updates the Bokeh ColumnDataSource using the clinic data collected.
+        get_clinic_data - Returns the data used to render visualizations.
+        calculate_plot_payload - Calculates the clinic data and data source columns without changing the plot.
+        set_plot_payload - Sets the clinic data and data sources from a shared payload.
         add_plot - Creates the figure and models that render the visual.
     """
 
@@ -82,24 +83,41 @@ class SeenRatioPlot:
         self.seen_ratio_label_data_source = None
     # END __init__
 
-    def load_clinic_data(self, month: datetime, clinic: str) -> None:
+    def get_clinic_data(self, month: datetime, clinic: str) -> dict:
         """
-        Loads the data used to render visualizations.
+        Returns the data used to render visualizations.
         :param month: The month to query data from
         :param clinic: The name of the clinic to query data for
+        :return: The referral counts of the clinic by ratio measure and the denominator count
         """
 
-        ratio_values = [wt.get_clinic_count_measure(month, clinic, self.seen_measure),
-                        wt.get_clinic_count_measure(month, clinic, self.scheduled_measure),
-                        wt.get_clinic_count_measure(month, clinic, self.neither_measure)]
-        self.denominator = wt.get_clinic_count_measure(month, clinic, self.denominator_measure)
-        self.ratio_data = {'measure': self.ratio_measures,
-                           'value': ratio_values,
-                           'color': self.slice_colors}
-    # END load_clinic_data
+        measures_df = wt.get_clinic_measures(month,
+                                             clinic,
+                                             [self.seen_measure,
+                                              self.scheduled_measure,
+                                              self.neither_measure,
+                                              self.denominator_measure])
+        ratio_values = [int(measures_df.at[0, self.seen_measure]),
+                        int(measures_df.at[0, self.scheduled_measure]),
+                        int(measures_df.at[0, self.neither_measure])]
+        return {'denominator': int(measures_df.at[0, self.denominator_measure]),
+                'ratio_data': {'measure': self.ratio_measures,
+                               'value': ratio_values,
+                               'color': self.slice_colors}}
+    # END get_clinic_data
+
+    def calculate_plot_payload(self, month: datetime, clinic: str) -> dict:
+        """
+        Returns the clinic data of the plot and the columns of its data sources, calculated from the model
+        without changing this plot or creating Bokeh models.
+        :param month: The month to query data from
+        :param clinic: The name of the clinic to query data for
+        :return: A dictionary with the clinic data attributes and the data source columns of the plot
+        """
 
-    def create_plot_data(self) -> None:
-        """Creates or updates the Bokeh ColumnDataSource using the clinic data collected."""
+        clinic_data = self.get_clinic_data(month, clinic)
+        denominator = clinic_data['denominator']
+        ratio_data = clinic_data['ratio_data']
 
         # Calculate the size of the donut
         if self.plot_height < self.plot_width:
@@ -109,10 +127,10 @@ class SeenRatioPlot:
         outer_radius = outer_radius - (self.plot_height / 7.0)
 
         # Create a dataframe to hold potting data for each slice of the pie chart
-        seen_ratio_dataframe = pd.DataFrame.from_dict(self.ratio_data)
+        seen_ratio_dataframe = pd.DataFrame.from_dict(ratio_data)
         seen_ratio_dataframe = seen_ratio_dataframe.loc[seen_ratio_dataframe['value'] > 0]
-        if self.denominator > 0:
-            seen_ratio_dataframe['angle_increment'] = seen_ratio_dataframe['value'] / self.denominator * 2 * pi
+        if denominator > 0:
+            seen_ratio_dataframe['angle_increment'] = seen_ratio_dataframe['value'] / denominator * 2 * pi
         else:
             seen_ratio_dataframe['angle_increment'] = 0
         seen_ratio_dataframe['ending_plot_angle'] = cumsum(seen_ratio_dataframe['angle_increment'].values)
@@ -120,7 +138,7 @@ class SeenRatioPlot:
         seen_ratio_dataframe.loc[1:, ['starting_plot_angle']] = seen_ratio_dataframe.shift(1).ending_plot_angle
 
         # Place the labels in the center of each slice in a circle around the outside edge of the pie wedges
-        if self.denominator > 0:
+        if denominator > 0:
             seen_ratio_dataframe['label_angle'] = (
                     seen_ratio_dataframe['ending_plot_angle'] - seen_ratio_dataframe['angle_increment'].div(2))
             seen_ratio_dataframe['label_y_pos'] = (
@@ -135,7 +153,7 @@ class SeenRatioPlot:
         # Labels on the left of the pie are right-aligned, on the right of the pie are left-aligned
         # Labels on the top are positioned relative to the bottom of the label
         # Labels on the bottom are positioned relative to the top of the label
-        if self.denominator > 0:
+        if denominator > 0:
             seen_ratio_dataframe['label_align'] = 'center'
             seen_ratio_dataframe['label_baseline'] = 'middle'
             seen_ratio_dataframe.loc[(seen_ratio_dataframe.label_angle < (0.125 * 2 * pi)), ['label_align']] = 'left'
@@ -153,66 +171,54 @@ class SeenRatioPlot:
             seen_ratio_dataframe['label_align'] = 'left'
 
         # Create the data point label text
-        if self.denominator > 0:
+        if denominator > 0:
             seen_ratio_dataframe['data_point_label'] = seen_ratio_dataframe['value'].apply(lambda x: str(x))
             idx = (seen_ratio_dataframe['value'] == 0)
             seen_ratio_dataframe.loc[idx, 'data_point_label'] = ''
         else:
             seen_ratio_dataframe['data_point_label'] = ''
 
-        # Store the plot data to be used for rendering
-        self.plot_data = seen_ratio_dataframe
-
-        # Either create or update a column data source for the donut chart
-        if self.plot_data_source is None:
-            self.plot_data_source = ColumnDataSource(seen_ratio_dataframe)
-        else:
-            self.plot_data_source.data = seen_ratio_dataframe.to_dict(orient="list")
-
         # Left aligned labels must be in a separate label set layout from the right aligned labels
         idx = (seen_ratio_dataframe.label_align == 'center') & (seen_ratio_dataframe.label_baseline == 'top')
-        self.plot_center_top_labels_data = seen_ratio_dataframe.loc[idx]
-        if self.plot_center_top_labels_data_source is None:
-            self.plot_center_top_labels_data_source = ColumnDataSource(self.plot_center_top_labels_data)
-        else:
-            self.plot_center_top_labels_data_source.data = self.plot_center_top_labels_data.to_dict(orient="list")
-
+        center_top_labels_data = seen_ratio_dataframe.loc[idx]
         idx = (seen_ratio_dataframe.label_align == 'center') & (seen_ratio_dataframe.label_baseline == 'bottom')
-        self.plot_center_bottom_labels_data = seen_ratio_dataframe.loc[idx]
-        if self.plot_center_bottom_labels_data_source is None:
-            self.plot_center_bottom_labels_data_source = ColumnDataSource(self.plot_center_bottom_labels_data)
-        else:
-            self.plot_center_bottom_labels_data_source.data = self.plot_center_bottom_labels_data.to_dict(orient="list")
-
+        center_bottom_labels_data = seen_ratio_dataframe.loc[idx]
         idx = (seen_ratio_dataframe.label_align == 'left') & (seen_ratio_dataframe.label_baseline == 'middle')
-        self.plot_left_middle_labels_data = seen_ratio_dataframe.loc[idx]
-        if self.plot_left_middle_labels_data_source is None:
-            self.plot_left_middle_labels_data_source = ColumnDataSource(self.plot_left_middle_labels_data)
-        else:
-            self.plot_left_middle_labels_data_source.data = self.plot_left_middle_labels_data.to_dict(orient="list")
-
+        left_middle_labels_data = seen_ratio_dataframe.loc[idx]
         idx = (seen_ratio_dataframe.label_align == 'right') & (seen_ratio_dataframe.label_baseline == 'middle')
-        self.plot_right_middle_labels_data = seen_ratio_dataframe.loc[idx]
-        if self.plot_right_middle_labels_data_source is None:
-            self.plot_right_middle_labels_data_source = ColumnDataSource(self.plot_right_middle_labels_data)
-        else:
-            self.plot_right_middle_labels_data_source.data = self.plot_right_middle_labels_data.to_dict(orient="list")
+        right_middle_labels_data = seen_ratio_dataframe.loc[idx]
 
         # Create a centered label with the ratio
-        seen_count = self.ratio_data['value'][0]
-        if self.denominator > 0:
-            seen_ratio = seen_count / self.denominator
+        seen_count = ratio_data['value'][0]
+        if denominator > 0:
+            seen_ratio = seen_count / denominator
         else:
             seen_ratio = 0.0
-
-        self.seen_ratio_label_data = {'label_x_pos': [0],
-                                      'label_y_pos': [0],
-                                      'data_point_label': [str(v.half_up_int((seen_ratio * 100.0))) + r'%']}
-        if self.seen_ratio_label_data_source is None:
-            self.seen_ratio_label_data_source = ColumnDataSource(data=self.seen_ratio_label_data)
-        else:
-            self.seen_ratio_label_data_source.data = self.seen_ratio_label_data
-    # END create_plot_data
+        seen_ratio_label_data = {'label_x_pos': [0],
+                                 'label_y_pos': [0],
+                                 'data_point_label': [str(v.half_up_int((seen_ratio * 100.0))) + r'%']}
+
+        return rp.create_plot_payload(
+            {'denominator': denominator,
+             'ratio_data': ratio_data,
+             'plot_data': seen_ratio_dataframe,
+             'plot_center_top_labels_data': center_top_labels_data,
+             'plot_center_bottom_labels_data': center_bottom_labels_data,
+             'plot_left_middle_labels_data': left_middle_labels_data,
+             'plot_right_middle_labels_data': right_middle_labels_data,
+             'seen_ratio_label_data': seen_ratio_label_data},
+            {'plot_data_source': 'plot_data',
+             'plot_center_top_labels_data_source': 'plot_center_top_labels_data',
+             'plot_center_bottom_labels_data_source': 'plot_center_bottom_labels_data',
+             'plot_left_middle_labels_data_source': 'plot_left_middle_labels_data',
+             'plot_right_middle_labels_data_source': 'plot_right_middle_labels_data',
+             'seen_ratio_label_data_source': 'seen_ratio_label_data'})
+    # END calculate_plot_payload
+
+    def set_plot_payload(self, payload: dict) -> None:
+        """Sets the clinic data of the plot and creates or updates its data sources from a shared payload."""
+        rp.set_plot_payload(self, payload)
+    # END set_plot_payload
 
     def add_plot(self) -> None:
         """Creates the figure and models that render the visual."""
@@ -0,0 +1,11 @@
+"""
+Package: referrals-bokeh.benchmarks
+A collection of scripts that time the calculation of referral measures.  Scripts are run as modules from the
+working folder, for example python -m benchmarks.model_benchmarks --rows 10000 100000
+
+Modules:
+    golden_outputs.py - Checks that a candidate model implementation produces the same measures as a reference
+    model_benchmarks.py - Times the model layer on synthetic source data and compares the results to a baseline
+    synthetic_data.py - Generates deterministic synthetic referral and DSM source files at any number of rows
+    variance_scoring.py - Times variance directions and variance category scoring against element-wise scoring
+"""
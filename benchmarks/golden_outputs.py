@@ -0,0 +1,266 @@
+"""
+golden_outputs.py
+Equivalence harness that checks a candidate implementation of the model layer against a reference
+implementation.  Both implementations load the same real or synthetic source files, every measure for every
+month and clinic is captured from ProcessTime, PendingTime, CRMUse, and DSMUse, and the captures are compared
+with a configurable tolerance.  A readable report lists each mismatched value, row, and column.
+Run from the working folder with:
+    python -m benchmarks.golden_outputs --reference HEAD~1 --rows 20000
+    python -m benchmarks.golden_outputs --reference HEAD --source-directory . --save-golden golden.pkl
+    python -m benchmarks.golden_outputs --golden golden.pkl --source-directory .
+https://907sjl.github.io/
+
+Functions:
+    capture_outputs - Returns every measure DataFrame of the model modules loaded in this process
+    capture_implementation - Captures the outputs of the implementation in a code folder in a new process
+    compare_outputs - Returns report lines of the differences between reference and candidate outputs
+"""
+
+import pandas as pd
+from pandas import DataFrame
+import numpy as np
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+
+# Source data files that the model modules load from the working folder
+_SOURCE_FILES = ['referrals.csv', 'DirectSecureMessages.csv']
+
+# Frames of pending referral measures in PendingTime, which are calculated once for the as-of date
+_PENDING_FRAMES = ['_on_hold_ages_df', '_on_hold_reasons_df', '_reschedule_ages_df', '_reschedule_status_df',
+                   '_acceptance_ages_df', '_acceptance_status_df', '_accepted_ages_df', '_accepted_status_df']
+
+# Monthly measure data in each module by module name and data name
+_MONTHLY_DATA = {'ProcessTime': ['clinic_measures', 'distribution_data'],
+                 'CRMUse': ['overall_measures', 'clinic_measures', 'distribution_data', 'test_results'],
+                 'DSMUse': ['overall_measures', 'clinic_measures']}
+
+# Default tolerances of numeric values, relative to the reference value and absolute
+_RELATIVE_TOLERANCE = 1e-9
+_ABSOLUTE_TOLERANCE = 1e-9
+
+# Default number of mismatched values reported for each DataFrame
+_MAX_REPORTED_VALUES = 20
+
+
+def capture_outputs() -> dict[str, DataFrame]:
+    """
+    Returns every measure DataFrame of the model modules.  Importing the modules loads the source files in
+    the working folder.  Months are requested one at a time so that months evicted from memory are captured.
+    :return: a dictionary of DataFrames by module, data name, and month
+    """
+
+    import importlib
+    outputs = {}
+    for module_name, data_names in _MONTHLY_DATA.items():
+        module = importlib.import_module('model.' + module_name)
+        for report_month in sorted(getattr(module, data_names[0]).keys()):
+            for data_name in data_names:
+                outputs[f"{module_name} {data_name} {report_month.strftime('%Y-%m-%d')}"] = (
+                    pd.DataFrame(getattr(module, data_name)[report_month]).copy())
+
+    pending_module = importlib.import_module('model.PendingTime')
+    for frame_name in _PENDING_FRAMES:
+        outputs['PendingTime ' + frame_name.strip('_')] = getattr(pending_module, frame_name).copy()
+    return outputs
+# END capture_outputs
+
+
+def _export_revision(revision: str, directory: str) -> str:
+    """Exports the files of a git revision of this project to a folder and returns the folder."""
+    project_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.makedirs(directory, exist_ok=True)
+    archive = subprocess.run(['git', 'archive', revision], cwd=project_directory, capture_output=True, check=True)
+    subprocess.run(['tar', '-x', '-C', directory], input=archive.stdout, check=True)
+    return directory
+# END export_revision
+
+
+def capture_implementation(code_directory: str, source_directory: str, output_file: str) -> None:
+    """
+    Captures the outputs of the implementation in a code folder in a new process.  The process runs in a new
+    working folder with links to the source files so that cached measures of another implementation are
+    never read.
+    :param code_directory: the folder with the model package of the implementation
+    :param source_directory: the folder with the source data files
+    :param output_file: the path of the file the captured outputs are written to
+    """
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        for source_file in _SOURCE_FILES:
+            os.symlink(os.path.abspath(os.path.join(source_directory, source_file)),
+                       os.path.join(working_directory, source_file))
+        environment = dict(os.environ, PYTHONPATH=os.path.abspath(code_directory), REFERRALS_MONTH_WORKERS='0')
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--capture',
+                                    os.path.abspath(output_file)],
+                                   cwd=working_directory, env=environment, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f'Capture of {code_directory} failed:\n{completed.stderr}')
+# END capture_implementation
+
+
+def _get_key_columns(df: DataFrame) -> list[str]:
+    """
+    Returns the columns that identify the rows of a measure DataFrame.  Rows are identified by clinic when
+    each clinic has one row, otherwise by clinic and every text or category column.
+    """
+    if 'Clinic' not in df.columns:
+        return []
+    if not df['Clinic'].duplicated().any():
+        return ['Clinic']
+    return ['Clinic'] + [column for column in df.columns
+                         if column != 'Clinic' and not pd.api.types.is_numeric_dtype(df[column])]
+# END get_key_columns
+
+
+def _index_rows(df: DataFrame, key_columns: list[str]) -> DataFrame:
+    """Returns a DataFrame indexed by the text of its key columns, or by row position without key columns."""
+    if len(key_columns) == 0:
+        return df.reset_index(drop=True)
+    keys = df[key_columns].astype(str).agg(' | '.join, axis=1)
+    return df.set_index(pd.Index(keys, name='Row'))
+# END index_rows
+
+
+def _compare_frame(name: str,
+                   reference_df: DataFrame,
+                   candidate_df: DataFrame,
+                   relative_tolerance: float,
+                   absolute_tolerance: float,
+                   max_reported_values: int) -> list[str]:
+    """Returns report lines of the differences between the reference and candidate versions of one DataFrame."""
+
+    lines = []
+    for column in reference_df.columns.difference(candidate_df.columns):
+        lines.append(f'{name}: column {column} is missing from the candidate')
+    for column in candidate_df.columns.difference(reference_df.columns):
+        lines.append(f'{name}: column {column} is not in the reference')
+
+    key_columns = _get_key_columns(reference_df)
+    if any(column not in candidate_df.columns for column in key_columns):
+        return lines + [f'{name}: rows cannot be matched because key columns are missing']
+    reference_df = _index_rows(reference_df, key_columns)
+    candidate_df = _index_rows(candidate_df, key_columns)
+    for row in reference_df.index.difference(candidate_df.index):
+        lines.append(f'{name}: row {row} is missing from the candidate')
+    for row in candidate_df.index.difference(reference_df.index):
+        lines.append(f'{name}: row {row} is not in the reference')
+    if reference_df.index.has_duplicates or candidate_df.index.has_duplicates:
+        return lines + [f'{name}: rows cannot be matched because row keys are not unique']
+
+    rows = reference_df.index.intersection(candidate_df.index)
+    mismatch_count = 0
+    for column in reference_df.columns.intersection(candidate_df.columns):
+        reference_values = reference_df.loc[rows, column]
+        candidate_values = candidate_df.loc[rows, column]
+        if (pd.api.types.is_numeric_dtype(reference_values) and pd.api.types.is_numeric_dtype(candidate_values)
+                and not pd.api.types.is_bool_dtype(reference_values)):
+            matched = np.isclose(candidate_values.to_numpy(dtype=np.float64, na_value=np.nan),
+                                 reference_values.to_numpy(dtype=np.float64, na_value=np.nan),
+                                 rtol=relative_tolerance, atol=absolute_tolerance, equal_nan=True)
+        else:
+            matched = ((reference_values.astype(object).where(reference_values.notna(), None).astype(str)
+                        == candidate_values.astype(object).where(candidate_values.notna(), None).astype(str))
+                       .to_numpy())
+        for row in rows[~matched]:
+            mismatch_count += 1
+            if mismatch_count <= max_reported_values:
+                lines.append(f'{name}: {row} | {column} | reference {reference_df.at[row, column]!r} '
+                             f'| candidate {candidate_df.at[row, column]!r}')
+    if mismatch_count > max_reported_values:
+        lines.append(f'{name}: {mismatch_count - max_reported_values} more mismatched values')
+    return lines
+# END compare_frame
+
+
+def compare_outputs(reference: dict[str, DataFrame],
+                    candidate: dict[str, DataFrame],
+                    relative_tolerance: float = _RELATIVE_TOLERANCE,
+                    absolute_tolerance: float = _ABSOLUTE_TOLERANCE,
+                    max_reported_values: int = _MAX_REPORTED_VALUES) -> list[str]:
+    """
+    Returns report lines of the differences between reference and candidate outputs.  Rows are matched by
+    their key columns regardless of order.  Numeric values match when they are within the tolerances and
+    other values match when their text is equal.  Missing values match missing values.
+    :param reference: the reference DataFrames by module, data name, and month
+    :param candidate: the candidate DataFrames by module, data name, and month
+    :param relative_tolerance: the tolerance of numeric values relative to the reference value
+    :param absolute_tolerance: the absolute tolerance of numeric values
+    :param max_reported_values: the number of mismatched values reported for each DataFrame
+    :return: a list of report lines, which is empty when the outputs are equivalent
+    """
+
+    lines = []
+    for name in sorted(set(reference) - set(candidate)):
+        lines.append(f'{name}: missing from the candidate')
+    for name in sorted(set(candidate) - set(reference)):
+        lines.append(f'{name}: not in the reference')
+    for name in sorted(set(reference) & set(candidate)):
+        lines.extend(_compare_frame(name, reference[name], candidate[name],
+                                    relative_tolerance, absolute_tolerance, max_reported_values))
+    return lines
+# END compare_outputs
+
+
+# MAIN
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks a candidate model implementation against a reference.')
+    parser.add_argument('--reference', help='folder or git revision of the reference implementation')
+    parser.add_argument('--golden', help='file of stored reference outputs to compare instead of a reference')
+    parser.add_argument('--candidate', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='folder of the candidate implementation, this project by default')
+    parser.add_argument('--source-directory', help='folder with the source data files')
+    parser.add_argument('--rows', type=int, help='compare on synthetic source data with this many referrals')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rtol', type=float, default=_RELATIVE_TOLERANCE)
+    parser.add_argument('--atol', type=float, default=_ABSOLUTE_TOLERANCE)
+    parser.add_argument('--max-values', type=int, default=_MAX_REPORTED_VALUES)
+    parser.add_argument('--save-golden', help='file to store the reference outputs in')
+    parser.add_argument('--capture', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.capture is not None:
+        # Capture the outputs of the implementation on the path for the process that compares them
+        pd.to_pickle(capture_outputs(), args.capture)
+        sys.exit(0)
+
+    if (args.reference is None) == (args.golden is None):
+        parser.error('give either a reference implementation or a golden output file')
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        source_directory = args.source_directory
+        if args.rows is not None:
+            from benchmarks.synthetic_data import write_source_files
+            source_directory = os.path.join(temporary_directory, 'source')
+            write_source_files(source_directory, args.rows, args.seed)
+        if source_directory is None:
+            parser.error('give a source data folder or a number of synthetic rows')
+
+        if args.golden is not None:
+            reference_outputs = pd.read_pickle(args.golden)
+        else:
+            reference_directory = args.reference
+            if not os.path.isdir(reference_directory):
+                reference_directory = _export_revision(args.reference, os.path.join(temporary_directory, 'reference'))
+            print('Capturing reference outputs from ' + args.reference)
+            reference_file = os.path.join(temporary_directory, 'reference.pkl')
+            capture_implementation(reference_directory, source_directory, reference_file)
+            reference_outputs = pd.read_pickle(reference_file)
+            if args.save_golden is not None:
+                pd.to_pickle(reference_outputs, args.save_golden)
+
+        print('Capturing candidate outputs from ' + args.candidate)
+        candidate_file = os.path.join(temporary_directory, 'candidate.pkl')
+        capture_implementation(args.candidate, source_directory, candidate_file)
+        candidate_outputs = pd.read_pickle(candidate_file)
+
+    report = compare_outputs(reference_outputs, candidate_outputs, args.rtol, args.atol, args.max_values)
+    print('\n'.join(report))
+    print(f'{len(reference_outputs)} reference DataFrames, {len(candidate_outputs)} candidate DataFrames, '
+          f'{len(report)} lines of differences')
+    sys.exit(1 if len(report) > 0 else 0)
@@ -0,0 +1,233 @@
+"""
+model_benchmarks.py
+Benchmarks of the model layer on synthetic source data at several row counts.  Each stage runs in its own
+process in a folder of synthetic source files so that the model modules load the synthetic data when they are
+imported.  The wall time of each stage and the peak memory it allocates are reported and compared to a stored
+baseline so that regressions are visible.  Run from the working folder with:
+    python -m benchmarks.model_benchmarks --rows 10000 100000
+    python -m benchmarks.model_benchmarks --rows 10000 100000 --save-baseline
+https://907sjl.github.io/
+
+Functions:
+    run_stage - Runs one benchmark stage in this process and returns its wall time and peak memory
+    run_benchmarks - Runs benchmark stages at several row counts, each in its own process
+    compare_to_baseline - Returns report lines of benchmark results compared to baseline results
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic_data import write_source_files
+
+
+# Row counts of synthetic referrals that are benchmarked by default
+_DEFAULT_ROWS = [10000, 100000, 1000000, 10000000]
+
+# Folder of synthetic source files by row count, relative to the working folder
+_DATA_DIRECTORY = 'benchmark_data'
+
+# Baseline results stored with the benchmarks
+_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Ratio of a result to its baseline above which the result is reported as a regression
+_REGRESSION_TOLERANCE = 1.25
+
+
+def _prepare_referral_master():
+    """Returns the function that creates the referral master DataFrame from the source file."""
+    import model.source.Referrals as r
+    return r.create_master_data_frame
+# END prepare_referral_master
+
+
+def _prepare_process_time():
+    """Returns the function that calculates the process measures for the last month with new fact cubes."""
+    import model.source.Referrals as r
+    import model.ProcessTime as wt
+    return lambda: wt._calculate_process_measures_for_month(r.referral_df, wt.last_month)
+# END prepare_process_time
+
+
+def _prepare_pending_time():
+    """Returns the function that calculates every pending referral measure."""
+    import model.source.Referrals as r
+    import model.PendingTime as p
+
+    def calculate_pending_time():
+        p._calculate_on_hold_measures(r.referral_df)
+        p._calculate_pending_reschedule_measures(r.referral_df)
+        p._calculate_pending_acceptance_measures(r.referral_df)
+        p._calculate_accepted_status_measures(r.referral_df)
+
+    return calculate_pending_time
+# END prepare_pending_time
+
+
+def _prepare_crm_use():
+    """Returns the function that calculates the CRM use measures for the last month."""
+    import model.source.Referrals as r
+    import model.CRMUse as c
+    return lambda: c._calculate_crm_measures_for_month(r.referral_df, c.last_month)
+# END prepare_crm_use
+
+
+def _prepare_dsm_use():
+    """Returns the function that creates the DSM master DataFrame and calculates the DSM use measures."""
+    import model.source.DSMs as d
+    import model.DSMUse as du
+
+    def calculate_dsm_use():
+        dsm_df = d.create_master_data_frame()
+        d.encode_master_data_frame(dsm_df)
+        du._calculate_dsm_measures_for_month(dsm_df, du.last_month)
+
+    return calculate_dsm_use
+# END prepare_dsm_use
+
+
+# Benchmark stages by name, with the function that imports the model modules and returns the function to time
+_STAGES = {'referral-master': _prepare_referral_master,
+           'process-time': _prepare_process_time,
+           'pending-time': _prepare_pending_time,
+           'crm-use': _prepare_crm_use,
+           'dsm-use': _prepare_dsm_use}
+
+
+def run_stage(stage: str, measure_memory: bool = True) -> dict[str, float]:
+    """
+    Runs one benchmark stage in this process.  The model modules are imported first, which loads the source
+    files in the working folder, and are not timed.  The stage is run once for wall time and once more with
+    memory tracing for the peak memory allocated by Python and numpy, so tracing does not slow the timed run.
+    :param stage: the name of the stage
+    :param measure_memory: True to measure the peak memory of the stage
+    :return: a dictionary with the seconds of wall time and the peak megabytes allocated by the stage
+    """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        calculate = _STAGES[stage]()
+
+        start_time = time.perf_counter()
+        calculate()
+        seconds = time.perf_counter() - start_time
+
+        peak_mb = None
+        if measure_memory:
+            tracemalloc.start()
+            calculate()
+            peak_mb = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+            tracemalloc.stop()
+
+    return {'seconds': seconds, 'peak-mb': peak_mb}
+# END run_stage
+
+
+def run_benchmarks(rows: list[int],
+                   stages: list[str],
+                   data_directory: str = _DATA_DIRECTORY,
+                   measure_memory: bool = True) -> dict[str, dict[str, dict]]:
+    """
+    Runs benchmark stages at several row counts.  Synthetic source files are written for each row count the
+    first time it is benchmarked.  Each stage runs in a new process in the folder of the source files.
+    :param rows: the row counts of synthetic referrals
+    :param stages: the names of the stages
+    :param data_directory: the folder of synthetic source files by row count
+    :param measure_memory: True to measure the peak memory of each stage
+    :return: the results of each stage by row count and stage name
+    """
+
+    project_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, REFERRALS_MONTH_WORKERS='0')
+    results = {}
+    for row_count in rows:
+        source_directory = os.path.abspath(os.path.join(data_directory, str(row_count)))
+        print(f'Writing synthetic source data with {row_count} rows...')
+        write_source_files(source_directory, row_count)
+
+        results[str(row_count)] = {}
+        for stage in stages:
+            command = [sys.executable, '-m', 'benchmarks.model_benchmarks', '--run-stage', stage,
+                       '--source-directory', source_directory]
+            if not measure_memory:
+                command.append('--no-memory')
+            completed = subprocess.run(command, cwd=project_directory, env=environment,
+                                       capture_output=True, text=True, check=True)
+            results[str(row_count)][stage] = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{row_count:>10} rows {stage:<16} {results[str(row_count)][stage]['seconds']:10.3f} s")
+    return results
+# END run_benchmarks
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float = _REGRESSION_TOLERANCE) -> list[str]:
+    """
+    Returns report lines of benchmark results compared to baseline results.  Results that are slower or
+    allocate more memory than the baseline by more than the tolerance are marked as regressions.
+    :param results: the results of each stage by row count and stage name
+    :param baseline: the baseline results in the same layout, which may be empty
+    :param tolerance: the ratio of a result to its baseline above which the result is a regression
+    :return: a list of report lines
+    """
+
+    def format_ratio(value: float, baseline_value: float) -> (str, bool):
+        if value is None or baseline_value is None or baseline_value <= 0.0:
+            return f"{'':>7}", False
+        ratio = value / baseline_value
+        return f'{ratio:6.2f}x', ratio > tolerance
+
+    lines = [f"{'rows':>10} {'stage':<16} {'seconds':>10} {'vs base':>7} {'peak MB':>10} {'vs base':>7}"]
+    for row_count, stage_results in results.items():
+        for stage, result in stage_results.items():
+            baseline_result = baseline.get(row_count, {}).get(stage, {})
+            time_ratio, slower = format_ratio(result['seconds'], baseline_result.get('seconds'))
+            memory_ratio, larger = format_ratio(result['peak-mb'], baseline_result.get('peak-mb'))
+            peak_mb = f"{result['peak-mb']:10.1f}" if result['peak-mb'] is not None else f"{'':>10}"
+            line = f"{row_count:>10} {stage:<16} {result['seconds']:10.3f} {time_ratio} {peak_mb} {memory_ratio}"
+            if slower or larger:
+                line += '  REGRESSION'
+            lines.append(line)
+    return lines
+# END compare_to_baseline
+
+
+# MAIN
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the model layer on synthetic source data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=_DEFAULT_ROWS)
+    parser.add_argument('--stages', nargs='+', choices=list(_STAGES), default=list(_STAGES))
+    parser.add_argument('--data-directory', default=_DATA_DIRECTORY)
+    parser.add_argument('--baseline', default=_BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results in the baseline file, replacing results for the same row counts')
+    parser.add_argument('--tolerance', type=float, default=_REGRESSION_TOLERANCE)
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced run that measures peak memory')
+    parser.add_argument('--run-stage', choices=list(_STAGES), help=argparse.SUPPRESS)
+    parser.add_argument('--source-directory', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage is not None:
+        # Run one stage in this process for the process that runs the benchmarks
+        os.chdir(args.source_directory)
+        print(json.dumps(run_stage(args.run_stage, not args.no_memory)))
+        sys.exit(0)
+
+    stored_baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            stored_baseline = json.load(baseline_file)
+
+    benchmark_results = run_benchmarks(args.rows, args.stages, args.data_directory, not args.no_memory)
+    print('\n'.join(compare_to_baseline(benchmark_results, stored_baseline, args.tolerance)))
+
+    if args.save_baseline:
+        for rows_key, rows_results in benchmark_results.items():
+            stored_baseline.setdefault(rows_key, {}).update(rows_results)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(stored_baseline, baseline_file, indent=2, sort_keys=True)
+        print('Baseline saved to ' + args.baseline)
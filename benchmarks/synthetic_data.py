@@ -0,0 +1,261 @@
+"""
+synthetic_data.py
+Generates deterministic synthetic referral and direct secure message source files in the layout of the real
+source files, at any number of rows.  Clinic volumes are skewed so that a few clinics receive most referrals,
+priorities and statuses follow a typical mix, and the days between referral milestones are drawn from skewed
+distributions that are shorter for urgent referrals.  The same row count and seed always generate the same rows.
+https://907sjl.github.io/
+
+Functions:
+    generate_referrals - Returns a DataFrame of synthetic referrals in the layout of the referral source file
+    generate_dsms - Returns a DataFrame of synthetic direct secure messages in the layout of the DSM source file
+    write_source_files - Writes synthetic referral and DSM source files to a folder
+"""
+
+import pandas as pd
+from pandas import DataFrame
+import numpy as np
+
+from datetime import datetime
+
+import os
+
+
+# Last day of source data before the effective as-of date of the model, and the days of referral history
+_LAST_DATA_DATE = datetime(2023, 2, 28)
+_HISTORY_DAYS = 3 * 365
+
+# Specialty clinics in order of referral volume, with volumes that fall off as a Zipf distribution
+_CLINICS = ['Orthopedics', 'Cardiology', 'Dermatology', 'Gastroenterology', 'Neurology', 'Pulmonology',
+            'Endocrinology', 'Urology', 'Oncology', 'Rheumatology', 'Nephrology', 'Ophthalmology',
+            'Otolaryngology', 'Allergy and Immunology', 'Infectious Disease', 'Hematology', 'Podiatry',
+            'Sleep Medicine', 'Pain Management', 'Genetics']
+_CLINIC_SKEW = 1.1
+
+# Mix of referral priorities, where a missing priority is None
+_PRIORITIES = {'Routine': 0.72, 'Urgent': 0.25, 'STAT': 0.02, None: 0.01}
+
+# Mix of current referral statuses
+_STATUSES = {'Completed': 0.36,
+             'Closed': 0.09,
+             'Scheduled': 0.12,
+             'Accepted': 0.09,
+             'Pending Acceptance': 0.07,
+             'On Hold': 0.05,
+             'Pending Reschedule': 0.04,
+             'Rejected': 0.08,
+             'Cancelled': 0.10}
+
+# Statuses of referrals that are still waiting for acceptance, an appointment, or a visit
+_OPEN_STATUSES = ['Scheduled', 'Accepted', 'Pending Acceptance', 'On Hold', 'Pending Reschedule']
+
+# Sub-status values that referrals with each status are tagged with
+_SUB_STATUSES = {'Pending Acceptance': ['Review Referral', 'Awaiting Records', 'Awaiting Insurance Authorization'],
+                 'Pending Reschedule': ['Call Patient to Schedule Appointment', 'Patient to Call Back',
+                                        'Provider Rescheduled'],
+                 'Accepted': ['Call Patient to Schedule Appointment', 'Awaiting Patient Response',
+                              'Awaiting Provider Schedule']}
+_HOLD_REASONS = ['Coordinating Care', 'Insurance', 'Patient Request', 'Awaiting Records']
+
+# Gamma distributions of the days between milestones as shape and scale, by routine and urgent priority
+_MILESTONE_DAYS = {'accept': {'Routine': (1.2, 2.5), 'Urgent': (1.0, 0.8)},
+                   'schedule': {'Routine': (1.5, 5.0), 'Urgent': (1.2, 1.0)},
+                   'seen': {'Routine': (2.0, 6.0), 'Urgent': (1.5, 1.2)},
+                   'complete': {'Routine': (1.0, 6.0), 'Urgent': (1.0, 4.0)}}
+
+# Share of messages that lead to a referral to the same clinic
+_DSM_REFERRAL_RATE = 0.35
+_SENDER_CATEGORIES = {'Primary Care': 0.6, 'Emergency Department': 0.15, 'Specialty Care': 0.15, 'Other': 0.1}
+
+
+def _choose(generator: np.random.Generator, mix: dict, rows: int) -> np.ndarray:
+    """Returns values drawn from a dictionary of values and their shares."""
+    values = np.array(list(mix.keys()), dtype=object)
+    shares = np.array(list(mix.values()), dtype=np.float64)
+    return values[generator.choice(len(values), size=rows, p=shares / shares.sum())]
+# END choose
+
+
+def _make_ids(prefix: str, numbers: np.ndarray) -> np.ndarray:
+    """Returns text identifiers made from a prefix and zero padded numbers."""
+    return np.char.add(prefix, np.char.zfill(numbers.astype(str), 9)).astype(object)
+# END make_ids
+
+
+def _draw_sent_days(generator: np.random.Generator, rows: int) -> np.ndarray:
+    """
+    Returns the days that referrals were sent, as days before the last data date.  Volume grows over the
+    history and few referrals are sent on weekends.
+    """
+    days_before = np.arange(_HISTORY_DAYS)
+    dates = np.datetime64(_LAST_DATA_DATE, 'D') - days_before
+    weekday = ((dates.astype(np.int64) + 3) % 7) < 5
+    weights = np.where(weekday, 1.0, 0.15) * (1.0 + (0.5 * (_HISTORY_DAYS - days_before) / _HISTORY_DAYS))
+    return generator.choice(days_before, size=rows, p=weights / weights.sum())
+# END draw_sent_days
+
+
+def _draw_milestone_days(generator: np.random.Generator, milestone: str, urgent: np.ndarray) -> np.ndarray:
+    """Returns whole days until a milestone drawn from the distribution of each referral's priority."""
+    routine_shape, routine_scale = _MILESTONE_DAYS[milestone]['Routine']
+    urgent_shape, urgent_scale = _MILESTONE_DAYS[milestone]['Urgent']
+    routine_days = generator.gamma(routine_shape, routine_scale, size=len(urgent))
+    urgent_days = generator.gamma(urgent_shape, urgent_scale, size=len(urgent))
+    return np.floor(np.where(urgent, urgent_days, routine_days)).astype(np.int64)
+# END draw_milestone_days
+
+
+def _to_dates(days_before: np.ndarray, present: np.ndarray) -> np.ndarray:
+    """
+    Returns dates for days before the last data date.  Dates that are not present or that fall after the
+    last data date are missing.
+    """
+    dates = (np.datetime64(_LAST_DATA_DATE, 'D') - days_before).astype('datetime64[ns]')
+    return np.where(present & (days_before >= 0), dates, np.datetime64('NaT'))
+# END to_dates
+
+
+def generate_referrals(rows: int, seed: int = 0) -> DataFrame:
+    """
+    Returns synthetic referrals in the layout of the referral source file.  Milestone dates follow each other
+    in order and are present for the statuses that reach them.  Recent referrals are more often still open.
+    :param rows: the number of referrals
+    :param seed: the seed of the random values
+    :return: a dataframe with a row for each referral
+    """
+
+    generator = np.random.default_rng(seed)
+
+    clinic_weights = 1.0 / np.power(np.arange(1, len(_CLINICS) + 1), _CLINIC_SKEW)
+    clinics = np.array(_CLINICS, dtype=object)[generator.choice(len(_CLINICS), size=rows,
+                                                                p=clinic_weights / clinic_weights.sum())]
+    priorities = _choose(generator, _PRIORITIES, rows)
+    urgent = (priorities == 'Urgent') | (priorities == 'STAT')
+    statuses = _choose(generator, _STATUSES, rows)
+
+    # Referrals sent in the last weeks are more often still waiting for acceptance or an appointment, and
+    # referrals are more likely to have been completed or closed the longer ago they were sent
+    sent_days = _draw_sent_days(generator, rows)
+    recent = (sent_days < 45) & (generator.random(rows) < 0.5)
+    statuses = np.where(recent & np.isin(statuses, ['Completed', 'Closed']),
+                        np.where(generator.random(rows) < 0.5, 'Pending Acceptance', 'Scheduled'), statuses)
+    settled = np.isin(statuses, _OPEN_STATUSES) & (generator.random(rows) < np.minimum(sent_days / 90.0, 0.95))
+    statuses = np.where(settled, np.where(generator.random(rows) < 0.75, 'Completed', 'Closed'), statuses)
+    statuses = statuses.astype(object)
+
+    # Days before the last data date of each milestone, where later milestones follow earlier ones
+    accepted_days = sent_days - _draw_milestone_days(generator, 'accept', urgent)
+    scheduled_days = accepted_days - _draw_milestone_days(generator, 'schedule', urgent)
+    seen_days = scheduled_days - _draw_milestone_days(generator, 'seen', urgent)
+    completed_days = seen_days - _draw_milestone_days(generator, 'complete', urgent)
+
+    is_accepted = ~np.isin(statuses, ['Pending Acceptance', 'Rejected'])
+    is_accepted &= ~((statuses == 'Cancelled') & (generator.random(rows) < 0.5))
+    is_scheduled = np.isin(statuses, ['Scheduled', 'Completed', 'Pending Reschedule'])
+    is_scheduled |= (statuses == 'Closed') & (generator.random(rows) < 0.3)
+    is_seen = ((statuses == 'Completed') & (generator.random(rows) < 0.92))
+    is_seen |= (statuses == 'Closed') & (generator.random(rows) < 0.2)
+    is_checked_in = is_seen & (generator.random(rows) < 0.8)
+    is_completed = statuses == 'Completed'
+    is_similar = ~is_scheduled & (generator.random(rows) < 0.08)
+
+    sub_statuses = np.full(rows, None, dtype=object)
+    for status, values in _SUB_STATUSES.items():
+        idx = statuses == status
+        sub_statuses[idx] = np.array(values, dtype=object)[generator.integers(0, len(values), idx.sum())]
+    on_hold = statuses == 'On Hold'
+    hold_reasons = np.full(rows, None, dtype=object)
+    hold_reasons[on_hold] = np.array(_HOLD_REASONS, dtype=object)[generator.integers(0, len(_HOLD_REASONS),
+                                                                                     on_hold.sum())]
+
+    last_update_days = np.minimum.reduce([sent_days,
+                                          np.where(is_accepted, accepted_days, sent_days),
+                                          np.where(is_scheduled, scheduled_days, sent_days),
+                                          np.where(is_completed, completed_days, sent_days)])
+    last_update_days = last_update_days - generator.integers(0, 10, rows)
+
+    df = pd.DataFrame({
+        'Referral ID': _make_ids('R', generator.permutation(rows)),
+        'Source Location': _choose(generator, {'Main Campus': 0.5, 'North Clinic': 0.3, 'Telehealth': 0.2}, rows),
+        'Provider Referred To': _make_ids('DR', generator.integers(0, 40 + (rows // 2000), rows)),
+        'Location Referred To': _choose(generator, {'Building A': 0.6, 'Building B': 0.4}, rows),
+        'Referral Priority': priorities,
+        'Referral Status': statuses,
+        'Patient ID': _make_ids('P', generator.integers(0, max((rows * 3) // 5, 1), rows)),
+        'Clinic': clinics,
+        'Last Referral Update By': _make_ids('U', generator.integers(0, 50, rows)),
+        'Assigned Personnel': _make_ids('S', generator.integers(0, 30, rows)),
+        'Organization Referred To': 'Specialty Care',
+        'Reason for Hold': hold_reasons,
+        'Referral Sub-Status': sub_statuses,
+        'Date Referral Sent': _to_dates(sent_days, generator.random(rows) >= 0.005),
+        'Date Referral Seen': _to_dates(seen_days, is_seen),
+        'Date Patient Checked In': _to_dates(seen_days, is_checked_in),
+        'Date Held': _to_dates(sent_days - generator.integers(0, 30, rows), on_hold),
+        'Date Pending Reschedule': _to_dates(scheduled_days, statuses == 'Pending Reschedule'),
+        'Date Last Referral Update': _to_dates(np.maximum(last_update_days, 0), np.full(rows, True)),
+        'Date Similar Appt Scheduled': _to_dates(accepted_days - generator.integers(0, 20, rows), is_similar),
+        'Date Accepted': _to_dates(accepted_days, is_accepted),
+        'Date Referral Written': _to_dates(sent_days + generator.geometric(0.6, rows) - 1, np.full(rows, True)),
+        'Date Referral Completed': _to_dates(completed_days, is_completed),
+        'Date Referral Scheduled': _to_dates(scheduled_days, is_scheduled)})
+    return df
+# END generate_referrals
+
+
+def generate_dsms(rows: int, referrals_df: DataFrame, seed: int = 0) -> DataFrame:
+    """
+    Returns synthetic direct secure messages in the layout of the DSM source file.  Some messages lead to
+    a referral of the same patient to the same clinic, which is sent on or after the message date.
+    :param rows: the number of messages
+    :param referrals_df: the synthetic referrals that messages lead to
+    :param seed: the seed of the random values
+    :return: a dataframe with a row for each message
+    """
+
+    generator = np.random.default_rng(seed + 1)
+
+    referrals = referrals_df.loc[referrals_df['Date Referral Sent'].notna()]
+    sources = referrals.iloc[generator.integers(0, len(referrals.index), rows)]
+    has_referral = generator.random(rows) < _DSM_REFERRAL_RATE
+    message_dates = (sources['Date Referral Sent'].to_numpy(dtype='datetime64[ns]')
+                     - generator.geometric(0.3, rows).astype('timedelta64[D]'))
+
+    df = pd.DataFrame({
+        'Message ID': _make_ids('M', generator.permutation(rows)),
+        'Message Date': message_dates,
+        'Clinic': sources['Clinic'].to_numpy(),
+        'Sender Category': _choose(generator, _SENDER_CATEGORIES, rows),
+        'Sent From': _make_ids('F', generator.integers(0, 200, rows)),
+        'Referral ID': np.where(has_referral, sources['Referral ID'].to_numpy(), None),
+        'Date Referral Sent': np.where(has_referral, sources['Date Referral Sent'].to_numpy(), np.datetime64('NaT')),
+        'Person ID': np.where(has_referral, sources['Patient ID'].to_numpy(),
+                              _make_ids('P', generator.integers(0, max(rows, 1), rows)))})
+    return df
+# END generate_dsms
+
+
+def write_source_files(directory: str, rows: int, seed: int = 0) -> None:
+    """
+    Writes synthetic referral and DSM source files to a folder with the file names of the real source files.
+    Files that were already written for the same row count and seed are kept.
+    :param directory: the folder to write the source files to
+    :param rows: the number of referrals, with one message for every three referrals
+    :param seed: the seed of the random values
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    marker_path = os.path.join(directory, 'synthetic-source.txt')
+    marker = f'rows={rows} seed={seed}'
+    if os.path.exists(marker_path):
+        with open(marker_path) as file:
+            if file.read() == marker:
+                return
+
+    referrals_df = generate_referrals(rows, seed)
+    referrals_df.to_csv(os.path.join(directory, 'referrals.csv'), index=False, date_format='%Y-%m-%d')
+    generate_dsms(max(rows // 3, 1), referrals_df, seed).to_csv(os.path.join(directory, 'DirectSecureMessages.csv'),
+                                                                  index=False, date_format='%Y-%m-%d')
+    with open(marker_path, 'w') as file:
+        file.write(marker)
+# END write_source_files
@@ -0,0 +1,120 @@
+"""
+variance_scoring.py
+Micro-benchmark of the variance directions and variance category scoring of the process measures.  The array
+operations in ProcessTime are timed against the element-wise Series.apply scoring that they replaced, on a
+month of synthetic variances for many clinics, after checking that both produce the same columns.
+https://907sjl.github.io/
+
+Functions:
+    create_month_data_frame - Returns a month of synthetic variances by clinic
+    run_benchmark - Times both implementations and returns the timings in seconds
+"""
+
+import pandas as pd
+from pandas import DataFrame
+import numpy as np
+
+import argparse
+import timeit
+
+import model.ProcessTime as wt
+
+
+def _up_or_down(x: float) -> str:
+    """Element-wise directional indicator of a variance that the array operations replaced."""
+    if x < 0.0:
+        return "\u25BC"
+    elif x > 0.0:
+        return "\u25B2"
+    else:
+        return "-"
+# END up_or_down
+
+
+def _calculate_elementwise(curr_month_df: DataFrame) -> None:
+    """Calculates the variances, directions, and categories with the element-wise Series.apply scoring."""
+
+    def calculate_score(x: float, score: int) -> int:
+        if x >= 0.0:
+            return score
+        else:
+            return 0
+
+    for measure in wt._DEPENDENT_VARIANCES:
+        variances = curr_month_df[measure['value']] - curr_month_df[measure['standard']]
+        curr_month_df[measure['measure']] = variances
+        curr_month_df['Dir ' + measure['measure']] = variances.apply(_up_or_down)
+
+    for category in wt._VARIANCE_CATEGORIES:
+        near_vars = curr_month_df[category['near-term']].apply(calculate_score, args=(1,))
+        mid_vars = curr_month_df[category['mid-term']].apply(calculate_score, args=(10,))
+        long_vars = curr_month_df[category['long-term']].apply(calculate_score, args=(100,))
+        scores = near_vars + mid_vars + long_vars
+        curr_month_df[category['category']] = scores.map(category['rubric'])
+# END calculate_elementwise
+
+
+def _calculate_vectorized(curr_month_df: DataFrame) -> None:
+    """Calculates the variances, directions, and categories with the array operations in ProcessTime."""
+    for measure in wt._DEPENDENT_VARIANCES:
+        wt._calculate_dependent_variance(curr_month_df, measure)
+    for category in wt._VARIANCE_CATEGORIES:
+        wt._calculate_variance_category(curr_month_df, category)
+# END calculate_vectorized
+
+
+def create_month_data_frame(clinic_count: int, seed: int = 0) -> DataFrame:
+    """
+    Returns a month of synthetic measures that the variances are calculated from.  Values include ties,
+    so that variances of zero are scored, and missing values.
+    :param clinic_count: the number of clinic rows
+    :param seed: the seed of the random values
+    :return: a dataframe with a row per clinic and a column for each value and standard of a variance
+    """
+
+    generator = np.random.default_rng(seed)
+    columns = sorted({name for measure in wt._DEPENDENT_VARIANCES for name in [measure['value'], measure['standard']]})
+    month_df = pd.DataFrame({'Clinic': [f'Clinic {number}' for number in range(clinic_count)]})
+    for column in columns:
+        values = generator.integers(0, 20, clinic_count).astype(np.float64)
+        values[generator.random(clinic_count) < 0.05] = np.nan
+        month_df[column] = values
+    return month_df
+# END create_month_data_frame
+
+
+def run_benchmark(clinic_count: int, repeat: int) -> dict[str, float]:
+    """
+    Times both implementations on the same month of synthetic measures after checking that they produce
+    the same columns.
+    :param clinic_count: the number of clinic rows
+    :param repeat: the number of timed runs of each implementation, of which the fastest is kept
+    :return: the fastest run in seconds by implementation name
+    """
+
+    month_df = create_month_data_frame(clinic_count)
+    expected_df = month_df.copy()
+    _calculate_elementwise(expected_df)
+    actual_df = month_df.copy()
+    _calculate_vectorized(actual_df)
+    pd.testing.assert_frame_equal(actual_df, expected_df)
+
+    return {name: min(timeit.repeat(lambda: calculate(month_df.copy()), number=1, repeat=repeat))
+            for name, calculate in [('element-wise', _calculate_elementwise),
+                                    ('vectorized', _calculate_vectorized)]}
+# END run_benchmark
+
+
+# MAIN
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times variance directions and variance category scoring.')
+    parser.add_argument('--clinics', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for clinics in args.clinics:
+        timings = run_benchmark(clinics, args.repeat)
+        print(f"{clinics:>6} clinics: element-wise {timings['element-wise'] * 1000.0:9.2f} ms, "
+              f"vectorized {timings['vectorized'] * 1000.0:9.2f} ms, "
+              f"speedup {timings['element-wise'] / timings['vectorized']:6.1f}x")
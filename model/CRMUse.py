@@ -1,22 +1,23 @@
 """
 CRMUse.py
 Module that provides measure data for the relative use of the Clinic Referral Management system vs. the schedule
+The measure data is served from the current model snapshot, which is replaced when the source data changes.
 https://907sjl.github.io/
 
 Top-Level Variables:
     overall_measures[month] - Calculated measurement data by month aggregated across all clinics
-    clinic_measures[month] - Calculated measurement data by month by clinic
+    clinic_measures[month] - Calculated measurement data by month by clinic, calculated on first request
     distribution_data[month] - Calculated counts by category by month and clinic
     test_results[month] - Calculated test scores of CRM use by month and clinic
     last_month - The first day of the previous month at time 00:00:00
 
 Functions:
-    set_crm_usage_score_for_clinic - Calculates the point score for one of the CRM usage tests
+    set_crm_usage_score - Calculates the point score for one of the CRM usage tests in test results of a clinic
     get_counts_by_not_accepted_referral_status - Returns referral status and counts for referrals not accepted,
                                                  canceled, nor rejected
     get_not_accepted_referral_status_list - Returns the list of unique statuses included in the counts by status
     get_clinic_count_measure - Returns the requested measure value as an integer data type
-    get_crm_usage_test_results - Returns the CRM usage test results for a clinic as a DataFrame of milestones and scores
+    get_crm_usage_test_results - Returns a copy of the CRM usage test results for a clinic to calculate scores in
 """
 
 from pandas import DataFrame
@@ -26,18 +27,28 @@ import numpy as np
 
 from datetime import datetime 
 from dateutil.relativedelta import relativedelta
+from typing import Callable
 
 import model.source.Referrals as r
+import model.source.Encoding as e
+from model.MeasureCache import MeasureCache
+from model.MeasureStore import MeasureStore
+from model.MonthCache import MonthCache
+import model.Snapshot as sn
 
 
 # Effective as-of date for data
 _AS_OF_DATE = datetime(2023, 3, 1)
 
-# Top-level variable pointers to CRM data
-overall_measures = {}
-clinic_measures = {}
-distribution_data = {}
-test_results = {}
+# Version of the measure definitions in this module, incremented when a change invalidates cached measures
+_MEASURE_DEFINITION_VERSION = 1
+
+# Number of reporting months that can be requested, and the number of months kept resident in memory
+_HISTORY_MONTHS = 12
+_RESIDENT_MONTHS = 6
+
+# Months offset from the last month that are calculated ahead of requests from Bokeh
+_PREFETCH_MONTH_OFFSETS = [0]
 
 # Config for a standardized test of CRM use vs. the schedule book
 _CRM_USAGE_TESTS = {'Milestone': ['Accepted', 'Linked', 'Seen', 'Completed', 'Import'],
@@ -64,7 +75,7 @@ def _calculate_distributions_after_90_days(source_df: DataFrame, category_column
     """
 
     # Create sums of referrals by clinic and category combinations
-    distribution_df = source_df.groupby(['Clinic', category_column]) \
+    distribution_df = source_df.groupby(['Clinic', category_column], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
@@ -73,23 +84,23 @@ def _calculate_distributions_after_90_days(source_df: DataFrame, category_column
 # END calculate_distributions_after_90_days
 
 
-def set_crm_usage_score_for_clinic(report_month: datetime, clinic: str, milestone: str, result_ratio: float) -> None:
+def set_crm_usage_score(test_results_df: DataFrame, milestone: str, result_ratio: float) -> None:
     """
-    Calculates a point score for one of the tests of CRM use.
-    :param report_month: The month to calculate the score for
-    :param clinic: The clinic to calculate the score for
+    Calculates a point score for one of the tests of CRM use in the test results of a clinic.  The test results
+    of the month are shared by every session, so scores are calculated in the copy of the test results of a clinic
+    returned by get_crm_usage_test_results.
+    :param test_results_df: The test results of a clinic returned by get_crm_usage_test_results
     :param milestone: The test to calculate the score for
     :param result_ratio: The percentage result for the test
     """
 
-    df = test_results[report_month]
-    vw = df.loc[((df['Milestone'] == milestone) & (df['Clinic'] == clinic))]
-    index = min(vw.index) 
-    value = vw.at[min(vw.index), 'Point Value'] 
+    vw = test_results_df.loc[(test_results_df['Milestone'] == milestone)]
+    index = min(vw.index)
+    value = vw.at[index, 'Point Value']
     score = value * result_ratio
-    df.at[index, 'Result'] = int((result_ratio * 100.0) + 0.5)
-    df.at[index, 'Score'] = round(score, 2) 
-# END set_crm_usage_score_for_clinic
+    test_results_df.at[index, 'Result'] = int((result_ratio * 100.0) + 0.5)
+    test_results_df.at[index, 'Score'] = round(score, 2)
+# END set_crm_usage_score
 
 
 def _calculate_crm_measures_for_month(referral_df: DataFrame,
@@ -107,8 +118,8 @@ def _calculate_crm_measures_for_month(referral_df: DataFrame,
     next_month = report_month + relativedelta(months=1)
 
     # Create sliced views of data for various lookback periods of time
-    month_view_90d = referral_df.loc[(referral_df['Reporting Date 90 Day Lag'] >= report_month) 
-                                     & (referral_df['Reporting Date 90 Day Lag'] < next_month)].copy()
+    month_view_90d = referral_df.loc[(referral_df['Reporting Date 90 Day Lag'] >= e.to_epoch_day(report_month))
+                                     & (referral_df['Reporting Date 90 Day Lag'] < e.to_epoch_day(next_month))].copy()
     
     # Create master list of clinics used to merge data using left joins and add a placeholder clinic named *ALL* 
     crm_df = pd.DataFrame({'Clinic': np.sort(referral_df['Clinic'].unique())})
@@ -125,7 +136,7 @@ def _calculate_crm_measures_for_month(referral_df: DataFrame,
     # MEASURE: Count of appointments linked in CRM after 90 days
     scheduled_by_90d_df = month_view_90d.loc[(month_view_90d['Appointment Linked Yn'] == 1)
                                              & (month_view_90d['Referral Aged Yn'] == 1)] \
-        .groupby('Clinic') \
+        .groupby('Clinic', observed=True) \
         .agg({'Referral ID': 'count'}) \
         .rename(columns={'Referral ID': 'Appointments Linked After 90d'})
     
@@ -135,7 +146,7 @@ def _calculate_crm_measures_for_month(referral_df: DataFrame,
     # MEASURE: Count of referrals seen in CRM after 90 days
     seen_by_90d_df = month_view_90d.loc[(month_view_90d['Referral Seen in CRM Yn'] == 1)
                                         & (month_view_90d['Referral Aged Yn'] == 1)] \
-        .groupby('Clinic') \
+        .groupby('Clinic', observed=True) \
         .agg({'Referral ID': 'count'}) \
         .rename(columns={'Referral ID': 'Referrals Seen in CRM After 90d'})
     
@@ -157,56 +168,141 @@ def get_counts_by_not_accepted_referral_status(report_month: datetime, clinic: s
     :param clinic: The clinic to return counts for
     :return: A DataFrame of referral counts by status
     """
-    df = distribution_data[report_month]
+    df = _get_data()['distribution_data'][report_month]
     return df.loc[(df['Clinic'] == clinic)]
 # END get_counts_by_not_accepted_referral_status
 
 
 def get_not_accepted_referral_status_list(report_month: datetime, clinic: str) -> list[str]:
     """Returns the list of unique statuses included in the counts by status."""
-    df = distribution_data[report_month]
+    df = _get_data()['distribution_data'][report_month]
     return df.loc[(df['Clinic'] == clinic)]['Referral Status'].tolist()
 # END get_not_accepted_referral_status_list
 
 
 def get_clinic_count_measure(report_month: datetime, clinic: str, measure: str) -> int:
     """Returns a clinic measure value as an integer count or as zero if there is no value."""
-    df = clinic_measures[report_month]
-    if measure in df.select_dtypes(include=['int64', 'int32', 'float64']).columns:
-        view = df.loc[(df['Clinic'] == clinic)]
-        if view.empty:
-            return 0
-        else:
-            return int(view.at[min(view.index), measure])
+    value = _read_measure_store([report_month], lambda store: store.get_numeric_measure(report_month, clinic, measure))
+    if value is not None:
+        return int(value)
 # END get_clinic_count_measure
 
 
 def get_crm_usage_test_results(report_month: datetime, clinic: str) -> DataFrame:
-    """Returns the CRM usage test results for a clinic as a DataFrame of milestones and scores."""
-    df = test_results[report_month]
-    return df.loc[(df['Clinic'] == clinic)]
+    """
+    Returns a copy of the CRM usage test results for a clinic as a DataFrame of milestones and scores, which the
+    scores of the tests are calculated in with set_crm_usage_score.
+    :param report_month: The month of the test results
+    :param clinic: The clinic of the test results
+    :return: A DataFrame of the milestones, point values, results, and scores of the clinic
+    """
+    df = _get_data()['test_results'][report_month]
+    return df.loc[(df['Clinic'] == clinic)].copy()
 # END get_crm_usage_test_results
 
 
-def _calculate_crm_measures() -> None:
-    for iter_month in range(12):
-        curr_month = last_month + relativedelta(months=-1 * iter_month)
-        print('Calculating measures for ' + curr_month.strftime('%Y-%m-%d'))
-        curr_month_crm_df, curr_month_distributions_df, curr_month_tests_df = (
-            _calculate_crm_measures_for_month(r.referral_df, curr_month))
-        overall_measures[curr_month] = curr_month_crm_df.loc[(curr_month_crm_df['Clinic'] == '*ALL*')]
-        clinic_measures[curr_month] = curr_month_crm_df.loc[~(curr_month_crm_df['Clinic'] == '*ALL*')]
-        distribution_data[curr_month] = (
-            curr_month_distributions_df.loc)[~(curr_month_distributions_df['Clinic'] == '*ALL*')]
-        test_results[curr_month] = curr_month_tests_df
+def _calculate_crm_measures(data: dict, report_month: datetime) -> tuple[DataFrame, DataFrame, DataFrame, DataFrame]:
+    """
+    Calculates the CRM measures for one reporting month.
+    :param data: The data of this module in the model snapshot that the month is loaded into
+    :param report_month: The month to calculate measures for
+    :return: A tuple with the overall measures, clinic measures, distribution counts, and test results for the month
+    """
+
+    print('Calculating measures for ' + report_month.strftime('%Y-%m-%d'))
+    curr_month_crm_df, curr_month_distributions_df, curr_month_tests_df = (
+        _calculate_crm_measures_for_month(data['_referral_df'], report_month))
+    curr_month_overall_df = curr_month_crm_df.loc[(curr_month_crm_df['Clinic'] == '*ALL*')]
+    curr_month_clinic_df = curr_month_crm_df.loc[~(curr_month_crm_df['Clinic'] == '*ALL*')]
+    curr_month_distributions_df = (
+        curr_month_distributions_df.loc)[~(curr_month_distributions_df['Clinic'] == '*ALL*')]
+    return curr_month_overall_df, curr_month_clinic_df, curr_month_distributions_df, curr_month_tests_df
 # END calculate_crm_measures
 
 
-# MAIN
+def _load_crm_measures(data: dict, report_month: datetime) -> tuple[DataFrame, DataFrame, DataFrame, DataFrame]:
+    """
+    Loads the CRM measures for one reporting month when the month is first requested.  Measures are read
+    from the cache on disk, or calculated and cached if they are not cached for the current source data.
+    :param data: The data of this module in the model snapshot that the month is loaded into
+    :param report_month: The month to load measures for
+    :return: A tuple with the overall measures, clinic measures, distribution counts, and test results for the month
+    """
+
+    overall_df, clinic_df, distributions_df, test_results_df = (
+        data['_measure_cache'].get(report_month.strftime('%Y-%m-%d'),
+                                   lambda: _calculate_crm_measures(data, report_month)))
 
-print('Calculating CRM measures...')
+    return overall_df, clinic_df, distributions_df, test_results_df
+# END load_crm_measures
+
+
+def _get_data() -> dict:
+    """Returns the data of this module in the model snapshot of the caller."""
+    return sn.get_data('crm-use')
+# END get_data
+
+
+def _read_measure_store(report_months: list[datetime], read_store: Callable[[MeasureStore], object]) -> object:
+    """
+    Returns the result of a read of the measure store with the given months calculated and resident in memory.
+    The months are made resident and read as one operation of the month cache, so a clinic selection calculated
+    in another thread cannot evict the months or resize the store during the read.
+    """
+    data = _get_data()
+    return data['_month_cache'].read(report_months, lambda: read_store(data['_measure_store']))
+# END read_measure_store
+
+
+def _load_snapshot_data() -> dict:
+    """
+    Returns the top-level variables of this module for a new model snapshot.  Calculated measures are kept on
+    disk until the source data, as-of date, or measure definitions change.  CRM data is calculated on first
+    request by month.
+    """
+    print('Calculating CRM measures...')
+
+    # The measure store has constant time lookups of the resident monthly clinic measurements
+    measure_store = MeasureStore()
+    data = {'_referral_df': r.referral_df,
+            '_measure_cache': MeasureCache('crm-use', [r.source_file], _AS_OF_DATE, _MEASURE_DEFINITION_VERSION),
+            '_measure_store': measure_store}
+    month_cache = MonthCache([last_month + relativedelta(months=-1 * iter_month)
+                              for iter_month in reversed(range(_HISTORY_MONTHS))],
+                             lambda report_month: _load_crm_measures(data, report_month),
+                             _RESIDENT_MONTHS,
+                             evict_month=measure_store.remove_measures,
+                             add_month=lambda report_month, month_data: measure_store.add_measures(report_month,
+                                                                                                   month_data[1]))
+    data['_month_cache'] = month_cache
+    data['overall_measures'] = month_cache.view(0)
+    data['clinic_measures'] = month_cache.view(1)
+    data['distribution_data'] = month_cache.view(2)
+    data['test_results'] = month_cache.view(3)
+
+    # Months are calculated ahead of requests from Bokeh, and the latest months that stay resident are calculated
+    # when worker processes can be forked to calculate them in parallel
+    if month_cache.can_fork_workers():
+        month_cache.prefetch(month_cache.months[-month_cache.capacity:])
+    else:
+        month_cache.prefetch([last_month + relativedelta(months=month_offset)
+                              for month_offset in _PREFETCH_MONTH_OFFSETS])
+
+    print('CRM measures calculated')
+    return data
+# END load_snapshot_data
+
+
+def __getattr__(name: str) -> object:
+    """Returns the top-level variables of this module from the model snapshot of the caller."""
+    return sn.get_module_variable('crm-use', __name__, name)
+# END getattr
+
+
+# MAIN
 
 last_month = datetime.combine(_AS_OF_DATE.replace(day=1).date(), datetime.min.time()) + relativedelta(months=-1)
-_calculate_crm_measures()
 
-print('CRM measures calculated')
+# Initialize module with the CRM measures of the current model snapshot, which is replaced when the source data
+# changes
+sn.register_loader('crm-use', [r.source_file], _load_snapshot_data)
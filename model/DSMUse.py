@@ -1,12 +1,13 @@
 """
 DSMs.py
 Module that provides data from measures of direct secure message usage and conversions to referrals.
-This module automatically loads top level variables with this data when imported.
+This module automatically loads top level variables with this data when imported, and again into a new model
+snapshot when the source file changes.
 https://907sjl.github.io/
 
 Top-Level Variables:
     overall_measures[month] - Calculated measurement data by month aggregated across all clinics
-    clinic_measures[month] - Calculated measurement data by month by clinic
+    clinic_measures[month] - Calculated measurement data by month by clinic, calculated on first request
     last_month - The first day of the previous month at time 00:00:00
 
 Functions:
@@ -19,16 +20,28 @@ import numpy as np
 
 from datetime import datetime 
 from dateutil.relativedelta import relativedelta
+from typing import Callable
 
 import model.source.DSMs as d
+import model.source.Encoding as e
+from model.MeasureCache import MeasureCache
+from model.MeasureStore import MeasureStore
+from model.MonthCache import MonthCache
+import model.Snapshot as sn
 
 
 # Effective as-of date for data
 _AS_OF_DATE = datetime(2023, 3, 1)
 
-# Top-level variable pointers to the DSM data
-overall_measures = {}
-clinic_measures = {}
+# Version of the measure definitions in this module, incremented when a change invalidates cached measures
+_MEASURE_DEFINITION_VERSION = 1
+
+# Number of reporting months that can be requested, and the number of months kept resident in memory
+_HISTORY_MONTHS = 12
+_RESIDENT_MONTHS = 6
+
+# Months offset from the last month that are calculated ahead of requests from Bokeh
+_PREFETCH_MONTH_OFFSETS = [0]
 
 
 def _calculate_dsm_measures_for_month(source_df: DataFrame, report_month: datetime) -> DataFrame:
@@ -42,8 +55,8 @@ def _calculate_dsm_measures_for_month(source_df: DataFrame, report_month: dateti
     next_month = report_month + relativedelta(months=1)
 
     # Create sliced views of data for various lookback periods of time
-    month_view_90d = source_df.loc[(source_df['Reporting Date 90 Day Lag'] >= report_month) 
-                                   & (source_df['Reporting Date 90 Day Lag'] < next_month)].copy()
+    month_view_90d = source_df.loc[(source_df['Reporting Date 90 Day Lag'] >= e.to_epoch_day(report_month))
+                                   & (source_df['Reporting Date 90 Day Lag'] < e.to_epoch_day(next_month))].copy()
     
     # Create master list of clinics used to merge data using left joins and add a placeholder clinic named *ALL* 
     dsm_data_df = pd.DataFrame({'Clinic': np.sort(source_df['Clinic'].unique())})
@@ -51,7 +64,7 @@ def _calculate_dsm_measures_for_month(source_df: DataFrame, report_month: dateti
 
     # MEASURE: Count of patients with DSM referrals after 90 days
     patients_df = month_view_90d \
-        .groupby('Clinic') \
+        .groupby('Clinic', observed=True) \
         .agg({'Person ID': 'nunique'}) \
         .rename(columns={'Person ID': 'Patients with DSMs After 90d'})
     
@@ -60,7 +73,7 @@ def _calculate_dsm_measures_for_month(source_df: DataFrame, report_month: dateti
 
     # MEASURE: Count of patients with DSM referrals and CRM referrals within 30 days of each other after 90 days
     crm_patients_df = month_view_90d.loc[(~month_view_90d['Referral Person ID'].isna())] \
-        .groupby('Clinic') \
+        .groupby('Clinic', observed=True) \
         .agg({'Referral Person ID': 'nunique'}) \
         .rename(columns={'Referral Person ID': 'Patients with DSM and CRM Referrals After 90d'})
     
@@ -83,31 +96,100 @@ def get_clinic_count_measure(report_month: datetime, clinic: str, measure: str)
     :return: The integer measure value or zero if there is none
     """
 
-    df = clinic_measures[report_month]
-    if measure in df.select_dtypes(include=['int64', 'int32', 'float64']).columns:
-        view = df.loc[(df['Clinic'] == clinic)]
-        if view.empty:
-            return 0
-        else:
-            return int(view.at[min(view.index), measure])
+    value = _read_measure_store([report_month], lambda store: store.get_numeric_measure(report_month, clinic, measure))
+    if value is not None:
+        return int(value)
 # END get_clinic_count_measure
 
 
-def _calculate_dsm_measures() -> None:
-    for iter_month in range(12):
-        curr_month = last_month + relativedelta(months=-1 * iter_month)
-        print('Calculating measures for ' + curr_month.strftime('%Y-%m-%d'))
-        curr_month_dsm_df = _calculate_dsm_measures_for_month(d.dsm_df, curr_month)
-        overall_measures[curr_month] = curr_month_dsm_df.loc[(curr_month_dsm_df['Clinic'] == '*ALL*')]
-        clinic_measures[curr_month] = curr_month_dsm_df.loc[~(curr_month_dsm_df['Clinic'] == '*ALL*')]
+def _calculate_dsm_measures(data: dict, report_month: datetime) -> tuple[DataFrame, DataFrame]:
+    """
+    Calculates the DSM measures for one reporting month.
+    :param data: The data of this module in the model snapshot that the month is loaded into
+    :param report_month: The first day of the month to calculate measures for at time 00:00:00
+    :return: A tuple with the overall measures and the clinic measures for the month
+    """
+
+    print('Calculating measures for ' + report_month.strftime('%Y-%m-%d'))
+    curr_month_dsm_df = _calculate_dsm_measures_for_month(data['_dsm_df'], report_month)
+    curr_month_overall_df = curr_month_dsm_df.loc[(curr_month_dsm_df['Clinic'] == '*ALL*')]
+    curr_month_clinic_df = curr_month_dsm_df.loc[~(curr_month_dsm_df['Clinic'] == '*ALL*')]
+    return curr_month_overall_df, curr_month_clinic_df
 # END calculate_dsm_measures
 
 
-# MAIN - run on execution
+def _load_dsm_measures(data: dict, report_month: datetime) -> tuple[DataFrame, DataFrame]:
+    """
+    Loads the DSM measures for one reporting month when the month is first requested.  Measures are read
+    from the cache on disk, or calculated and cached if they are not cached for the current source data.
+    :param data: The data of this module in the model snapshot that the month is loaded into
+    :param report_month: The first day of the month to load measures for at time 00:00:00
+    :return: A tuple with the overall measures and the clinic measures for the month
+    """
+
+    return data['_measure_cache'].get(report_month.strftime('%Y-%m-%d'),
+                                      lambda: _calculate_dsm_measures(data, report_month))
+# END load_dsm_measures
+
 
-print('Calculating DSM measures...')
+def _read_measure_store(report_months: list[datetime], read_store: Callable[[MeasureStore], object]) -> object:
+    """
+    Returns the result of a read of the measure store with the given months calculated and resident in memory.
+    The months are made resident and read as one operation of the month cache, so a clinic selection calculated
+    in another thread cannot evict the months or resize the store during the read.
+    """
+    data = sn.get_data('dsm-use')
+    return data['_month_cache'].read(report_months, lambda: read_store(data['_measure_store']))
+# END read_measure_store
+
+
+def _load_snapshot_data() -> dict:
+    """
+    Returns the top-level variables of this module for a new model snapshot.  Calculated measures are kept on
+    disk until the source data, as-of date, or measure definitions change.  DSM data is calculated on first
+    request by month.
+    """
+    print('Calculating DSM measures...')
+
+    # The measure store has constant time lookups of the resident monthly clinic measurements
+    measure_store = MeasureStore()
+    data = {'_dsm_df': d.dsm_df,
+            '_measure_cache': MeasureCache('dsm-use', [d.source_file], _AS_OF_DATE, _MEASURE_DEFINITION_VERSION),
+            '_measure_store': measure_store}
+    month_cache = MonthCache([last_month + relativedelta(months=-1 * iter_month)
+                              for iter_month in reversed(range(_HISTORY_MONTHS))],
+                             lambda report_month: _load_dsm_measures(data, report_month),
+                             _RESIDENT_MONTHS,
+                             evict_month=measure_store.remove_measures,
+                             add_month=lambda report_month, month_data: measure_store.add_measures(report_month,
+                                                                                                   month_data[1]))
+    data['_month_cache'] = month_cache
+    data['overall_measures'] = month_cache.view(0)
+    data['clinic_measures'] = month_cache.view(1)
+
+    # Months are calculated ahead of requests from Bokeh, and the latest months that stay resident are calculated
+    # when worker processes can be forked to calculate them in parallel
+    if month_cache.can_fork_workers():
+        month_cache.prefetch(month_cache.months[-month_cache.capacity:])
+    else:
+        month_cache.prefetch([last_month + relativedelta(months=month_offset)
+                              for month_offset in _PREFETCH_MONTH_OFFSETS])
+
+    print('DSM measures calculated')
+    return data
+# END load_snapshot_data
+
+
+def __getattr__(name: str) -> object:
+    """Returns the top-level variables of this module from the model snapshot of the caller."""
+    return sn.get_module_variable('dsm-use', __name__, name)
+# END getattr
+
+
+# MAIN - run on execution
 
 last_month = datetime.combine(_AS_OF_DATE.replace(day=1).date(), datetime.min.time()) + relativedelta(months=-1)
-_calculate_dsm_measures()
 
-print('DSM measures calculated')
+# Initialize module with the DSM measures of the current model snapshot, which is replaced when the source data
+# changes
+sn.register_loader('dsm-use', [d.source_file], _load_snapshot_data)
@@ -0,0 +1,101 @@
+"""
+DerivedMeasures.py
+Provides a dependency graph of measures that are derived from the base measures of a month, such as targets,
+variances, and categories.  Each node names the measures it reads and the measures it writes, so a node that reads
+a measure before another node writes it is found when the graph is created rather than when a month is loaded.
+https://907sjl.github.io/
+
+Classes:
+    DerivedMeasureGraph - Dependency graph of derived measure calculations over a monthly measure DataFrame
+"""
+
+from pandas import DataFrame
+
+from typing import Callable
+
+from model.Timing import timed
+
+
+class DerivedMeasureGraph:
+    """
+    Class that holds derived measure calculations as the nodes of a dependency graph.  Nodes are added after the
+    nodes that write their inputs, so the order the nodes are added in is an order they can be calculated in.
+    Measures that no node writes are base measures of the month.  The time of each node calculation is
+    recorded under the name of the graph and the node.
+
+    Public Attributes:
+        name - The name of the graph that node timings are recorded under
+        nodes - The names of the nodes in calculation order
+
+    Public Methods:
+        add_node - Adds a derived measure calculation to the graph
+        get_outputs - Returns the names of every derived measure written by the graph
+        calculate - Calculates every derived measure of a month
+    """
+
+    def __init__(self, name: str = 'derived'):
+        """
+        Initialize instances with no nodes.
+        :param name: the name of the graph that node timings are recorded under
+        """
+        self.name = name
+        self.nodes = []
+        self._inputs = {}
+        self._outputs = {}
+        self._calculations = {}
+    # END __init__
+
+    def add_node(self,
+                 name: str,
+                 inputs: list[str],
+                 outputs: list[str],
+                 calculate: Callable[[DataFrame], None]) -> None:
+        """
+        Adds a derived measure calculation to the graph.
+        :param name: the name of the node that its timings are recorded under
+        :param inputs: names of the measures that the calculation reads
+        :param outputs: names of the measures that the calculation writes
+        :param calculate: function that writes the output measure columns into a monthly measure DataFrame
+        """
+        if name in self._calculations:
+            raise ValueError(f'Derived measure node {name} is already in the graph')
+        written = self.get_outputs()
+        for node in self.nodes:
+            if any(output in self._inputs[node] for output in outputs):
+                raise ValueError(f'Derived measure node {name} must be added before node {node} that reads it')
+            if any(output in self._outputs[node] for output in outputs):
+                raise ValueError(f'Derived measure node {name} writes a measure that node {node} writes')
+        if name in written:
+            raise ValueError(f'Derived measure node {name} has the name of a measure that another node writes')
+
+        self.nodes.append(name)
+        self._inputs[name] = list(inputs)
+        self._outputs[name] = list(outputs)
+        self._calculations[name] = calculate
+    # END add_node
+
+    def get_outputs(self) -> list[str]:
+        """Returns the names of every derived measure written by the graph in calculation order."""
+        return [output for node in self.nodes for output in self._outputs[node]]
+    # END get_outputs
+
+    def calculate(self, month_df: DataFrame) -> DataFrame:
+        """
+        Calculates every derived measure of a month.
+        :param month_df: a dataframe of the base measures of a month with a row per clinic
+        :return: the dataframe with the derived measure columns added
+        """
+        for node in self.nodes:
+            self._calculate_node(node, month_df)
+
+        # Return a copy to automagically clean up dataframe fragmentation caused by
+        # adding lots of individual columns
+        return month_df.copy()
+    # END calculate
+
+    def _calculate_node(self, node: str, month_df: DataFrame) -> None:
+        """Calculates the measures of one node and records the time of the calculation."""
+        with timed(self.name + '/' + node):
+            self._calculations[node](month_df)
+    # END calculate_node
+# END CLASS DerivedMeasureGraph
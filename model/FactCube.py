@@ -0,0 +1,321 @@
+"""
+FactCube.py
+Provides daily counts and value histograms of referral facts by clinic with cumulative sums over the days of a
+reporting date.  The counts and medians of referrals in any range of days come from the difference of two
+cumulative rows so moving windows are calculated without rescanning the referral data.
+https://907sjl.github.io/
+
+Classes:
+    DailyFactCube - Cumulative daily counts and value histograms of referral columns by clinic and reporting date
+"""
+
+import pandas as pd
+from pandas import DataFrame
+import numpy as np
+
+from datetime import datetime
+
+
+# Most cells of the cumulative value histogram of a median indicator, which is reporting days x clinics x values.
+# Values beyond the histogram are counted in its last bin and kept by day so that medians in it are exact.
+_MAX_HISTOGRAM_CELLS = 1 << 23
+
+# Most cells of the daily value histograms counted at once while a cumulative histogram is built
+_HISTOGRAM_BLOCK_CELLS = 1 << 20
+
+
+class DailyFactCube:
+    """
+    Class that holds cumulative daily counts and value histograms of referral columns.  Counts have the
+    dimensions reporting day x clinic x indicator.  Histograms of whole number values, such as days until
+    a referral is seen, have the dimensions reporting day x clinic x value for each median indicator.  The value
+    axis is limited so that a histogram has no more than a fixed number of cells, and the last bin counts every
+    larger value.  Medians that fall in the last bin are found from the values in it, which are kept by day.
+    Reporting dates are truncated to the day so the periods that are queried must start and end on whole days.
+
+    Public Attributes:
+        date_column - The name of the reporting date column that places referrals on the day axis
+        clinics - The list of clinic names along the clinic axis
+        priority - The referral priority that was counted, or None for all priorities
+        indicators - The names of the counts along the indicator axis
+        median_indicators - The names of the medians with value histograms
+
+    Public Methods:
+        get_window_counts - Returns the counts by clinic for a range of reporting days
+        get_window_medians - Returns the medians by clinic for a range of reporting days
+        get_overall_medians - Returns the medians across all clinics for a range of reporting days
+    """
+
+    def __init__(self,
+                 source_df: DataFrame,
+                 date_column: str,
+                 clinics: list[str],
+                 indicators: dict[str, tuple],
+                 priority: str = None):
+        """
+        Initialize instances with one pass over the source data.
+        :param source_df: a dataframe of referrals
+        :param date_column: name of the reporting date column used for the day axis
+        :param clinics: list of clinic names to count referrals for
+        :param indicators: a dictionary of indicator names with a tuple of the source column, the aggregation
+                           function of count, sum, or median, and the name of an indicator column that limits
+                           the rows aggregated or None.  The values of median indicators must be whole numbers.
+        :param priority: the referral priority to count, or None to count all priorities
+        """
+        for name, (_, aggfunc, _) in indicators.items():
+            if aggfunc not in ['count', 'sum', 'median']:
+                raise ValueError(f'Indicator {name} has the aggregation function {aggfunc} that is not counted')
+
+        self.date_column = date_column
+        self.clinics = list(clinics)
+        self.priority = priority
+        self.indicators = [name for name, spec in indicators.items() if spec[1] in ['count', 'sum']]
+        self.median_indicators = []
+
+        # Limit the source data to referrals with a reporting date at one of the given clinics
+        clinic_codes = pd.Categorical(source_df['Clinic'], categories=self.clinics).codes
+        idx = (clinic_codes >= 0) & source_df[date_column].notna().to_numpy()
+        if priority is not None:
+            idx = idx & (source_df['Referral Priority'] == priority).fillna(False).to_numpy(dtype=bool)
+        clinic_codes = clinic_codes[idx].astype(np.int64)
+
+        # Days are numbered from the first reporting date in the source data.  Reporting dates are held
+        # either as datetimes or as integer numbers of days since 1970-01-01.
+        dates = source_df.loc[idx, date_column]
+        if pd.api.types.is_datetime64_any_dtype(dates):
+            days = dates.to_numpy().astype('datetime64[D]')
+        else:
+            days = dates.to_numpy(dtype=np.int64).astype('datetime64[D]')
+        self._first_day = days.min() if len(days) > 0 else np.datetime64('1970-01-01', 'D')
+        day_numbers = (days - self._first_day).astype(np.int64)
+        self._day_count = int(day_numbers.max()) + 1 if len(days) > 0 else 0
+        cells = (day_numbers * len(self.clinics)) + clinic_codes
+
+        # Indicators with the same declaration are counted once, and each limiting indicator column is read once
+        self._count_positions = {}
+        count_specs = []
+        for name in self.indicators:
+            spec = tuple(indicators[name])
+            if spec not in count_specs:
+                count_specs.append(spec)
+            self._count_positions[name] = count_specs.index(spec)
+        limits = {}
+        for _, _, limit_column in indicators.values():
+            if limit_column is not None and limit_column not in limits:
+                limits[limit_column] = source_df.loc[idx, limit_column].to_numpy(dtype=np.int64)
+
+        # Count every indicator by day and clinic in one fused pass over the weights of all indicators
+        weights = np.zeros((len(clinic_codes), len(count_specs)), dtype=np.int64)
+        for position, (column, aggfunc, limit_column) in enumerate(count_specs):
+            if aggfunc == 'count':
+                weights[:, position] = source_df.loc[idx, column].notna().to_numpy(dtype=np.int64)
+            else:
+                weights[:, position] = source_df.loc[idx, column].to_numpy(dtype=np.int64)
+            if limit_column is not None:
+                weights[:, position] *= limits[limit_column]
+        indicator_cells = (cells[:, np.newaxis] * len(count_specs)) + np.arange(len(count_specs))
+        daily_counts = (
+            np.bincount(indicator_cells.ravel(),
+                        weights=weights.ravel(),
+                        minlength=self._day_count * len(self.clinics) * len(count_specs))
+            .reshape((self._day_count, len(self.clinics), len(count_specs)))
+            .astype(np.int32))
+
+        # Cumulative counts have a leading row of zeros so that row n holds the counts for days before day n
+        self._cumulative_counts = self._accumulate(daily_counts)
+
+        # Count the whole number values of each median indicator by day and clinic
+        self._first_values = {}
+        self._cumulative_histograms = {}
+        self._overflow_values = {}
+        value_limit = max(_MAX_HISTOGRAM_CELLS // ((self._day_count + 1) * max(len(self.clinics), 1)), 1)
+        for name, (column, aggfunc, limit_column) in indicators.items():
+            if aggfunc != 'median':
+                continue
+
+            values = source_df.loc[idx, column].to_numpy(dtype=np.float64, na_value=np.nan)
+            keep = ~np.isnan(values)
+            if limit_column is not None:
+                keep = keep & (limits[limit_column] == 1)
+            if not np.array_equal(values[keep], np.floor(values[keep])):
+                raise ValueError(f'Median indicator {name} has values that are not whole numbers')
+
+            values = values[keep].astype(np.int64)
+            first_value = int(values.min()) if len(values) > 0 else 0
+            value_count = min(int(values.max()) - first_value + 1 if len(values) > 0 else 1, value_limit)
+            bins = np.minimum(values - first_value, value_count - 1)
+
+            self.median_indicators.append(name)
+            self._first_values[name] = first_value
+            self._cumulative_histograms[name] = self._accumulate_histograms(day_numbers[keep], clinic_codes[keep],
+                                                                            bins, value_count)
+
+            # Values counted in the last bin with larger values are kept in day order for exact medians
+            overflow = bins == value_count - 1
+            if np.any(values[overflow] > first_value + value_count - 1):
+                order = np.argsort(day_numbers[keep][overflow], kind='stable')
+                self._overflow_values[name] = (day_numbers[keep][overflow][order],
+                                               clinic_codes[keep][overflow][order],
+                                               values[overflow][order])
+    # END __init__
+
+    @staticmethod
+    def _accumulate(daily_values: np.ndarray) -> np.ndarray:
+        """
+        Returns cumulative sums over the day axis with a leading row of zeros.  The sums are kept in the
+        smallest integer type that holds the totals because value histograms have many cells.
+        """
+        totals = daily_values.sum(axis=0)
+        dtype = np.uint16 if totals.size == 0 or totals.max() <= np.iinfo(np.uint16).max else np.int32
+        cumulative = np.zeros((daily_values.shape[0] + 1,) + daily_values.shape[1:], dtype=dtype)
+        np.cumsum(daily_values, axis=0, out=cumulative[1:])
+        return cumulative
+    # END accumulate
+
+    def _accumulate_histograms(self,
+                               day_numbers: np.ndarray,
+                               clinic_codes: np.ndarray,
+                               bins: np.ndarray,
+                               value_count: int) -> np.ndarray:
+        """
+        Returns the cumulative value histograms of a median indicator over the day axis with a leading row of
+        zeros.  Daily histograms are counted for blocks of days so that the counts of all days are never held at
+        once in the 64 bit integers that np.bincount returns.
+        :param day_numbers: the reporting day of each value
+        :param clinic_codes: the position of the clinic of each value on the clinic axis
+        :param bins: the position of each value on the value axis
+        :param value_count: the number of bins on the value axis
+        :return: an array with the dimensions reporting day + 1 x clinic x value
+        """
+        clinic_count = len(self.clinics)
+        totals = np.bincount((clinic_codes * value_count) + bins, minlength=clinic_count * value_count)
+        dtype = np.uint16 if totals.size == 0 or totals.max() <= np.iinfo(np.uint16).max else np.int32
+        cumulative = np.zeros((self._day_count + 1, clinic_count, value_count), dtype=dtype)
+
+        order = np.argsort(day_numbers, kind='stable')
+        day_numbers, cells = day_numbers[order], ((clinic_codes * value_count) + bins)[order]
+        block_days = max(_HISTOGRAM_BLOCK_CELLS // max(clinic_count * value_count, 1), 1)
+        for first_day in range(0, self._day_count, block_days):
+            last_day = min(first_day + block_days, self._day_count)
+            start, end = np.searchsorted(day_numbers, [first_day, last_day])
+            daily_histograms = (
+                np.bincount(((day_numbers[start:end] - first_day) * clinic_count * value_count) + cells[start:end],
+                            minlength=(last_day - first_day) * clinic_count * value_count)
+                .reshape((last_day - first_day, clinic_count, value_count)))
+            daily_histograms[0] += cumulative[first_day]
+            np.cumsum(daily_histograms, axis=0, out=cumulative[first_day + 1:last_day + 1])
+        return cumulative
+    # END accumulate_histograms
+
+    def _get_day_number(self, date: datetime) -> int:
+        """Returns the position of a date on the cumulative day axis limited to the range of the cube."""
+        day_number = int((np.datetime64(date, 'D') - self._first_day).astype(np.int64))
+        return min(max(day_number, 0), self._day_count)
+    # END get_day_number
+
+    def _get_window(self, cumulative: np.ndarray, start_date: datetime, end_date: datetime) -> np.ndarray:
+        """Returns the sums for a range of reporting days from cumulative values."""
+        return (cumulative[self._get_day_number(end_date)].astype(np.int64)
+                - cumulative[self._get_day_number(start_date)])
+    # END get_window
+
+    @staticmethod
+    def _calculate_medians(histograms: np.ndarray, first_value: int) -> np.ndarray:
+        """
+        Returns the median of each row of value histograms.  An even count of values returns the mean
+        of the two middle values to match the median of the values themselves.
+        :param histograms: a two dimensional array of value counts with a row for each median
+        :param first_value: the value counted in the first column of the histograms
+        :return: an array of medians, with NaN for rows without values
+        """
+        totals = histograms.sum(axis=1)
+        cumulative = histograms.cumsum(axis=1)
+        lower = (cumulative > ((totals - 1) // 2)[:, np.newaxis]).argmax(axis=1)
+        upper = (cumulative > (totals // 2)[:, np.newaxis]).argmax(axis=1)
+        medians = first_value + ((lower + upper) / 2.0)
+        medians[totals == 0] = np.nan
+        return medians
+    # END calculate_medians
+
+    def get_window_counts(self, start_date: datetime, end_date: datetime) -> DataFrame:
+        """
+        Returns the counts by clinic for referrals with a reporting date in the given range of days.
+        :param start_date: the first date in the period
+        :param end_date: the day after the last date in the period
+        :return: a dataframe of clinics and counts for each indicator
+        """
+        counts = self._get_window(self._cumulative_counts, start_date, end_date)
+        counts_df = pd.DataFrame(counts[:, [self._count_positions[name] for name in self.indicators]],
+                                 columns=self.indicators)
+        counts_df.insert(0, 'Clinic', self.clinics)
+        return counts_df
+    # END get_window_counts
+
+    def _get_medians(self, name: str, start_date: datetime, end_date: datetime, overall: bool) -> np.ndarray:
+        """
+        Returns the medians of a median indicator for a range of reporting days from its value histograms.  The
+        middle values that fall in the last bin of a histogram with larger values are found from the values kept
+        for the bin.
+        :param name: the name of the median indicator
+        :param start_date: the first date in the period
+        :param end_date: the day after the last date in the period
+        :param overall: True for one median across all clinics, or False for a median by clinic
+        :return: an array of medians in clinic order, or with one median across all clinics
+        """
+        histograms = self._get_window(self._cumulative_histograms[name], start_date, end_date)
+        if overall:
+            histograms = histograms.sum(axis=0, keepdims=True)
+        first_value = self._first_values[name]
+        medians = self._calculate_medians(histograms, first_value)
+        if name not in self._overflow_values:
+            return medians
+
+        # Rows whose upper middle value is counted in the last bin
+        totals = histograms.sum(axis=1)
+        below_overflow = totals - histograms[:, -1]
+        rows = np.flatnonzero((totals > 0) & (below_overflow <= totals // 2))
+        if len(rows) == 0:
+            return medians
+
+        overflow_days, overflow_clinics, overflow_values = self._overflow_values[name]
+        start, end = np.searchsorted(overflow_days, [self._get_day_number(start_date),
+                                                     self._get_day_number(end_date)])
+        overflow_clinics, overflow_values = overflow_clinics[start:end], overflow_values[start:end]
+        lower_ranks = (totals - 1) // 2
+        for row in rows:
+            values = np.sort(overflow_values if overall else overflow_values[overflow_clinics == row])
+            upper = values[totals[row] // 2 - below_overflow[row]]
+            if lower_ranks[row] >= below_overflow[row]:
+                lower = values[lower_ranks[row] - below_overflow[row]]
+            else:
+                lower = first_value + (histograms[row].cumsum() > lower_ranks[row]).argmax()
+            medians[row] = (lower + upper) / 2.0
+        return medians
+    # END get_medians
+
+    def get_window_medians(self, start_date: datetime, end_date: datetime) -> DataFrame:
+        """
+        Returns the medians by clinic for referrals with a reporting date in the given range of days.
+        :param start_date: the first date in the period
+        :param end_date: the day after the last date in the period
+        :return: a dataframe of clinics and medians for each median indicator
+        """
+        medians_df = pd.DataFrame({'Clinic': self.clinics})
+        for name in self.median_indicators:
+            medians_df[name] = self._get_medians(name, start_date, end_date, overall=False)
+        return medians_df
+    # END get_window_medians
+
+    def get_overall_medians(self, start_date: datetime, end_date: datetime) -> dict[str, float]:
+        """
+        Returns the medians across all clinics for referrals with a reporting date in the given range of days.
+        :param start_date: the first date in the period
+        :param end_date: the day after the last date in the period
+        :return: a dictionary of medians by median indicator name
+        """
+        medians = {}
+        for name in self.median_indicators:
+            medians[name] = float(self._get_medians(name, start_date, end_date, overall=True)[0])
+        return medians
+    # END get_overall_medians
+# END CLASS DailyFactCube
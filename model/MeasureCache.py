@@ -0,0 +1,406 @@
+"""
+MeasureCache.py
+Provides a persistent cache of calculated measure data on disk so that measures are not recalculated on every start.
+Snapshots of the derived master data are cached the same way so that source files are not parsed on every start.
+Cached data is keyed by a fingerprint of the source data files, the as-of date, and the version of the measure
+definitions.  A change to any of these calculates the measures again.  The column arrays of a cached item are
+kept in one NumPy file that is memory mapped when the item is loaded, and a small JSON file describes the columns,
+categories, and indexes, so loading cached data never runs code from the cache folder.
+https://907sjl.github.io/
+
+Classes:
+    MeasureCache - Persistent cache of calculated measure DataFrames on disk
+
+Functions:
+    fingerprint_files - Returns a fingerprint of the contents of source data files
+"""
+
+import pandas as pd
+from pandas import DataFrame, Index, RangeIndex
+import numpy as np
+
+from datetime import datetime
+from typing import Callable
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+
+from model.Timing import timed
+
+
+# Folder where cached measure data is kept, relative to the working folder with the source data files
+_CACHE_DIRECTORY = 'measure_cache'
+
+# Version of the format of cached files, which is part of the key so that data in an older format is removed
+_CACHE_FORMAT_VERSION = 2
+
+# Permissions of the cache folders, which only the account that runs the server can read or change
+_CACHE_DIRECTORY_MODE = 0o700
+
+# Alignment in bytes of each column array within the array file of an item, so that every array can be viewed
+_ARRAY_ALIGNMENT = 64
+
+# File fingerprints by path, file size, and modification time so that each source file is read once
+_file_fingerprints = {}
+
+# Number of caches in this process by the folder of their key, whose folders are not removed while they are used
+_live_directories = {}
+
+# Lock held while the folders of keys are counted or removed, reentrant since the garbage collector can release
+# a cache in any thread while the lock is held
+_directory_lock = threading.RLock()
+
+
+def fingerprint_files(source_files: list[str]) -> str:
+    """
+    Returns a fingerprint of the contents of source data files.
+    :param source_files: paths of the source data files
+    :return: a hexadecimal digest that changes when the contents of any of the files change
+    """
+
+    digest = hashlib.sha256()
+    for source_file in source_files:
+        stat = os.stat(source_file)
+        file_key = (os.path.abspath(source_file), stat.st_size, stat.st_mtime_ns)
+        if file_key not in _file_fingerprints:
+            file_digest = hashlib.sha256()
+            with open(source_file, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    file_digest.update(block)
+            _file_fingerprints[file_key] = file_digest.hexdigest()
+        digest.update(os.path.basename(source_file).encode())
+        digest.update(_file_fingerprints[file_key].encode())
+    return digest.hexdigest()
+# END fingerprint_files
+
+
+def _describe_array(array: np.ndarray, arrays: list) -> dict:
+    """
+    Adds an array to the arrays to write and returns the description of where it is written in the array file.
+    :param array: a one dimensional array of numbers, booleans, dates, or fixed width unicode
+    :param arrays: the list of byte offsets and arrays to write, which is extended
+    :return: a dictionary with the byte offset, data type, and length of the array
+    """
+    array = np.ascontiguousarray(array)
+    offset = 0
+    if len(arrays) > 0:
+        last_offset, last_array = arrays[-1]
+        offset = -(-(last_offset + last_array.nbytes) // _ARRAY_ALIGNMENT) * _ARRAY_ALIGNMENT
+    arrays.append((offset, array))
+    return {'offset': offset, 'dtype': array.dtype.str, 'length': len(array)}
+# END describe_array
+
+
+def _create_array_buffer(arrays: list) -> np.ndarray:
+    """Returns the bytes of the arrays to write at their offsets, as one array for the array file of an item."""
+    size = 0 if len(arrays) == 0 else arrays[-1][0] + arrays[-1][1].nbytes
+    buffer = np.zeros(max(size, 1), dtype=np.uint8)
+    for offset, array in arrays:
+        buffer[offset:offset + array.nbytes] = array.view(np.uint8)
+    return buffer
+# END create_array_buffer
+
+
+def _describe_values(series: pd.Series | Index, arrays: list) -> dict:
+    """
+    Returns the description of the values of a column or an index, adding the arrays that hold them to the
+    arrays to write.  Categoricals are kept as codes with a description of the categories, nullable values as
+    data with a mask, and text as fixed width unicode with a mask of missing values.
+    :param series: a column or an index
+    :param arrays: the list of byte offsets and arrays to write, which is extended
+    :return: a dictionary that can be written as JSON
+    """
+    dtype = series.dtype
+    values = series.array if pd.api.types.is_extension_array_dtype(dtype) else series.to_numpy()
+    if isinstance(dtype, pd.CategoricalDtype):
+        return {'kind': 'categorical',
+                'codes': _describe_array(np.asarray(values.codes), arrays),
+                'categories': _describe_values(values.categories, arrays),
+                'ordered': bool(dtype.ordered)}
+    if isinstance(dtype, pd.StringDtype) or dtype == object:
+        mask = np.asarray(pd.isna(values), dtype=bool)
+        text = np.asarray(values, dtype=object)[~mask]
+        if not all(isinstance(value, str) for value in text):
+            raise TypeError('Only text and missing values can be cached in an object column')
+        data = np.full(len(values), '', dtype=str if len(text) == 0 else np.asarray(text, dtype=str).dtype)
+        data[~mask] = text
+        return {'kind': 'text',
+                'dtype': str(dtype),
+                'data': _describe_array(data, arrays),
+                'mask': _describe_array(mask, arrays)}
+    if isinstance(values, (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)):
+        return {'kind': 'masked',
+                'dtype': str(dtype),
+                'data': _describe_array(values.to_numpy(dtype=dtype.numpy_dtype, na_value=0), arrays),
+                'mask': _describe_array(np.asarray(values.isna()), arrays)}
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+        return {'kind': 'array', 'data': _describe_array(np.asarray(values), arrays)}
+    raise TypeError(f'Values of type {dtype} cannot be cached')
+# END describe_values
+
+
+def _describe_value(value, arrays: list) -> dict:
+    """
+    Returns the description of a cached value, adding the arrays that hold its data to the arrays to write.
+    :param value: a tuple, a dictionary with text keys, a DataFrame, or an index
+    :param arrays: the list of byte offsets and arrays to write, which is extended
+    :return: a dictionary that can be written as JSON
+    """
+    if isinstance(value, tuple):
+        return {'kind': 'tuple', 'items': [_describe_value(item, arrays) for item in value]}
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) for key in value):
+            raise TypeError('Only dictionaries with text keys can be cached')
+        return {'kind': 'dict',
+                'items': [[key, _describe_value(item, arrays)] for key, item in value.items()]}
+    if isinstance(value, DataFrame):
+        if not all(isinstance(column, str) for column in value.columns) or not value.columns.is_unique:
+            raise TypeError('Only DataFrames with unique text column names can be cached')
+        return {'kind': 'frame',
+                'index': _describe_value(value.index, arrays),
+                'columns': [[column, _describe_values(value[column], arrays)]
+                            for column in value.columns]}
+    if isinstance(value, RangeIndex):
+        return {'kind': 'range', 'start': value.start, 'stop': value.stop, 'step': value.step, 'name': value.name}
+    if isinstance(value, Index) and not isinstance(value, pd.MultiIndex):
+        return {'kind': 'index', 'values': _describe_values(value, arrays), 'name': value.name}
+    raise TypeError(f'Values of type {type(value).__name__} cannot be cached')
+# END describe_value
+
+
+def _read_values(description: dict, buffer: np.ndarray):
+    """
+    Returns the values of a column or an index from their description, with the arrays of numbers viewed
+    read-only in the memory mapped bytes of the array file of the item.
+    """
+
+    def read_array(array_description: dict) -> np.ndarray:
+        dtype = np.dtype(array_description['dtype'])
+        offset = array_description['offset']
+        return buffer[offset:offset + dtype.itemsize * array_description['length']].view(dtype)
+
+    kind = description['kind']
+    if kind == 'categorical':
+        categories = _read_values(description['categories'], buffer)
+        return pd.Categorical.from_codes(read_array(description['codes']),
+                                         dtype=pd.CategoricalDtype(Index(categories), description['ordered']))
+    if kind == 'text':
+        values = read_array(description['data']).astype(object)
+        values[read_array(description['mask'])] = np.nan
+        return values if description['dtype'] == 'object' else pd.array(values, dtype=description['dtype'])
+    if kind == 'masked':
+        return (pd.api.types.pandas_dtype(description['dtype']).construct_array_type()
+                (read_array(description['data']), read_array(description['mask'])))
+    return read_array(description['data'])
+# END read_values
+
+
+def _read_value(description: dict, buffer: np.ndarray):
+    """Returns a cached value from its description, with its arrays viewed in the bytes of the array file."""
+    kind = description['kind']
+    if kind == 'tuple':
+        return tuple(_read_value(item, buffer) for item in description['items'])
+    if kind == 'dict':
+        return {key: _read_value(item, buffer) for key, item in description['items']}
+    if kind == 'frame':
+        index = _read_value(description['index'], buffer)
+        columns = {column: _read_values(values, buffer) for column, values in description['columns']}
+        return DataFrame(columns, index=index, copy=False)
+    if kind == 'range':
+        return RangeIndex(description['start'], description['stop'], description['step'], name=description['name'])
+    return Index(_read_values(description['values'], buffer), name=description['name'], copy=False)
+# END read_value
+
+
+def _release_directory(directory: str, process_id: int) -> None:
+    """
+    Counts the release of a cache of the key with the given folder, and removes the folder when no cache in this
+    process uses the key and a newer key of the same name replaced it.  Memory mapped files that cannot be removed
+    yet are removed with the folder by the next cache that is created for the name.
+    :param directory: the absolute path of the folder of the key
+    :param process_id: the process that created the cache, since forked worker processes do not remove folders
+    """
+    if os.getpid() != process_id:
+        return
+    with _directory_lock:
+        _live_directories[directory] -= 1
+        if _live_directories[directory] > 0:
+            return
+        del _live_directories[directory]
+        name_directory = os.path.dirname(directory)
+        if any(os.path.dirname(live_directory) == name_directory for live_directory in list(_live_directories)):
+            shutil.rmtree(directory, ignore_errors=True)
+# END release_directory
+
+
+class MeasureCache:
+    """
+    Class that keeps calculated measure DataFrames on disk under a key made from the source data, the as-of
+    date, and the measure definition version.  Each cached item is a tuple of DataFrames, or of dictionaries of
+    indexes, with the column arrays written to one NumPy file of bytes and their data types, offsets, categories,
+    and small indexes described in a JSON file.  The array file is memory mapped read-only when an item is loaded
+    and the columns are views of it, so the columns of loaded DataFrames must not be changed in place.  Cached
+    data for other keys is removed when a cache is created, except for the keys of caches that are still used in
+    this process, such as the caches of a model snapshot that sessions still show while a new snapshot is loaded.
+    The folder of a key is removed once the last cache of the key is released, if a newer key replaced it.
+
+    Cached files are read as data without unpickling, so a changed file cannot run code in the server, but the
+    measures served are only as sound as the files.  The cache folders are created with access for the account
+    that runs the server only, and a cache folder that already exists must not be writable by other accounts.
+
+    Public Attributes:
+        name - The name of the measure data that is cached
+        key - The fingerprint of the source data, as-of date, and definition version of the cached data
+        directory - The folder that holds the cached items for the key
+
+    Public Methods:
+        is_cached - Returns True if an item is cached
+        load - Returns a cached item, or None if the item is not cached
+        save - Writes an item to the cache
+        get - Returns a cached item, calculating and caching the item if it is not cached
+    """
+
+    def __init__(self,
+                 name: str,
+                 source_files: list[str],
+                 as_of_date: datetime,
+                 definition_version: int,
+                 cache_directory: str = _CACHE_DIRECTORY):
+        """
+        Initialize instances.
+        :param name: the name of the measure data that is cached
+        :param source_files: paths of the source data files that the measures are calculated from
+        :param as_of_date: the effective as-of date of the measures
+        :param definition_version: the version of the measure definitions, incremented when they change
+        :param cache_directory: the folder that holds cached measure data
+        """
+        self.name = name
+        self.key = hashlib.sha256('|'.join([fingerprint_files(source_files),
+                                            as_of_date.isoformat(),
+                                            str(definition_version),
+                                            str(_CACHE_FORMAT_VERSION)]).encode()).hexdigest()[:32]
+        self.directory = os.path.join(cache_directory, name, self.key)
+        live_directory = os.path.abspath(self.directory)
+        with _directory_lock:
+            _live_directories[live_directory] = _live_directories.get(live_directory, 0) + 1
+        finalizer = weakref.finalize(self, _release_directory, live_directory, os.getpid())
+        finalizer.atexit = False
+        for directory in [cache_directory, os.path.dirname(self.directory), self.directory]:
+            os.makedirs(directory, mode=_CACHE_DIRECTORY_MODE, exist_ok=True)
+        self._remove_other_keys()
+    # END __init__
+
+    def _remove_other_keys(self) -> None:
+        """Removes cached data for this name that was kept under other keys that no cache in this process uses."""
+        name_directory = os.path.dirname(os.path.abspath(self.directory))
+        with _directory_lock:
+            for key in os.listdir(name_directory):
+                directory = os.path.join(name_directory, key)
+                if key != self.key and directory not in _live_directories:
+                    shutil.rmtree(directory, ignore_errors=True)
+    # END remove_other_keys
+
+    def _get_path(self, item: str) -> str:
+        """Returns the path of the JSON file that describes a cached item."""
+        return os.path.join(self.directory, item + '.json')
+    # END get_path
+
+    def _remove_array_files(self, item: str) -> None:
+        """
+        Removes the array files of earlier writes of an item.  The array file of the JSON file that was renamed
+        last is kept, which is the file of another write when the item is written by two processes at once.
+        """
+        try:
+            with open(self._get_path(item), 'r', encoding='utf-8') as file:
+                keep_file_name = json.load(file)['arrays']
+        except (OSError, ValueError, KeyError):
+            return
+        try:
+            file_names = os.listdir(self.directory)
+        except OSError:
+            return
+        for file_name in file_names:
+            if file_name.startswith(item + '.') and file_name.endswith('.npy') and file_name != keep_file_name:
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    pass
+    # END remove_array_files
+
+    def is_cached(self, item: str) -> bool:
+        """Returns True if an item is cached, without reading it."""
+        return os.path.exists(self._get_path(item))
+    # END is_cached
+
+    def load(self, item: str) -> tuple | None:
+        """
+        Returns a cached item.
+        :param item: the name of the item
+        :return: the tuple of DataFrames that was cached, or None if the item is not cached or cannot be read
+        """
+        path = self._get_path(item)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                description = json.load(file)
+            buffer = np.load(os.path.join(self.directory, description['arrays']), mmap_mode='r', allow_pickle=False)
+            return _read_value(description['value'], buffer)
+        except Exception:
+            return None
+    # END load
+
+    def save(self, item: str, frames: tuple) -> None:
+        """
+        Writes an item to the cache.  The column arrays are written to an array file named for this write, and
+        then the JSON file that describes them is written under a temporary name and renamed, so that a partial
+        write is never read.  Array files of earlier writes of the item are removed afterwards.  An item that
+        cannot be written, such as when the folder was removed by another process, is not cached.
+        :param item: the name of the item, which must not contain a period
+        :param frames: the tuple of DataFrames to cache
+        """
+        arrays = []
+        array_file_name = f'{item}.{uuid.uuid4().hex}.npy'
+        description = {'format': _CACHE_FORMAT_VERSION,
+                       'arrays': array_file_name,
+                       'value': _describe_value(frames, arrays)}
+        array_path = os.path.join(self.directory, array_file_name)
+        temporary_path = None
+        try:
+            file_handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            os.close(file_handle)
+            np.save(array_path, _create_array_buffer(arrays), allow_pickle=False)
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                json.dump(description, file)
+            os.replace(temporary_path, self._get_path(item))
+        except OSError:
+            for path in [temporary_path, array_path]:
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+            return
+        self._remove_array_files(item)
+    # END save
+
+    def get(self, item: str, calculate_item: Callable[[], tuple]) -> tuple:
+        """
+        Returns a cached item, calculating and caching the item if it is not cached.  The time to load or
+        to calculate the item is recorded under the name of the cache.
+        :param item: the name of the item
+        :param calculate_item: function that calculates the tuple of DataFrames for the item
+        :return: the tuple of DataFrames for the item
+        """
+        with timed('cache-load/' + self.name):
+            frames = self.load(item)
+        if frames is None:
+            with timed('cache-calculate/' + self.name):
+                frames = calculate_item()
+                self.save(item, frames)
+        return frames
+    # END get
+# END CLASS MeasureCache
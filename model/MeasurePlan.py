@@ -0,0 +1,65 @@
+"""
+MeasurePlan.py
+Compiles declared referral measures into a plan of shared passes over the referral data.  Measures are declared
+by lookback with the time shifted reporting date column and referral priority that select the referrals in the
+lookback window, and with the source column, aggregation, and limiting indicator of each measure.  Lookbacks
+that select the same referrals share one daily fact cube, and measures with the same declaration are
+aggregated once.
+https://907sjl.github.io/
+
+Classes:
+    MeasurePlan - Plan of the daily fact cubes that aggregate a set of declared lookback measures
+"""
+
+from pandas import DataFrame
+
+from model.FactCube import DailyFactCube
+
+
+class MeasurePlan:
+    """
+    Class that groups declared lookback measures by the window of referrals they aggregate.  A window is the
+    combination of a time shifted reporting date column and a referral priority.  All measures of the lookbacks
+    in a window are aggregated by one daily fact cube, which evaluates each limiting indicator once and counts
+    every measure in a single fused pass over the referrals in the window.
+
+    Public Attributes:
+        windows - The measure declarations of each window by the window key of reporting date column and priority
+        lookbacks - The window key of each lookback by lookback name
+
+    Public Methods:
+        create_fact_cubes - Creates one daily fact cube per window and returns the cubes by lookback name
+    """
+
+    def __init__(self, lookbacks: dict[str, dict]):
+        """
+        Initialize instances.
+        :param lookbacks: a dictionary of lookback configurations by lookback name, each with a lag-column,
+                          a priority, and a dictionary of measures with a tuple of the source column, the
+                          aggregation function, and the name of an indicator column that limits the rows
+                          aggregated or None
+        """
+        self.windows = {}
+        self.lookbacks = {}
+        for name, lookback in lookbacks.items():
+            window_key = (lookback['lag-column'], lookback['priority'])
+            window_measures = self.windows.setdefault(window_key, {})
+            for measure, spec in lookback['measures'].items():
+                if window_measures.get(measure, spec) != spec:
+                    raise ValueError(f'Measure {measure} is declared differently by lookbacks in one window')
+                window_measures[measure] = spec
+            self.lookbacks[name] = window_key
+    # END __init__
+
+    def create_fact_cubes(self, referrals_df: DataFrame, clinics: list[str]) -> dict[str, DailyFactCube]:
+        """
+        Creates one daily fact cube for each window of referrals.
+        :param referrals_df: a dataframe of referrals
+        :param clinics: list of clinic names to calculate measures for
+        :return: a dictionary of daily fact cubes by lookback name, where lookbacks in one window share a cube
+        """
+        window_cubes = {(lag_column, priority): DailyFactCube(referrals_df, lag_column, clinics, measures, priority)
+                        for (lag_column, priority), measures in self.windows.items()}
+        return {name: window_cubes[window_key] for name, window_key in self.lookbacks.items()}
+    # END create_fact_cubes
+# END CLASS MeasurePlan
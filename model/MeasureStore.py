@@ -0,0 +1,216 @@
+"""
+MeasureStore.py
+Provides constant time lookups of calculated measure values by month, clinic, and measure name.
+https://907sjl.github.io/
+
+Classes:
+    MeasureStore - Dense storage of measure values indexed by month, clinic, and measure
+"""
+
+from pandas import DataFrame
+import numpy as np
+
+from datetime import datetime
+
+
+# Column data types that are returned by the numeric measure lookups
+_NUMERIC_TYPES = ['int64', 'int32', 'float64']
+
+
+class MeasureStore:
+    """
+    Class that holds measure values in a dense array with the dimensions month x clinic x measure.
+    Positions along each dimension are found with dictionaries so that a lookup does not scan the
+    monthly measure data.  Numeric values are held as floating point numbers and returned in the
+    data type of their source column.  Other values, such as category names and direction indicators,
+    are held by month and measure in arrays along the clinic dimension.
+
+    Public Methods:
+        add_measures - Adds or replaces the measure values for a month
+        remove_measures - Removes the measure values for a month
+        has_month - Returns True if measure values have been added for a month
+        get_measure - Returns a measure value regardless of datatype
+        get_numeric_measure - Returns a numeric measure value, or None if the measure is not numeric
+        get_measures - Returns the values of several measures for several months in one fetch
+    """
+
+    def __init__(self):
+        """Initialize instances with no months."""
+        self._month_positions = {}
+        self._free_month_positions = []
+        self._clinic_positions = {}
+        self._measure_positions = {}
+        self._values = np.full((0, 0, 0), np.nan)
+        self._has_clinic = np.zeros((0, 0), dtype=bool)
+        self._has_measure = np.zeros((0, 0), dtype=bool)
+        self._types = np.empty((0, 0), dtype=object)
+        self._labels = {}
+    # END __init__
+
+    def _resize(self) -> None:
+        """Grows the storage arrays to the number of known months, clinics, and measures."""
+        shape = (len(self._month_positions) + len(self._free_month_positions),
+                 len(self._clinic_positions),
+                 len(self._measure_positions))
+        if shape == self._values.shape:
+            return
+
+        padding = [(0, new - old) for new, old in zip(shape, self._values.shape)]
+        self._values = np.pad(self._values, padding, constant_values=np.nan)
+        self._has_clinic = np.pad(self._has_clinic, [padding[0], padding[1]], constant_values=False)
+        self._has_measure = np.pad(self._has_measure, [padding[0], padding[2]], constant_values=False)
+        self._types = np.pad(self._types, [padding[0], padding[2]], constant_values=None)
+    # END resize
+
+    def add_measures(self, report_month: datetime, measures_df: DataFrame) -> None:
+        """
+        Adds or replaces the measure values for a month.  The first row for a clinic is kept when
+        a clinic has more than one row.
+        :param report_month: the month of the measure values
+        :param measures_df: a dataframe of measure values with a row per clinic in the Clinic column
+        """
+        measures_df = measures_df.drop_duplicates(subset=['Clinic'])
+        clinics = measures_df['Clinic'].tolist()
+        measures = measures_df.columns.tolist()
+
+        for clinic in clinics:
+            self._clinic_positions.setdefault(clinic, len(self._clinic_positions))
+        for measure in measures:
+            self._measure_positions.setdefault(measure, len(self._measure_positions))
+        if report_month not in self._month_positions:
+            if len(self._free_month_positions) > 0:
+                self._month_positions[report_month] = self._free_month_positions.pop()
+            else:
+                self._month_positions[report_month] = len(self._month_positions) + len(self._free_month_positions)
+        month = self._month_positions[report_month]
+        self._resize()
+
+        # Clear any values from a prior version of the month
+        self._clear_month(month)
+
+        clinic_positions = [self._clinic_positions[clinic] for clinic in clinics]
+        self._has_clinic[month, clinic_positions] = True
+
+        numeric_measures = measures_df.select_dtypes(include=_NUMERIC_TYPES).columns.tolist()
+        numeric_positions = [self._measure_positions[measure] for measure in numeric_measures]
+        self._values[month][np.ix_(clinic_positions, numeric_positions)] = (
+            measures_df[numeric_measures].to_numpy(dtype=np.float64))
+        for measure, position in zip(numeric_measures, numeric_positions):
+            self._types[month, position] = measures_df[measure].dtype.type
+
+        # Keep other values in clinic order for the month
+        for measure in measures:
+            position = self._measure_positions[measure]
+            self._has_measure[month, position] = True
+            if self._types[month, position] is None:
+                labels = np.zeros(len(self._clinic_positions), dtype=object)
+                labels[clinic_positions] = measures_df[measure].to_numpy(dtype=object)
+                self._labels[(month, position)] = labels
+    # END add_measures
+
+    def _clear_month(self, month: int) -> None:
+        """Clears the values stored at a month position."""
+        self._values[month] = np.nan
+        self._has_clinic[month] = False
+        self._has_measure[month] = False
+        self._types[month] = None
+        self._labels = {key: labels for key, labels in self._labels.items() if key[0] != month}
+    # END clear_month
+
+    def remove_measures(self, report_month: datetime) -> None:
+        """Removes the measure values for a month and frees its position for another month."""
+        month = self._month_positions.pop(report_month, None)
+        if month is not None:
+            self._clear_month(month)
+            self._free_month_positions.append(month)
+    # END remove_measures
+
+    def has_month(self, report_month: datetime) -> bool:
+        """Returns True if measure values have been added for the given month."""
+        return report_month in self._month_positions
+    # END has_month
+
+    def _get_positions(self, report_month: datetime, clinic: str, measure: str) -> (int, int, int):
+        """
+        Returns the month, clinic, and measure positions of a value.  The clinic position is None
+        when the clinic has no values for the month.  The measure position is None when the measure
+        has no values for the month.
+        """
+        month = self._month_positions[report_month]
+        clinic_position = self._clinic_positions.get(clinic)
+        if clinic_position is not None and not self._has_clinic[month, clinic_position]:
+            clinic_position = None
+        measure_position = self._measure_positions.get(measure)
+        if measure_position is not None and not self._has_measure[month, measure_position]:
+            measure_position = None
+        return month, clinic_position, measure_position
+    # END get_positions
+
+    def get_measure(self, report_month: datetime, clinic: str, measure: str) -> object:
+        """
+        Returns a measure value for a clinic and month regardless of datatype.
+        :param report_month: month being measured
+        :param clinic: name of clinic to return the measurement for
+        :param measure: name of the measure to return
+        :return: the measure value, or 0 if the clinic has no values for the month
+        """
+        month, clinic_position, measure_position = self._get_positions(report_month, clinic, measure)
+        if clinic_position is None:
+            return 0
+        if measure_position is None:
+            raise KeyError(measure)
+        measure_type = self._types[month, measure_position]
+        if measure_type is None:
+            return self._labels[(month, measure_position)][clinic_position]
+        return measure_type(self._values[month, clinic_position, measure_position])
+    # END get_measure
+
+    def get_numeric_measure(self, report_month: datetime, clinic: str, measure: str) -> object:
+        """
+        Returns a numeric measure value for a clinic and month.
+        :param report_month: month being measured
+        :param clinic: name of clinic to return the measurement for
+        :param measure: name of the measure to return
+        :return: the measure value, 0 if the clinic has no values for the month, or None if the
+                 measure is not numeric
+        """
+        month, clinic_position, measure_position = self._get_positions(report_month, clinic, measure)
+        if measure_position is None or self._types[month, measure_position] is None:
+            return None
+        if clinic_position is None:
+            return 0
+        return self._types[month, measure_position](self._values[month, clinic_position, measure_position])
+    # END get_numeric_measure
+
+    def get_measures(self, report_months: list[datetime], clinic: str, measures: list[str]) -> np.ndarray:
+        """
+        Returns the values of several measures for a clinic and several months in one fetch.  Numeric
+        values are gathered from the dense array with a single index operation.
+        :param report_months: months being measured
+        :param clinic: name of clinic to return the measurements for
+        :param measures: names of the measures to return
+        :return: an array with a row per month and a column per measure of values in the data type of
+                 their source column, or 0 for months that the clinic has no values for
+        """
+        months = [self._month_positions[report_month] for report_month in report_months]
+        values = np.zeros((len(months), len(measures)), dtype=object)
+        clinic_position = self._clinic_positions.get(clinic)
+        if clinic_position is None:
+            return values
+
+        measure_positions = [self._measure_positions[measure] for measure in measures]
+        numeric_values = self._values[np.ix_(months, [clinic_position], measure_positions)][:, 0, :]
+        for row, month in enumerate(months):
+            if not self._has_clinic[month, clinic_position]:
+                continue
+            for column, position in enumerate(measure_positions):
+                if not self._has_measure[month, position]:
+                    raise KeyError(measures[column])
+                measure_type = self._types[month, position]
+                if measure_type is None:
+                    values[row, column] = self._labels[(month, position)][clinic_position]
+                else:
+                    values[row, column] = measure_type(numeric_values[row, column])
+        return values
+    # END get_measures
+# END CLASS MeasureStore
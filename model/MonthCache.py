@@ -0,0 +1,320 @@
+"""
+MonthCache.py
+Provides monthly measure data that is calculated the first time a month is requested and kept in a
+least recently used cache of a limited number of months.  Months that are prefetched can be calculated in
+parallel by a pool of worker processes.  Data derived from the resident months, such as the lookups of a measure
+store, is read with MonthCache.read, which reads resident months without locking and reads again under the lock
+when another thread evicted or added a month during the read.  A month is calculated outside the lock, so reads
+of resident months do not wait for the calculation of another month.
+https://907sjl.github.io/
+
+Classes:
+    MonthCache - Least recently used cache of monthly measure data calculated on demand
+    MonthCacheView - Read-only dictionary view of one item of the monthly measure data in a cache
+
+Top-Level Variables:
+    PARALLEL_WORKERS - The number of worker processes that calculate prefetched months, from REFERRALS_MONTH_WORKERS
+"""
+
+from collections import Counter
+from collections.abc import Mapping
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import count
+from typing import Callable
+
+from datetime import datetime
+from threading import RLock, active_count
+
+import multiprocessing
+import os
+
+
+# Number of worker processes that calculate prefetched months in parallel, or 0 to calculate months in this process
+PARALLEL_WORKERS = int(os.environ.get('REFERRALS_MONTH_WORKERS', '0'))
+
+# Function that calculates months in worker processes, which the workers inherit when they are forked.  Workers are
+# only forked while this process has one thread, since a fork copies locks held by other threads in their locked
+# state and the workers would deadlock on them.
+_forked_calculate_month = None
+
+
+def _calculate_forked_month(report_month: datetime) -> tuple:
+    """
+    Calculates a month in a worker process with the function inherited from the parent process.  Workers are
+    forked while the measure modules are still being imported, so the function is not sent by reference.
+    """
+    return _forked_calculate_month(report_month)
+# END calculate_forked_month
+
+
+class MonthCache(Mapping):
+    """
+    Class that holds the measure data calculated for reporting months.  A month is calculated the first
+    time it is requested.  The least recently used month is evicted when more than the given number
+    of months are resident.  Months that a read calculates are pinned until the read returns, so a read of
+    more months than the capacity keeps every one of them resident until it is done.  Each month is calculated
+    by one thread at a time, and other threads that request the month wait for that calculation.
+
+    Public Attributes:
+        months - The reporting months that can be requested, in order
+        capacity - The maximum number of months kept resident
+        workers - The number of worker processes that calculate prefetched months, or 0 for none
+
+    Public Methods:
+        is_resident - Returns True if a month is calculated and resident in the cache
+        ensure_resident - Calculates the given months that are not resident
+        read - Calls a function that reads data derived from the given months while they are pinned resident
+        can_fork_workers - Returns True if months can be prefetched in parallel by forked worker processes
+        prefetch - Calculates the given months ahead of their first request, in parallel if there are workers
+        view - Returns a read-only dictionary of one item of the monthly measure data
+    """
+
+    def __init__(self,
+                 months: list[datetime],
+                 calculate_month: Callable[[datetime], tuple],
+                 capacity: int,
+                 evict_month: Callable[[datetime], None] = None,
+                 add_month: Callable[[datetime, tuple], None] = None,
+                 workers: int = PARALLEL_WORKERS):
+        """
+        Initialize instances.
+        :param months: the reporting months that can be requested
+        :param calculate_month: function that calculates the measure data for a month, which must not
+                                depend on changes made in this process after the months are prefetched
+        :param capacity: the maximum number of months kept resident
+        :param evict_month: function called after a month is evicted from the cache, or None
+        :param add_month: function called in this process after a month is calculated, or None
+        :param workers: the number of worker processes that calculate prefetched months, or 0 for none
+        """
+        self.months = list(months)
+        self.capacity = max(capacity, 1)
+        self.workers = workers
+        self._calculate_month = calculate_month
+        self._evict_month = evict_month
+        self._add_month = add_month
+        self._resident = {}
+        self._last_used = {}
+        self._use_counter = count()
+        self._calculating = {}
+        self._pinned_months = Counter()
+        self._version = 0
+        self._lock = RLock()
+    # END __init__
+
+    def __getitem__(self, report_month: datetime) -> tuple:
+        """Returns the measure data for a month, calculating the month if it is not resident."""
+        return self._make_resident(report_month)
+    # END __getitem__
+
+    def _make_resident(self, report_month: datetime) -> tuple:
+        """
+        Calculates a month if it is not resident, marks it as the most recently used, and returns its data.
+        A resident month is returned without locking.  A month is calculated outside the lock, so reads of
+        resident months are not blocked by it, and by one thread only, so other threads that request the month
+        while it is calculated wait for the same result.
+        """
+        if report_month not in self.months:
+            raise KeyError(report_month)
+
+        month_data = self._resident.get(report_month)
+        if month_data is not None:
+            self._last_used[report_month] = next(self._use_counter)
+            return month_data
+
+        with self._lock:
+            month_data = self._resident.get(report_month)
+            if month_data is not None:
+                self._last_used[report_month] = next(self._use_counter)
+                return month_data
+            calculation = self._calculating.get(report_month)
+            calculating = calculation is None
+            if calculating:
+                calculation = Future()
+                self._calculating[report_month] = calculation
+        if not calculating:
+            return calculation.result()
+
+        try:
+            month_data = self._calculate_month(report_month)
+            self._add(report_month, month_data)
+        except BaseException as error:
+            with self._lock:
+                del self._calculating[report_month]
+            calculation.set_exception(error)
+            raise
+        calculation.set_result(month_data)
+        return month_data
+    # END make_resident
+
+    def _add(self, report_month: datetime, month_data: tuple) -> None:
+        """
+        Makes a calculated month resident and evicts the least recently used months beyond the capacity.  The
+        version is odd while the months and the data derived from them change, so reads without the lock that
+        overlap the change are repeated.
+        """
+        with self._lock:
+            self._version += 1
+            try:
+                if self._add_month is not None:
+                    self._add_month(report_month, month_data)
+                self._resident[report_month] = month_data
+                self._last_used[report_month] = next(self._use_counter)
+                self._calculating.pop(report_month, None)
+                self._evict_beyond_capacity()
+            finally:
+                self._version += 1
+    # END add
+
+    def _evict_beyond_capacity(self) -> None:
+        """Evicts the least recently used months that are not pinned until no more than the capacity are resident."""
+        with self._lock:
+            unpinned_months = sorted((report_month for report_month in self._resident
+                                      if report_month not in self._pinned_months),
+                                     key=lambda report_month: self._last_used.get(report_month, -1))
+            evicted_months = unpinned_months[:max(len(self._resident) - self.capacity, 0)]
+            if len(evicted_months) == 0:
+                return
+            self._version += 1
+            try:
+                for evicted_month in evicted_months:
+                    del self._resident[evicted_month]
+                    self._last_used.pop(evicted_month, None)
+                    if self._evict_month is not None:
+                        self._evict_month(evicted_month)
+            finally:
+                self._version += 1
+    # END evict_beyond_capacity
+
+    def __iter__(self):
+        return iter(self.months)
+
+    def __len__(self) -> int:
+        return len(self.months)
+
+    def __contains__(self, report_month) -> bool:
+        return report_month in self.months
+
+    def is_resident(self, report_month: datetime) -> bool:
+        """Returns True if the month is calculated and resident in the cache."""
+        return report_month in self._resident
+    # END is_resident
+
+    def ensure_resident(self, report_months: list[datetime]) -> None:
+        """
+        Calculates the given months that are not resident, and marks every given month as the most recently used
+        in the given order.  Months beyond the capacity are evicted, so when more months are given than the
+        capacity the first months are not resident afterwards.  Use read to read data derived from the months.
+        :param report_months: the months to make resident
+        """
+        for report_month in report_months:
+            self._make_resident(report_month)
+    # END ensure_resident
+
+    def read(self, report_months: list[datetime], read_data: Callable[[], object]) -> object:
+        """
+        Makes the given months resident and calls a function that reads data derived from them, such as a lookup
+        maintained by the add_month and evict_month functions, as one operation.  When the months are resident
+        the function is called without locking, and is called again under the lock if another thread added or
+        evicted a month during the call.  Otherwise the months are pinned and calculated, so every given month
+        stays resident even when there are more of them than the capacity, and the function is called under the
+        lock so that no other thread can evict, add, or replace months during the read.
+        :param report_months: the months that the function reads
+        :param read_data: function that reads the data derived from the months
+        :return: the value returned by the function
+        """
+        version = self._version
+        if version % 2 == 0 and all(report_month in self._resident for report_month in report_months):
+            for report_month in report_months:
+                self._last_used[report_month] = next(self._use_counter)
+            try:
+                data = read_data()
+            except Exception:
+                if self._version == version:
+                    raise
+            else:
+                if self._version == version:
+                    return data
+
+        with self._lock:
+            self._pinned_months.update(report_months)
+        try:
+            self.ensure_resident(report_months)
+            with self._lock:
+                return read_data()
+        finally:
+            with self._lock:
+                self._pinned_months.subtract(report_months)
+                self._pinned_months = +self._pinned_months
+                self._evict_beyond_capacity()
+    # END read
+
+    def can_fork_workers(self) -> bool:
+        """
+        Returns True if prefetched months can be calculated in parallel by worker processes forked from this
+        process.  Workers are never forked once other threads are running, so a snapshot that is loaded in the
+        background of a server, such as for changed source files, calculates its months in this process.
+        """
+        return self.workers > 1 and active_count() == 1 and 'fork' in multiprocessing.get_all_start_methods()
+    # END can_fork_workers
+
+    def prefetch(self, report_months: list[datetime]) -> None:
+        """
+        Calculates the given months ahead of their first request, skipping months that cannot be requested.
+        The months that are not resident are calculated in parallel by worker processes forked from this process
+        when can_fork_workers returns True, so they share the source data without copying it, and in this process
+        otherwise.  Months are made resident in the given order so the last months given are the last to be
+        evicted, and months given beyond the capacity are calculated only to be evicted.
+        :param report_months: the months to calculate
+        """
+        report_months = [report_month for report_month in report_months if report_month in self.months]
+        missing_months = [report_month for report_month in report_months if not self.is_resident(report_month)]
+
+        # Worker processes are forked so that they start with the source data already loaded
+        if len(missing_months) > 1 and self.can_fork_workers():
+            global _forked_calculate_month
+            _forked_calculate_month = self._calculate_month
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(missing_months)),
+                                     mp_context=multiprocessing.get_context('fork')) as pool:
+                for report_month, month_data in zip(missing_months,
+                                                    pool.map(_calculate_forked_month, missing_months)):
+                    self._add(report_month, month_data)
+            report_months = [report_month for report_month in report_months if report_month not in missing_months]
+
+        self.ensure_resident(report_months)
+    # END prefetch
+
+    def view(self, item: int) -> 'MonthCacheView':
+        """Returns a read-only dictionary of one item of the monthly measure data by month."""
+        return MonthCacheView(self, item)
+    # END view
+# END CLASS MonthCache
+
+
+class MonthCacheView(Mapping):
+    """
+    Class that presents one item of the monthly measure data in a cache as a dictionary by month.
+    Requesting a month from the view calculates the month in the cache if it is not resident.
+    """
+
+    def __init__(self, cache: MonthCache, item: int):
+        """
+        Initialize instances.
+        :param cache: the cache of monthly measure data
+        :param item: the position of the item in the monthly measure data
+        """
+        self._cache = cache
+        self._item = item
+    # END __init__
+
+    def __getitem__(self, report_month: datetime):
+        return self._cache[report_month][self._item]
+
+    def __iter__(self):
+        return iter(self._cache)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, report_month) -> bool:
+        return report_month in self._cache
+# END CLASS MonthCacheView
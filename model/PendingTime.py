@@ -1,7 +1,8 @@
 """
 PendingTime.py
 Module that provides data for pending referral wait times.  This data is not aggregated by month.  All referrals
-in a pending status are included.
+in a pending status are included.  The measure data is served from the current model snapshot, which is replaced
+when the source data changes.
 https://907sjl.github.io/
 
 Top-Level Variables:
@@ -26,10 +27,16 @@ from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
 import model.source.Referrals as r
+from model.MeasureCache import MeasureCache
+import model.Snapshot as sn
+from model.Timing import timed_function
 
 # Effective as-of date for data
 _AS_OF_DATE = datetime(2023, 3, 1)
 
+# Version of the measure definitions in this module, incremented when a change invalidates cached measures
+_MEASURE_DEFINITION_VERSION = 3
+
 
 def _calculate_on_hold_measures(referral_df: DataFrame) -> tuple[DataFrame, DataFrame]:
     """
@@ -47,13 +54,13 @@ def _calculate_on_hold_measures(referral_df: DataFrame) -> tuple[DataFrame, Data
     r.calculate_age_category(on_hold_df, 'Age Category On Hold', 'Days On Hold')
 
     # Create sums of referrals by clinic and age category combinations
-    age_distribution_df = on_hold_df.groupby(['Clinic', 'Age Category On Hold']) \
+    age_distribution_df = on_hold_df.groupby(['Clinic', 'Age Category On Hold'], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
 
     # Create sums of referrals by clinic and hold reason combinations
-    reason_distribution_df = on_hold_df.groupby(['Clinic', 'Reason for Hold']) \
+    reason_distribution_df = on_hold_df.groupby(['Clinic', 'Reason for Hold'], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
@@ -97,7 +104,8 @@ def get_count_by_age_category(clinic: str, count_function: str, category: str) -
 
 def get_counts_by_on_hold_reason(clinic: str) -> DataFrame:
     """Returns a DataFrame of current referral counts by hold reason for the given clinic."""
-    df = _on_hold_reasons_df.loc[(_on_hold_reasons_df['Clinic'] == clinic)].copy()
+    df = _get_data()['_on_hold_reasons_df']
+    df = df.loc[(df['Clinic'] == clinic)].copy()
     df['Reason for Hold'] = df['Reason for Hold'].str.replace('Coordinating', 'Coord.')
     return df
 # END get_counts_by_on_hold_reason
@@ -106,7 +114,7 @@ def get_counts_by_on_hold_reason(clinic: str) -> DataFrame:
 def get_on_hold_age_by_category(clinic: str, category: str) -> int:
     """Returns the count of on-hold referrals currently in an age category for the given clinic."""
 
-    df = _on_hold_ages_df
+    df = _get_data()['_on_hold_ages_df']
     view = df.loc[(df['Clinic'] == clinic)
                   & (df['Age Category On Hold'] == category)]
     if len(view.index) == 0:
@@ -132,13 +140,13 @@ def _calculate_pending_reschedule_measures(referral_df: DataFrame) -> tuple[Data
     r.calculate_age_category(pending_df, 'Age Category Pending Reschedule', 'Days Pending Reschedule')
 
     # Create sums of referrals by clinic and age category combinations
-    age_distribution_df = pending_df.groupby(['Clinic', 'Age Category Pending Reschedule']) \
+    age_distribution_df = pending_df.groupby(['Clinic', 'Age Category Pending Reschedule'], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
     
     # Create sums of referrals by clinic and sub-status combinations
-    reason_distribution_df = pending_df.groupby(['Clinic', 'Referral Sub-Status']) \
+    reason_distribution_df = pending_df.groupby(['Clinic', 'Referral Sub-Status'], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
@@ -149,7 +157,8 @@ def _calculate_pending_reschedule_measures(referral_df: DataFrame) -> tuple[Data
 
 def get_counts_by_pending_reschedule_sub_status(clinic: str) -> DataFrame:
     """Returns a DataFrame of current pending reschedule referral counts by queue sub-status for the given clinic."""
-    df = _reschedule_status_df.loc[(_reschedule_status_df['Clinic'] == clinic)].copy()
+    df = _get_data()['_reschedule_status_df']
+    df = df.loc[(df['Clinic'] == clinic)].copy()
     df['Referral Sub-Status'] = (
         df['Referral Sub-Status'].str.replace('Call Patient to Schedule Appointment',
                                               'Call Patient to Schedule'))
@@ -160,7 +169,7 @@ def get_counts_by_pending_reschedule_sub_status(clinic: str) -> DataFrame:
 def get_pending_reschedule_age_by_category(clinic: str, category: str) -> int:
     """Returns the count of pending reschedule referrals currently in an age category for the given clinic."""
 
-    df = _reschedule_ages_df
+    df = _get_data()['_reschedule_ages_df']
     view = df.loc[(df['Clinic'] == clinic)
                   & (df['Age Category Pending Reschedule'] == category)]
     if len(view.index) == 0:
@@ -186,13 +195,13 @@ def _calculate_pending_acceptance_measures(referral_df: DataFrame) -> tuple[Data
     r.calculate_age_category(pending_df, 'Age Category Pending Acceptance', 'Days until Referral Accepted')
 
     # Create sums of referrals by clinic and age category combinations
-    age_distribution_df = pending_df.groupby(['Clinic', 'Age Category Pending Acceptance']) \
+    age_distribution_df = pending_df.groupby(['Clinic', 'Age Category Pending Acceptance'], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
     
     # Create sums of referrals by clinic and sub-status combinations
-    reason_distribution_df = pending_df.groupby(['Clinic', 'Referral Sub-Status']) \
+    reason_distribution_df = pending_df.groupby(['Clinic', 'Referral Sub-Status'], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
@@ -203,7 +212,8 @@ def _calculate_pending_acceptance_measures(referral_df: DataFrame) -> tuple[Data
 
 def get_counts_by_pending_acceptance_sub_status(clinic: str) -> DataFrame:
     """Returns a DataFrame of current pending acceptance referral counts by queue sub-status for the given clinic."""
-    df = _acceptance_status_df.loc[(_acceptance_status_df['Clinic'] == clinic)].copy()
+    df = _get_data()['_acceptance_status_df']
+    df = df.loc[(df['Clinic'] == clinic)].copy()
     df['Referral Sub-Status'] = (
         df['Referral Sub-Status'].str.replace('Call Patient to Schedule Appointment',
                                               'Call Patient to Schedule'))
@@ -214,7 +224,7 @@ def get_counts_by_pending_acceptance_sub_status(clinic: str) -> DataFrame:
 def get_pending_acceptance_age_by_category(clinic: str, category: str) -> int:
     """Returns the count of pending acceptance referrals currently in an age category for the given clinic."""
 
-    df = _acceptance_ages_df
+    df = _get_data()['_acceptance_ages_df']
     view = df.loc[(df['Clinic'] == clinic)
                   & (df['Age Category Pending Acceptance'] == category)]
     if len(view.index) == 0:
@@ -241,13 +251,13 @@ def _calculate_accepted_status_measures(referral_df: DataFrame) -> tuple[DataFra
     r.calculate_age_category(pending_df, 'Age Category to Seen', 'Days until Patient Seen or Check In')
 
     # Create sums of referrals by clinic and age category combinations
-    age_distribution_df = pending_df.groupby(['Clinic', 'Age Category to Seen']) \
+    age_distribution_df = pending_df.groupby(['Clinic', 'Age Category to Seen'], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
     
     # Create sums of referrals by clinic and sub-status combinations
-    reason_distribution_df = pending_df.groupby(['Clinic', 'Referral Sub-Status']) \
+    reason_distribution_df = pending_df.groupby(['Clinic', 'Referral Sub-Status'], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
@@ -258,7 +268,8 @@ def _calculate_accepted_status_measures(referral_df: DataFrame) -> tuple[DataFra
 
 def get_counts_by_accepted_referral_sub_status(clinic: str) -> DataFrame:
     """Returns a DataFrame of current accepted stats referral counts by queue sub-status for the given clinic."""
-    df = _accepted_status_df.loc[(_accepted_status_df['Clinic'] == clinic)].copy()
+    df = _get_data()['_accepted_status_df']
+    df = df.loc[(df['Clinic'] == clinic)].copy()
     df['Referral Sub-Status'] = (
         df['Referral Sub-Status'].str.replace('Call Patient to Schedule Appointment',
                                               'Call Patient to Schedule'))
@@ -269,7 +280,7 @@ def get_counts_by_accepted_referral_sub_status(clinic: str) -> DataFrame:
 def get_accepted_referral_age_by_category(clinic: str, category: str) -> int:
     """Returns the count of accepted referrals currently in an age category for the given clinic."""
 
-    df = _accepted_ages_df
+    df = _get_data()['_accepted_ages_df']
     view = df.loc[(df['Clinic'] == clinic)
                   & (df['Age Category to Seen'] == category)]
     if len(view.index) == 0:
@@ -279,15 +290,53 @@ def get_accepted_referral_age_by_category(clinic: str, category: str) -> int:
 # END get_accepted_referral_age_by_category
 
 
-# MAIN
+def _get_data() -> dict:
+    """Returns the data of this module in the model snapshot of the caller."""
+    return sn.get_data('pending-time')
+# END get_data
 
-print('Calculating pending time measures...')
 
-last_month = datetime.combine(_AS_OF_DATE.replace(day=1).date(), datetime.min.time()) + relativedelta(months=-1)
+def _load_snapshot_data() -> dict:
+    """
+    Returns the top-level variables of this module for a new model snapshot.  Calculated measures are kept on
+    disk until the source data, as-of date, or measure definitions change.
+    """
+    print('Calculating pending time measures...')
+
+    referral_df = r.referral_df
+    measure_cache = MeasureCache('pending-time', [r.source_file], _AS_OF_DATE, _MEASURE_DEFINITION_VERSION)
+    data = {}
+    data['_on_hold_ages_df'], data['_on_hold_reasons_df'] = (
+        measure_cache.get('on-hold', timed_function('pending-time/on-hold',
+                                                    lambda: _calculate_on_hold_measures(referral_df))))
+    data['_reschedule_ages_df'], data['_reschedule_status_df'] = (
+        measure_cache.get('pending-reschedule',
+                          timed_function('pending-time/pending-reschedule',
+                                         lambda: _calculate_pending_reschedule_measures(referral_df))))
+    data['_acceptance_ages_df'], data['_acceptance_status_df'] = (
+        measure_cache.get('pending-acceptance',
+                          timed_function('pending-time/pending-acceptance',
+                                         lambda: _calculate_pending_acceptance_measures(referral_df))))
+    data['_accepted_ages_df'], data['_accepted_status_df'] = (
+        measure_cache.get('accepted-status',
+                          timed_function('pending-time/accepted-status',
+                                         lambda: _calculate_accepted_status_measures(referral_df))))
+
+    print('Pending time measures calculated')
+    return data
+# END load_snapshot_data
+
+
+def __getattr__(name: str) -> object:
+    """Returns the top-level variables of this module from the model snapshot of the caller."""
+    return sn.get_module_variable('pending-time', __name__, name)
+# END getattr
 
-_on_hold_ages_df, _on_hold_reasons_df = _calculate_on_hold_measures(r.referral_df)
-_reschedule_ages_df, _reschedule_status_df = _calculate_pending_reschedule_measures(r.referral_df)
-_acceptance_ages_df, _acceptance_status_df = _calculate_pending_acceptance_measures(r.referral_df)
-_accepted_ages_df, _accepted_status_df = _calculate_accepted_status_measures(r.referral_df)
 
-print('Pending time measures calculated')
+# MAIN
+
+last_month = datetime.combine(_AS_OF_DATE.replace(day=1).date(), datetime.min.time()) + relativedelta(months=-1)
+
+# Initialize module with the pending time measures of the current model snapshot, which is replaced when the
+# source data changes
+sn.register_loader('pending-time', [r.source_file], _load_snapshot_data)
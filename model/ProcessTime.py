@@ -1,11 +1,12 @@
 """
 ProcessTime.py
 Provides data for process aim performance and process timing for conversion of referrals into attended appointments
+The measure data is served from the current model snapshot, which is replaced when the source data changes.
 https://907sjl.github.io/
 
 Top-Level Variables:
     last_month - The first day of the previous month at time 00:00:00
-    clinic_measures[month] - Calculated measurement data by month by clinic
+    clinic_measures[month] - Calculated measurement data by month by clinic, calculated on first request
     distribution_data[month] - Calculated counts by category by month and clinic
 
 Functions:
@@ -15,23 +16,46 @@ Functions:
     get_clinic_measure - Returns a measure value for the given clinic and month regardless of datatype
     get_clinic_rate_measure - Returns a float measure value for the given clinic and month
     get_clinic_count_measure - Returns an integer measure value for the given clinic and month
+    get_clinic_measures - Returns several measure values for the given clinic and months in one fetch
     get_clinics - Returns a list of unique clinic names
     get_clinic_distribution_count - Returns the distribution count for a clinic, category, and bin name combination
+    get_snapshot_key - Returns a key of the measure data that changes when the source data or measures change
 """
 
 import pandas as pd
-from pandas import DataFrame
+from pandas import DataFrame, Series
 import numpy as np
 
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
+from typing import Callable
 
 import model.source.Referrals as r
+import model.source.Encoding as e
+from model.DerivedMeasures import DerivedMeasureGraph
+from model.FactCube import DailyFactCube
+from model.MeasureCache import MeasureCache
+from model.MeasurePlan import MeasurePlan
+from model.MeasureStore import MeasureStore
+from model.MonthCache import MonthCache
+import model.Snapshot as sn
+from model.Timing import timed
 
 
 # Effective as-of date for data
 _AS_OF_DATE = datetime(2023, 3, 1)
 
+# Version of the measure definitions in this module, incremented when a change invalidates cached measures
+_MEASURE_DEFINITION_VERSION = 4
+
+# Targets of measures that are compared to the measures by variances against target
+_MEASURE_TARGETS = {'Target Pct Routine Referrals Seen in 30d': 50.0,
+                    'Target Pct Urgent Referrals Seen in 5d': 50.0}
+
+# Median measures that are tagged with an age category name
+_AGE_CATEGORY_MEASURES = {'Age Category to Scheduled': 'Median Days until Scheduled',
+                          'Age Category to Seen': 'Median Days until Seen'}
+
 # Configurations to auto-calculate measures dependent on other measures
 _DEPENDENT_VARIANCES = [
     {'measure': 'Var MOV91 Pct Routine Referrals Seen in 30d',
@@ -115,6 +139,12 @@ _DEPENDENT_VARIANCES = [
      'standard': 'MOV364 Median Days until Scheduled',
      'is-percent': True}]
 
+# Directional indicators of negative, zero, and positive variances
+_DIRECTION_SYMBOLS = np.array(['\u25BC', '-', '\u25B2'], dtype=object)
+
+# Scores added to variance category scores when the variance of each term is not negative
+_VARIANCE_TERM_SCORES = {'near-term': 1, 'mid-term': 10, 'long-term': 100}
+
 _VARIANCE_CATEGORIES = [
     {'category': 'Routine Performance vs. Target',
      'near-term': 'Var Target MOV91 Pct Routine Referrals Seen in 30d',
@@ -165,184 +195,233 @@ _VARIANCE_CATEGORIES = [
                 100: 'Falling',
                 0: 'Falling'}}]
 
+# Configurations of the measures aggregated for each lookback.  Each measure names the source column, the
+# aggregation function, and an indicator column that limits the rows aggregated or None.  Measures across
+# all clinics are listed as global measures.  Rate measures name the numerator and denominator measures and
+# whether the percent is rounded to a whole number.  Lookbacks are compiled into a measure plan that
+# aggregates the measures of each window of referrals in one pass.
+_LOOKBACK_MEASURES = {
+    '5d': {'lag-column': 'Reporting Date 5 Day Lag',
+           'priority': 'Urgent',
+           'measures': {
+               # MEASURE: Count of urgent referrals sent after 5 days
+               'Urgent Referrals Sent': ('Referral ID', 'count', None),
+               # MEASURE: Count of urgent referrals kept after 5 days
+               'Urgent Referrals Aged': ('Referral Aged Yn', 'sum', None),
+               # MEASURE: Count of referrals rejected after 5 days
+               'Urgent Referrals Rejected After 5d': ('Referral Rejected Yn', 'sum', None),
+               # MEASURE: Count of referrals canceled after 5 days
+               'Urgent Referrals Canceled After 5d': ('Referral Canceled Yn', 'sum', None),
+               # MEASURE: Count of referrals closed without being seen after 5 days
+               'Urgent Referrals Closed WBS After 5d': ('Referral Closed WBS Yn', 'sum', None),
+               # MEASURE: Count of referrals seen after 5 days
+               'Urgent Referrals Seen After 5d': ('Referral Seen or Checked In Yn', 'sum', 'Referral Aged Yn'),
+               # MEASURE: Count of referrals scheduled after 5 days
+               'Urgent Referrals Scheduled After 5d': ('Referral Scheduled Yn', 'sum', 'Referral Aged Yn'),
+               # MEASURE: Count of referrals scheduled and waiting to be seen after 5 days
+               'Urgent Referrals Waiting After 5d': ('Referral Waiting Yn', 'sum', 'Referral Aged Yn'),
+               # MEASURE: Count of referrals not scheduled after 5 days
+               'Urgent Referrals Not Scheduled After 5d': ('Referral Not Scheduled Yn', 'sum', 'Referral Aged Yn'),
+               # MEASURE: Count of urgent referrals seen in 5 days by clinic and across all clinics
+               'Urgent Referrals Seen in 5d': ('Referral Seen in 5d Yn', 'sum', 'Referral Aged Yn')},
+           'global-measures': ['Urgent Referrals Aged', 'Urgent Referrals Seen in 5d'],
+           'rate-measures': {
+               # MEASURE: Percent of urgent referrals seen after 5 days
+               'Pct Urgent Referrals Seen in 5d': ('Urgent Referrals Seen in 5d', 'Urgent Referrals Aged', True)}},
+    '30d': {'lag-column': 'Reporting Date 30 Day Lag',
+            'priority': 'Routine',
+            'measures': {
+                # MEASURE: Count of routine referrals sent after 30 days
+                'Routine Referrals Sent': ('Referral ID', 'count', None),
+                # MEASURE: Count of routine referrals kept after 30 days
+                'Routine Referrals Aged': ('Referral Aged Yn', 'sum', None),
+                # MEASURE: Count of referrals rejected after 30 days
+                'Routine Referrals Rejected After 30d': ('Referral Rejected Yn', 'sum', None),
+                # MEASURE: Count of referrals canceled after 30 days
+                'Routine Referrals Canceled After 30d': ('Referral Canceled Yn', 'sum', None),
+                # MEASURE: Count of referrals closed without being seen after 30 days
+                'Routine Referrals Closed WBS After 30d': ('Referral Closed WBS Yn', 'sum', None),
+                # MEASURE: Count of referrals seen after 30 days
+                'Routine Referrals Seen After 30d': ('Referral Seen or Checked In Yn', 'sum', 'Referral Aged Yn'),
+                # MEASURE: Count of referrals scheduled after 30 days
+                'Routine Referrals Scheduled After 30d': ('Referral Scheduled Yn', 'sum', 'Referral Aged Yn'),
+                # MEASURE: Count of referrals scheduled and waiting to be seen after 30 days
+                'Routine Referrals Waiting After 30d': ('Referral Waiting Yn', 'sum', 'Referral Aged Yn'),
+                # MEASURE: Count of referrals not scheduled after 30 days
+                'Routine Referrals Not Scheduled After 30d': ('Referral Not Scheduled Yn', 'sum',
+                                                              'Referral Aged Yn'),
+                # MEASURE: Count of routine referrals seen within 30 days by clinic and across all clinics
+                'Routine Referrals Seen in 30d': ('Referral Seen in 30d Yn', 'sum', 'Referral Aged Yn')},
+            'global-measures': ['Routine Referrals Aged', 'Routine Referrals Seen in 30d'],
+            'rate-measures': {
+                # MEASURE: Percent of referrals seen in 30 days by clinic and overall
+                'Pct Routine Referrals Seen in 30d': ('Routine Referrals Seen in 30d', 'Routine Referrals Aged',
+                                                      False)}},
+    '90d': {'lag-column': 'Reporting Date 90 Day Lag',
+            'priority': None,
+            'measures': {
+                # MEASURE: Count of referrals sent after 90 days
+                'Referrals Sent': ('Referral ID', 'count', None),
+                # MEASURE: Count of referrals kept after 90 days
+                'Referrals Aged': ('Referral Aged Yn', 'sum', None),
+                # MEASURE: Count of referrals rejected after 90 days
+                'Referrals Rejected After 90d': ('Referral Rejected Yn', 'sum', None),
+                # MEASURE: Count of referrals canceled after 90 days
+                'Referrals Canceled After 90d': ('Referral Canceled Yn', 'sum', None),
+                # MEASURE: Count of referrals closed without being seen after 90 days
+                'Referrals Closed WBS After 90d': ('Referral Closed WBS Yn', 'sum', None),
+                # MEASURE: Count of referrals seen after 90 days
+                'Referrals Seen After 90d': ('Referral Seen or Checked In Yn', 'sum', 'Referral Aged Yn'),
+                # MEASURE: Count of referrals scheduled after 90 days
+                'Referrals Scheduled After 90d': ('Referral Scheduled Yn', 'sum', 'Referral Aged Yn'),
+                # MEASURE: Count of referrals scheduled and waiting to be seen after 90 days
+                'Referrals Waiting After 90d': ('Referral Waiting Yn', 'sum', 'Referral Aged Yn'),
+                # MEASURE: Count of referrals not scheduled after 90 days
+                'Referrals Not Scheduled After 90d': ('Referral Not Scheduled Yn', 'sum', 'Referral Aged Yn'),
+                # MEASURE: Count of referrals accepted after 90 days
+                'Referrals Accepted After 90d': ('Referral Accepted Yn', 'sum', 'Referral Aged Yn'),
+                # MEASURE: Count of referrals completed after 90 days
+                'Referrals Completed After 90d': ('Referral Completed Yn', 'sum', 'Referral Aged Yn'),
+                # MEASURE: Count of referrals seen and completed after 90 days
+                'Referrals Completed and Seen After 90d': ('Referral Completed and Seen Yn', 'sum',
+                                                           'Referral Aged Yn'),
+                # MEASURE: Median days to see referral by clinic and across all clinics
+                'Median Days until Seen': ('Days until Patient Seen or Check In', 'median', 'Referral Aged Yn'),
+                # MEASURE: Median days to schedule referral by clinic and across all clinics
+                'Median Days until Scheduled': ('Days until Referral or Patient Scheduled', 'median',
+                                                'Referral Aged Yn'),
+                # MEASURE: Median days to complete referral
+                'Median Days until Completed': ('Days until Referral Completed', 'median', 'Referral Aged Yn'),
+                # MEASURE: Median days to accept referral
+                'Median Days to Accept': ('Days until Referral Accepted', 'median', 'Referral Aged Yn')},
+            'global-measures': ['Median Days until Seen', 'Median Days until Scheduled'],
+            'rate-measures': {
+                # MEASURE: Percent of referrals seen after 90 days
+                'Pct Referrals Seen After 90d': ('Referrals Seen After 90d', 'Referrals Aged', True),
+                # MEASURE: Percent of referrals scheduled after 90 days
+                'Pct Referrals Scheduled After 90d': ('Referrals Scheduled After 90d', 'Referrals Aged', True)}}}
+
+# Reporting windows calculated for every lookback by measure name prefix, with the number of days the window
+# reaches back from the end of the reporting month or None for the reporting month itself
+_REPORTING_WINDOWS = {'': None,
+                      'MOV28 ': 28,
+                      'MOV91 ': 91,
+                      'MOV182 ': 182,
+                      'MOV364 ': 364}
+
+# Plan of the daily fact cubes that aggregate the lookback measures
+_measure_plan = MeasurePlan(_LOOKBACK_MEASURES)
+
+
+# Number of reporting months that can be requested, and the number of months kept resident in memory
+_HISTORY_MONTHS = 12
+_RESIDENT_MONTHS = 6
+
+# Months offset from the last month that are calculated ahead of requests from Bokeh
+_PREFETCH_MONTH_OFFSETS = [0]
+
+
+def _get_window_referrals(referrals_df: DataFrame,
+                          clinics_df: DataFrame,
+                          lag_column: str,
+                          start_date: datetime,
+                          end_date: datetime) -> DataFrame:
+    """
+    Returns the referrals for the given clinics that reached the age of a lookback in the given period.
+    :param referrals_df: a dataframe of referrals
+    :param clinics_df: a dataframe of clinic names to calculate measures for
+    :param lag_column: name of the time shifted reporting date column for the lookback
+    :param start_date: the first date in the period
+    :param end_date: the day after the last date in the period
+    :return: a view of the referrals in the lookback window
+    """
+    idx = (referrals_df['Clinic'].isin(clinics_df['Clinic'])
+           & (referrals_df[lag_column] >= e.to_epoch_day(start_date))
+           & (referrals_df[lag_column] < e.to_epoch_day(end_date)))
+    return referrals_df.loc[idx]
+# END get_window_referrals
+
+
+def _aggregate_window_measures(clinics_df: DataFrame,
+                               fact_cube: DailyFactCube,
+                               lookback: dict,
+                               start_date: datetime,
+                               end_date: datetime,
+                               prefix: str = '') -> DataFrame:
+    """
+    Aggregates every measure of a lookback for the given period.  Counts and medians come from the
+    difference of two cumulative rows in the daily fact cube of the lookback, since the days of every
+    median measure are whole numbers.
+    :param clinics_df: a dataframe of clinic names to calculate measures for
+    :param fact_cube: the daily fact cube of counted measures for the lookback
+    :param lookback: a dictionary node from the lookback measure configurations
+    :param start_date: the first date in the period
+    :param end_date: the day after the last date in the period
+    :param prefix: prefix to add to the measure name
+    :return: a dataframe of clinics and calculated measures with a row for the *ALL* clinic
+    """
+
+    measures = lookback['measures']
+    global_measures = lookback['global-measures']
 
-# Memory resident storage for monthly process measurements
-clinic_measures = {}
-distribution_data = {}
+    # Counts and medians by clinic come from the fact cube without scanning the referrals
+    by_clinic_df = pd.merge(fact_cube.get_window_counts(start_date, end_date),
+                            fact_cube.get_window_medians(start_date, end_date),
+                            how='left',
+                            on=['Clinic'])
 
+    # Measures across all clinics use the *ALL* clinic name, other measures are zero for *ALL*
+    global_values = {measure: 0 for measure in measures}
+    global_values.update({measure: by_clinic_df[measure].sum()
+                          for measure in global_measures if measure in fact_cube.indicators})
+    global_values.update({measure: median
+                          for measure, median in fact_cube.get_overall_medians(start_date, end_date).items()
+                          if measure in global_measures})
 
-def _calculate_measures_after_5_days(referrals_df: DataFrame,
-                                     clinics_df: DataFrame,
-                                     start_date: datetime,
-                                     end_date: datetime,
-                                     prefix: str = '') -> DataFrame:
+    global_df = pd.DataFrame({'Clinic': '*ALL*', **global_values}, index=[0])
+
+    # Clean up missing data from clinics by replacing with zero
+    by_clinic_df = pd.concat([by_clinic_df, global_df], ignore_index=True).fillna(0)
+    by_clinic_df = by_clinic_df[['Clinic'] + list(measures)]
+    return by_clinic_df.rename(columns={measure: prefix + measure for measure in measures})
+# END aggregate_window_measures
+
+
+def _calculate_lookback_measures(clinics_df: DataFrame,
+                                 fact_cube: DailyFactCube,
+                                 lookback: dict,
+                                 start_date: datetime,
+                                 end_date: datetime,
+                                 prefix: str = '') -> DataFrame:
     """
-    Calculates measures of referral processing using a 5 day lookback.
-    :param referrals_df: a dataframe of referrals
+    Calculates the measures of referral processing for a lookback, including the rate measures that depend
+    on other measures of the lookback.
     :param clinics_df: a dataframe of clinic names to calculate measures for
+    :param fact_cube: the daily fact cube of counted measures for the lookback
+    :param lookback: a dictionary node from the lookback measure configurations
     :param start_date: the first date in the period
     :param end_date: the day after the last date in the period
     :param prefix: prefix to add to the measure name
     :return: a dataframe of clinics and calculated measures
     """
 
-    # Limit the source data to the given clinic names and the referrals that reached
-    # 5 days of age in the given period.
-    idx = (referrals_df['Clinic'].isin(clinics_df['Clinic'])
-           & (referrals_df['Reporting Date 5 Day Lag'] >= start_date)
-           & (referrals_df['Reporting Date 5 Day Lag'] < end_date))
-    source_df = referrals_df.loc[idx].copy()
-
-    # Create a dataframe of aggregations by clinic starting with independent measures
-    # MEASURE: Count of urgent referrals sent after 5 days
-    # MEASURE: Count of urgent referrals kept after 5 days
-    by_clinic_df = source_df.loc[source_df['Referral Priority'] == 'Urgent'] \
-        .groupby('Clinic') \
-        .agg(rid=pd.NamedAgg(column="Referral ID", aggfunc="count"),
-             aged=pd.NamedAgg(column="Referral Aged Yn", aggfunc="sum")) \
-        .rename(columns={'rid': prefix + 'Urgent Referrals Sent',
-                         'aged': prefix + 'Urgent Referrals Aged'})
-
-    # MEASURE: Count of referrals rejected after 5 days
-    idx = ((source_df['Referral Status'] == 'Rejected')
-           & (source_df['Referral Sent Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Urgent'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Rejected After 5d'})
-
-    # Merge count of referrals rejected into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals canceled after 5 days
-    idx = ((source_df['Referral Status'] == 'Cancelled')
-           & (source_df['Referral Sent Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Urgent'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Canceled After 5d'})
-
-    # Merge count of referrals canceled into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals closed without being seen after 5 days
-    idx = (~(source_df['Referral Status'] == 'Cancelled')
-           & ~(source_df['Referral Status'] == 'Rejected')
-           & (source_df['Referral Aged Yn'] == 0)
-           & (source_df['Referral Sent Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Urgent'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Closed WBS After 5d'})
-
-    # Merge count of referrals closed without being seen into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals seen after 5 days
-    idx = ((source_df['Referral Seen or Checked In Yn'] == 1)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Urgent'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Seen After 5d'})
-
-    # Merge count of referrals seen into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals scheduled after 5 days
-    idx = (((source_df['Patient Scheduled Yn'] + source_df['Appointment Linked Yn']) > 0)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Urgent'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Scheduled After 5d'})
-
-    # Merge count of referrals scheduled into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals scheduled and waiting to be seen after 5 days
-    idx = ((source_df['Referral Seen or Checked In Yn'] == 0)
-           & ((source_df['Patient Scheduled Yn'] + source_df['Appointment Linked Yn']) > 0)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Urgent'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Waiting After 5d'})
-
-    # Merge count of referrals waiting into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals not scheduled after 5 days
-    idx = (((source_df['Patient Scheduled Yn'] + source_df['Appointment Linked Yn']) == 0)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Urgent'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Not Scheduled After 5d'})
-
-    # Merge count of referrals not scheduled into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of urgent referrals seen in 5 days by clinic
-    idx = ((source_df['Days until Patient Seen or Check In'] <= 5.0)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Urgent'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Seen in 5d'})
-
-    # Merge count of referrals seen by 5 days into dataframe of measures by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # Create a single row dataframe to hold global measures across all clinics
-    # using the *ALL* clinic name 
-    global_df = clinics_df.loc[(clinics_df['Clinic'] == '*ALL*')].copy()
-
-    # MEASURE: Count of urgent referrals seen within 5 days
-    measure_df = source_df.loc[idx, ['Referral ID']] \
-        .count().to_frame().transpose() \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Seen in 5d'})
-    measure_df['Clinic'] = '*ALL*'
-
-    # Merge count of all referrals seen within 5 days into global ages dataframe 
-    global_df = pd.merge(global_df, measure_df, how='inner', on=['Clinic'])
-
-    # MEASURE: Count of urgent referrals kept after 5 days
-    idx = ((source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Urgent'))
-    measure_df = source_df.loc[idx, ['Referral ID']] \
-        .count().to_frame().transpose() \
-        .rename(columns={'Referral ID': prefix + 'Urgent Referrals Aged'})
-    measure_df['Clinic'] = '*ALL*'
-
-    # Merge count of all referrals kept after 5 days into global measures dataframe
-    global_df = pd.merge(global_df, measure_df, how='inner', on=['Clinic'])
-
-    # Merge global measures into a seamless table of measures by clinic using the *ALL* clinic
-    by_clinic_df = pd.merge(by_clinic_df, global_df, how='outer',
-                            on=['Clinic', prefix + 'Urgent Referrals Aged', prefix + 'Urgent Referrals Seen in 5d'])
-
-    # Clean up missing data from clinics by replacing with zero
-    by_clinic_df = by_clinic_df.fillna(0)
+    by_clinic_df = _aggregate_window_measures(clinics_df,
+                                              fact_cube,
+                                              lookback,
+                                              start_date,
+                                              end_date,
+                                              prefix)
 
     # Calculate dependent measures using table of measures by clinic
-    # MEASURE: Percent of urgent referrals seen after 5 days
-    by_clinic_df[prefix + 'Pct Urgent Referrals Seen in 5d'] = (
-        ((by_clinic_df[prefix + 'Urgent Referrals Seen in 5d']
-          .div(by_clinic_df[prefix + 'Urgent Referrals Aged'])
-          .fillna(0) * 100.0) + 0.5)
-        .astype(int))
+    for measure, (numerator, denominator, is_rounded) in lookback['rate-measures'].items():
+        rates = by_clinic_df[prefix + numerator].div(by_clinic_df[prefix + denominator])
+        if is_rounded:
+            by_clinic_df[prefix + measure] = ((rates.fillna(0) * 100.0) + 0.5).astype(int)
+        else:
+            by_clinic_df[prefix + measure] = rates * 100.0
 
     return by_clinic_df
-# END calculate_measures_after_5_days
+# END calculate_lookback_measures
 
 
 def _calculate_distributions_after_90_days(referrals_df: DataFrame,
@@ -361,16 +440,17 @@ def _calculate_distributions_after_90_days(referrals_df: DataFrame,
 
     # Limit the source data to the given clinic names and the referrals that reached
     # 90 days of age in the given period.
-    idx = (referrals_df['Clinic'].isin(clinics_df['Clinic'])
-           & (referrals_df['Reporting Date 90 Day Lag'] >= start_date)
-           & (referrals_df['Reporting Date 90 Day Lag'] < end_date))
-    source_df = referrals_df.loc[idx].copy()
+    source_df = _get_window_referrals(referrals_df,
+                                      clinics_df,
+                                      'Reporting Date 90 Day Lag',
+                                      start_date,
+                                      end_date).copy()
 
     # Categorize the days to seen for referrals after 90 days
     r.calculate_age_category(source_df, 'Age Category to Seen', 'Days until Patient Seen or Check In')
 
     # Create a data set of referral counts by priority and age category to seen
-    distribution_df = source_df.groupby(['Clinic', 'Referral Priority', 'Age Category to Seen']) \
+    distribution_df = source_df.groupby(['Clinic', 'Referral Priority', 'Age Category to Seen'], observed=True) \
         .agg({'Referral Aged Yn': 'sum'}) \
         .rename(columns={'Referral Aged Yn': 'Referrals Aged'}) \
         .reset_index()
@@ -379,508 +459,52 @@ def _calculate_distributions_after_90_days(referrals_df: DataFrame,
 # END calculate_distributions_after_90_days
 
 
-def _calculate_measures_after_90_days(referrals_df: DataFrame,
-                                      clinics_df: DataFrame,
-                                      start_date: datetime,
-                                      end_date: datetime,
-                                      prefix: str = '') -> DataFrame:
-    """
-    Calculates measures of referral processing using a 90 day lookback.
-    :param referrals_df: a dataframe of referrals
-    :param clinics_df: a dataframe of clinic names to calculate measures for
-    :param start_date: the first date in the period
-    :param end_date: the day after the last date in the period
-    :param prefix: prefix to add to the measure name
-    :return: a dataframe of clinics and calculated measures,
-             a dataframe of referral counts by priority and age category
-    """
-
-    # Limit the source data to the given clinic names and the referrals that reached
-    # 90 days of age in the given period.
-    idx = (referrals_df['Clinic'].isin(clinics_df['Clinic'])
-           & (referrals_df['Reporting Date 90 Day Lag'] >= start_date)
-           & (referrals_df['Reporting Date 90 Day Lag'] < end_date))
-    source_df = referrals_df.loc[idx].copy()
-
-    # Create a dataframe of aggregations by clinic starting with independent measures
-    # MEASURE: Count of referrals sent after 90 days
-    # MEASURE: Count of referrals kept after 90 days
-    by_clinic_df = source_df \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count', 'Referral Aged Yn': 'sum'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Sent', 'Referral Aged Yn': prefix + 'Referrals Aged'})
-
-    # MEASURE: Count of referrals rejected after 90 days
-    idx = ((source_df['Referral Status'] == 'Rejected')
-           & (source_df['Referral Sent Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Rejected After 90d'})
-
-    # Merge count of referrals rejected into count of all referrals by clinic 
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals canceled after 90 days
-    idx = ((source_df['Referral Status'] == 'Cancelled')
-           & (source_df['Referral Sent Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Canceled After 90d'})
-
-    # Merge count of referrals canceled into count of all referrals by clinic 
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals closed without being seen after 90 days
-    idx = (~(source_df['Referral Status'] == 'Cancelled')
-           & ~(source_df['Referral Status'] == 'Rejected')
-           & (source_df['Referral Aged Yn'] == 0)
-           & (source_df['Referral Sent Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Closed WBS After 90d'})
-
-    # Merge count of referrals closed without being seen into count of all referrals by clinic 
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals seen after 90 days
-    idx = ((source_df['Referral Seen or Checked In Yn'] == 1)
-           & (source_df['Referral Aged Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Seen After 90d'})
-
-    # Merge count of referrals seen into count of all referrals by clinic 
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals scheduled after 90 days
-    idx = (((source_df['Patient Scheduled Yn'] + source_df['Appointment Linked Yn']) > 0)
-           & (source_df['Referral Aged Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Scheduled After 90d'})
-
-    # Merge count of referrals scheduled into count of all referrals by clinic 
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals scheduled and waiting to be seen after 90 days
-    idx = ((source_df['Referral Seen or Checked In Yn'] == 0)
-           & ((source_df['Patient Scheduled Yn'] + source_df['Appointment Linked Yn']) > 0)
-           & (source_df['Referral Aged Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Waiting After 90d'})
-
-    # Merge count of referrals waiting into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals not scheduled after 90 days
-    idx = (((source_df['Patient Scheduled Yn'] + source_df['Appointment Linked Yn']) == 0)
-           & (source_df['Referral Aged Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Not Scheduled After 90d'})
-
-    # Merge count of referrals not scheduled into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals accepted after 90 days
-    idx = ((source_df['Referral Accepted Yn'] > 0)
-           & (source_df['Referral Aged Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Accepted After 90d'})
-
-    # Merge count of referrals accepted into count of all referrals by clinic 
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals completed after 90 days
-    idx = ((source_df['Referral Completed Yn'] == 1)
-           & (source_df['Referral Aged Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Completed After 90d'})
-
-    # Merge count of referrals completed into count of all referrals by clinic 
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals seen and completed after 90 days
-    idx = ((source_df['Referral Completed Yn'] == 1)
-           & (source_df['Referral Seen or Checked In Yn'] == 1)
-           & (source_df['Referral Aged Yn'] == 1))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Referrals Completed and Seen After 90d'})
-
-    # Merge count of referrals seen and completed into count of all referrals by clinic 
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Median days to see referral
-    # MEASURE: Median days to schedule referral
-    # MEASURE: Median days to accept referral
-    # MEASURE: Median days to complete referral
-    measure_df = source_df.loc[(source_df['Referral Aged Yn'] == 1)] \
-        .groupby('Clinic') \
-        .agg({'Days until Patient Seen or Check In': 'median',
-              'Days until Referral or Patient Scheduled': 'median',
-              'Days until Referral Completed': 'median',
-              'Days until Referral Accepted': 'median'}) \
-        .rename(columns={'Days until Patient Seen or Check In': prefix + 'Median Days until Seen',
-                         'Days until Referral or Patient Scheduled': prefix + 'Median Days until Scheduled',
-                         'Days until Referral Completed': prefix + 'Median Days until Completed',
-                         'Days until Referral Accepted': prefix + 'Median Days to Accept'})
-
-    # Merge ages into count of all referrals by clinic 
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # Create a single row dataframe to hold measures across all clinics
-    # using the placeholder clinic name *ALL*
-    global_df = clinics_df.loc[(clinics_df['Clinic'] == '*ALL*')].copy()
-
-    # MEASURE: Median days to see all referrals
-    # Calculate the global median age to see all referrals using *ALL* clinic
-    measure_df = source_df.loc[(source_df['Referral Aged Yn'] == 1), ['Days until Patient Seen or Check In']] \
-        .median().to_frame().transpose().rename(
-        columns={'Days until Patient Seen or Check In': prefix + 'Median Days until Seen'})
-    measure_df['Clinic'] = '*ALL*'
-
-    # Merge median age to see into a single view of global ages 
-    global_df = pd.merge(global_df, measure_df, how='inner', on=['Clinic'])
-
-    # MEASURE: Median days to schedule all referrals
-    measure_df = source_df.loc[(source_df['Referral Aged Yn'] == 1), ['Days until Referral or Patient Scheduled']] \
-        .median().to_frame().transpose().rename(
-        columns={'Days until Referral or Patient Scheduled': prefix + 'Median Days until Scheduled'})
-    measure_df['Clinic'] = '*ALL*'
-
-    # Merge median age to schedule into a single view of global ages 
-    global_df = pd.merge(global_df, measure_df, how='inner', on=['Clinic'])
-
-    # Merge global measures into a seamless table of measures by clinic using the *ALL*
-    # placeholder clinic name
-    by_clinic_df = pd.merge(by_clinic_df, global_df, how='outer',
-                            on=['Clinic', prefix + 'Median Days until Scheduled', prefix + 'Median Days until Seen'])
-
-    # Clean up missing data from clinics without counts 
-    by_clinic_df = by_clinic_df.fillna(0)
-
-    # Calculate the dependent measures using the table of measures by clinic
-    # MEASURE: Percent of referrals seen after 90 days
-    by_clinic_df[prefix + 'Pct Referrals Seen After 90d'] = (
-        ((by_clinic_df[prefix + 'Referrals Seen After 90d']
-          .div(by_clinic_df[prefix + 'Referrals Aged'])
-          .fillna(0) * 100.0) + 0.5)
-        .astype(int))
-
-    # MEASURE: Percent of referrals scheduled after 90 days
-    # Calculate rate of referrals scheduled by clinic
-    by_clinic_df[prefix + 'Pct Referrals Scheduled After 90d'] = (
-        ((by_clinic_df[prefix + 'Referrals Scheduled After 90d']
-          .div(by_clinic_df[prefix + 'Referrals Aged'])
-          .fillna(0) * 100.0) + 0.5)
-        .astype(int))
-
-    return by_clinic_df
-# END calculate_measures_after_90_days
-
-
-def _calculate_measures_after_30_days(referrals_df: DataFrame,
-                                      clinics_df: DataFrame,
-                                      start_date: datetime,
-                                      end_date: datetime,
-                                      prefix: str = '') -> DataFrame:
-    """
-    Calculates measures of referral processing using a 30 day lookback.
-    :param referrals_df: a dataframe of referrals
-    :param clinics_df: a dataframe of clinic names to calculate measures for
-    :param start_date: the first date in the period
-    :param end_date: the day after the last date in the period
-    :param prefix: prefix to add to the measure name
-    :return: a dataframe of clinics and calculated measures
-    """
-
-    # Limit the source data to the given clinic names and the referrals that reached
-    # 30 days of age in the given period.
-    idx = (referrals_df['Clinic'].isin(clinics_df['Clinic'])
-           & (referrals_df['Reporting Date 30 Day Lag'] >= start_date)
-           & (referrals_df['Reporting Date 30 Day Lag'] < end_date))
-    source_df = referrals_df.loc[idx].copy()
-
-    # Create a dataframe of aggregations by clinic starting with independent measures
-    # MEASURE: Count of routine referrals sent after 30 days 
-    # MEASURE: Count of routine referrals kept after 30 days 
-    by_clinic_df = source_df.loc[source_df['Referral Priority'] == 'Routine'] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count', 'Referral Aged Yn': 'sum'}) \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Sent',
-                         'Referral Aged Yn': prefix + 'Routine Referrals Aged'})
-
-    # MEASURE: Count of referrals rejected after 30 days
-    idx = ((source_df['Referral Status'] == 'Rejected')
-           & (source_df['Referral Sent Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Routine'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Rejected After 30d'})
-
-    # Merge count of referrals rejected into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals canceled after 30 days
-    idx = ((source_df['Referral Status'] == 'Cancelled')
-           & (source_df['Referral Sent Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Routine'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Canceled After 30d'})
-
-    # Merge count of referrals canceled into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals closed without being seen after 30 days
-    idx = (~(source_df['Referral Status'] == 'Cancelled')
-           & ~(source_df['Referral Status'] == 'Rejected')
-           & (source_df['Referral Aged Yn'] == 0)
-           & (source_df['Referral Sent Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Routine'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Closed WBS After 30d'})
-
-    # Merge count of referrals closed without being seen into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals seen after 30 days
-    idx = ((source_df['Referral Seen or Checked In Yn'] == 1)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Routine'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Seen After 30d'})
-
-    # Merge count of referrals seen into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals scheduled after 30 days
-    idx = (((source_df['Patient Scheduled Yn'] + source_df['Appointment Linked Yn']) > 0)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Routine'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Scheduled After 30d'})
-
-    # Merge count of referrals scheduled into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals scheduled and waiting to be seen after 30 days
-    idx = ((source_df['Referral Seen or Checked In Yn'] == 0)
-           & ((source_df['Patient Scheduled Yn'] + source_df['Appointment Linked Yn']) > 0)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Routine'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Waiting After 30d'})
-
-    # Merge count of referrals waiting into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of referrals not scheduled after 30 days
-    idx = (((source_df['Patient Scheduled Yn'] + source_df['Appointment Linked Yn']) == 0)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Routine'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Not Scheduled After 30d'})
-
-    # Merge count of referrals not scheduled into count of all referrals by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # MEASURE: Count of routine referrals seen within 30 days by clinic
-    idx = ((source_df['Days until Patient Seen or Check In'] <= 30.0)
-           & (source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Routine'))
-    measure_df = source_df.loc[idx] \
-        .groupby('Clinic') \
-        .agg({'Referral ID': 'count'}) \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Seen in 30d'})
-
-    # Merge count of referrals seen by 30 days into dataframe by clinic
-    by_clinic_df = pd.merge(by_clinic_df, measure_df, how='left', on=['Clinic'])
-
-    # Create a single row dataframe to hold global ages across all referrals 
-    # using the *ALL* clinic name 
-    global_df = clinics_df.loc[(clinics_df['Clinic'] == '*ALL*')].copy()
-
-    # MEASURE: Count of routine referrals seen within 30 days across all clinics
-    measure_df = source_df.loc[idx, ['Referral ID']] \
-        .count().to_frame().transpose() \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Seen in 30d'})
-    measure_df['Clinic'] = '*ALL*'
-
-    # Merge count of referrals seen within 30 days into dataframe of global measures
-    global_df = pd.merge(global_df, measure_df, how='inner', on=['Clinic'])
-
-    # MEASURE: Count of routine referrals kept after 30 days across all clinics
-    idx = ((source_df['Referral Aged Yn'] == 1)
-           & (source_df['Referral Priority'] == 'Routine'))
-    measure_df = source_df.loc[idx, ['Referral ID']] \
-        .count().to_frame().transpose() \
-        .rename(columns={'Referral ID': prefix + 'Routine Referrals Aged'})
-    measure_df['Clinic'] = '*ALL*'
-
-    # Merge count of referrals kept after 30 days into dataframe of global measures
-    global_df = pd.merge(global_df, measure_df, how='inner', on=['Clinic'])
-
-    # Merge global measures with measures by clinic into one seamless table using the *ALL* clinic
-    by_clinic_df = pd.merge(by_clinic_df, global_df, how='outer',
-                            on=['Clinic', prefix + 'Routine Referrals Aged', prefix + 'Routine Referrals Seen in 30d'])
-
-    # Clean up missing data from clinics by replacing with zero
-    by_clinic_df = by_clinic_df.fillna(0)
-
-    # Calculate dependent measures using from table of measures by clinic
-    # MEASURE: Percent of referrals seen in 30 days by clinic and overall
-    by_clinic_df[prefix + 'Pct Routine Referrals Seen in 30d'] = (
-        by_clinic_df[prefix + 'Routine Referrals Seen in 30d']
-        .div(by_clinic_df[prefix + 'Routine Referrals Aged']) * 100.0)
-
-    return by_clinic_df
-# END calculate_measures_after_30_days
-
-
 def _calculate_process_measures_for_month(referral_df: DataFrame,
-                                          report_month: datetime) -> (DataFrame, DataFrame):
+                                          report_month: datetime,
+                                          fact_cubes: dict[str, DailyFactCube] = None) -> (DataFrame, DataFrame):
     """
     Returns the wait time data for one reporting month.  A reporting month includes
     measure data that looks back the appropriate amount of time for each measure.
     :param referral_df: a dataframe of referrals
     :param report_month: the first day of the month to return measures for @(00:00:00)
+    :param fact_cubes: the daily fact cubes of the referrals by lookback name, created when not given
     :return: a dataframe of process measures for the month,
              a dataframe of referral distributions by days to seen
     """
 
     next_month = report_month + relativedelta(months=1)
-    moving_28_day_start = next_month + relativedelta(days=-28)
-    moving_91_day_start = next_month + relativedelta(days=-91)
-    moving_182_day_start = next_month + relativedelta(days=-182)
-    moving_364_day_start = next_month + relativedelta(days=-364)
 
     # Create master list of clinics to calculate measures for, and add a placeholder clinic name for measures
     # across all clinics
-    process_measures_df = pd.DataFrame({'Clinic': np.sort(referral_df['Clinic'].unique())})
-    process_measures_df = (
-        pd.concat([pd.DataFrame({'Clinic': '*ALL*'}, index=[0]), process_measures_df]).reset_index(drop=True))
-
-    # Calculate measures of referral processing that use different lookback periods of time
-    after_5d_df = _calculate_measures_after_5_days(referral_df, process_measures_df, report_month, next_month)
-    after_5d_m28_df = _calculate_measures_after_5_days(referral_df,
-                                                       process_measures_df,
-                                                       moving_28_day_start,
-                                                       next_month,
-                                                       'MOV28 ')
-    after_5d_m91_df = _calculate_measures_after_5_days(referral_df,
-                                                       process_measures_df,
-                                                       moving_91_day_start,
-                                                       next_month,
-                                                       'MOV91 ')
-    after_5d_m182_df = _calculate_measures_after_5_days(referral_df,
-                                                        process_measures_df,
-                                                        moving_182_day_start,
-                                                        next_month,
-                                                        'MOV182 ')
-    after_5d_m364_df = _calculate_measures_after_5_days(referral_df,
-                                                        process_measures_df,
-                                                        moving_364_day_start,
-                                                        next_month,
-                                                        'MOV364 ')
-    after_30d_df = _calculate_measures_after_30_days(referral_df, process_measures_df, report_month, next_month)
-    after_30d_m28_df = _calculate_measures_after_30_days(referral_df,
-                                                         process_measures_df,
-                                                         moving_28_day_start,
+    clinics_df = pd.DataFrame({'Clinic': np.sort(referral_df['Clinic'].unique())})
+    clinics_df = pd.concat([pd.DataFrame({'Clinic': '*ALL*'}, index=[0]), clinics_df]).reset_index(drop=True)
+    process_measures_df = clinics_df
+
+    if fact_cubes is None:
+        with timed('process-time/fact-cubes'):
+            fact_cubes = _measure_plan.create_fact_cubes(referral_df, clinics_df.loc[1:, 'Clinic'])
+
+    # Calculate measures of referral processing that use different lookback periods of time over each
+    # reporting window, and create one data set of referral performance measures by clinic
+    for name, lookback in _LOOKBACK_MEASURES.items():
+        for prefix, window_days in _REPORTING_WINDOWS.items():
+            start_date = report_month if window_days is None else next_month + relativedelta(days=-window_days)
+            with timed(f"process-time/{name}/{prefix.strip() or 'month'}"):
+                window_df = _calculate_lookback_measures(clinics_df,
+                                                         fact_cubes[name],
+                                                         lookback,
+                                                         start_date,
                                                          next_month,
-                                                         'MOV28 ')
-    after_30d_m91_df = _calculate_measures_after_30_days(referral_df,
-                                                         process_measures_df,
-                                                         moving_91_day_start,
-                                                         next_month,
-                                                         'MOV91 ')
-    after_30d_m182_df = _calculate_measures_after_30_days(referral_df,
-                                                          process_measures_df,
-                                                          moving_182_day_start,
-                                                          next_month,
-                                                          'MOV182 ')
-    after_30d_m364_df = _calculate_measures_after_30_days(referral_df,
-                                                          process_measures_df,
-                                                          moving_364_day_start,
-                                                          next_month,
-                                                          'MOV364 ')
-    after_90d_df = (
-        _calculate_measures_after_90_days(referral_df, process_measures_df, report_month, next_month))
-    after_90d_m28_df = _calculate_measures_after_90_days(referral_df,
-                                                         process_measures_df,
-                                                         moving_28_day_start,
-                                                         next_month,
-                                                         'MOV28 ')
-    after_90d_m91_df = _calculate_measures_after_90_days(referral_df,
-                                                         process_measures_df,
-                                                         moving_91_day_start,
-                                                         next_month,
-                                                         'MOV91 ')
-    after_90d_m182_df = _calculate_measures_after_90_days(referral_df,
-                                                          process_measures_df,
-                                                          moving_182_day_start,
-                                                          next_month,
-                                                          'MOV182 ')
-    after_90d_m364_df = _calculate_measures_after_90_days(referral_df,
-                                                          process_measures_df,
-                                                          moving_364_day_start,
-                                                          next_month,
-                                                          'MOV364 ')
-    after_90d_distribution_df = (
-        _calculate_distributions_after_90_days(referral_df, process_measures_df, report_month, next_month))
-
-    # Create one data set of referral performance measures by clinic
-    process_measures_df = pd.merge(process_measures_df, after_5d_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_5d_m28_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_5d_m91_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_5d_m182_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_5d_m364_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_30d_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_30d_m28_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_30d_m91_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_30d_m182_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_30d_m364_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_90d_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_90d_m28_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_90d_m91_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_90d_m182_df, how='left', on=['Clinic'])
-    process_measures_df = pd.merge(process_measures_df, after_90d_m364_df, how='left', on=['Clinic'])
+                                                         prefix)
+            process_measures_df = pd.merge(process_measures_df, window_df, how='left', on=['Clinic'])
+
+    with timed('process-time/90d/distribution'):
+        after_90d_distribution_df = (
+            _calculate_distributions_after_90_days(referral_df, clinics_df, report_month, next_month))
 
     # Clean up missing data from clinics by replacing with zero 
     process_measures_df = process_measures_df.fillna(0)
 
-    # Tag the calculated ages to schedule with a category name 
-    r.calculate_age_category(process_measures_df, 'Age Category to Scheduled', 'Median Days until Scheduled')
-
-    # Tag the calculated ages to seen with a category name 
-    r.calculate_age_category(process_measures_df, 'Age Category to Seen', 'Median Days until Seen')
-
     return process_measures_df, after_90d_distribution_df
 # End calculate_process_measures_for_month
 
@@ -905,12 +529,7 @@ def get_overall_count_measure(report_month: datetime, measure: str) -> int:
 
 def get_clinic_measure(report_month: datetime, clinic: str, measure: str) -> object:
     """Returns the value of the given measure for the given month for a given clinic regardless of datatype."""
-    df = clinic_measures[report_month]
-    view = df.loc[(df['Clinic'] == clinic)]
-    if view.empty:
-        return 0
-    else:
-        return view.at[min(view.index), measure]
+    return _read_measure_store([report_month], lambda store: store.get_measure(report_month, clinic, measure))
 # END get_clinic_measure
 
 
@@ -925,13 +544,9 @@ def get_clinic_rate_measure(report_month: datetime, clinic: str, measure: str, m
     :return: the measure value as a float, or 0.0 if measure is not numeric
     """
     offset_month = report_month + relativedelta(months=month_offset)
-    df = clinic_measures[offset_month]
-    if measure in df.select_dtypes(include=['int64', 'int32', 'float64']).columns:
-        view = df.loc[(df['Clinic'] == clinic)]
-        if view.empty:
-            return 0.0
-        else:
-            return float(view.at[min(view.index), measure])
+    value = _read_measure_store([offset_month], lambda store: store.get_numeric_measure(offset_month, clinic, measure))
+    if value is not None:
+        return float(value)
 # END get_clinic_rate_measure
 
 
@@ -946,23 +561,41 @@ def get_clinic_count_measure(report_month: datetime, clinic: str, measure: str,
     :return: the measure value as an int, or 0 if measure is not numeric
     """
     offset_month = report_month + relativedelta(months=month_offset)
-    df = clinic_measures[offset_month]
-    if measure in df.select_dtypes(include=['int64', 'int32', 'float64']).columns:
-        view = df.loc[(df['Clinic'] == clinic)]
-        if view.empty:
-            return 0
-        else:
-            return int(view.at[min(view.index), measure])
+    value = _read_measure_store([offset_month], lambda store: store.get_numeric_measure(offset_month, clinic, measure))
+    if value is not None:
+        return int(value)
 # END get_clinic_count_measure
 
 
+def get_clinic_measures(report_month: datetime,
+                        clinic: str,
+                        measures: list[str],
+                        month_offsets: list[int] = None) -> DataFrame:
+    """
+    Returns the values of several measures for the given month and months offset from it in one fetch.
+    :param report_month: month being measured
+    :param clinic: name of clinic to return the measurements for
+    :param measures: names of the measures to return
+    :param month_offsets: numbers of months prior or after the month being measured, or None for only
+                          the month being measured
+    :return: a dataframe with a row per month offset and a column per measure, with zeros when the clinic
+             has no measurements
+    """
+    if month_offsets is None:
+        month_offsets = [0]
+    offset_months = [report_month + relativedelta(months=month_offset) for month_offset in month_offsets]
+    values = _read_measure_store(offset_months, lambda store: store.get_measures(offset_months, clinic, measures))
+    return pd.DataFrame(values, index=month_offsets, columns=measures)
+# END get_clinic_measures
+
+
 def get_clinics(report_month: datetime) -> list[str]:
     """
     Returns an array of clinic names from the referral measures data.
     :param report_month: month being measured
     :return: a list of unique clinic names
     """
-    df = clinic_measures[report_month]
+    df = _get_data()['clinic_measures'][report_month]
     return df.loc[(df['Clinic'] != '*ALL*'), 'Clinic'].unique().tolist()[::1]
 # END get_clinics
 
@@ -982,7 +615,7 @@ def get_clinic_distribution_count(report_month: datetime,
     :return: a count of referrals
     """
 
-    df = distribution_data[report_month]
+    df = _get_data()['distribution_data'][report_month]
     view = df.loc[(df['Clinic'] == clinic)
                   & (df['Referral Priority'] == priority)
                   & (df[measure] == category)]
@@ -993,108 +626,226 @@ def get_clinic_distribution_count(report_month: datetime,
 # END get_clinic_distribution_count
 
 
-def _up_or_down(x: float) -> str:
+def _up_or_down(values: Series) -> Series:
     """
-    Helper function to return a directional indicator based on the given
-    number being positive or negative.  Applied to Pandas series.
-    :param x: A numeric value
-    :return: A directional indicator string
+    Helper function to return directional indicators based on the given
+    numbers being positive or negative.  Missing numbers have no direction.
+    :param values: A series of numeric values
+    :return: A series of directional indicator strings
     """
-    if x < 0.0:
-        return "\u25BC"
-    elif x > 0.0:
-        return "\u25B2"
-    else:
-        return "-"
+    signs = np.sign(values.to_numpy(dtype=np.float64, na_value=np.nan))
+    return pd.Series(_DIRECTION_SYMBOLS[np.nan_to_num(signs).astype(np.int64) + 1], index=values.index)
 # END up_or_down
 
 
-def _calculate_dependent_variances(curr_month_df: DataFrame,
-                                   measures: list[dict]) -> DataFrame:
+def _calculate_dependent_variance(curr_month_df: DataFrame, measure: dict) -> None:
     """
-    Calculates variances that are dependent upon measure calculations or rolling sums.
+    Calculates a variance that is dependent upon measure calculations or rolling sums, and its direction.
     :param curr_month_df: process measure data for the current month
-    :param measures: a list of dictionary nodes that describe variances to calculate
-    :return: the new current month dataframe
+    :param measure: a dictionary node that describes the variance to calculate
     """
 
-    for measure in measures:
-        variances = curr_month_df[measure['value']] - curr_month_df[measure['standard']]
-
-        directions = variances.apply(_up_or_down)
+    variances = curr_month_df[measure['value']] - curr_month_df[measure['standard']]
 
-        curr_month_df[measure['measure']] = variances
-        curr_month_df['Dir ' + measure['measure']] = directions
+    directions = _up_or_down(variances)
 
-    # Return a copy to automagically clean up dataframe fragmentation caused by
-    # adding lots of individual columns
-    return curr_month_df.copy()
-# END calculate_dependent_variances
+    curr_month_df[measure['measure']] = variances
+    curr_month_df['Dir ' + measure['measure']] = directions
+# END calculate_dependent_variance
 
 
-def _add_targets(curr_month_df: DataFrame) -> DataFrame:
+def _calculate_variance_category(curr_month_df: DataFrame, category: dict) -> None:
     """
-    Adds columns with measure targets to the monthly process measurement data.
+    Tags each clinic with a performance or improvement category based on near term,
+    midterm, and long term variances against targets or against historical rates.
+    Each variance that is not negative adds its score to a three digit score.
     :param curr_month_df: process measure data for the current month
-    :return: the new current month dataframe
+    :param category: a dictionary node with the category, its included variance measures, and its rubric
     """
-    curr_month_df['Target Pct Routine Referrals Seen in 30d'] = 50.0
-    curr_month_df['Target Pct Urgent Referrals Seen in 5d'] = 50.0
-    return curr_month_df
-# END add_targets
 
+    scores = np.zeros(len(curr_month_df.index), dtype=np.int64)
+    for term, score in _VARIANCE_TERM_SCORES.items():
+        scores += np.where(curr_month_df[category[term]].to_numpy(dtype=np.float64, na_value=np.nan) >= 0.0,
+                           score, 0)
+    curr_month_df[category['category']] = pd.Series(scores, index=curr_month_df.index).map(category['rubric'])
+# END calculate_variance_category
 
-def _calculate_variance_categories(curr_month_df: DataFrame, categories: list[dict]) -> DataFrame:
+
+def _create_derived_measure_graph() -> DerivedMeasureGraph:
     """
-    Tags each clinic with performance and improvement categories based on near term,
-    midterm, and long term variances against targets and against historical rates.
-    :param curr_month_df: process measure data for the current month
-    :param categories: list of categories and their included variance measures
-    :return: the new current month dataframe
+    Creates the dependency graph of the measures derived from the monthly process measures.  Age categories
+    are tagged on medians, targets are added, variances are calculated against rolling rates and targets,
+    and clinics are tagged with variance categories.
+    :return: the graph of derived measure calculations
     """
 
-    def calculate_score(x: float, score: int) -> int:
-        if x >= 0.0:
-            return score
-        else:
-            return 0
+    graph = DerivedMeasureGraph('process-time/derived')
 
-    for category in categories:
-        near_vars = curr_month_df[category['near-term']].apply(calculate_score, args=(1,))
-        mid_vars = curr_month_df[category['mid-term']].apply(calculate_score, args=(10,))
-        long_vars = curr_month_df[category['long-term']].apply(calculate_score, args=(100,))
-        scores = near_vars + mid_vars + long_vars
-        curr_month_df[category['category']] = scores.map(category['rubric'])
+    # Tag the calculated median ages with a category name
+    for age_category, median in _AGE_CATEGORY_MEASURES.items():
+        graph.add_node(age_category, [median], [age_category],
+                       lambda df, age_category=age_category, median=median:
+                       r.calculate_age_category(df, age_category, median))
 
-    return curr_month_df
-# END calculate_variance_categories
+    # Add columns with measure targets to the monthly process measurement data
+    for target in _MEASURE_TARGETS:
+        graph.add_node(target, [], [target],
+                       lambda df, target=target: df.__setitem__(target, _MEASURE_TARGETS[target]))
 
+    for measure in _DEPENDENT_VARIANCES:
+        graph.add_node(measure['measure'],
+                       [measure['value'], measure['standard']],
+                       [measure['measure'], 'Dir ' + measure['measure']],
+                       lambda df, measure=measure: _calculate_dependent_variance(df, measure))
 
-def _calculate_process_time_measures() -> None:
-    first_month = datetime.combine(_AS_OF_DATE.replace(day=1).date(), datetime.min.time()) + relativedelta(months=-12)
+    for category in _VARIANCE_CATEGORIES:
+        graph.add_node(category['category'],
+                       [category['near-term'], category['mid-term'], category['long-term']],
+                       [category['category']],
+                       lambda df, category=category: _calculate_variance_category(df, category))
 
-    for iter_month in range(12):
-        curr_month = first_month + relativedelta(months=iter_month)
-        print('Calculating clinic process measures for ' + curr_month.strftime('%Y-%m-%d'))
+    return graph
+# END create_derived_measure_graph
 
-        # Calculate measure values for this month
-        curr_month_clinic_df, curr_month_distributions_df = (
-            _calculate_process_measures_for_month(r.referral_df, curr_month))
-        curr_month_clinic_df = _add_targets(curr_month_clinic_df)
-        curr_month_clinic_df = _calculate_dependent_variances(curr_month_clinic_df, _DEPENDENT_VARIANCES)
-        curr_month_clinic_df = _calculate_variance_categories(curr_month_clinic_df, _VARIANCE_CATEGORIES)
 
-        # Keep the 12 months of data resident in memory for requests from Bokeh
-        clinic_measures[curr_month] = curr_month_clinic_df
-        distribution_data[curr_month] = curr_month_distributions_df
-# END _calculate_process_time_measures
+def get_snapshot_key() -> str:
+    """
+    Returns a key of the measure data that is served.  The key changes when a new model snapshot is loaded, and
+    when the source data, the as-of date, or the measure definitions change.
+    :return: a key of the measure data in the model snapshot of the caller
+    """
+    snapshot = sn.get_snapshot()
+    return f'{snapshot.version}-{snapshot.get_data("process-time")["_measure_cache"].key}'
+# END get_snapshot_key
 
 
-# MAIN
+def _get_fact_cubes(data: dict) -> dict:
+    """
+    Returns the daily fact cubes of the referrals in a model snapshot, creating them the first time they are needed.
+    The referrals are counted once by day so that every month and moving window reads from the same cubes.
+    :param data: the data of this module in the model snapshot
+    :return: the daily fact cubes of the referrals by lookback name
+    """
+    if data['_fact_cubes'] is None:
+        referral_df = data['_referral_df']
+        with timed('process-time/fact-cubes'):
+            data['_fact_cubes'] = _measure_plan.create_fact_cubes(referral_df,
+                                                                  np.sort(referral_df['Clinic'].unique()))
+    return data['_fact_cubes']
+# END get_fact_cubes
+
+
+def _calculate_process_time_measures(data: dict, report_month: datetime) -> (DataFrame, DataFrame):
+    """
+    Calculates the base process measures for one reporting month, before derived measures are added.
+    :param data: the data of this module in the model snapshot that the month is loaded into
+    :param report_month: the first day of the month to calculate measures for @(00:00:00)
+    :return: a dataframe of base process measures for the month,
+             a dataframe of referral distributions by days to seen
+    """
+    fact_cubes = _get_fact_cubes(data)
+
+    print('Calculating clinic process measures for ' + report_month.strftime('%Y-%m-%d'))
+
+    # Calculate measure values for this month
+    return _calculate_process_measures_for_month(data['_referral_df'], report_month, fact_cubes)
+# END calculate_process_time_measures
+
+
+def _load_process_time_measures(data: dict, report_month: datetime) -> (DataFrame, DataFrame):
+    """
+    Loads the process measures for one reporting month when the month is first requested.  Base measures are
+    read from the cache on disk, or calculated and cached if they are not cached for the current source data.
+    Derived measures are then calculated from the base measures with the current targets and rubrics.
+    :param data: the data of this module in the model snapshot that the month is loaded into
+    :param report_month: the first day of the month to load measures for @(00:00:00)
+    :return: a dataframe of process measures for the month,
+             a dataframe of referral distributions by days to seen
+    """
+    curr_month_clinic_df, curr_month_distributions_df = (
+        data['_measure_cache'].get(report_month.strftime('%Y-%m-%d'),
+                                   lambda: _calculate_process_time_measures(data, report_month)))
+
+    # Cached columns are read-only views of the cache file, so derived measures are added to a copy in memory
+    curr_month_clinic_df = _derived_measures.calculate(curr_month_clinic_df.copy())
+    return curr_month_clinic_df, curr_month_distributions_df
+# END load_process_time_measures
+
+
+def _get_data() -> dict:
+    """Returns the data of this module in the model snapshot of the caller."""
+    return sn.get_data('process-time')
+# END get_data
 
-print('Calculating clinic processing time measures...')
+
+def _read_measure_store(report_months: list[datetime], read_store: Callable[[MeasureStore], object]) -> object:
+    """
+    Returns the result of a read of the measure store with the given months calculated and resident in memory.
+    The months are made resident and read as one operation of the month cache, so a clinic selection calculated
+    in another thread cannot evict the months or resize the store during the read.
+    """
+    data = _get_data()
+    return data['_month_cache'].read(report_months, lambda: read_store(data['_measure_store']))
+# END read_measure_store
+
+
+def _load_snapshot_data() -> dict:
+    """
+    Returns the top-level variables of this module for a new model snapshot.  Calculated measures are kept on
+    disk until the source data, as-of date, or measure definitions change.  Months of process measurements are
+    calculated on first request and the least recently used are evicted.
+    """
+    print('Calculating clinic processing time measures...')
+
+    # The measure store has constant time lookups of the resident months, and the daily fact cubes of the
+    # referral data are created when the first month is calculated
+    measure_store = MeasureStore()
+    data = {'_referral_df': r.referral_df,
+            '_measure_cache': MeasureCache('process-time', [r.source_file], _AS_OF_DATE, _MEASURE_DEFINITION_VERSION),
+            '_measure_store': measure_store,
+            '_fact_cubes': None}
+    month_cache = MonthCache([last_month + relativedelta(months=-1 * iter_month)
+                              for iter_month in reversed(range(_HISTORY_MONTHS))],
+                             lambda report_month: _load_process_time_measures(data, report_month),
+                             _RESIDENT_MONTHS,
+                             evict_month=measure_store.remove_measures,
+                             add_month=lambda report_month, month_data: measure_store.add_measures(report_month,
+                                                                                                   month_data[0]))
+    data['_month_cache'] = month_cache
+    data['clinic_measures'] = month_cache.view(0)
+    data['distribution_data'] = month_cache.view(1)
+
+    # Months are calculated ahead of requests from Bokeh, and the latest months that stay resident are calculated
+    # when worker processes can be forked to calculate them in parallel.  The fact cubes are created before the
+    # workers are forked so that the workers share them instead of each creating them again.
+    if month_cache.can_fork_workers():
+        prefetch_months = month_cache.months[-month_cache.capacity:]
+        if not all(data['_measure_cache'].is_cached(report_month.strftime('%Y-%m-%d'))
+                   for report_month in prefetch_months):
+            _get_fact_cubes(data)
+        month_cache.prefetch(prefetch_months)
+    else:
+        month_cache.prefetch([last_month + relativedelta(months=month_offset)
+                              for month_offset in _PREFETCH_MONTH_OFFSETS])
+
+    print('Clinic processing time measures calculated')
+    return data
+# END load_snapshot_data
+
+
+def __getattr__(name: str) -> object:
+    """Returns the top-level variables of this module from the model snapshot of the caller."""
+    return sn.get_module_variable('process-time', __name__, name)
+# END getattr
+
+
+# MAIN
 
 last_month = datetime.combine(_AS_OF_DATE.replace(day=1).date(), datetime.min.time()) + relativedelta(months=-1)
-_calculate_process_time_measures()
 
-print('Clinic processing time measures calculated')
+# Measures derived from the base measures of each month, which are calculated when a month is loaded
+_derived_measures = _create_derived_measure_graph()
+
+# Initialize module with the process measures of the current model snapshot, which is replaced when the source
+# data changes
+sn.register_loader('process-time', [r.source_file], _load_snapshot_data)
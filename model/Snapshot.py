@@ -0,0 +1,226 @@
+"""
+Snapshot.py
+Provides the reference to the snapshot of model data that the model modules serve.  A snapshot holds the data that
+each model module loads from the source files, such as the master DataFrames and the monthly measure caches.
+Model modules register a loader for their data, and the loaders fill the first snapshot as the modules are
+imported.  When source files change, a new snapshot is built in the background with every loader and swapped in
+with one assignment, so reads of model data never wait on a lock.  Code that needs a consistent view across
+several reads, such as the callbacks of a Bokeh session, pins the snapshot that it started with.
+https://907sjl.github.io/
+
+Classes:
+    ModelSnapshot - The data of every model module loaded from one version of the source files
+
+Functions:
+    register_loader - Registers the loader of a model module and loads its data into the current snapshot
+    get_snapshot - Returns the snapshot pinned in the current context, or else the current snapshot
+    get_data - Returns the data of a model module in the snapshot returned by get_snapshot
+    get_module_variable - Returns a top-level variable of a model module from the snapshot returned by get_snapshot
+    pinned - Context manager that pins a snapshot for the code in its block
+    reload - Builds a new snapshot from the source files and makes it the current snapshot
+    reload_if_changed - Builds a new snapshot when source files changed and are no longer being written
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from threading import Lock
+from typing import Callable
+
+import os
+import time
+
+from model.Timing import timed
+
+
+# Seconds that a changed source file must go unmodified before it is loaded, so that partial extracts are not read
+_SETTLE_SECONDS = 10.0
+
+
+def _get_file_stat(source_file: str) -> tuple:
+    """Returns the size and modification time of a file, or None if the file does not exist."""
+    try:
+        stat = os.stat(source_file)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+# END get_file_stat
+
+
+class ModelSnapshot:
+    """
+    Class that holds the data of every model module loaded from one version of the source files.  The data of a
+    snapshot is not replaced after the snapshot is made current.  The modification times of the source files are
+    recorded before the files are read, so a file that changes while it is read is seen as changed.
+
+    Public Attributes:
+        version - The number of the snapshot in this process, starting at 1 for the snapshot loaded on import
+        loaded_time - The time that the snapshot was created
+        source_files - The paths of the source files that the data was loaded from
+
+    Public Methods:
+        add_source_files - Records the sizes and modification times of source files before they are read
+        add_data - Adds the data of a model module
+        get_data - Returns the data of a model module
+        get_changed_source_files - Returns the source files that changed since they were read
+    """
+
+    def __init__(self, version: int):
+        """
+        Initialize instances with no data.
+        :param version: the number of the snapshot in this process
+        """
+        self.version = version
+        self.loaded_time = datetime.now()
+        self.source_files = []
+        self._source_stats = {}
+        self._data = {}
+    # END __init__
+
+    def add_source_files(self, source_files: list[str]) -> None:
+        """Records the sizes and modification times of source files before they are read."""
+        for source_file in source_files:
+            if source_file not in self._source_stats:
+                self.source_files.append(source_file)
+                self._source_stats[source_file] = _get_file_stat(source_file)
+    # END add_source_files
+
+    def add_data(self, name: str, data: dict) -> None:
+        """Adds the data of a model module by the name the module registered its loader under."""
+        self._data[name] = data
+    # END add_data
+
+    def get_data(self, name: str) -> dict:
+        """Returns the data of a model module by the name the module registered its loader under."""
+        return self._data[name]
+    # END get_data
+
+    def get_changed_source_files(self) -> list[str]:
+        """Returns the source files that were changed, added, or removed since they were read."""
+        return [source_file for source_file in self.source_files
+                if _get_file_stat(source_file) != self._source_stats[source_file]]
+    # END get_changed_source_files
+# END CLASS ModelSnapshot
+
+
+# Loaders of the model modules by name with their source files, in the order the loaders must run
+_loaders = {}
+
+# The snapshot that is served, which is replaced and never changed in place by a reload
+_current_snapshot = ModelSnapshot(1)
+
+# The snapshot pinned by the code running in a context, which is None where no snapshot is pinned
+_pinned_snapshot = ContextVar('pinned_snapshot', default=None)
+
+# Lock held while a new snapshot is built, so that builds do not overlap
+_reload_lock = Lock()
+
+# Sizes and modification times of the changed source files that last failed to load, which are not loaded again
+_failed_source_stats = None
+
+
+def register_loader(name: str, source_files: list[str], loader: Callable[[], dict]) -> None:
+    """
+    Registers the loader of a model module and loads its data into the current snapshot.  Loaders of modules that
+    depend on the data of other modules must be registered after them, which importing the modules ensures.
+    :param name: the name of the data of the model module
+    :param source_files: the paths of the source files that the loader reads
+    :param loader: function that returns a dictionary of the data of the module, reading the data of other modules
+                   from the snapshot that is being loaded
+    """
+    _loaders[name] = (list(source_files), loader)
+    _current_snapshot.add_source_files(source_files)
+    _current_snapshot.add_data(name, loader())
+# END register_loader
+
+
+def get_snapshot() -> ModelSnapshot:
+    """Returns the snapshot pinned in the current context, or else the current snapshot."""
+    snapshot = _pinned_snapshot.get()
+    return _current_snapshot if snapshot is None else snapshot
+# END get_snapshot
+
+
+def get_data(name: str) -> dict:
+    """Returns the data of a model module in the snapshot pinned in the current context or the current snapshot."""
+    return get_snapshot().get_data(name)
+# END get_data
+
+
+def get_module_variable(name: str, module_name: str, variable: str) -> object:
+    """
+    Returns a top-level variable of a model module from the snapshot pinned in the current context or the current
+    snapshot.  Model modules call this from their module __getattr__ function to serve the variables they loaded.
+    :param name: the name that the model module registered its loader under
+    :param module_name: the name of the model module, for the error raised for unknown variables
+    :param variable: the name of the top-level variable
+    :return: the value of the variable in the snapshot
+    """
+    data = get_snapshot()._data.get(name, {})
+    if variable not in data:
+        raise AttributeError(f'module {module_name!r} has no attribute {variable!r}')
+    return data[variable]
+# END get_module_variable
+
+
+@contextmanager
+def pinned(snapshot: ModelSnapshot):
+    """
+    Context manager that pins a snapshot for the code in its block, including code in other modules that it calls.
+    :param snapshot: the snapshot to read model data from
+    """
+    token = _pinned_snapshot.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        _pinned_snapshot.reset(token)
+# END pinned
+
+
+def reload() -> ModelSnapshot:
+    """
+    Builds a new snapshot with every registered loader and makes it the current snapshot.  The current snapshot
+    is served while the new snapshot is built, and is kept if a loader raises an exception.
+    :return: the new current snapshot
+    """
+    global _current_snapshot
+    with _reload_lock:
+        snapshot = ModelSnapshot(_current_snapshot.version + 1)
+        with timed('snapshot/reload'), pinned(snapshot):
+            for name, (source_files, loader) in _loaders.items():
+                snapshot.add_source_files(source_files)
+                snapshot.add_data(name, loader())
+        _current_snapshot = snapshot
+    print(f'Model snapshot {snapshot.version} loaded')
+    return snapshot
+# END reload
+
+
+def reload_if_changed(settle_seconds: float = _SETTLE_SECONDS) -> bool:
+    """
+    Builds a new snapshot when source files of the current snapshot changed.  Files that are missing or that
+    were modified within the settle time are still being written, and are loaded by a later check.
+    Changed files that failed to load are not loaded again until they change again.
+    :param settle_seconds: seconds that a changed file must go unmodified before it is loaded
+    :return: True if a new snapshot was made current
+    """
+    global _failed_source_stats
+    changed_files = _current_snapshot.get_changed_source_files()
+    if len(changed_files) == 0:
+        return False
+    source_stats = {source_file: _get_file_stat(source_file) for source_file in changed_files}
+    for stat in source_stats.values():
+        if stat is None or time.time() - stat[1] / 1e9 < settle_seconds:
+            return False
+    if source_stats == _failed_source_stats:
+        return False
+
+    print('Source files changed: ' + ', '.join(changed_files))
+    try:
+        reload()
+    except Exception:
+        _failed_source_stats = source_stats
+        raise
+    _failed_source_stats = None
+    return True
+# END reload_if_changed
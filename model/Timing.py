@@ -0,0 +1,160 @@
+"""
+Timing.py
+Provides in-process timing instrumentation.  Durations of data loads, measure calculations, and app handlers are
+collected by name into histograms with fixed buckets so that the cost of each measure and page can be reviewed
+while the server runs.  Timings are kept per process.
+https://907sjl.github.io/
+
+Classes:
+    TimingHistogram - Counts of durations in fixed buckets with summary statistics
+
+Functions:
+    record_timing - Adds a duration to the histogram of a name
+    timed - Context manager that records the duration of a block of code
+    timed_function - Returns a function that records the duration of each call of another function
+    get_timing_stats - Returns the summary statistics and buckets of every histogram
+    reset_timings - Removes every histogram
+"""
+
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable
+
+import functools
+import time
+
+
+# Upper bounds in milliseconds of the histogram buckets, with a last bucket for longer durations
+_BUCKET_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+
+
+class TimingHistogram:
+    """
+    Class that counts durations in buckets with fixed upper bounds.  Percentiles are estimated from the bucket
+    counts as the upper bound of the bucket that holds the percentile.
+
+    Public Attributes:
+        count - The number of durations recorded
+        total_seconds - The sum of the durations recorded
+        min_seconds - The shortest duration recorded, or None
+        max_seconds - The longest duration recorded, or None
+
+    Public Methods:
+        record - Adds a duration to the histogram
+        to_dict - Returns the summary statistics and bucket counts in milliseconds
+    """
+
+    def __init__(self):
+        """Initialize instances with no durations."""
+        self.count = 0
+        self.total_seconds = 0.0
+        self.min_seconds = None
+        self.max_seconds = None
+        self._bucket_counts = [0] * (len(_BUCKET_BOUNDS_MS) + 1)
+    # END __init__
+
+    def record(self, seconds: float) -> None:
+        """Adds a duration to the histogram."""
+        milliseconds = seconds * 1000.0
+        bucket = next((position for position, bound in enumerate(_BUCKET_BOUNDS_MS) if milliseconds <= bound),
+                      len(_BUCKET_BOUNDS_MS))
+        self._bucket_counts[bucket] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        self.min_seconds = seconds if self.min_seconds is None else min(self.min_seconds, seconds)
+        self.max_seconds = seconds if self.max_seconds is None else max(self.max_seconds, seconds)
+    # END record
+
+    def _get_percentile_ms(self, percentile: float) -> float:
+        """Returns the upper bound of the bucket that holds a percentile, or the longest duration past the buckets."""
+        rank = percentile * self.count
+        cumulative_count = 0
+        for bound, bucket_count in zip(_BUCKET_BOUNDS_MS, self._bucket_counts):
+            cumulative_count += bucket_count
+            if cumulative_count >= rank:
+                return float(bound)
+        return self.max_seconds * 1000.0
+    # END get_percentile_ms
+
+    def to_dict(self) -> dict:
+        """Returns the summary statistics in milliseconds and the bucket counts by bucket upper bound."""
+        if self.count == 0:
+            return {'count': 0}
+        buckets = {f'<={bound}ms': bucket_count
+                   for bound, bucket_count in zip(_BUCKET_BOUNDS_MS, self._bucket_counts) if bucket_count > 0}
+        if self._bucket_counts[-1] > 0:
+            buckets[f'>{_BUCKET_BOUNDS_MS[-1]}ms'] = self._bucket_counts[-1]
+        return {'count': self.count,
+                'total-ms': round(self.total_seconds * 1000.0, 3),
+                'mean-ms': round(self.total_seconds * 1000.0 / self.count, 3),
+                'min-ms': round(self.min_seconds * 1000.0, 3),
+                'max-ms': round(self.max_seconds * 1000.0, 3),
+                'p50-ms': self._get_percentile_ms(0.5),
+                'p95-ms': self._get_percentile_ms(0.95),
+                'buckets': buckets}
+    # END to_dict
+# END CLASS TimingHistogram
+
+
+# Histograms of durations by name, which are shared by every thread of the process
+_histograms = {}
+_lock = Lock()
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """
+    Adds a duration to the histogram of a name, creating the histogram the first time the name is timed.
+    :param name: the name of the timed activity, such as process-time/5d/MOV28
+    :param seconds: the duration
+    """
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = TimingHistogram()
+        histogram.record(seconds)
+# END record_timing
+
+
+@contextmanager
+def timed(name: str):
+    """
+    Context manager that records the duration of a block of code, including blocks that raise an exception.
+    :param name: the name of the timed activity
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start_time)
+# END timed
+
+
+def timed_function(name: str, function: Callable) -> Callable:
+    """
+    Returns a function that records the duration of each call of another function.
+    :param name: the name of the timed activity
+    :param function: the function to time
+    :return: a function with the same signature that calls the timed function
+    """
+
+    @functools.wraps(function)
+    def call_timed(*args, **kwargs):
+        with timed(name):
+            return function(*args, **kwargs)
+
+    return call_timed
+# END timed_function
+
+
+def get_timing_stats() -> dict[str, dict]:
+    """Returns the summary statistics and bucket counts of every histogram by name, in name order."""
+    with _lock:
+        return {name: _histograms[name].to_dict() for name in sorted(_histograms)}
+# END get_timing_stats
+
+
+def reset_timings() -> None:
+    """Removes every histogram."""
+    with _lock:
+        _histograms.clear()
+# END reset_timings
@@ -5,7 +5,15 @@ referral management system.
 
 Modules:
     CRMUse.py - Provides measure data for the relative use of the Clinic Referral Management system vs. the schedule
+    DerivedMeasures.py - Provides a dependency graph of derived measures calculated from the base measures of a month
     DSMUse.py - Provides measure data of direct secure message use and conversions to referrals
+    FactCube.py - Provides cumulative daily counts and histograms of referral facts for moving window measures
+    MeasureCache.py - Provides a persistent cache of calculated measure data on disk keyed by the source data
+    MeasurePlan.py - Compiles declared lookback measures into shared daily fact cubes over the referral data
+    MeasureStore.py - Provides constant time lookups of calculated measure values by month, clinic, and measure
+    MonthCache.py - Provides monthly measure data calculated on first request and kept in a least recently used cache
     PendingTime.py - Provides measure data for pending referral wait times
     ProcessTime.py - Process aim performance and process timing for conversion of referrals into attended appointments
+    Snapshot.py - Provides the model data of the source files in snapshots that are swapped when the files change
+    Timing.py - Provides in-process timing histograms of data loads, measure calculations, and app handlers
 """
\ No newline at end of file
@@ -1,28 +1,50 @@
 """
 DSMs.py
 Module that sources and provides data for individual direct secure messages.  This module automatically
-loads top level variables with this data when imported.
+loads top level variables with this data when imported, and again into a new model snapshot when the source file
+changes.
 https://907sjl.github.io/
 
 Top-Level Variables:
     dsm_df - The DSM master DataFrame
+    id_dictionaries - The identifier text by code for identifier columns in the compact encoding
+    source_file - The path of the source data file
 
 Functions:
     load_dsm_data - Loads direct secure message data from the source
     create_master_data_frame - Calculates facts and adds convenience columns for downstream filtering
+    encode_master_data_frame - Converts text columns of the master DataFrame to the compact encoding
 """
 
 import pandas as pd
-from pandas import DataFrame
+from pandas import DataFrame, Index
 
 from datetime import datetime 
 
+from model.MeasureCache import MeasureCache
+import model.Snapshot as sn
+import model.source.Encoding as e
+
 # Effective as-of date for data
 _AS_OF_DATE = datetime(2023, 3, 1)
 
+# Version of the derived master data columns, incremented when a change invalidates the snapshot
+_MASTER_DATA_VERSION = 3
+
+# Compact in-memory encoding of text columns with categoricals for dimensions and integer codes for identifiers
+_COMPACT_ENCODING = True
+_CATEGORY_COLUMNS = ['Clinic', 'Sender Category', 'Sent From']
+_ID_COLUMNS = ['Message ID', 'Referral ID', 'Person ID', 'Referral Person ID']
+
+# Source data file in the working folder
+source_file = 'DirectSecureMessages.csv'
+
 
 def load_dsm_data() -> DataFrame:
-    """Loads direct secure message data from the source and returns a DataFrame with a row for each message."""
+    """
+    Loads direct secure message data from the source and returns a DataFrame with a row for each message.
+    Dates are returned as integer numbers of days since 1970-01-01.
+    """
 
     date_columns = ['Message Date',
                     'Date Referral Sent']
@@ -37,7 +59,9 @@ def load_dsm_data() -> DataFrame:
         'Date Referral Sent': 'object',
         'Person ID': 'string'}
 
-    return pd.read_csv('DirectSecureMessages.csv', dtype=column_types, parse_dates=date_columns)
+    df = pd.read_csv(source_file, dtype=column_types, parse_dates=date_columns)
+    e.encode_date_columns(df, date_columns)
+    return df
 # END load_dsm_data
 
 
@@ -50,7 +74,7 @@ def create_master_data_frame():
     df = load_dsm_data()
 
     # Create time shifted date values to simplify transformations downstream
-    df['Reporting Date 90 Day Lag'] = df['Message Date'] + pd.Timedelta(days=90)
+    df['Reporting Date 90 Day Lag'] = df['Message Date'] + 90
 
     # Create convenience column to find unique patients who also have referrals
     # to the same clinic that a DSM was sent to
@@ -62,11 +86,50 @@ def create_master_data_frame():
 # End create_master_data_frame
 
 
-# MAIN
+def encode_master_data_frame(df: DataFrame) -> dict[str, Index]:
+    """
+    Converts text columns of the master DataFrame to the compact encoding in place.
+    :param df: the master DSM DataFrame
+    :return: a dictionary of identifier text by code for each identifier column
+    """
 
-print('Loading DSM data...')
+    e.encode_category_columns(df, _CATEGORY_COLUMNS)
+    return e.encode_id_columns(df, _ID_COLUMNS)
+# END encode_master_data_frame
 
-# Initialize module with master dataframe of referral data 
-dsm_df = create_master_data_frame()
 
-print('DSM data loaded')
+def _load_master_data_frame() -> tuple[DataFrame, dict[str, Index]]:
+    """Returns the master DataFrame and identifier dictionaries in the configured encoding."""
+    df = create_master_data_frame()
+    if not _COMPACT_ENCODING:
+        return df, {}
+    return df, encode_master_data_frame(df)
+# END load_master_data_frame
+
+
+def _load_snapshot_data() -> dict:
+    """
+    Returns the top-level variables of this module for a new model snapshot.  The master dataframe is read from a
+    snapshot of the derived columns, which is written on the first load of a source file and read on later loads
+    without parsing the source file.
+    """
+    print('Loading DSM data...')
+    master_cache = MeasureCache('dsm-data', [source_file], _AS_OF_DATE, _MASTER_DATA_VERSION)
+    master_key = 'dsm-master-compact' if _COMPACT_ENCODING else 'dsm-master'
+    dsm_df, id_dictionaries = master_cache.get(master_key, _load_master_data_frame)
+    print('DSM data loaded')
+    return {'dsm_df': dsm_df, 'id_dictionaries': id_dictionaries}
+# END load_snapshot_data
+
+
+def __getattr__(name: str) -> object:
+    """Returns the top-level variables of this module from the model snapshot of the caller."""
+    return sn.get_module_variable('dsms', __name__, name)
+# END getattr
+
+
+# MAIN
+
+# Initialize module with the master dataframe of DSM data in the current model snapshot, which is replaced
+# when the source file changes
+sn.register_loader('dsms', [source_file], _load_snapshot_data)
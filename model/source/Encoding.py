@@ -0,0 +1,116 @@
+"""
+Encoding.py
+Module that provides a compact in-memory encoding of columns in the master DataFrames.  Columns with few
+distinct values are held as categoricals.  Identifier columns are held as integer codes with a dictionary of the
+identifier text for display.  Dates are held as 32-bit integer numbers of days since 1970-01-01.
+https://907sjl.github.io/
+
+Functions:
+    encode_category_columns - Converts low cardinality text columns to categoricals
+    encode_id_columns - Converts identifier columns to integer codes and returns the dictionaries of identifiers
+    decode_ids - Returns the identifier text for integer codes
+    to_epoch_day - Returns the number of days since 1970-01-01 for a date
+    encode_date_columns - Converts date columns to integer numbers of days since 1970-01-01
+    decode_dates - Returns the dates for integer numbers of days since 1970-01-01
+    days_between - Returns the number of days between two columns of day numbers
+"""
+
+import pandas as pd
+from pandas import DataFrame, Index, Series
+import numpy as np
+
+from datetime import datetime
+
+
+# The date of day number zero
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def encode_category_columns(df: DataFrame, columns: list[str]) -> None:
+    """
+    Converts low cardinality text columns to categoricals in place.  Categories are sorted so that grouping by
+    a categorical column returns groups in the same order as the text values.
+    :param df: a master DataFrame
+    :param columns: names of the columns to convert
+    """
+
+    for column in columns:
+        df[column] = df[column].astype('category')
+# END encode_category_columns
+
+
+def encode_id_columns(df: DataFrame, columns: list[str]) -> dict[str, Index]:
+    """
+    Converts identifier columns to integer codes in place.  Missing identifiers remain missing so that counts
+    of non-missing values and counts of unique values are unchanged.
+    :param df: a master DataFrame
+    :param columns: names of the columns to convert
+    :return: a dictionary of identifier text by code for each column
+    """
+
+    dictionaries = {}
+    for column in columns:
+        codes, dictionary = pd.factorize(df[column], sort=True)
+        df[column] = pd.arrays.IntegerArray(codes.astype(np.int32), mask=(codes < 0))
+        dictionaries[column] = pd.Index(dictionary)
+    return dictionaries
+# END encode_id_columns
+
+
+def decode_ids(codes: Series, dictionary: Index) -> Series:
+    """
+    Returns the identifier text for integer codes.
+    :param codes: a Series of identifier codes
+    :param dictionary: the dictionary of identifier text by code for the column
+    :return: a Series of identifier text with missing values where a code is missing
+    """
+
+    values = dictionary.take(codes.fillna(0).to_numpy(dtype=np.int64))
+    return pd.Series(values, index=codes.index, dtype='string').mask(codes.isna())
+# END decode_ids
+
+
+def to_epoch_day(date: datetime) -> int:
+    """Returns the number of days since 1970-01-01 for a date, truncated to the day."""
+    return int((np.datetime64(date, 'D') - _EPOCH).astype(np.int64))
+# END to_epoch_day
+
+
+def encode_date_columns(df: DataFrame, columns: list[str]) -> None:
+    """
+    Converts date columns to 32-bit integer numbers of days since 1970-01-01 in place.  Times of day are
+    truncated.  Missing dates remain missing so that tests for missing dates are unchanged.
+    :param df: a master DataFrame
+    :param columns: names of the date columns to convert
+    """
+
+    for column in columns:
+        dates = df[column].to_numpy(dtype='datetime64[ns]')
+        days = (dates.astype('datetime64[D]') - _EPOCH).astype(np.int64)
+        df[column] = pd.arrays.IntegerArray(np.where(np.isnat(dates), 0, days).astype(np.int32),
+                                            mask=np.isnat(dates))
+# END encode_date_columns
+
+
+def decode_dates(days: Series) -> Series:
+    """
+    Returns the dates for integer numbers of days since 1970-01-01.
+    :param days: a Series of day numbers
+    :return: a Series of dates at time 00:00:00 with missing values where a day number is missing
+    """
+
+    dates = _EPOCH + days.fillna(0).to_numpy(dtype=np.int64).astype('timedelta64[D]')
+    return pd.Series(dates.astype('datetime64[ns]'), index=days.index).mask(days.isna())
+# END decode_dates
+
+
+def days_between(end_days: Series, start_days: Series) -> Series:
+    """
+    Returns the number of days between two columns of day numbers using integer arithmetic.
+    :param end_days: a Series of day numbers at the end of each period
+    :param start_days: a Series of day numbers at the start of each period
+    :return: a Series of floating point day counts with NaN where either day number is missing
+    """
+
+    return (end_days - start_days).astype(np.float64)
+# END days_between
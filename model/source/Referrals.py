@@ -1,30 +1,69 @@
 """
 Referrals.py
 Module that sources and provides individual referral data.  This module automatically
-loads referral_df with this data when imported.
+loads referral_df with this data when imported, and again into a new model snapshot when the source file changes.
 https://907sjl.github.io/
 
 Top-Level Variables:
     referral_df - The referral master DataFrame
+    AGE_CATEGORY_BINS - The default bin edges and labels of age categories
+    id_dictionaries - The identifier text by code for identifier columns in the compact encoding
+    source_file - The path of the source data file
 
 Functions:
     load_referral_data - Loads referral data from the source
     create_master_data_frame - Calculates facts and adds convenience columns for downstream filtering
     calculate_age_category - Adds a calculated age category bin name to the master referral DataFrame
+    encode_master_data_frame - Converts text columns of the master DataFrame to the compact encoding
 """
 
 import pandas as pd
-from pandas import DataFrame
+from pandas import DataFrame, Index
+import numpy as np
 
 from datetime import datetime
 
+from model.MeasureCache import MeasureCache
+import model.Snapshot as sn
+import model.source.Encoding as e
+
 
 # Effective as-of date for data
 _AS_OF_DATE = datetime(2023, 3, 1)
 
+# Version of the derived master data columns, incremented when a change invalidates the snapshot
+_MASTER_DATA_VERSION = 3
+
+# Compact in-memory encoding of text columns with categoricals for dimensions and integer codes for identifiers
+_COMPACT_ENCODING = True
+_CATEGORY_COLUMNS = ['Source Location',
+                     'Provider Referred To',
+                     'Location Referred To',
+                     'Referral Priority',
+                     'Referral Status',
+                     'Clinic',
+                     'Last Referral Update By',
+                     'Assigned Personnel',
+                     'Organization Referred To',
+                     'Reason for Hold',
+                     'Referral Sub-Status']
+_ID_COLUMNS = ['Referral ID', 'Patient ID']
+
+# Source data file in the working folder
+source_file = 'referrals.csv'
+
+# Default age categories in days.  Each bin holds the ages greater than the edge before it and no greater than
+# its own edge.  The last bin holds the ages greater than the last edge.
+AGE_CATEGORY_BINS = {'edges': [7.0, 14.0, 30.0, 60.0, 90.0],
+                     'labels': ['7d', '14d', '30d', '60d', '90d', '>90d'],
+                     'unknown-label': '(none)'}
+
 
 def load_referral_data() -> DataFrame:
-    """Loads referral data from the source and returns a DataFrame with a row for each referral."""
+    """
+    Loads referral data from the source and returns a DataFrame with a row for each referral.  Dates are
+    returned as integer numbers of days since 1970-01-01.
+    """
 
     date_columns = ['Date Referral Sent',
                     'Date Referral Seen',
@@ -64,7 +103,9 @@ def load_referral_data() -> DataFrame:
         'Date Referral Completed': 'object',
         'Date Referral Scheduled': 'object'}
 
-    return pd.read_csv('referrals.csv', dtype=column_types, parse_dates=date_columns)
+    df = pd.read_csv(source_file, dtype=column_types, parse_dates=date_columns)
+    e.encode_date_columns(df, date_columns)
+    return df
 # END load_referral_data
 
 
@@ -77,10 +118,10 @@ def create_master_data_frame() -> DataFrame:
     df = load_referral_data()
 
     # Create time shifted date values to simplify transformations downstream
-    df['Reporting Date 30 Day Lag'] = df['Date Referral Sent'] + pd.Timedelta(days=30)
-    df['Reporting Date 90 Day Lag'] = df['Date Referral Sent'] + pd.Timedelta(days=90)
-    df['Reporting Date 5 Day Lag'] = df['Date Referral Sent'] + pd.Timedelta(days=5)
-    df['As Of Date'] = _AS_OF_DATE
+    df['Reporting Date 30 Day Lag'] = df['Date Referral Sent'] + 30
+    df['Reporting Date 90 Day Lag'] = df['Date Referral Sent'] + 90
+    df['Reporting Date 5 Day Lag'] = df['Date Referral Sent'] + 5
+    df['As Of Date'] = np.int32(e.to_epoch_day(_AS_OF_DATE))
 
     # Calculate processing time deltas for use in measures
     # Days until the referral tagged as seen or patient checked into clinic appointment
@@ -88,40 +129,40 @@ def create_master_data_frame() -> DataFrame:
     idx = df['Date Patient Seen or Checked In'].isna()
     df.loc[idx, 'Date Patient Seen or Checked In'] = df.loc[idx, 'Date Patient Checked In']
     df['Days until Patient Seen or Check In'] = (
-            (df['Date Patient Seen or Checked In'] - df['Date Referral Sent']) / pd.Timedelta(days=1))
+            e.days_between(df['Date Patient Seen or Checked In'], df['Date Referral Sent']))
     idx = df['Date Patient Seen or Checked In'].isna()
     df.loc[idx, 'Days until Patient Seen or Check In'] = (
-            (df.loc[idx, 'As Of Date'] - df.loc[idx, 'Date Referral Sent']) / pd.Timedelta(days=1))
+            e.days_between(df.loc[idx, 'As Of Date'], df.loc[idx, 'Date Referral Sent']))
 
     # Days until the referral accepted
     df['Days until Referral Accepted'] = (
-            (df['Date Accepted'] - df.loc[idx, 'Date Referral Sent']) / pd.Timedelta(days=1))
+            e.days_between(df['Date Accepted'], df.loc[idx, 'Date Referral Sent']))
     idx = df['Date Accepted'].isna()
     df.loc[idx, 'Days until Referral Accepted'] = (
-            (df.loc[idx, 'As Of Date'] - df.loc[idx, 'Date Referral Sent']) / pd.Timedelta(days=1))
+            e.days_between(df.loc[idx, 'As Of Date'], df.loc[idx, 'Date Referral Sent']))
 
     # Days until the referral completed
     df['Days until Referral Completed'] = (
-            (df['Date Referral Completed'] - df['Date Referral Sent']) / pd.Timedelta(days=1))
+            e.days_between(df['Date Referral Completed'], df['Date Referral Sent']))
     idx = df['Date Referral Completed'].isna()
     df.loc[idx, 'Days until Referral Completed'] = (
-            (df.loc[idx, 'As Of Date'] - df.loc[idx, 'Date Referral Sent']) / pd.Timedelta(days=1))
+            e.days_between(df.loc[idx, 'As Of Date'], df.loc[idx, 'Date Referral Sent']))
 
     # Days until the referral linked to an appointment or patient scheduled for a clinic appointment
     df['Date Referral or Patient Scheduled'] = df['Date Referral Scheduled']
     idx = df['Date Referral or Patient Scheduled'].isna()
     df.loc[idx, 'Date Referral or Patient Scheduled'] = df.loc[idx, 'Date Similar Appt Scheduled']
     df['Days until Referral or Patient Scheduled'] = (
-            (df['Date Referral or Patient Scheduled'] - df['Date Referral Sent']) / pd.Timedelta(days=1))
+            e.days_between(df['Date Referral or Patient Scheduled'], df['Date Referral Sent']))
     idx = df['Date Referral or Patient Scheduled'].isna()
     df.loc[idx, 'Days until Referral or Patient Scheduled'] = (
-            (df.loc[idx, 'As Of Date'] - df.loc[idx, 'Date Referral Sent']) / pd.Timedelta(days=1))
+            e.days_between(df.loc[idx, 'As Of Date'], df.loc[idx, 'Date Referral Sent']))
 
     # Days on hold
-    df['Days On Hold'] = (_AS_OF_DATE - df['Date Held']) / pd.Timedelta(days=1)
+    df['Days On Hold'] = e.days_between(df['As Of Date'], df['Date Held'])
 
     # Days pending reschedule
-    df['Days Pending Reschedule'] = (_AS_OF_DATE - df['Date Pending Reschedule']) / pd.Timedelta(days=1)
+    df['Days Pending Reschedule'] = e.days_between(df['As Of Date'], df['Date Pending Reschedule'])
 
     # Create a convenience column to aggregate referrals that are sent and not
     # rejected, canceled, or closed without being seen
@@ -170,46 +211,127 @@ def create_master_data_frame() -> DataFrame:
     df['Referral Seen in CRM Yn'] = 0
     df.loc[idx, 'Referral Seen in CRM Yn'] = 1
 
+    # Create a convenience column to aggregate referrals rejected after being sent
+    idx = ((df['Referral Status'] == 'Rejected') & (df['Referral Sent Yn'] == 1)).fillna(False)
+    df['Referral Rejected Yn'] = 0
+    df.loc[idx, 'Referral Rejected Yn'] = 1
+
+    # Create a convenience column to aggregate referrals canceled after being sent
+    idx = ((df['Referral Status'] == 'Cancelled') & (df['Referral Sent Yn'] == 1)).fillna(False)
+    df['Referral Canceled Yn'] = 0
+    df.loc[idx, 'Referral Canceled Yn'] = 1
+
+    # Create a convenience column to aggregate referrals sent and closed without being seen
+    idx = (~(df['Referral Status'] == 'Cancelled')
+           & ~(df['Referral Status'] == 'Rejected')
+           & (df['Referral Aged Yn'] == 0)
+           & (df['Referral Sent Yn'] == 1)).fillna(False)
+    df['Referral Closed WBS Yn'] = 0
+    df.loc[idx, 'Referral Closed WBS Yn'] = 1
+
+    # Create a convenience column to aggregate referrals with either a linked appointment or
+    # an appointment scheduled at the same clinic
+    idx = (df['Patient Scheduled Yn'] + df['Appointment Linked Yn']) > 0
+    df['Referral Scheduled Yn'] = 0
+    df.loc[idx, 'Referral Scheduled Yn'] = 1
+
+    # Create a convenience column to aggregate referrals scheduled and waiting to be seen
+    idx = (df['Referral Scheduled Yn'] == 1) & (df['Referral Seen or Checked In Yn'] == 0)
+    df['Referral Waiting Yn'] = 0
+    df.loc[idx, 'Referral Waiting Yn'] = 1
+
+    # Create a convenience column to aggregate referrals that are not scheduled
+    df['Referral Not Scheduled Yn'] = 1 - df['Referral Scheduled Yn']
+
+    # Create a convenience column to aggregate referrals that are completed and seen
+    idx = (df['Referral Completed Yn'] == 1) & (df['Referral Seen or Checked In Yn'] == 1)
+    df['Referral Completed and Seen Yn'] = 0
+    df.loc[idx, 'Referral Completed and Seen Yn'] = 1
+
+    # Create convenience columns to aggregate referrals seen within the urgent and routine process aims
+    idx = df['Days until Patient Seen or Check In'] <= 5.0
+    df['Referral Seen in 5d Yn'] = 0
+    df.loc[idx, 'Referral Seen in 5d Yn'] = 1
+
+    idx = df['Days until Patient Seen or Check In'] <= 30.0
+    df['Referral Seen in 30d Yn'] = 0
+    df.loc[idx, 'Referral Seen in 30d Yn'] = 1
+
     # df.to_csv(r'C:\Users\SJL\PycharmProjects\referrals-bokeh\referrals_df.csv')
     return df
 # END create_master_data_frame
 
 
-def calculate_age_category(source: DataFrame, category_column: str, age_column: str) -> None:
+def calculate_age_category(source: DataFrame,
+                           category_column: str,
+                           age_column: str,
+                           bins: dict = AGE_CATEGORY_BINS) -> None:
     """
     Add age category values to a column in a given dataframe using age values
-    in a given column.
+    in a given column.  The column is an ordered categorical of the bin labels.
     :param source: a dataframe with age values
     :param category_column: name of the column to receive the category values
     :param age_column: name of the column with the age values
+    :param bins: a dictionary of bin edges, bin labels, and the label for unknown ages
     """
 
-    # Initialize the new category name column with either the first category or
-    # the default for unknown
-    source[category_column] = source[age_column].apply(lambda x: '7d' if x <= 7.0 else '(none)')
+    # Find the bin of each age with a binary search of the bin edges, where an age equal to an edge
+    # falls in the bin that ends at the edge
+    ages = source[age_column].to_numpy(dtype=np.float64, na_value=np.nan)
+    codes = np.searchsorted(np.asarray(bins['edges'], dtype=np.float64), ages, side='left')
 
-    # Override the default unknown category with the other categories that apply
-    idx = ((source[age_column] > 7.0) & (source[age_column] <= 14.0))
-    source.loc[idx, [category_column]] = '14d'
+    # Ages that are unknown fall in the last category
+    codes[np.isnan(ages)] = len(bins['labels'])
+    source[category_column] = pd.Categorical.from_codes(codes,
+                                                        categories=bins['labels'] + [bins['unknown-label']],
+                                                        ordered=True)
+# END calculate_age_category
 
-    idx = ((source[age_column] > 14.0) & (source[age_column] <= 30.0))
-    source.loc[idx, [category_column]] = '30d'
 
-    idx = ((source[age_column] > 30.0) & (source[age_column] <= 60.0))
-    source.loc[idx, [category_column]] = '60d'
+def encode_master_data_frame(df: DataFrame) -> dict[str, Index]:
+    """
+    Converts text columns of the master DataFrame to the compact encoding in place.
+    :param df: the master referral DataFrame
+    :return: a dictionary of identifier text by code for each identifier column
+    """
 
-    idx = ((source[age_column] > 60.0) & (source[age_column] <= 90.0))
-    source.loc[idx, [category_column]] = '90d'
+    e.encode_category_columns(df, _CATEGORY_COLUMNS)
+    return e.encode_id_columns(df, _ID_COLUMNS)
+# END encode_master_data_frame
 
-    source.loc[(source[age_column] > 90.0), [category_column]] = '>90d'
-# END calculate_age_category
 
+def _load_master_data_frame() -> tuple[DataFrame, dict[str, Index]]:
+    """Returns the master DataFrame and identifier dictionaries in the configured encoding."""
+    df = create_master_data_frame()
+    if not _COMPACT_ENCODING:
+        return df, {}
+    return df, encode_master_data_frame(df)
+# END load_master_data_frame
+
+
+def _load_snapshot_data() -> dict:
+    """
+    Returns the top-level variables of this module for a new model snapshot.  The master dataframe is read from a
+    snapshot of the derived columns, which is written on the first load of a source file and read on later loads
+    without parsing the source file.
+    """
+    print('Loading referral data...')
+    master_cache = MeasureCache('referral-data', [source_file], _AS_OF_DATE, _MASTER_DATA_VERSION)
+    master_key = 'referral-master-compact' if _COMPACT_ENCODING else 'referral-master'
+    referral_df, id_dictionaries = master_cache.get(master_key, _load_master_data_frame)
+    print('Referral data loaded')
+    return {'referral_df': referral_df, 'id_dictionaries': id_dictionaries}
+# END load_snapshot_data
 
-# MAIN
 
-print('Loading referral data...')
+def __getattr__(name: str) -> object:
+    """Returns the top-level variables of this module from the model snapshot of the caller."""
+    return sn.get_module_variable('referrals', __name__, name)
+# END getattr
 
-# Initialize module with master dataframe of referral data 
-referral_df = create_master_data_frame()
 
-print('Referral data loaded')
+# MAIN
+
+# Initialize module with the master dataframe of referral data in the current model snapshot, which is replaced
+# when the source file changes
+sn.register_loader('referrals', [source_file], _load_snapshot_data)
@@ -4,5 +4,6 @@ A collection of modules that source and provide data for referrals and direct se
 
 Modules:
     DSMs.py - Sources and provides individual direct secure message data
+    Encoding.py - Provides a compact in-memory encoding of text columns in the master data
     Referrals.py - Sources and provides individual referral data
 """
\ No newline at end of file
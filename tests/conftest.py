@@ -0,0 +1,25 @@
+"""
+conftest.py
+Prepares the working folder for the tests.  The model modules load the source files from the working folder when
+they are imported, so small synthetic source files are written to a temporary folder that is made the working
+folder before any test module imports them.
+https://907sjl.github.io/
+"""
+
+import os
+import sys
+import tempfile
+
+# The application modules are imported from the root folder of the repository, as when the server is run
+_REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPOSITORY_FOLDER not in sys.path:
+    sys.path.insert(0, _REPOSITORY_FOLDER)
+
+from benchmarks.synthetic_data import write_source_files
+
+# Number of synthetic referrals in the source files that the tests load
+SOURCE_ROWS = 3000
+
+_source_folder = tempfile.mkdtemp(prefix='referrals-tests-')
+write_source_files(_source_folder, SOURCE_ROWS)
+os.chdir(_source_folder)
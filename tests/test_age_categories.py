@@ -0,0 +1,75 @@
+"""
+test_age_categories.py
+Tests that ages are binned into the ordered age categories with the edges of each bin included in the bin, and
+with unknown ages in the '(none)' category.
+https://907sjl.github.io/
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model.source.Referrals as r
+
+
+def _get_expected_label(age: float) -> str:
+    """Returns the age category of an age with the comparisons that the categories are defined by."""
+    if pd.isna(age):
+        return '(none)'
+    for edge, label in [(7.0, '7d'), (14.0, '14d'), (30.0, '30d'), (60.0, '60d'), (90.0, '90d')]:
+        if age <= edge:
+            return label
+    return '>90d'
+# END get_expected_label
+
+
+_AGES = [-3.0, 0.0, 6.5, 7.0, 7.01, 13.99, 14.0, 14.5, 30.0, 31.0, 59.9, 60.0, 89.0, 90.0, 90.0001, 365.0, np.nan]
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'Float64'])
+def test_ages_on_and_between_the_edges_fall_in_the_bins_that_end_at_the_edges(dtype: str):
+    ages_df = pd.DataFrame({'Days': pd.Series(_AGES, dtype=dtype)})
+    r.calculate_age_category(ages_df, 'Age Category', 'Days')
+    assert list(ages_df['Age Category']) == [_get_expected_label(age) for age in _AGES]
+# END test_ages_on_and_between_the_edges_fall_in_the_bins_that_end_at_the_edges
+
+
+def test_whole_day_ages_with_missing_values_are_binned():
+    ages = pd.Series([0, 7, 8, 14, 15, 30, 60, 61, 90, 91, None], dtype='Int32')
+    ages_df = pd.DataFrame({'Days': ages})
+    r.calculate_age_category(ages_df, 'Age Category', 'Days')
+    assert list(ages_df['Age Category']) == ['7d', '7d', '14d', '14d', '30d', '30d', '60d', '90d', '90d', '>90d',
+                                             '(none)']
+# END test_whole_day_ages_with_missing_values_are_binned
+
+
+def test_categories_are_ordered_with_unknown_ages_last():
+    ages_df = pd.DataFrame({'Days': [np.nan, 100.0, 3.0, 45.0]})
+    r.calculate_age_category(ages_df, 'Age Category', 'Days')
+
+    categories = ages_df['Age Category'].dtype
+    assert isinstance(categories, pd.CategoricalDtype) and categories.ordered
+    assert list(categories.categories) == ['7d', '14d', '30d', '60d', '90d', '>90d', '(none)']
+
+    # Grouped counts list every category in category order, including categories without ages
+    counts = ages_df.groupby('Age Category', observed=False)['Days'].size()
+    assert list(counts.index) == list(categories.categories)
+    assert list(counts) == [1, 0, 0, 1, 0, 1, 1]
+# END test_categories_are_ordered_with_unknown_ages_last
+
+
+def test_ages_are_binned_with_configured_bins():
+    bins = {'edges': [1.0, 5.0], 'labels': ['1d', '5d', 'later'], 'unknown-label': 'unknown'}
+    ages_df = pd.DataFrame({'Days': [0.5, 1.0, 3.0, 5.0, 6.0, np.nan]})
+    r.calculate_age_category(ages_df, 'Age Category', 'Days', bins)
+    assert list(ages_df['Age Category']) == ['1d', '1d', '5d', '5d', 'later', 'unknown']
+    assert list(ages_df['Age Category'].cat.categories) == ['1d', '5d', 'later', 'unknown']
+# END test_ages_are_binned_with_configured_bins
+
+
+def test_frame_without_ages_gets_an_empty_category_column():
+    ages_df = pd.DataFrame({'Days': pd.Series([], dtype='float64')})
+    r.calculate_age_category(ages_df, 'Age Category', 'Days')
+    assert len(ages_df['Age Category']) == 0
+    assert list(ages_df['Age Category'].cat.categories)[-1] == '(none)'
+# END test_frame_without_ages_gets_an_empty_category_column
@@ -0,0 +1,124 @@
+"""
+test_clinic_selection.py
+Tests of clinic selections that calculate render payloads in worker threads and apply them to a document.
+https://907sjl.github.io/
+"""
+
+import asyncio
+
+import pytest
+from bokeh.document import Document
+
+import app.common as v
+import app.ClinicProcessApp as cpa
+import model.ProcessTime as wt
+import model.Snapshot as sn
+
+
+class _CallbackDocument:
+    """Stands in for a Bokeh document by collecting next tick callbacks so that a test can run them in order."""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def add_next_tick_callback(self, callback) -> None:
+        self.callbacks.append(callback)
+# END CLASS CallbackDocument
+
+
+def _get_clinics(count: int) -> list[str]:
+    """Returns clinics with aged urgent and routine referrals in the last month, which every plot can render."""
+    return [clinic for clinic in wt.get_clinics(wt.last_month)
+            if wt.get_clinic_count_measure(wt.last_month, clinic, 'Urgent Referrals Aged') > 0
+            and wt.get_clinic_count_measure(wt.last_month, clinic, 'Routine Referrals Aged') > 0][:count]
+# END get_clinics
+
+
+def _get_plot_columns(process_app: cpa.ClinicProcessApp) -> dict:
+    """Returns the label data and the data source columns of the plots of an application as comparable text."""
+    columns = {'label_data': repr(process_app._label_data_source.label_data)}
+    for name, plot in process_app._get_payload_plots().items():
+        for attribute, value in vars(plot).items():
+            if attribute.endswith('_source') and hasattr(value, 'data'):
+                columns[name + '.' + attribute] = repr({key: list(data) for key, data in value.data.items()})
+    return columns
+# END get_plot_columns
+
+
+def test_clinic_payload_is_calculated_without_changing_the_plots():
+    clinic = _get_clinics(1)[0]
+    process_app = cpa.ClinicProcessApp(Document())
+    label_data = dict(process_app._label_data_source.label_data)
+
+    payload = process_app._calculate_clinic_payload(clinic, wt.last_month)
+
+    assert set(payload) == set(process_app._get_payload_plots())
+    assert process_app._urgent_volume_plot.plot_data_source is None
+    assert process_app._label_data_source.label_data == label_data
+    assert payload['label_data_source']['attributes']['label_data'] != label_data
+# END test_clinic_payload_is_calculated_without_changing_the_plots
+
+
+def test_payload_of_the_selected_clinic_updates_the_plots():
+    first_clinic, second_clinic = _get_clinics(2)
+    process_app = cpa.ClinicProcessApp(Document())
+    process_app.set_clinic(first_clinic)
+    process_app._load_clinic_data(wt.last_month)
+    process_app._add_plots()
+
+    process_app.set_clinic(second_clinic)
+    process_app._apply_clinic_payload(second_clinic,
+                                      process_app._get_clinic_payload(second_clinic, wt.last_month))
+
+    expected_app = cpa.ClinicProcessApp(Document())
+    expected_app.set_clinic(second_clinic)
+    expected_app._load_clinic_data(wt.last_month)
+    expected_app._label_data_source.update_plot_data()
+    assert _get_plot_columns(process_app) == _get_plot_columns(expected_app)
+# END test_payload_of_the_selected_clinic_updates_the_plots
+
+
+def test_payload_of_a_replaced_clinic_selection_is_dropped():
+    first_clinic, second_clinic, third_clinic = _get_clinics(3)
+    process_app = cpa.ClinicProcessApp(Document())
+    process_app.set_clinic(first_clinic)
+    process_app._load_clinic_data(wt.last_month)
+    process_app._add_plots()
+    process_app.set_clinic(third_clinic)
+    columns = _get_plot_columns(process_app)
+
+    # The second clinic was selected first, but its payload arrives after the third clinic was selected
+    process_app._apply_clinic_payload(second_clinic,
+                                      process_app._get_clinic_payload(second_clinic, wt.last_month))
+    assert _get_plot_columns(process_app) == columns
+# END test_payload_of_a_replaced_clinic_selection_is_dropped
+
+
+def test_calculation_error_is_raised_in_the_session():
+    doc = _CallbackDocument()
+    applied = []
+
+    def calculate() -> dict:
+        raise ValueError('clinic data failed')
+
+    v.offload_clinic_selection(doc, sn.get_snapshot(), calculate, applied.append)
+    asyncio.run(doc.callbacks[0]())
+
+    assert len(doc.callbacks) == 2
+    with pytest.raises(ValueError, match='clinic data failed'):
+        doc.callbacks[1]()
+    assert applied == []
+# END test_calculation_error_is_raised_in_the_session
+
+
+def test_calculation_result_is_applied_on_the_next_tick():
+    doc = _CallbackDocument()
+    applied = []
+
+    v.offload_clinic_selection(doc, sn.get_snapshot(), lambda: 'clinic data', applied.append)
+    asyncio.run(doc.callbacks[0]())
+    assert applied == []
+
+    doc.callbacks[1]()
+    assert applied == ['clinic data']
+# END test_calculation_result_is_applied_on_the_next_tick
@@ -0,0 +1,58 @@
+"""
+test_derived_measures.py
+Tests of the dependency graph of derived measure calculations.
+https://907sjl.github.io/
+"""
+
+import pandas as pd
+import pytest
+
+from model.DerivedMeasures import DerivedMeasureGraph
+import model.ProcessTime as wt
+
+
+def _make_graph(calculated: list) -> DerivedMeasureGraph:
+    """Returns a graph of total = a + b, doubled = 2 x total, and flag = c > 0."""
+
+    def node(name: str, calculate) -> callable:
+        def calculate_node(df: pd.DataFrame) -> None:
+            calculated.append(name)
+            calculate(df)
+        return calculate_node
+
+    graph = DerivedMeasureGraph('test')
+    graph.add_node('total', ['a', 'b'], ['total'], node('total', lambda df: df.__setitem__('total', df['a'] + df['b'])))
+    graph.add_node('doubled', ['total'], ['doubled'],
+                   node('doubled', lambda df: df.__setitem__('doubled', df['total'] * 2)))
+    graph.add_node('flag', ['c'], ['flag'], node('flag', lambda df: df.__setitem__('flag', df['c'] > 0)))
+    return graph
+# END make_graph
+
+
+def test_nodes_are_calculated_in_the_order_they_were_added():
+    calculated = []
+    graph = _make_graph(calculated)
+    df = graph.calculate(pd.DataFrame({'a': [1, 2], 'b': [3, 4], 'c': [0, 1]}))
+
+    assert calculated == ['total', 'doubled', 'flag']
+    assert graph.get_outputs() == ['total', 'doubled', 'flag']
+    assert df['doubled'].tolist() == [8, 12]
+    assert df['flag'].tolist() == [False, True]
+# END test_nodes_are_calculated_in_the_order_they_were_added
+
+
+def test_nodes_must_be_added_after_their_inputs():
+    graph = _make_graph([])
+    with pytest.raises(ValueError):
+        graph.add_node('a source', [], ['b'], lambda df: None)
+    with pytest.raises(ValueError):
+        graph.add_node('total', [], ['other'], lambda df: None)
+    with pytest.raises(ValueError):
+        graph.add_node('second flag', ['c'], ['flag'], lambda df: None)
+# END test_nodes_must_be_added_after_their_inputs
+
+
+def test_process_measures_have_every_derived_measure():
+    month_df = wt.clinic_measures[wt.last_month]
+    assert all(measure in month_df.columns for measure in wt._derived_measures.get_outputs())
+# END test_process_measures_have_every_derived_measure
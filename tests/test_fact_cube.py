@@ -0,0 +1,132 @@
+"""
+test_fact_cube.py
+Tests that the counts and medians of the daily fact cubes match the same measures calculated with pandas by
+filtering the referrals to a window of reporting days and aggregating them by clinic.
+https://907sjl.github.io/
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model.FactCube as fc
+from model.FactCube import DailyFactCube
+
+
+_CLINICS = ['Cardiology', 'Dermatology', 'Neurology', 'Urology']
+
+# Indicators by name with the source column, aggregation function, and limiting indicator column
+_INDICATORS = {'Referrals': ('Referral ID', 'count', None),
+               'Referrals Seen': ('Seen Indicator', 'sum', None),
+               'Referrals Seen Counted': ('Referral ID', 'count', 'Seen Indicator'),
+               'Median Days until Seen': ('Days until Seen', 'median', 'Seen Indicator'),
+               'Median Days to Accept': ('Days to Accept', 'median', None)}
+
+
+def _create_referrals(row_count: int, date_type: str) -> pd.DataFrame:
+    """Returns random referrals with missing values, clinics outside of the cube, and either date type."""
+    generator = np.random.default_rng(2023)
+    dates = pd.Timestamp('2023-01-01') + pd.to_timedelta(generator.integers(0, 200, row_count), unit='D')
+    dates = pd.Series(dates).where(generator.random(row_count) > 0.05)
+    if date_type == 'epoch-day':
+        dates = pd.Series((dates - pd.Timestamp('1970-01-01')).dt.days, dtype='Int32')
+    referrals_df = pd.DataFrame(
+        {'Clinic': generator.choice(_CLINICS + ['Podiatry'], row_count),
+         'Referral Date': dates,
+         'Referral Priority': generator.choice(['Urgent', 'Routine', None], row_count),
+         'Referral ID': pd.Series(np.arange(row_count), dtype='float').where(generator.random(row_count) > 0.1),
+         'Seen Indicator': generator.integers(0, 2, row_count),
+         'Days until Seen': pd.Series(generator.integers(0, 120, row_count), dtype='float')
+         .where(generator.random(row_count) > 0.2),
+         'Days to Accept': pd.Series(generator.integers(-3, 40, row_count), dtype='float')})
+    return referrals_df
+# END create_referrals
+
+
+def _filter_window(referrals_df: pd.DataFrame, start_date: datetime, end_date: datetime,
+                   priority: str) -> pd.DataFrame:
+    """Returns the referrals at the clinics of the cube with a reporting date in a window of days."""
+    dates = referrals_df['Referral Date']
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.Timestamp('1970-01-01') + pd.to_timedelta(dates.astype('float'), unit='D')
+    idx = (dates >= start_date) & (dates < end_date) & referrals_df['Clinic'].isin(_CLINICS)
+    if priority is not None:
+        idx = idx & (referrals_df['Referral Priority'] == priority)
+    return referrals_df.loc[idx.fillna(False)]
+# END filter_window
+
+
+def _calculate_expected(window_df: pd.DataFrame, name: str) -> pd.Series:
+    """Returns a measure of the referrals in a window by clinic, calculated with pandas."""
+    column, aggfunc, limit_column = _INDICATORS[name]
+    if limit_column is not None:
+        window_df = window_df.loc[window_df[limit_column] == 1]
+    values = window_df.groupby('Clinic')[column].agg(aggfunc).reindex(_CLINICS)
+    return values.fillna(0).astype('int64') if aggfunc in ['count', 'sum'] else values.astype('float')
+# END calculate_expected
+
+
+_WINDOWS = [(datetime(2023, 1, 1), datetime(2023, 7, 20)),
+            (datetime(2023, 2, 14), datetime(2023, 3, 1)),
+            (datetime(2023, 3, 1), datetime(2023, 3, 2)),
+            (datetime(2022, 11, 1), datetime(2023, 1, 15)),
+            (datetime(2023, 6, 1), datetime(2024, 1, 1)),
+            (datetime(2024, 1, 1), datetime(2024, 2, 1))]
+
+
+@pytest.mark.parametrize('date_type', ['datetime', 'epoch-day'])
+@pytest.mark.parametrize('priority', [None, 'Urgent'])
+@pytest.mark.parametrize('histogram_cells', [None, 20000, 1])
+def test_window_counts_and_medians_match_pandas(date_type: str, priority: str, histogram_cells: int, monkeypatch):
+    # Smaller histograms count the larger values in their last bin, and are counted in blocks of a few days
+    if histogram_cells is not None:
+        monkeypatch.setattr(fc, '_MAX_HISTOGRAM_CELLS', histogram_cells)
+        monkeypatch.setattr(fc, '_HISTOGRAM_BLOCK_CELLS', 1000)
+    referrals_df = _create_referrals(5000, date_type)
+    fact_cube = DailyFactCube(referrals_df, 'Referral Date', _CLINICS, _INDICATORS, priority)
+    if histogram_cells is not None:
+        for cumulative in fact_cube._cumulative_histograms.values():
+            assert cumulative.size <= histogram_cells or cumulative.shape[2] == 1
+
+    assert fact_cube.median_indicators == ['Median Days until Seen', 'Median Days to Accept']
+
+    for start_date, end_date in _WINDOWS:
+        window_df = _filter_window(referrals_df, start_date, end_date, priority)
+        counts_df = fact_cube.get_window_counts(start_date, end_date).set_index('Clinic')
+        medians_df = fact_cube.get_window_medians(start_date, end_date).set_index('Clinic')
+        overall_medians = fact_cube.get_overall_medians(start_date, end_date)
+        for name in fact_cube.indicators:
+            pd.testing.assert_series_equal(counts_df[name].astype('int64'), _calculate_expected(window_df, name),
+                                           check_names=False, check_index_type=False)
+        for name in fact_cube.median_indicators:
+            pd.testing.assert_series_equal(medians_df[name], _calculate_expected(window_df, name),
+                                           check_names=False, check_index_type=False)
+            column, _, limit_column = _INDICATORS[name]
+            values = window_df[column] if limit_column is None else window_df.loc[window_df[limit_column] == 1,
+                                                                                   column]
+            assert overall_medians[name] == pytest.approx(values.median(), nan_ok=True)
+# END test_window_counts_and_medians_match_pandas
+
+
+def test_cube_without_referrals_returns_zero_counts_and_missing_medians():
+    referrals_df = _create_referrals(50, 'datetime').iloc[0:0]
+    fact_cube = DailyFactCube(referrals_df, 'Referral Date', _CLINICS, _INDICATORS)
+    counts_df = fact_cube.get_window_counts(datetime(2023, 1, 1), datetime(2023, 2, 1))
+    assert (counts_df[fact_cube.indicators].to_numpy() == 0).all()
+    medians_df = fact_cube.get_window_medians(datetime(2023, 1, 1), datetime(2023, 2, 1))
+    assert medians_df[fact_cube.median_indicators].isna().all().all()
+# END test_cube_without_referrals_returns_zero_counts_and_missing_medians
+
+
+def test_indicators_that_cannot_be_counted_are_rejected():
+    referrals_df = _create_referrals(50, 'datetime')
+    referrals_df['Fractional Days'] = np.linspace(0.5, 10.0, len(referrals_df))
+    with pytest.raises(ValueError):
+        DailyFactCube(referrals_df, 'Referral Date', _CLINICS,
+                      {'Median Fractional Days': ('Fractional Days', 'median', None)})
+    with pytest.raises(ValueError):
+        DailyFactCube(referrals_df, 'Referral Date', _CLINICS,
+                      {'Mean Days to Accept': ('Days to Accept', 'mean', None)})
+# END test_indicators_that_cannot_be_counted_are_rejected
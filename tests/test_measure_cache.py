@@ -0,0 +1,210 @@
+"""
+test_measure_cache.py
+Tests that cached measure data is keyed by the source data, as-of date, and definition version, that cached
+frames are read back with the same values and data types, and that a failed or damaged write is never read.
+https://907sjl.github.io/
+"""
+
+from datetime import datetime
+
+import gc
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model.CRMUse as c
+import model.MeasureCache as mc
+import model.Snapshot as sn
+
+
+def _create_cache(directory, source_text: str = 'referrals', as_of_date: datetime = datetime(2023, 3, 1),
+                  definition_version: int = 1) -> mc.MeasureCache:
+    """Returns a measure cache in a folder for a source file with the given contents."""
+    source_file = os.path.join(directory, 'source.csv')
+    with open(source_file, 'w') as file:
+        file.write(source_text)
+    return mc.MeasureCache('measures', [source_file], as_of_date, definition_version,
+                           cache_directory=os.path.join(directory, 'cache'))
+# END create_cache
+
+
+def _create_frames() -> tuple:
+    """Returns a tuple of frames and identifier dictionaries with every data type that the model caches."""
+    measures_df = pd.DataFrame(
+        {'Clinic': ['Cardiology', 'Dermatology', None, 'Urology'],
+         'Referral Status': pd.Series(['Accepted', None, 'On Hold', 'Accepted'],
+                                      dtype=pd.CategoricalDtype(pd.Index(['Accepted', 'On Hold'], dtype='string'))),
+         'Age Category': pd.Categorical(['0-30', '(none)', '31-60', '0-30'],
+                                        categories=['0-30', '31-60', '(none)'], ordered=True),
+         'Reason for Hold': pd.Series(['Insurance', pd.NA, 'Records', 'Insurance'], dtype='string'),
+         'Referrals Seen': np.array([3, 0, 5, 8], dtype=np.int64),
+         'Days until Seen': pd.Series([12, pd.NA, 3, 40], dtype='Int32'),
+         'Appointments': np.array([1, 2, 3, 4], dtype=np.int32),
+         'Median Days to Accept': [1.5, np.nan, 3.0, 0.25],
+         'Seen Indicator': [True, False, True, True],
+         'Referral Date': pd.to_datetime(['2023-01-04', None, '2023-02-11', '2023-02-28'])})
+    distributions_df = pd.DataFrame({'Days': [0, 7, 14]}, index=pd.Index([10, 20, 30], name='Clinic ID'))
+    id_dictionaries = {'Referral ID': pd.Index(['R-1', 'R-2', 'R-3']), 'Patient ID': pd.Index([], dtype=object)}
+    return measures_df, distributions_df, id_dictionaries
+# END create_frames
+
+
+def _get_array_files(cache: mc.MeasureCache) -> list[str]:
+    """Returns the names of the array files in the folder of a cache."""
+    return sorted(file_name for file_name in os.listdir(cache.directory) if file_name.endswith('.npy'))
+# END get_array_files
+
+
+def test_key_changes_with_the_source_data_as_of_date_and_definition_version(tmp_path):
+    cache = _create_cache(tmp_path)
+    assert _create_cache(tmp_path).key == cache.key
+    keys = {cache.key,
+            _create_cache(tmp_path, source_text='referrals and more').key,
+            _create_cache(tmp_path, as_of_date=datetime(2023, 4, 1)).key,
+            _create_cache(tmp_path, definition_version=2).key}
+    assert len(keys) == 4
+# END test_key_changes_with_the_source_data_as_of_date_and_definition_version
+
+
+def test_folders_of_other_keys_are_removed_once_no_cache_uses_them(tmp_path):
+    os.makedirs(tmp_path / 'cache' / 'measures' / 'earlier-process')
+    cache = _create_cache(tmp_path)
+    measures_df, _, _ = _create_frames()
+    cache.save('2023-02-01', (measures_df,))
+    loaded_measures_df = cache.load('2023-02-01')[0]
+
+    # Creating a cache removed the folder left by an earlier process, and keeps the folder that is still used
+    new_cache = _create_cache(tmp_path, definition_version=2)
+    assert sorted(os.listdir(tmp_path / 'cache' / 'measures')) == sorted([cache.key, new_cache.key])
+    pd.testing.assert_frame_equal(loaded_measures_df.copy(), measures_df)
+
+    del cache, loaded_measures_df
+    gc.collect()
+    assert os.listdir(tmp_path / 'cache' / 'measures') == [new_cache.key]
+
+    # The folder of the last key is kept for the next start
+    del new_cache
+    gc.collect()
+    assert len(os.listdir(tmp_path / 'cache' / 'measures')) == 1
+# END test_folders_of_other_keys_are_removed_once_no_cache_uses_them
+
+
+def test_write_to_a_removed_folder_is_not_cached(tmp_path):
+    cache = _create_cache(tmp_path)
+    measures_df, _, _ = _create_frames()
+    shutil.rmtree(cache.directory)
+
+    cache.save('2023-02-01', (measures_df,))
+    assert cache.load('2023-02-01') is None
+    pd.testing.assert_frame_equal(cache.get('2023-02-01', lambda: (measures_df,))[0], measures_df)
+# END test_write_to_a_removed_folder_is_not_cached
+
+
+def test_cached_frames_are_read_with_their_values_and_data_types(tmp_path):
+    cache = _create_cache(tmp_path)
+    measures_df, distributions_df, id_dictionaries = _create_frames()
+    cache.save('2023-02-01', (measures_df, distributions_df, id_dictionaries))
+
+    loaded_measures_df, loaded_distributions_df, loaded_id_dictionaries = _create_cache(tmp_path).load('2023-02-01')
+
+    pd.testing.assert_frame_equal(loaded_measures_df.copy(), measures_df, check_exact=True)
+    pd.testing.assert_frame_equal(loaded_distributions_df.copy(), distributions_df, check_exact=True)
+    assert list(loaded_id_dictionaries) == list(id_dictionaries)
+    for name, index in id_dictionaries.items():
+        pd.testing.assert_index_equal(loaded_id_dictionaries[name], index, exact=True)
+
+    # Columns are read-only views of the array file
+    with pytest.raises(ValueError, match='read-only'):
+        loaded_measures_df['Referrals Seen'].to_numpy()[0] = 1
+# END test_cached_frames_are_read_with_their_values_and_data_types
+
+
+def test_values_that_cannot_be_described_are_not_cached(tmp_path):
+    cache = _create_cache(tmp_path)
+    with pytest.raises(TypeError):
+        cache.save('mixed', (pd.DataFrame({'Clinic': ['Cardiology', 3]}),))
+    assert os.listdir(cache.directory) == []
+    assert cache.load('mixed') is None
+# END test_values_that_cannot_be_described_are_not_cached
+
+
+def test_rewritten_item_removes_the_array_file_of_the_earlier_write(tmp_path):
+    cache = _create_cache(tmp_path)
+    measures_df, distributions_df, _ = _create_frames()
+    cache.save('2023-02-01', (measures_df,))
+    cache.save('2023-03-01', (measures_df,))
+    earlier_files = _get_array_files(cache)
+
+    cache.save('2023-02-01', (distributions_df,))
+
+    assert len(_get_array_files(cache)) == 2
+    assert [file_name for file_name in earlier_files if file_name.startswith('2023-03-01.')] == \
+           [file_name for file_name in _get_array_files(cache) if file_name.startswith('2023-03-01.')]
+    assert sorted(os.listdir(cache.directory)) == sorted(_get_array_files(cache) + ['2023-02-01.json',
+                                                                                    '2023-03-01.json'])
+    pd.testing.assert_frame_equal(cache.load('2023-02-01')[0].copy(), distributions_df)
+# END test_rewritten_item_removes_the_array_file_of_the_earlier_write
+
+
+def test_failed_write_keeps_the_earlier_write(tmp_path, monkeypatch):
+    cache = _create_cache(tmp_path)
+    measures_df, distributions_df, _ = _create_frames()
+    cache.save('2023-02-01', (measures_df,))
+    files = sorted(os.listdir(cache.directory))
+
+    def fail_replace(source: str, destination: str) -> None:
+        raise OSError('disk full')
+
+    monkeypatch.setattr(mc.os, 'replace', fail_replace)
+    cache.save('2023-02-01', (distributions_df,))
+    monkeypatch.undo()
+
+    assert sorted(os.listdir(cache.directory)) == files
+    pd.testing.assert_frame_equal(cache.load('2023-02-01')[0].copy(), measures_df)
+# END test_failed_write_keeps_the_earlier_write
+
+
+def test_damaged_items_are_calculated_again(tmp_path):
+    cache = _create_cache(tmp_path)
+    measures_df, distributions_df, _ = _create_frames()
+    cache.save('2023-02-01', (measures_df,))
+    cache.save('2023-03-01', (measures_df,))
+
+    with open(os.path.join(cache.directory, '2023-02-01.json'), 'w') as file:
+        file.write('{"format": 2, "arrays": ')
+    with open(os.path.join(cache.directory, '2023-03-01.json')) as file:
+        array_file_name = json.load(file)['arrays']
+    np.save(os.path.join(cache.directory, array_file_name), np.array([{'code': 'not data'}], dtype=object))
+
+    assert cache.load('2023-02-01') is None
+    assert cache.load('2023-03-01') is None
+    frames = cache.get('2023-03-01', lambda: (distributions_df,))
+    pd.testing.assert_frame_equal(frames[0], distributions_df)
+    pd.testing.assert_frame_equal(cache.load('2023-03-01')[0].copy(), distributions_df)
+# END test_damaged_items_are_calculated_again
+
+
+def test_cache_folders_are_private_to_the_server_account(tmp_path):
+    cache = _create_cache(tmp_path)
+    for directory in [tmp_path / 'cache', tmp_path / 'cache' / 'measures', cache.directory]:
+        assert os.stat(directory).st_mode & 0o777 == 0o700
+# END test_cache_folders_are_private_to_the_server_account
+
+
+def test_measures_read_from_the_cache_are_scored_in_a_copy():
+    clinic = c._get_data()['test_results'][c.last_month]['Clinic'].iloc[0]
+
+    # The new snapshot reads the measures of the month from the cache written by the first snapshot
+    sn.reload()
+    shared_df = c._get_data()['test_results'][c.last_month].copy()
+    results_df = c.get_crm_usage_test_results(c.last_month, clinic)
+    c.set_crm_usage_score(results_df, 'Accepted', 0.5)
+
+    assert results_df.loc[results_df['Milestone'] == 'Accepted', 'Result'].iloc[0] == 50
+    # The test results of the month that every session reads are not changed
+    pd.testing.assert_frame_equal(c._get_data()['test_results'][c.last_month], shared_df)
+# END test_measures_read_from_the_cache_are_scored_in_a_copy
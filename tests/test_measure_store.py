@@ -0,0 +1,66 @@
+"""
+test_measure_store.py
+Tests of the dense storage of measure values by month, clinic, and measure.
+https://907sjl.github.io/
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from model.MeasureStore import MeasureStore
+
+
+def _measures_df(scale: int, clinics: list[str]) -> pd.DataFrame:
+    return pd.DataFrame({'Clinic': clinics,
+                         'Referrals': [scale * (position + 1) for position in range(len(clinics))],
+                         'Rate': [scale / (position + 2) for position in range(len(clinics))],
+                         'Direction': ['up' if position % 2 == 0 else 'down' for position in range(len(clinics))]})
+
+
+def test_lookups_return_values_in_source_types():
+    store = MeasureStore()
+    month = datetime(2023, 5, 1)
+    store.add_measures(month, _measures_df(10, ['Clinic A', 'Clinic B']))
+
+    assert store.get_measure(month, 'Clinic B', 'Referrals') == 20
+    assert isinstance(store.get_measure(month, 'Clinic B', 'Referrals'), np.int64)
+    assert store.get_numeric_measure(month, 'Clinic A', 'Rate') == pytest.approx(5.0)
+    assert store.get_measure(month, 'Clinic A', 'Direction') == 'up'
+    assert store.get_numeric_measure(month, 'Clinic A', 'Direction') is None
+    assert store.get_measure(month, 'Clinic Z', 'Referrals') == 0
+    with pytest.raises(KeyError):
+        store.get_measure(month, 'Clinic A', 'Unknown')
+# END test_lookups_return_values_in_source_types
+
+
+def test_get_measures_fetches_several_months():
+    store = MeasureStore()
+    months = [datetime(2023, 4, 1), datetime(2023, 5, 1)]
+    store.add_measures(months[0], _measures_df(1, ['Clinic A']))
+    store.add_measures(months[1], _measures_df(3, ['Clinic A', 'Clinic B']))
+
+    values = store.get_measures(months, 'Clinic B', ['Referrals', 'Direction'])
+    assert values.tolist() == [[0, 0], [6, 'down']]
+# END test_get_measures_fetches_several_months
+
+
+def test_removed_month_position_is_reused_without_old_values():
+    store = MeasureStore()
+    old_month, other_month, new_month = datetime(2023, 1, 1), datetime(2023, 2, 1), datetime(2023, 3, 1)
+    store.add_measures(old_month, _measures_df(5, ['Clinic A', 'Clinic B']))
+    store.add_measures(other_month, _measures_df(7, ['Clinic A']))
+    store.remove_measures(old_month)
+
+    assert not store.has_month(old_month)
+    with pytest.raises(KeyError):
+        store.get_measure(old_month, 'Clinic A', 'Referrals')
+
+    # The new month takes the freed position and must not show values of the removed month
+    store.add_measures(new_month, _measures_df(9, ['Clinic A']))
+    assert store.get_measure(new_month, 'Clinic A', 'Referrals') == 9
+    assert store.get_measure(new_month, 'Clinic B', 'Referrals') == 0
+    assert store.get_measure(other_month, 'Clinic A', 'Referrals') == 7
+# END test_removed_month_position_is_reused_without_old_values
@@ -0,0 +1,203 @@
+"""
+test_month_cache.py
+Tests of the least recently used cache of monthly measure data and of reads of the measure store behind it.
+https://907sjl.github.io/
+"""
+
+from datetime import datetime
+from threading import Event, Thread
+
+from dateutil.relativedelta import relativedelta
+import pandas as pd
+import pytest
+
+import os
+
+from model.MeasureStore import MeasureStore
+from model.MonthCache import MonthCache
+import model.ProcessTime as wt
+
+
+_MONTHS = [datetime(2022, 1, 1) + relativedelta(months=offset) for offset in range(12)]
+
+
+def _make_cache(capacity: int, calculated: list = None) -> (MonthCache, MeasureStore):
+    """Returns a cache of months whose single measure is the month number, and the store it maintains."""
+    store = MeasureStore()
+
+    def calculate_month(report_month: datetime) -> tuple:
+        if calculated is not None:
+            calculated.append(report_month)
+        return (pd.DataFrame({'Clinic': ['Clinic A'], 'Month': [report_month.month]}),)
+
+    cache = MonthCache(_MONTHS, calculate_month, capacity,
+                       evict_month=store.remove_measures,
+                       add_month=lambda report_month, month_data: store.add_measures(report_month, month_data[0]),
+                       workers=0)
+    return cache, store
+# END make_cache
+
+
+def test_least_recently_used_month_is_evicted():
+    calculated = []
+    cache, store = _make_cache(2, calculated)
+    cache.ensure_resident([_MONTHS[0], _MONTHS[1], _MONTHS[0], _MONTHS[2]])
+
+    assert calculated == [_MONTHS[0], _MONTHS[1], _MONTHS[2]]
+    assert cache.is_resident(_MONTHS[0]) and cache.is_resident(_MONTHS[2])
+    assert not cache.is_resident(_MONTHS[1])
+    assert not store.has_month(_MONTHS[1])
+    with pytest.raises(KeyError):
+        cache.ensure_resident([datetime(1999, 1, 1)])
+# END test_least_recently_used_month_is_evicted
+
+
+def test_read_keeps_more_months_than_the_capacity_resident():
+    cache, store = _make_cache(3)
+    values = cache.read(_MONTHS[:8], lambda: store.get_measures(_MONTHS[:8], 'Clinic A', ['Month']))
+
+    assert values[:, 0].tolist() == [month.month for month in _MONTHS[:8]]
+    assert [month for month in _MONTHS if cache.is_resident(month)] == _MONTHS[5:8]
+# END test_read_keeps_more_months_than_the_capacity_resident
+
+
+def test_concurrent_reads_never_see_another_month():
+    cache, store = _make_cache(2)
+    errors = []
+
+    def read_months(offset: int) -> None:
+        try:
+            for iteration in range(200):
+                report_month = _MONTHS[(offset + iteration) % len(_MONTHS)]
+                value = cache.read([report_month],
+                                   lambda: store.get_measure(report_month, 'Clinic A', 'Month'))
+                if value != report_month.month:
+                    errors.append((report_month, value))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [Thread(target=read_months, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+# END test_concurrent_reads_never_see_another_month
+
+
+def test_calculation_of_a_month_does_not_block_reads_of_resident_months():
+    calculating = Event()
+    finish = Event()
+    calculated = []
+    store = MeasureStore()
+
+    def calculate_month(report_month: datetime) -> tuple:
+        calculated.append(report_month)
+        if report_month == _MONTHS[1]:
+            calculating.set()
+            finish.wait(10)
+        return (pd.DataFrame({'Clinic': ['Clinic A'], 'Month': [report_month.month]}),)
+
+    cache = MonthCache(_MONTHS, calculate_month, 3,
+                       evict_month=store.remove_measures,
+                       add_month=lambda report_month, month_data: store.add_measures(report_month, month_data[0]),
+                       workers=0)
+    cache.ensure_resident([_MONTHS[0]])
+    results = []
+    threads = [Thread(target=lambda: results.append(cache[_MONTHS[1]][0]['Month'].iloc[0])) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert calculating.wait(10)
+
+    # The resident month is read while the other month is calculated
+    reads = []
+    reader = Thread(target=lambda: reads.extend([
+        cache.read([_MONTHS[0]], lambda: store.get_measure(_MONTHS[0], 'Clinic A', 'Month')),
+        cache[_MONTHS[0]][0]['Month'].iloc[0]]))
+    reader.start()
+    reader.join(5)
+    read_during_calculation = list(reads)
+    finish.set()
+    reader.join(10)
+    assert read_during_calculation == [1, 1]
+
+    for thread in threads:
+        thread.join(10)
+
+    # Every request for the month being calculated waited for the one calculation
+    assert results == [2, 2, 2]
+    assert calculated == [_MONTHS[0], _MONTHS[1]]
+    assert cache.read([_MONTHS[1]], lambda: store.get_measure(_MONTHS[1], 'Clinic A', 'Month')) == 2
+# END test_calculation_of_a_month_does_not_block_reads_of_resident_months
+
+
+def test_failed_calculation_is_raised_to_every_request_and_tried_again():
+    attempts = []
+
+    def calculate_month(report_month: datetime) -> tuple:
+        attempts.append(report_month)
+        if len(attempts) == 1:
+            raise ValueError('source data changed')
+        return (pd.DataFrame({'Clinic': ['Clinic A'], 'Month': [report_month.month]}),)
+
+    cache = MonthCache(_MONTHS, calculate_month, 2, workers=0)
+    with pytest.raises(ValueError):
+        cache.ensure_resident([_MONTHS[0]])
+    assert not cache.is_resident(_MONTHS[0])
+
+    assert cache[_MONTHS[0]][0]['Month'].iloc[0] == 1
+    assert attempts == [_MONTHS[0], _MONTHS[0]]
+# END test_failed_calculation_is_raised_to_every_request_and_tried_again
+
+
+def test_prefetch_does_not_fork_workers_while_other_threads_run():
+    calculating_processes = []
+
+    def calculate_month(report_month: datetime) -> tuple:
+        calculating_processes.append(os.getpid())
+        return (pd.DataFrame({'Clinic': ['Clinic A'], 'Month': [report_month.month]}),)
+
+    cache = MonthCache(_MONTHS, calculate_month, len(_MONTHS), workers=4)
+    stop = Event()
+    other_thread = Thread(target=stop.wait, args=(10,))
+    other_thread.start()
+    try:
+        cache.prefetch(_MONTHS[:4])
+    finally:
+        stop.set()
+        other_thread.join()
+
+    assert calculating_processes == [os.getpid()] * 4
+    assert all(cache.is_resident(month) for month in _MONTHS[:4])
+# END test_prefetch_does_not_fork_workers_while_other_threads_run
+
+
+def test_workers_are_not_forked_without_workers_or_with_other_threads():
+    assert not MonthCache(_MONTHS, lambda report_month: (), 2, workers=0).can_fork_workers()
+    assert not MonthCache(_MONTHS, lambda report_month: (), 2, workers=1).can_fork_workers()
+
+    cache = MonthCache(_MONTHS, lambda report_month: (), 2, workers=4)
+    stop = Event()
+    other_thread = Thread(target=stop.wait, args=(10,))
+    other_thread.start()
+    try:
+        assert not cache.can_fork_workers()
+    finally:
+        stop.set()
+        other_thread.join()
+# END test_workers_are_not_forked_without_workers_or_with_other_threads
+
+
+def test_clinic_measures_with_more_offsets_than_resident_months():
+    report_month = wt.last_month
+    month_offsets = list(range(-(wt._RESIDENT_MONTHS + 3), 1))
+    measures = ['Referrals Completed After 90d', 'Median Days until Seen']
+    clinic = wt.get_clinics(report_month)[0]
+
+    measures_df = wt.get_clinic_measures(report_month, clinic, measures, month_offsets)
+    for month_offset in month_offsets:
+        assert measures_df.loc[month_offset, 'Referrals Completed After 90d'] == (
+            wt.get_clinic_count_measure(report_month, clinic, 'Referrals Completed After 90d', month_offset))
+        assert measures_df.loc[month_offset, 'Median Days until Seen'] == pytest.approx(
+            wt.get_clinic_rate_measure(report_month, clinic, 'Median Days until Seen', month_offset))
+# END test_clinic_measures_with_more_offsets_than_resident_months
@@ -0,0 +1,111 @@
+"""
+test_render_payloads.py
+Tests of the process-wide cache of render payloads.
+https://907sjl.github.io/
+"""
+
+from datetime import datetime
+from threading import Event, Thread, Timer
+
+from tornado.ioloop import IOLoop
+
+import app.RenderPayloads as rp
+
+
+_MONTH = datetime(2023, 6, 1)
+
+
+def test_payload_is_calculated_once():
+    cache = rp.RenderPayloadCache()
+    calculations = []
+
+    def calculate() -> dict:
+        calculations.append(1)
+        return {'plot': {'attributes': {}, 'columns': {}}}
+
+    first = cache.get_payload('test-app', _MONTH, 'Clinic A', calculate)
+    second = cache.get_payload('test-app', _MONTH, 'Clinic A', calculate)
+    assert first is second
+    assert len(calculations) == 1
+# END test_payload_is_calculated_once
+
+
+def test_least_recently_used_payload_is_evicted():
+    cache = rp.RenderPayloadCache(capacity=2)
+    for clinic in ['Clinic A', 'Clinic B', 'Clinic A', 'Clinic C']:
+        cache.get_payload('test-app', _MONTH, clinic, lambda: {})
+    calculated = []
+    cache.get_payload('test-app', _MONTH, 'Clinic A', lambda: calculated.append('Clinic A') or {})
+    cache.get_payload('test-app', _MONTH, 'Clinic B', lambda: calculated.append('Clinic B') or {})
+    assert calculated == ['Clinic B']
+# END test_least_recently_used_payload_is_evicted
+
+
+def test_waiting_thread_shares_failed_calculation():
+    cache = rp.RenderPayloadCache()
+    started, release = Event(), Event()
+    errors = []
+
+    def fail() -> dict:
+        started.set()
+        release.wait(5)
+        raise ValueError('calculation failed')
+
+    def request() -> None:
+        try:
+            cache.get_payload('test-app', _MONTH, 'Clinic A', fail)
+        except ValueError as error:
+            errors.append(error)
+
+    leader = Thread(target=request)
+    leader.start()
+    started.wait(5)
+    follower = Thread(target=request)
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(errors) == 2
+# END test_waiting_thread_shares_failed_calculation
+
+
+def test_ioloop_load_does_not_wait_for_calculation_in_flight():
+    """A session that loads a payload being calculated by a worker thread must not block the IOLoop."""
+    cache = rp.RenderPayloadCache()
+    started, release = Event(), Event()
+    worker_payload = {'plot': 'worker'}
+
+    def calculate_slowly() -> dict:
+        started.set()
+        release.wait(10)
+        return worker_payload
+
+    worker = Thread(target=cache.get_payload, args=('test-app', _MONTH, 'Clinic A', calculate_slowly))
+    worker.start()
+    assert started.wait(5)
+
+    # Release the worker eventually, so that a regression fails the test instead of hanging it
+    safety_release = Timer(5, release.set)
+    safety_release.start()
+
+    events = []
+    loop = IOLoop(make_current=False)
+
+    def load_on_loop() -> None:
+        cache.load('test-app', _MONTH, 'Clinic A', {}, lambda: events.append('collected') or {})
+        events.append('loaded' if not release.is_set() else 'loaded after worker')
+
+    def heartbeat() -> None:
+        events.append('heartbeat')
+        loop.stop()
+
+    loop.add_callback(load_on_loop)
+    loop.add_callback(heartbeat)
+    loop.start()
+    loop.close()
+
+    release.set()
+    safety_release.cancel()
+    worker.join(5)
+    assert events == ['collected', 'loaded', 'heartbeat']
+# END test_ioloop_load_does_not_wait_for_calculation_in_flight
@@ -0,0 +1,149 @@
+"""
+test_snapshot.py
+Tests that a reload builds a new model snapshot and swaps it in whole, that code with a pinned snapshot keeps
+reading it during and after a reload, and that changed source files are loaded once they settle.
+https://907sjl.github.io/
+"""
+
+from threading import Event, Thread
+
+import os
+import time
+
+import pytest
+
+import model.Snapshot as sn
+
+
+@pytest.fixture
+def loaders(monkeypatch, tmp_path):
+    """Replaces the registered loaders and the current snapshot with ones that load a counter from a file."""
+    monkeypatch.setattr(sn, '_loaders', {})
+    monkeypatch.setattr(sn, '_current_snapshot', sn.ModelSnapshot(1))
+    monkeypatch.setattr(sn, '_failed_source_stats', None)
+    source_file = str(tmp_path / 'counts.csv')
+    _write_source(source_file, '1')
+
+    def load_counts() -> dict:
+        with open(source_file) as file:
+            return {'count': int(file.read())}
+
+    def load_totals() -> dict:
+        return {'total': sn.get_data('counts')['count'] * 10}
+
+    sn.register_loader('counts', [source_file], load_counts)
+    sn.register_loader('totals', [], load_totals)
+    return source_file
+# END loaders
+
+
+def _write_source(source_file: str, text: str, age_seconds: float = 60.0) -> None:
+    """Writes a source file with a modification time the given number of seconds ago."""
+    with open(source_file, 'w') as file:
+        file.write(text)
+    modified_time = time.time() - age_seconds
+    os.utime(source_file, (modified_time, modified_time))
+# END write_source
+
+
+def test_reload_swaps_in_a_new_snapshot_loaded_in_order(loaders):
+    first_snapshot = sn.get_snapshot()
+    assert first_snapshot.version == 1
+    assert sn.get_data('totals') == {'total': 10}
+
+    _write_source(loaders, '2')
+    second_snapshot = sn.reload()
+
+    assert sn.get_snapshot() is second_snapshot and second_snapshot.version == 2
+    assert sn.get_data('counts') == {'count': 2}
+    # The dependent loader read the data of the snapshot that was being loaded
+    assert sn.get_data('totals') == {'total': 20}
+    # The earlier snapshot is not changed by the reload
+    assert first_snapshot.get_data('counts') == {'count': 1}
+    assert first_snapshot.get_data('totals') == {'total': 10}
+# END test_reload_swaps_in_a_new_snapshot_loaded_in_order
+
+
+def test_pinned_snapshot_is_read_during_and_after_a_reload(loaders):
+    loading = Event()
+    loaded = Event()
+    reads = []
+
+    def load_slowly() -> dict:
+        # Loading a later snapshot waits until the test has read the pinned snapshot
+        if sn.get_snapshot().version > 1:
+            loading.set()
+            loaded.wait(5.0)
+        return {}
+
+    sn.register_loader('slow', [], load_slowly)
+    _write_source(loaders, '2')
+
+    pinned_snapshot = sn.get_snapshot()
+    reload_thread = Thread(target=sn.reload)
+    reload_thread.start()
+    assert loading.wait(5.0)
+
+    # Reads without a pin see the current snapshot until the new snapshot is complete
+    reads.append((sn.get_data('counts')['count'], sn.get_data('totals')['total']))
+    with sn.pinned(pinned_snapshot):
+        loaded.set()
+        reload_thread.join(5.0)
+        reads.append((sn.get_data('counts')['count'], sn.get_data('totals')['total']))
+
+    assert reads == [(1, 10), (1, 10)]
+    assert (sn.get_data('counts')['count'], sn.get_data('totals')['total']) == (2, 20)
+# END test_pinned_snapshot_is_read_during_and_after_a_reload
+
+
+def test_pin_applies_to_its_own_context_only(loaders):
+    first_snapshot = sn.get_snapshot()
+    _write_source(loaders, '2')
+    sn.reload()
+    reads = []
+
+    with sn.pinned(first_snapshot):
+        other_thread = Thread(target=lambda: reads.append(sn.get_data('counts')['count']))
+        other_thread.start()
+        other_thread.join(5.0)
+        reads.append(sn.get_data('counts')['count'])
+
+    assert reads == [2, 1]
+# END test_pin_applies_to_its_own_context_only
+
+
+def test_failed_reload_keeps_the_current_snapshot_until_the_files_change_again(loaders):
+    first_snapshot = sn.get_snapshot()
+    _write_source(loaders, 'not a count')
+
+    with pytest.raises(ValueError):
+        sn.reload_if_changed()
+    assert sn.get_snapshot() is first_snapshot
+
+    # The same failed files are not loaded again
+    assert sn.reload_if_changed() is False
+
+    _write_source(loaders, '3')
+    assert sn.reload_if_changed() is True
+    assert sn.get_data('totals') == {'total': 30}
+# END test_failed_reload_keeps_the_current_snapshot_until_the_files_change_again
+
+
+def test_changed_files_are_loaded_once_they_settle(loaders):
+    first_snapshot = sn.get_snapshot()
+    assert sn.reload_if_changed() is False
+
+    # A file modified within the settle time may still be written
+    _write_source(loaders, '2', age_seconds=0.0)
+    assert sn.reload_if_changed(settle_seconds=30.0) is False
+
+    # A missing file is being replaced
+    os.remove(loaders)
+    assert sn.reload_if_changed(settle_seconds=0.0) is False
+    assert sn.get_snapshot() is first_snapshot
+
+    _write_source(loaders, '2', age_seconds=60.0)
+    assert sn.reload_if_changed(settle_seconds=30.0) is True
+    assert sn.get_snapshot().version == 2 and sn.get_data('counts') == {'count': 2}
+    assert sn.reload_if_changed(settle_seconds=30.0) is False
+# END test_changed_files_are_loaded_once_they_settle
@@ -0,0 +1,147 @@
+"""
+test_static_page.py
+Tests that static pages are rendered once per data snapshot and answered with entity tags and modification
+times, so that a client with the current page gets status 304 and no content.
+https://907sjl.github.io/
+"""
+
+from datetime import timedelta
+from email.utils import format_datetime
+
+import asyncio
+import os
+
+import pytest
+from bokeh.document import Document
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+from tornado.web import Application, RequestHandler
+
+import app.RoutinePerformanceApp as rpa
+import app.ScheduleTimesApp as sta
+import app.SeenTimesApp as sea
+import app.StaticPage as sp
+import app.UrgentPerformanceApp as upa
+import model.ProcessTime as wt
+import model.Snapshot as sn
+
+
+class _PageHandler(RequestHandler):
+    """Serves one static page the way the server serves the static app pages once the data is loaded."""
+
+    def initialize(self, page: sp.StaticPage):
+        self.page = page
+
+    def get(self):
+        sp.write_static_page(self, self.page)
+# END CLASS PageHandler
+
+
+def _fetch(page: sp.StaticPage, headers: dict = None):
+    """Returns the response of a server with the page to a GET request with the given headers."""
+
+    async def fetch():
+        socket, port = bind_unused_port()
+        server = HTTPServer(Application([('/page', _PageHandler, {'page': page})]))
+        server.add_sockets([socket])
+        try:
+            return await AsyncHTTPClient().fetch(f'http://127.0.0.1:{port}/page', headers=headers,
+                                                 raise_error=False)
+        finally:
+            server.stop()
+
+    return asyncio.run(fetch())
+# END fetch
+
+
+@pytest.fixture
+def page(monkeypatch):
+    """Returns a static page that counts its renders, with a data snapshot key that the test can change."""
+    snapshot_keys = ['first']
+    monkeypatch.setattr(wt, 'get_snapshot_key', lambda: snapshot_keys[-1])
+    renders = []
+
+    def app_handler(doc: Document) -> None:
+        renders.append(snapshot_keys[-1])
+        doc.title = 'Clinic summary ' + snapshot_keys[-1]
+
+    static_page = sp.StaticPage('/page', app_handler)
+    static_page.snapshot_keys = snapshot_keys
+    static_page.renders = renders
+    return static_page
+# END page
+
+
+def test_page_is_answered_with_its_entity_tag_and_modification_time(page):
+    response = _fetch(page)
+    html, etag, last_modified = page.get_page()
+
+    assert response.code == 200
+    assert response.body == html and b'Clinic summary first' in html
+    assert response.headers['Etag'] == etag
+    assert response.headers['Last-Modified'] == format_datetime(last_modified, usegmt=True)
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert page.renders == ['first']
+# END test_page_is_answered_with_its_entity_tag_and_modification_time
+
+
+def test_client_with_the_current_entity_tag_gets_no_content(page):
+    etag = _fetch(page).headers['Etag']
+
+    for if_none_match in [etag, 'W/' + etag, '"other", ' + etag, '*']:
+        response = _fetch(page, {'If-None-Match': if_none_match})
+        assert (response.code, response.body) == (304, b'')
+
+    assert _fetch(page, {'If-None-Match': '"other"'}).code == 200
+    assert page.renders == ['first']
+# END test_client_with_the_current_entity_tag_gets_no_content
+
+
+def test_client_with_the_current_modification_time_gets_no_content(page):
+    _, _, last_modified = page.get_page()
+
+    assert _fetch(page, {'If-Modified-Since': format_datetime(last_modified, usegmt=True)}).code == 304
+    assert _fetch(page, {'If-Modified-Since': format_datetime(last_modified + timedelta(hours=1),
+                                                              usegmt=True)}).code == 304
+    assert _fetch(page, {'If-Modified-Since': format_datetime(last_modified - timedelta(seconds=1),
+                                                              usegmt=True)}).code == 200
+    assert _fetch(page, {'If-Modified-Since': 'yesterday'}).code == 200
+
+    # The entity tag decides when a request has both headers
+    assert _fetch(page, {'If-None-Match': '"other"',
+                         'If-Modified-Since': format_datetime(last_modified, usegmt=True)}).code == 200
+# END test_client_with_the_current_modification_time_gets_no_content
+
+
+def test_page_is_rendered_again_for_a_new_data_snapshot(page):
+    etag = _fetch(page).headers['Etag']
+
+    page.snapshot_keys.append('second')
+    response = _fetch(page, {'If-None-Match': etag})
+
+    assert response.code == 200
+    assert b'Clinic summary second' in response.body
+    assert response.headers['Etag'] != etag
+    assert _fetch(page, {'If-None-Match': response.headers['Etag']}).code == 304
+    assert page.renders == ['first', 'second']
+# END test_page_is_rendered_again_for_a_new_data_snapshot
+
+
+@pytest.mark.parametrize('app_handler', [rpa.routine_performance_app_handler, sta.schedule_times_app_handler,
+                                         sea.seen_times_app_handler, upa.urgent_performance_app_handler])
+def test_summary_pages_list_the_clinics_of_the_snapshot_they_render(app_handler, monkeypatch):
+    # Templates are read from the folder of the server
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    clinic_measures = wt.clinic_measures[wt.last_month].copy()
+    clinic_measures['Clinic'] = clinic_measures['Clinic'].where(clinic_measures['Clinic'] == '*ALL*',
+                                                                'Renamed ' + clinic_measures['Clinic'])
+    monkeypatch.setitem(sn.get_data('process-time'), 'clinic_measures', {wt.last_month: clinic_measures})
+
+    doc = Document()
+    app_handler(doc)
+
+    clinics = list(doc.template_variables['clinics']['Clinic'])
+    assert clinics == sorted(clinic for clinic in clinic_measures['Clinic'] if clinic != '*ALL*')
+    assert all(clinic.startswith('Renamed ') for clinic in clinics)
+# END test_summary_pages_list_the_clinics_of_the_snapshot_they_render